@@ -0,0 +1,226 @@
+# This script generates synthetic dataset sources in the format of every supported dataset,
+# so that the converters and utilities can be benchmarked at any scale without downloading the datasets.
+# Glyphs are random strokes on a white background, so that their images compress like real handwriting.
+# The same seed always generates the same dataset.
+
+# Output format (for 2 fonts and 2 characters):
+# synthetic/casia-dataset-source/
+# ├── 001-f.gnt
+# ├── 002-f.gnt
+# synthetic/zhuojg-dataset-source/
+# ├── font_001
+# │   ├── char1
+# │   │   ├── 0.gif
+# │   │   ├── 1.gif
+# synthetic/fyp23-dataset-source/
+# ├── wordlist.txt
+# ├── content
+# │   ├── 00000.png
+# ├── data
+# │   ├── id_0
+# │   │   ├── 00000.png
+# synthetic/neumason-dataset-source/png9169/
+# ├── 汉仪书宋二S10000000000000000.ttf
+# │   ├── char1.png
+# ├── font_000A00000000000000.ttf
+# │   ├── char1.png
+
+
+import shutil
+import struct
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+neumason_content_font_dir = "汉仪书宋二S10000000000000000.ttf"
+
+
+def get_gb2312_characters(count: int) -> list[str]:
+    # Level 1 GB2312 characters are in rows 0xB0-0xD7, with 94 cells per row
+    characters: list[str] = []
+
+    for row in range(0xB0, 0xD8):
+        for cell in range(0xA1, 0xFF):
+            try:
+                character = bytes([row, cell]).decode("gb2312")
+            except UnicodeDecodeError:
+                continue
+
+            characters.append(character)
+            if len(characters) == count:
+                return characters
+
+    raise ValueError(f"GB2312 has fewer than {count} level 1 characters.")
+
+
+def draw_glyph(rng: np.random.Generator, size: tuple[int, int]) -> Image.Image:
+    width, height = size
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+
+    for _ in range(rng.integers(4, 12)):
+        start = (
+            int(rng.integers(width // 8, width - width // 8)),
+            int(rng.integers(height // 8, height - height // 8)),
+        )
+        end = (
+            int(rng.integers(width // 8, width - width // 8)),
+            int(rng.integers(height // 8, height - height // 8)),
+        )
+        draw.line(
+            [start, end],
+            fill=int(rng.integers(0, 64)),
+            width=int(rng.integers(2, max(3, width // 12))),
+        )
+
+    return image
+
+
+def reset_directory(path: Path):
+    if path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True)
+
+
+def generate_casia_source(
+    output_dir: str | Path, fonts: int, characters_per_font: int, seed: int = 0
+):
+    # Every GNT sample is a 10-byte header followed by a grayscale bitmap of varying size
+    output_path = Path(output_dir)
+    reset_directory(output_path)
+
+    rng = np.random.default_rng(seed)
+    characters = get_gb2312_characters(characters_per_font)
+
+    for font_number in range(1, fonts + 1):
+        with open(output_path / f"{font_number:03d}-f.gnt", "wb") as f:
+            for character in characters:
+                width, height = (int(value) for value in rng.integers(50, 110, size=2))
+                bitmap = draw_glyph(rng, (width, height)).tobytes()
+
+                tag_code = int.from_bytes(character.encode("gb2312"), "big")
+                f.write(struct.pack("<I", 10 + len(bitmap)))
+                f.write(struct.pack(">H", tag_code))
+                f.write(struct.pack("<HH", width, height))
+                f.write(bitmap)
+
+
+def generate_zhuojg_source(
+    output_dir: str | Path,
+    fonts: int,
+    characters_per_font: int,
+    images_per_character: int = 2,
+    seed: int = 0,
+):
+    output_path = Path(output_dir)
+    reset_directory(output_path)
+
+    rng = np.random.default_rng(seed)
+    characters = get_gb2312_characters(characters_per_font)
+
+    for font_number in range(1, fonts + 1):
+        for character in characters:
+            character_path = output_path / f"font_{font_number:03d}" / character
+            character_path.mkdir(parents=True)
+
+            for image_number in range(images_per_character):
+                draw_glyph(rng, (128, 128)).save(
+                    character_path / f"{image_number}.gif", "GIF"
+                )
+
+
+def generate_fyp23_source(
+    output_dir: str | Path, fonts: int, characters_per_font: int, seed: int = 0
+):
+    # Image names are tokens, i.e. indices into the characters of wordlist.txt
+    output_path = Path(output_dir)
+    reset_directory(output_path)
+
+    rng = np.random.default_rng(seed)
+    characters = get_gb2312_characters(characters_per_font)
+
+    with open(output_path / "wordlist.txt", "w", encoding="utf-8") as f:
+        f.write("".join(characters))
+
+    content_path = output_path / "content"
+    content_path.mkdir()
+    for token in range(len(characters)):
+        draw_glyph(rng, (128, 128)).save(content_path / f"{token:05d}.png")
+
+    for font_number in range(fonts):
+        font_path = output_path / "data" / f"id_{font_number}"
+        font_path.mkdir(parents=True)
+
+        for token in range(len(characters)):
+            draw_glyph(rng, (128, 128)).save(font_path / f"{token:05d}.png")
+
+
+def generate_neumason_source(
+    output_dir: str | Path, fonts: int, characters_per_font: int, seed: int = 0
+):
+    # Font directories are named like font files, with trailing flags of 0s and 1s.
+    # The converter removes the flags, so a font name must not end with 0 or 1.
+    output_path = Path(output_dir)
+    reset_directory(output_path)
+
+    rng = np.random.default_rng(seed)
+    characters = get_gb2312_characters(characters_per_font)
+
+    font_dirs = [neumason_content_font_dir] + [
+        f"font_{font_number:03d}A00000000000000.ttf" for font_number in range(fonts)
+    ]
+
+    for font_dir in font_dirs:
+        font_path = output_path / font_dir
+        font_path.mkdir()
+
+        for character in characters:
+            draw_glyph(rng, (128, 128)).save(font_path / f"{character}.png")
+
+
+def generate_synthetic_datasets(
+    output_dir: str | Path,
+    fonts: int,
+    characters_per_font: int,
+    images_per_character: int = 2,
+    seed: int = 0,
+) -> dict[str, Path]:
+    output_path = Path(output_dir)
+
+    source_dirs = {
+        "casia": output_path / "casia-dataset-source",
+        "zhuojg": output_path / "zhuojg-dataset-source",
+        "fyp23": output_path / "fyp23-dataset-source",
+        "neumason": output_path / "neumason-dataset-source" / "png9169",
+    }
+
+    generate_casia_source(source_dirs["casia"], fonts, characters_per_font, seed)
+    generate_zhuojg_source(
+        source_dirs["zhuojg"], fonts, characters_per_font, images_per_character, seed
+    )
+    generate_fyp23_source(source_dirs["fyp23"], fonts, characters_per_font, seed)
+    generate_neumason_source(source_dirs["neumason"], fonts, characters_per_font, seed)
+
+    return source_dirs
+
+
+def main():
+    output_dir = "synthetic"
+    fonts = 8
+    characters_per_font = 500
+    images_per_character = 2
+
+    source_dirs = generate_synthetic_datasets(
+        output_dir=output_dir,
+        fonts=fonts,
+        characters_per_font=characters_per_font,
+        images_per_character=images_per_character,
+    )
+
+    for dataset_name, source_dir in source_dirs.items():
+        print(f"{dataset_name}: {source_dir.as_posix()}")
+
+
+if __name__ == "__main__":
+    main()
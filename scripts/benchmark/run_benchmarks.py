@@ -0,0 +1,419 @@
+# This script runs every converter and utility against synthetic datasets (see generate_synthetic_datasets.py)
+# and records their throughput, so that performance regressions can be noticed.
+# The results are compared against a baseline file, and can be saved as the new baseline.
+
+# Usage:
+# python -m scripts.benchmark.run_benchmarks                    (compare against the baseline)
+# python -m scripts.benchmark.run_benchmarks --update-baseline  (save the results as the baseline)
+
+# Baseline format (JSON):
+# {
+#     "scale": { "fonts": 8, "characters_per_font": 500, "images_per_character": 2 },
+#     "benchmarks": {
+#         "casia target images": {
+#             "items": 4000,
+#             "wall_seconds": 4.2,
+#             "cpu_seconds": 4.1,
+#             "bytes_read": 100000,
+#             "bytes_written": 100000,
+#             "items_per_second": 952.4
+#         },
+#     }
+# }
+
+
+import json
+import shutil
+import sys
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from ..casia.step_0_create_target_images import (
+    create_target_images as create_casia_target_images,
+)
+from ..common.create_content_images_from_target_images import (
+    create_content_images_from_target_images,
+)
+from ..common.dataset_shards import ShardedFontDataset, write_dataset_shards
+from ..common.delete_target_images_without_content_image import (
+    delete_target_images_without_content_image,
+)
+from ..common.font_dataset import FontDataset
+from ..common.metrics import record_metrics
+from ..fyp23.step_0_create_content_and_target_images import (
+    create_content_and_target_images as create_fyp23_images,
+)
+from ..neumason.step_0_create_content_and_target_images import (
+    create_content_and_target_images as create_neumason_images,
+)
+from ..util.balance_dataset import balance_dataset
+from ..util.check_file_ext import census_file_types
+from ..util.compare_directories import compare_directories
+from ..util.report_dataset_summary import collect_dataset_statistics
+from ..zhuojg.step_0_create_target_images import (
+    create_target_images as create_zhuojg_target_images,
+)
+from .generate_synthetic_datasets import (
+    generate_synthetic_datasets,
+    neumason_content_font_dir,
+)
+
+
+class Benchmark:
+    name: str
+    # Runs the benchmark in a work directory, and gives the number of items processed,
+    # or None to use the number of items counted by the metrics of the run
+    run: Callable[[Path], int | None]
+    # Prepares the work directory before every repeat (e.g. removes the previous output), without being measured
+    prepare: Callable[[Path], None] | None
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[Path], int | None],
+        prepare: Callable[[Path], None] | None = None,
+    ):
+        self.name = name
+        self.run = run
+        self.prepare = prepare
+
+
+def remove_output_dirs(*output_dirs: str) -> Callable[[Path], None]:
+    def prepare(work_path: Path):
+        for output_dir in output_dirs:
+            if (work_path / output_dir).exists():
+                shutil.rmtree(work_path / output_dir)
+
+    return prepare
+
+
+def count_files(directory: Path) -> int:
+    return sum(1 for path in directory.rglob("*") if path.is_file())
+
+
+def build_benchmarks(
+    source_dirs: dict[str, Path], font_file: str | Path
+) -> list[Benchmark]:
+    # Benchmarks run in order, and the utilities run on the output of the converters
+
+    def run_casia_target_images(work_path: Path):
+        create_casia_target_images(
+            source_dir=source_dirs["casia"],
+            output_target_image_dir=work_path / "casia-dataset" / "TargetImage",
+        )
+
+    def run_casia_content_images(work_path: Path):
+        create_content_images_from_target_images(
+            output_content_image_dir=work_path / "casia-dataset" / "ContentImage",
+            target_image_dir=work_path / "casia-dataset" / "TargetImage",
+            font_dir=font_file,
+            image_size=(128, 128),
+            font_size=100,
+        )
+
+    def run_zhuojg_target_images(work_path: Path):
+        create_zhuojg_target_images(
+            source_dir=source_dirs["zhuojg"],
+            output_target_image_dir=work_path / "zhuojg-dataset" / "TargetImage",
+        )
+
+    def run_fyp23_images(work_path: Path):
+        create_fyp23_images(
+            source_dir=source_dirs["fyp23"],
+            source_wordlist=source_dirs["fyp23"] / "wordlist.txt",
+            output_dir=work_path / "fyp23-dataset",
+        )
+
+    def run_neumason_images(work_path: Path):
+        create_neumason_images(
+            source_dir=source_dirs["neumason"],
+            output_dir=work_path / "neumason-dataset",
+            content_font_dir=neumason_content_font_dir,
+            rejected_font_dirs=[],
+        )
+
+    def run_report_dataset_summary(work_path: Path):
+        dataset_statistics = collect_dataset_statistics(
+            work_path / "zhuojg-dataset" / "TargetImage"
+        )
+        return dataset_statistics["image_count"]
+
+    def run_check_file_ext(work_path: Path):
+        census = census_file_types(source_dirs["zhuojg"])
+        return census["type_counts"].total()
+
+    def prepare_compare_directories(work_path: Path):
+        copied_target_image_path = work_path / "neumason-dataset-copy" / "TargetImage"
+
+        # Copy without the modification times, so that every file is compared by its content
+        if copied_target_image_path.exists():
+            shutil.rmtree(copied_target_image_path)
+        shutil.copytree(
+            work_path / "neumason-dataset" / "TargetImage",
+            copied_target_image_path,
+            copy_function=shutil.copyfile,
+        )
+
+    def run_compare_directories(work_path: Path):
+        target_image_path = work_path / "neumason-dataset" / "TargetImage"
+        copied_target_image_path = work_path / "neumason-dataset-copy" / "TargetImage"
+
+        outer_differences: list[Path] = []
+        inner_differences: list[tuple[Path, Path]] = []
+        uncomparable_files: list[tuple[Path, Path]] = []
+        compare_directories(
+            target_image_path,
+            copied_target_image_path,
+            outer_differences,
+            inner_differences,
+            uncomparable_files,
+        )
+        return count_files(target_image_path)
+
+    def run_balance_dataset(work_path: Path):
+        balance_dataset(
+            work_path / "fyp23-dataset" / "ContentImage",
+            work_path / "fyp23-dataset" / "TargetImage",
+            dry_run=True,
+        )
+        return count_files(work_path / "fyp23-dataset")
+
+    def run_delete_target_images(work_path: Path):
+        delete_target_images_without_content_image(
+            work_path / "neumason-dataset" / "ContentImage",
+            work_path / "neumason-dataset" / "TargetImage",
+            dry_run=True,
+        )
+        return count_files(work_path / "neumason-dataset" / "TargetImage")
+
+    def run_write_dataset_shards(work_path: Path):
+        written_count, _ = write_dataset_shards(
+            work_path / "fyp23-dataset", work_path / "fyp23-dataset-shards"
+        )
+        return written_count
+
+    def run_read_shuffled_shards(work_path: Path):
+        dataset = ShardedFontDataset(work_path / "fyp23-dataset-shards")
+        return sum(1 for _ in dataset)
+
+    def run_read_random_files(work_path: Path):
+        # The same samples as the shards, read one file at a time in random order
+        dataset = FontDataset(work_path / "fyp23-dataset")
+        for index in np.random.default_rng(0).permutation(len(dataset)):
+            dataset[index]
+        return len(dataset)
+
+    benchmarks = [
+        Benchmark(
+            "casia target images",
+            run_casia_target_images,
+            prepare=remove_output_dirs("casia-dataset/TargetImage"),
+        ),
+        Benchmark(
+            "zhuojg target images",
+            run_zhuojg_target_images,
+            prepare=remove_output_dirs("zhuojg-dataset/TargetImage"),
+        ),
+        Benchmark(
+            "fyp23 content and target images",
+            run_fyp23_images,
+            prepare=remove_output_dirs("fyp23-dataset"),
+        ),
+        Benchmark(
+            "neumason content and target images",
+            run_neumason_images,
+            prepare=remove_output_dirs("neumason-dataset"),
+        ),
+        Benchmark("report dataset summary", run_report_dataset_summary),
+        Benchmark("check file ext", run_check_file_ext),
+        Benchmark(
+            "compare directories",
+            run_compare_directories,
+            prepare=prepare_compare_directories,
+        ),
+        Benchmark("balance dataset (dry run)", run_balance_dataset),
+        Benchmark("delete target images (dry run)", run_delete_target_images),
+        Benchmark(
+            "write dataset shards",
+            run_write_dataset_shards,
+            prepare=remove_output_dirs("fyp23-dataset-shards"),
+        ),
+        Benchmark("read shuffled shards", run_read_shuffled_shards),
+        Benchmark("read random image files", run_read_random_files),
+    ]
+
+    # The content font is not part of the repository, so rendering is only benchmarked when it is available
+    if Path(font_file).exists():
+        benchmarks.insert(
+            1,
+            Benchmark(
+                "casia content images",
+                run_casia_content_images,
+                prepare=remove_output_dirs("casia-dataset/ContentImage"),
+            ),
+        )
+    else:
+        print(f"Skipping content image benchmark, font not found: {font_file}")
+
+    return benchmarks
+
+
+def run_benchmark(
+    benchmark: Benchmark, work_path: Path, metrics_path: Path
+) -> dict[str, float | int]:
+    if benchmark.prepare is not None:
+        benchmark.prepare(work_path)
+
+    metrics_name = benchmark.name.replace(" ", "-")
+    with record_metrics(metrics_name, output_prefix=metrics_path / metrics_name) as run:
+        items = benchmark.run(work_path)
+
+    total_metrics = run.stages["total"]
+    if items is None:
+        items = total_metrics.items
+
+    return {
+        "items": items,
+        "wall_seconds": total_metrics.wall_seconds,
+        "cpu_seconds": total_metrics.cpu_seconds,
+        "bytes_read": total_metrics.bytes_read,
+        "bytes_written": total_metrics.bytes_written,
+        "items_per_second": (
+            items / total_metrics.wall_seconds
+            if total_metrics.wall_seconds > 0
+            else 0.0
+        ),
+    }
+
+
+def run_benchmarks(
+    benchmarks: list[Benchmark], work_dir: str | Path, repeats: int = 1
+) -> dict[str, dict[str, float | int]]:
+    # With several repeats, the fastest run of each benchmark is kept,
+    # since noise from other processes only ever makes a run slower
+    work_path = Path(work_dir)
+    metrics_path = work_path / "metrics"
+    metrics_path.mkdir(parents=True, exist_ok=True)
+
+    results: dict[str, dict[str, float | int]] = {}
+
+    for benchmark in benchmarks:
+        print(f"Running benchmark: {benchmark.name}")
+
+        for _ in range(repeats):
+            result = run_benchmark(benchmark, work_path, metrics_path)
+
+            if (
+                benchmark.name not in results
+                or result["items_per_second"]
+                > results[benchmark.name]["items_per_second"]
+            ):
+                results[benchmark.name] = result
+
+    return results
+
+
+def compare_with_baseline(
+    results: dict[str, dict[str, float | int]],
+    baseline_results: dict[str, dict[str, float | int]],
+    tolerance: float = 0.2,
+) -> list[str]:
+    # Gives the benchmarks whose throughput dropped by more than the tolerance
+    regressions = []
+
+    for name, result in results.items():
+        if name not in baseline_results:
+            continue
+
+        baseline_throughput = baseline_results[name]["items_per_second"]
+        throughput = result["items_per_second"]
+
+        if throughput < baseline_throughput * (1 - tolerance):
+            regressions.append(
+                f"{name}: {throughput:.1f} items/s, baseline {baseline_throughput:.1f} items/s "
+                f"({(throughput / baseline_throughput - 1) * 100:+.1f}%)"
+            )
+
+    return regressions
+
+
+def load_baseline(baseline_file: str | Path) -> dict | None:
+    if not Path(baseline_file).exists():
+        return None
+
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_benchmark_results(
+    output_file: str | Path, scale: dict[str, int], results: dict
+):
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(
+            {"scale": scale, "benchmarks": results}, f, ensure_ascii=False, indent=2
+        )
+
+
+def main():
+    work_dir = "benchmark-work"  # Everything in this directory is overwritten
+    results_file = "benchmark-results.json"
+    baseline_file = "benchmark-baseline.json"
+    font_file = "ttf/SourceHanSerifTC-VF.ttf"
+    scale = {"fonts": 8, "characters_per_font": 500, "images_per_character": 2}
+    repeats = 3
+    tolerance = 0.2
+
+    update_baseline = "--update-baseline" in sys.argv[1:]
+
+    if Path(work_dir).exists():
+        shutil.rmtree(work_dir)
+
+    source_dirs = generate_synthetic_datasets(
+        output_dir=Path(work_dir) / "source", **scale
+    )
+
+    results = run_benchmarks(
+        build_benchmarks(source_dirs, font_file),
+        work_dir=Path(work_dir) / "output",
+        repeats=repeats,
+    )
+
+    save_benchmark_results(results_file, scale, results)
+
+    for name, result in results.items():
+        print(
+            f"{name}: {result['items']} items, {result['items_per_second']:.1f} items/s"
+        )
+
+    if update_baseline:
+        save_benchmark_results(baseline_file, scale, results)
+        print(f"Baseline saved to {baseline_file}")
+        return
+
+    baseline = load_baseline(baseline_file)
+
+    if baseline is None:
+        print(
+            f"No baseline found, run with --update-baseline to create {baseline_file}"
+        )
+        return
+
+    if baseline["scale"] != scale:
+        print(f"Baseline was recorded at a different scale: {baseline['scale']}")
+        return
+
+    regressions = compare_with_baseline(results, baseline["benchmarks"], tolerance)
+
+    if regressions:
+        print("Regressions found:")
+        for regression in regressions:
+            print(regression)
+        sys.exit(1)
+
+    print("No regressions found.")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,10 @@
 # │   ├── style_2+char2.png
 
 
+import os
 import struct
+import sys
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Callable, Sequence
 
@@ -23,6 +26,39 @@ import numpy as np
 from PIL import Image
 from tqdm import tqdm
 
+from ..common.dataset_manifest import write_dataset_manifest_for
+from ..common.metrics import (
+    count_bytes_read,
+    count_items,
+    metrics_section,
+    metrics_stage,
+    record_metrics,
+)
+from ..common.output_writer import (
+    encode_image,
+    ensure_dir_exists_with_perms,
+    permissive_umask,
+    save_image,
+    write_output_bytes,
+)
+from ..common.progress_journal import (
+    ProgressJournal,
+    get_journal_path,
+    list_output_names,
+    open_progress_journal,
+)
+from ..common.sharding import (
+    get_shard_path,
+    parse_shard_argument,
+    select_shard,
+    write_shard_report,
+)
+from ..common.streaming_pipeline import (
+    StreamingPipeline,
+    StreamingStage,
+    get_default_encode_workers,
+)
+
 
 class CharacterGlyph:
     sample_size: int
@@ -67,22 +103,6 @@ class CharacterGlyph:
         )
 
 
-def ensure_dir_exists_with_perms(path: str | Path):
-    # Create a Path object
-    base_path = Path(path)
-
-    # Create the directory if it doesn't exist
-    base_path.mkdir(parents=True, exist_ok=True)
-
-    # Change permissions of the base directory itself
-    base_path.chmod(0o777)
-
-    # Traverse up the directory tree and change permissions
-    for parent in base_path.parents:
-        if parent != Path("."):
-            parent.chmod(0o777)
-
-
 def list_gnt_files(source_dir: str | Path):
     source_path = Path(source_dir)
 
@@ -96,11 +116,17 @@ def list_gnt_files(source_dir: str | Path):
 
 
 def generate_target_images_from_gnt_files(
-    output_target_image_dir: str | Path, source_gnt_files: Sequence[str | Path]
+    output_target_image_dir: str | Path,
+    source_gnt_files: Sequence[str | Path],
+    journal: ProgressJournal | None = None,
+    pipeline: StreamingPipeline | None = None,
 ):
     success_characters: set[str] = set()
     skipped_characters: set[str] = set()
 
+    # One listing of the output directory instead of a stat call per GNT file
+    output_font_names = list_output_names(output_target_image_dir)
+
     for source_gnt_file in (
         progress_bar := tqdm(
             source_gnt_files, total=len(source_gnt_files), desc="Processing fonts"
@@ -110,25 +136,66 @@ def generate_target_images_from_gnt_files(
         font_name = f"style_{style_number}"
 
         target_font_path = Path(output_target_image_dir) / font_name
-        target_font_path.mkdir(exist_ok=True)
-        target_font_path.chmod(0o777)
+
+        # GNT files completed by an interrupted run are skipped, unless their font directory is gone
+        unit = Path(source_gnt_file).name
+        if (
+            journal is not None
+            and journal.is_completed(unit)
+            and font_name in output_font_names
+        ):
+            record = journal.get_record(unit)
+            success_characters.update(record["success"])
+            skipped_characters.update(record["skipped"])
+            continue
+
+        ensure_dir_exists_with_perms(target_font_path)
 
         progress_bar.set_postfix({"dir": target_font_path})
 
-        for character_glyph in tqdm(
-            read_gnt_file(source_gnt_file), desc=f"{font_name}", leave=False
-        ):
-            success = save_character(character_glyph, target_font_path, font_name)
-            character = character_glyph.get_character()
+        file_success_characters: set[str] = set()
+        file_skipped_characters: set[str] = set()
+
+        if pipeline is None:
+            results = (
+                (
+                    character_glyph.get_character(),
+                    save_character(character_glyph, target_font_path, font_name),
+                )
+                for character_glyph in read_gnt_file(source_gnt_file)
+            )
+        else:
+            # Reading, encoding and writing the glyphs of the GNT file overlap.
+            # Glyphs finish in any order, so only the last glyph of a character is queued,
+            # and it is the one written, as in the loop above.
+            last_glyph_indices = find_last_glyph_indices(source_gnt_file)
+            results = pipeline.run(
+                (character_glyph, target_font_path, font_name)
+                for index, character_glyph in enumerate(read_gnt_file(source_gnt_file))
+                if index in last_glyph_indices
+            )
+
+        for character, success in tqdm(results, desc=f"{font_name}", leave=False):
+            count_items(1)
 
             if character is not None:
                 remove_null_bytes: Callable[[str], str] = lambda char: char.rstrip(
                     "\x00"
                 )
                 if success:
-                    success_characters.add(remove_null_bytes(character))
+                    file_success_characters.add(remove_null_bytes(character))
                 else:
-                    skipped_characters.add(remove_null_bytes(character))
+                    file_skipped_characters.add(remove_null_bytes(character))
+
+        if journal is not None:
+            journal.record(
+                unit,
+                success=sorted(file_success_characters),
+                skipped=sorted(file_skipped_characters),
+            )
+
+        success_characters.update(file_success_characters)
+        skipped_characters.update(file_skipped_characters)
 
     return success_characters, skipped_characters
 
@@ -137,15 +204,37 @@ def read_gnt_file(file_path: str | Path):
 
     with open(file_path, "rb") as f:
         while True:
-            header = f.read(10)
-            if not header:
-                break
-            sample_size = struct.unpack("<I", header[:4])[0]
+            with metrics_section("parse"):
+                header = f.read(10)
+                if not header:
+                    break
+                sample_size = struct.unpack("<I", header[:4])[0]
+                tag_code = struct.unpack(">H", header[4:6])[0]
+                width = struct.unpack("<H", header[6:8])[0]
+                height = struct.unpack("<H", header[8:10])[0]
+                bitmap = f.read(width * height)
+                character_glyph = CharacterGlyph(
+                    sample_size, tag_code, width, height, bitmap
+                )
+            count_bytes_read(len(header) + len(bitmap))
+            yield character_glyph
+
+
+def find_last_glyph_indices(file_path: str | Path) -> set[int]:
+    # Gives the index of the last glyph of every character in a GNT file, reading only the headers
+    last_glyph_indices: dict[int, int] = {}
+
+    with open(file_path, "rb") as f:
+        index = 0
+        while header := f.read(10):
             tag_code = struct.unpack(">H", header[4:6])[0]
             width = struct.unpack("<H", header[6:8])[0]
             height = struct.unpack("<H", header[8:10])[0]
-            bitmap = f.read(width * height)
-            yield CharacterGlyph(sample_size, tag_code, width, height, bitmap)
+            f.seek(width * height, os.SEEK_CUR)
+            last_glyph_indices[tag_code] = index
+            index += 1
+
+    return set(last_glyph_indices.values())
 
 
 def save_character(
@@ -159,34 +248,141 @@ def save_character(
     img = character_glyph.to_image()
 
     img_file = Path(target_font_path) / f"{font_name}+{chinese_character}.png"
-    img.save(img_file)
-    img_file.chmod(0o777)
+    save_image(img, img_file)
 
     return True
 
 
-def create_target_images(source_dir: str | Path, output_target_image_dir: str | Path):
+def encode_character(
+    task: tuple[CharacterGlyph, Path, str],
+) -> tuple[str | None, Path | None, bytes | None]:
+    # Runs in a worker process of the streaming pipeline
+    character_glyph, target_font_path, font_name = task
+
+    chinese_character = character_glyph.get_chinese_character()
+
+    if not chinese_character:
+        return character_glyph.get_character(), None, None
+
+    img_file = target_font_path / f"{font_name}+{chinese_character}.png"
+    return (
+        character_glyph.get_character(),
+        img_file,
+        encode_image(character_glyph.to_image(), "PNG"),
+    )
+
+
+def write_character(
+    encoded_character: tuple[str | None, Path | None, bytes | None],
+) -> tuple[str | None, bool]:
+    character, img_file, data = encoded_character
+
+    if img_file is None or data is None:
+        return character, False
+
+    write_output_bytes(img_file, data)
+    return character, True
+
+
+def create_streaming_pipeline(encode_workers: int, write_workers: int = 2):
+    return StreamingPipeline(
+        [
+            StreamingStage(
+                "encode", encode_character, workers=encode_workers, use_processes=True
+            ),
+            StreamingStage("write", write_character, workers=write_workers),
+        ]
+    )
+
+
+@metrics_stage("create target images")
+@permissive_umask()
+def create_target_images(
+    source_dir: str | Path,
+    output_target_image_dir: str | Path,
+    journal_file: str | Path | None = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    encode_workers: int | None = None,
+):
+    # With a journal file, a rerun resumes from the GNT files completed by the previous run
+    # With several shards, only the GNT files assigned to this shard are converted
+    # With encode workers, glyphs are encoded in that many processes while the next glyphs are read
+
     ensure_dir_exists_with_perms(output_target_image_dir)
 
     assert Path(source_dir).exists(), f"Source directory {source_dir} does not exist."
 
-    source_gnt_files = list_gnt_files(source_dir)
-
-    success_characters, skipped_characters = generate_target_images_from_gnt_files(
-        output_target_image_dir=output_target_image_dir,
-        source_gnt_files=source_gnt_files,
+    source_gnt_files = select_shard(
+        list_gnt_files(source_dir),
+        shard_index,
+        shard_count,
+        key=lambda source_gnt_file: Path(source_gnt_file).name,
     )
 
+    with (
+        open_progress_journal(
+            journal_file, output_dir=output_target_image_dir
+        ) as journal,
+        (
+            create_streaming_pipeline(encode_workers)
+            if encode_workers
+            else nullcontext()
+        ) as pipeline,
+    ):
+        success_characters, skipped_characters = generate_target_images_from_gnt_files(
+            output_target_image_dir=output_target_image_dir,
+            source_gnt_files=source_gnt_files,
+            journal=journal,
+            pipeline=pipeline,
+        )
+
+        if pipeline is not None:
+            print(pipeline.format_statistics())
+
+    # A shard only sees part of the dataset, so the manifest is written by an unsharded run
+    if shard_count == 1:
+        write_dataset_manifest_for(output_target_image_dir)
+
     return success_characters, skipped_characters
 
 
 def main():
     source_dir = "casia-dataset-source"
     output_target_image_dir = "casia-dataset/TargetImage"
+    # casia-dataset/TargetImage.journal, delete this file to start over
+    journal_file = get_journal_path(output_target_image_dir)
+    report_file = "casia-dataset-target-images.json"
+    metrics_name = "casia-dataset-target-images"
+
+    # Run with "--shard index/count" to convert a part of the dataset on each machine
+    shard_index, shard_count = parse_shard_argument(sys.argv[1:])
+
+    if shard_count > 1:
+        journal_file = get_shard_path(journal_file, shard_index, shard_count)
+        metrics_name = get_shard_path(metrics_name, shard_index, shard_count).name
+
+    with record_metrics(metrics_name, dataset_dir="casia-dataset"):
+        success, skipped = create_target_images(
+            source_dir=source_dir,
+            output_target_image_dir=output_target_image_dir,
+            journal_file=journal_file,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            encode_workers=get_default_encode_workers(),
+        )
 
-    success, skipped = create_target_images(
-        source_dir=source_dir, output_target_image_dir=output_target_image_dir
-    )
+    if shard_count > 1:
+        shard_report_file = get_shard_path(report_file, shard_index, shard_count)
+        write_shard_report(
+            shard_report_file,
+            shard_index,
+            shard_count,
+            success=success,
+            skipped=skipped,
+        )
+        print(f"Shard report written to {shard_report_file}")
+        return
 
     print(f"Skipped characters: {' '.join(skipped)}")
 
@@ -17,6 +17,7 @@
 # │   ├── char2.png
 
 
+from contextlib import nullcontext
 from pathlib import Path
 
 from fontTools.ttLib import TTFont
@@ -24,21 +25,26 @@ from fontTools.ttLib.tables._c_m_a_p import table__c_m_a_p as CmapTable
 from PIL import Image, ImageDraw, ImageFont
 from tqdm import tqdm
 
-
-def ensure_dir_exists_with_perms(path: str | Path):
-    # Create a Path object
-    base_path = Path(path)
-
-    # Create the directory if it doesn't exist
-    base_path.mkdir(parents=True, exist_ok=True)
-
-    # Change permissions of the base directory itself
-    base_path.chmod(0o777)
-
-    # Traverse up the directory tree and change permissions
-    for parent in base_path.parents:
-        if parent != Path("."):
-            parent.chmod(0o777)
+from .dataset_manifest import (
+    load_dataset_manifest_for,
+    write_dataset_manifest_for,
+)
+from .metrics import count_items, metrics_section, metrics_stage, record_metrics
+from .output_writer import (
+    encode_image,
+    ensure_dir_exists_with_perms,
+    is_hidden_file_name,
+    permissive_umask,
+    save_image,
+    write_output_bytes,
+)
+from .progress_journal import (
+    ProgressJournal,
+    list_output_names,
+    open_progress_journal,
+)
+from .sharding import select_shard
+from .streaming_pipeline import StreamingPipeline, StreamingStage, worker_state
 
 
 def parse_target_image_name(target_image_name: str):
@@ -66,9 +72,20 @@ def is_char_in_font(char: str, tt_font: TTFont) -> bool:
     return False
 
 
+@metrics_stage("find required characters")
 def find_required_characters(target_image_dir: str | Path) -> set[str]:
     target_image_path = Path(target_image_dir)
 
+    # The dataset manifest is used instead of scanning the target images when it is up to date
+    manifest = load_dataset_manifest_for(None, target_image_dir)
+    if manifest is not None:
+        image_entries = [
+            (manifest.get_path(entry, target_image_dir), entry.char)
+            for entry in manifest.get_target_images()
+        ]
+        validate_character_names(image_entries)
+        return {char_name for _, char_name in image_entries}
+
     required_characters = set()
 
     total_fonts = len(list(target_image_path.iterdir()))
@@ -85,35 +102,31 @@ def find_required_characters(target_image_dir: str | Path) -> set[str]:
             desc=f"{font_name}",
             leave=False,
         ):
-            if image_file.is_file():
+            if image_file.is_file() and not is_hidden_file_name(image_file.name):
                 _, char_name = parse_target_image_name(image_file.stem)
+                validate_character_names([(image_file, char_name)])
+                required_characters.add(char_name)
 
-                if len(char_name) == 0:
-                    raise ValueError(
-                        f"Empty character name in file: {image_file.as_posix()}"
-                    )
+    return required_characters
 
-                if len(char_name) > 1:
-                    raise ValueError(
-                        f'Character name "{char_name}" should be a single character: {image_file.as_posix()}'
-                    )
 
-                required_characters.add(char_name)
+def validate_character_names(image_entries: list[tuple[Path, str]]):
+    for image_file, char_name in image_entries:
+        if len(char_name) == 0:
+            raise ValueError(f"Empty character name in file: {image_file.as_posix()}")
 
-    return required_characters
+        if len(char_name) > 1:
+            raise ValueError(
+                f'Character name "{char_name}" should be a single character: {image_file.as_posix()}'
+            )
 
 
-def render_character(
+def draw_character_image(
     character: str,
-    output_dir: str | Path,
     image_size: tuple[int, int],
     free_type_font: ImageFont.FreeTypeFont,
-    tt_font: TTFont,
-) -> bool | str:
-    if not is_char_in_font(character, tt_font):
-        return f"Character {character} not found in font."
-
-    try:
+) -> Image.Image:
+    with metrics_section("render"):
         # Create a new image with white background
         image = Image.new("RGB", image_size, "white")
         draw = ImageDraw.Draw(image)
@@ -127,9 +140,24 @@ def render_character(
         # Draw the character on the image
         draw.text((text_x, text_y), character, fill="black", font=free_type_font)
 
+    return image
+
+
+def render_character(
+    character: str,
+    output_dir: str | Path,
+    image_size: tuple[int, int],
+    free_type_font: ImageFont.FreeTypeFont,
+    tt_font: TTFont,
+) -> bool | str:
+    if not is_char_in_font(character, tt_font):
+        return f"Character {character} not found in font."
+
+    try:
+        image = draw_character_image(character, image_size, free_type_font)
+
         # Save the image
-        image.save(output_dir)
-        Path(output_dir).chmod(0o777)
+        save_image(image, output_dir)
 
     except Exception as e:
         return f"Exception in character image generation: {character}, error: {e}"
@@ -137,46 +165,166 @@ def render_character(
     return True
 
 
+def initialize_render_worker(font_path: str | Path, font_size: int):
+    # Each worker process of the streaming pipeline loads the font once
+    worker_state["font"] = load_font(font_path, font_size)
+
+
+def encode_character_image(
+    task: tuple[str, Path, tuple[int, int]],
+) -> tuple[str, Path, bytes | str]:
+    # Runs in a worker process of the streaming pipeline
+    character, output_path, image_size = task
+
+    font_result = worker_state["font"]
+    if not font_result:
+        return character, output_path, "Cannot load font in worker process."
+    free_type_font, tt_font = font_result
+
+    if not is_char_in_font(character, tt_font):
+        return character, output_path, f"Character {character} not found in font."
+
+    try:
+        image = draw_character_image(character, image_size, free_type_font)
+        return character, output_path, encode_image(image, "PNG")
+    except Exception as e:
+        return (
+            character,
+            output_path,
+            f"Exception in character image generation: {character}, error: {e}",
+        )
+
+
+def write_character_image(
+    encoded_character: tuple[str, Path, bytes | str],
+) -> tuple[str, bool | str]:
+    character, output_path, data = encoded_character
+
+    if isinstance(data, str):
+        return character, data
+
+    try:
+        write_output_bytes(output_path, data)
+    except Exception as e:
+        return (
+            character,
+            f"Exception in character image generation: {character}, error: {e}",
+        )
+
+    return character, True
+
+
+def create_streaming_pipeline(
+    font_path: str | Path, font_size: int, encode_workers: int, write_workers: int = 2
+):
+    return StreamingPipeline(
+        [
+            StreamingStage(
+                "render",
+                encode_character_image,
+                workers=encode_workers,
+                use_processes=True,
+                initializer=initialize_render_worker,
+                initargs=(font_path, font_size),
+            ),
+            StreamingStage("write", write_character_image, workers=write_workers),
+        ]
+    )
+
+
 def create_content_images(
     output_content_image_dir: str | Path,
     required_characters: set[str],
     free_type_font: ImageFont.FreeTypeFont,
     tt_font: TTFont,
     image_size: tuple[int, int],
+    journal: ProgressJournal | None = None,
+    pipeline: StreamingPipeline | None = None,
 ):
     successful_characters = set()
     unsuccessful_characters = set()
 
-    for character in (
+    pending_characters: list[tuple[str, Path]] = []
+
+    # One listing of the output directory instead of a stat call per character
+    output_names = list_output_names(output_content_image_dir)
+
+    for character in required_characters:
+        output_path = Path(output_content_image_dir) / f"{character}.png"
+
+        if journal is not None:
+            # Characters completed by an interrupted run are skipped unless their image is gone,
+            # and other characters are rendered again in case their files were partly written
+            if journal.is_completed(character):
+                if not journal.get_record(character)["successful"]:
+                    unsuccessful_characters.add(character)
+                    continue
+                if output_path.name in output_names:
+                    successful_characters.add(character)
+                    continue
+
+        elif output_path.name in output_names:
+            continue
+
+        pending_characters.append((character, output_path))
+
+    if pipeline is None:
+        results = (
+            (
+                character,
+                render_character(
+                    character, output_path, image_size, free_type_font, tt_font
+                ),
+            )
+            for character, output_path in pending_characters
+        )
+    else:
+        # Rendering the next characters overlaps with writing the previous ones
+        results = pipeline.run(
+            (character, output_path, image_size)
+            for character, output_path in pending_characters
+        )
+
+    for character, result in (
         progress_bar := tqdm(
-            required_characters,
-            total=len(required_characters),
+            results,
+            total=len(pending_characters),
             desc="Create content images",
         )
     ):
-        output_path = Path(output_content_image_dir) / f"{character}.png"
+        count_items(1)
 
-        if not output_path.exists():
-            result = render_character(
-                character, output_path, image_size, free_type_font, tt_font
-            )
+        if type(result) is bool:
+            successful_characters.add(character)
+        else:
+            progress_bar.write(result)
+            unsuccessful_characters.add(character)
 
-            if type(result) is bool:
-                successful_characters.add(character)
-            else:
-                progress_bar.write(result)
-                unsuccessful_characters.add(character)
+        if journal is not None:
+            journal.record(character, successful=type(result) is bool)
 
     return successful_characters, unsuccessful_characters
 
 
+@metrics_stage("create content images")
+@permissive_umask()
 def create_content_images_from_target_images(
     output_content_image_dir: str | Path,
     target_image_dir: str | Path,
     font_dir: str | Path,
     image_size: tuple[int, int],
     font_size: int,
+    required_characters: set[str] | None = None,
+    journal_file: str | Path | None = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    encode_workers: int | None = None,
 ):
+    # The required characters can be passed in (e.g. from a previous pipeline stage) to skip scanning target images
+    # With a journal file, a rerun resumes from the characters completed by the previous run
+    # With several shards, only the characters assigned to this shard are rendered
+    # With encode workers, characters are rendered in that many processes while others are written
+
     ensure_dir_exists_with_perms(output_content_image_dir)
 
     font_result = load_font(font_dir, font_size)
@@ -184,19 +332,44 @@ def create_content_images_from_target_images(
         return False
     free_type_font, tt_font = font_result
 
-    required_characters = find_required_characters(target_image_dir)
+    if required_characters is None:
+        required_characters = find_required_characters(target_image_dir)
 
-    successful_characters, unsuccessful_characters = create_content_images(
-        output_content_image_dir=output_content_image_dir,
-        required_characters=required_characters,
-        image_size=image_size,
-        free_type_font=free_type_font,
-        tt_font=tt_font,
+    required_characters = set(
+        select_shard(sorted(required_characters), shard_index, shard_count)
     )
 
+    with (
+        open_progress_journal(
+            journal_file, output_dir=output_content_image_dir
+        ) as journal,
+        (
+            create_streaming_pipeline(font_dir, font_size, encode_workers)
+            if encode_workers
+            else nullcontext()
+        ) as pipeline,
+    ):
+        successful_characters, unsuccessful_characters = create_content_images(
+            output_content_image_dir=output_content_image_dir,
+            required_characters=required_characters,
+            image_size=image_size,
+            free_type_font=free_type_font,
+            tt_font=tt_font,
+            journal=journal,
+            pipeline=pipeline,
+        )
+
+        if pipeline is not None:
+            print(pipeline.format_statistics())
+
+    # A shard only sees part of the dataset, so the manifest is written by an unsharded run
+    if shard_count == 1:
+        write_dataset_manifest_for(output_content_image_dir)
+
     return successful_characters, unsuccessful_characters
 
 
+@record_metrics("xxx-dataset-content-images", dataset_dir="xxx-dataset")
 def main():
     content_image_dir = "xxx-dataset/ContentImage"
     target_image_dir = "xxx-dataset/TargetImage"
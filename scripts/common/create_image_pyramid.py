@@ -0,0 +1,294 @@
+# This script creates copies of a dataset at several resolutions (e.g. 64, 96 and 128 px),
+# for training at more than one image size without resizing the dataset again for every size.
+# Every image is read and decoded once, and resized to every size with an antialiased (Lanczos) filter.
+# An image that already has the requested size is copied without being encoded again.
+# A non-square image (e.g. a CASIA glyph of its native width and height) is not stretched: it is scaled to fit
+# the square size and padded with its background (the median of its border pixels).
+# Directories are processed in parallel, one font (or the content images) per worker process.
+# The size and modification time of every resized image are recorded in each output directory, and images
+# whose record still matches (and whose resized copies exist) are skipped, so an interrupted run can be resumed.
+# Resized copies of images (and fonts) that were removed from the dataset, or that can no longer be resized,
+# are removed on the next run.
+
+# Dataset format:
+# xxx-dataset/
+# ├── ContentImage/
+# │   ├── char1.png
+# ├── TargetImage/
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png
+
+# Output format (one dataset per size, next to the source dataset):
+# xxx-dataset-64px/
+# ├── ContentImage/
+# │   ├── char1.png  <-- 64x64
+# ├── TargetImage/
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png  <-- 64x64
+# │   │   ├── .pyramid-sources.json  <-- {"fontA+char1.png": [size, mtime_ns]} of the source images
+# xxx-dataset-96px/
+# ├── ...
+
+
+import io
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from .dataset_manifest import write_dataset_manifest
+from .metrics import count_bytes_read, count_items, metrics_stage, record_metrics
+from .output_writer import (
+    encode_image,
+    ensure_dir_exists_with_perms,
+    is_hidden_file_name,
+    permissive_umask,
+    write_output_bytes,
+)
+from .recenter_target_images import place_on_canvas
+
+# Other modes (e.g. palette images) are converted to RGB, since they cannot be resized with antialiasing
+resized_image_modes = ["L", "LA", "RGB", "RGBA"]
+
+# A hidden file, so that it is not taken for an image of the dataset
+source_records_file_name = ".pyramid-sources.json"
+
+
+def get_pyramid_dataset_path(dataset_dir: str | Path, size: int) -> Path:
+    dataset_path = Path(dataset_dir).absolute()
+    return dataset_path.with_name(f"{dataset_path.name}-{size}px")
+
+
+def read_source_records(output_dir: Path) -> dict[str, list[int]]:
+    # Gives the size and modification time of the source of every image resized into the directory
+    try:
+        with open(output_dir / source_records_file_name, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def fit_image(image: Image.Image, size: int) -> Image.Image:
+    width, height = image.size
+    scale = size / max(width, height)
+    fitted_width = max(1, round(width * scale))
+    fitted_height = max(1, round(height * scale))
+
+    resized_image = image.resize(
+        (fitted_width, fitted_height), Image.Resampling.LANCZOS
+    )
+    if (fitted_width, fitted_height) == (size, size):
+        return resized_image
+
+    canvas = place_on_canvas(
+        np.asarray(resized_image),
+        (size, size),
+        ((size - fitted_width) // 2, (size - fitted_height) // 2),
+    )
+    return Image.fromarray(canvas)
+
+
+def resize_image_file(source_file: Path, output_files: list[Path], sizes: list[int]):
+    with open(source_file, "rb") as f:
+        data = f.read()
+    count_bytes_read(len(data))
+
+    with Image.open(io.BytesIO(data)) as image:
+        format = (
+            image.format or Image.registered_extensions()[source_file.suffix.lower()]
+        )
+        source_size = image.size
+
+        if image.mode not in resized_image_modes:
+            image = image.convert("RGB")
+        else:
+            image.load()
+
+        for output_file, size in zip(output_files, sizes):
+            if source_size == (size, size):
+                write_output_bytes(output_file, data)
+            else:
+                resized_image = fit_image(image, size)
+                write_output_bytes(output_file, encode_image(resized_image, format))
+
+
+def remove_stale_outputs(output_dir: Path, source_names: set[str]) -> int:
+    # Gives the number of files removed, whose source image is no longer in the dataset
+    removed_count = 0
+
+    for name in os.listdir(output_dir):
+        if name not in source_names and not is_hidden_file_name(name):
+            (output_dir / name).unlink()
+            removed_count += 1
+
+    return removed_count
+
+
+def resize_directory_images(
+    source_dir: Path, output_dirs: list[Path], sizes: list[int]
+) -> tuple[int, int, int, list[Path]]:
+    # Runs in a worker process.
+    # Gives the numbers of resized, skipped and removed images, and the files that failed.
+    resized_count = 0
+    skipped_count = 0
+    failed_files: list[Path] = []
+
+    # A source replaced by another file (even an older one, e.g. copied with its modification time) changes its record
+    previous_records = [read_source_records(output_dir) for output_dir in output_dirs]
+    output_names = [set(os.listdir(output_dir)) for output_dir in output_dirs]
+    source_records: dict[str, list[int]] = {}
+
+    for source_file in sorted(source_dir.iterdir()):
+        if not source_file.is_file() or is_hidden_file_name(source_file.name):
+            continue
+
+        stat_result = source_file.stat()
+        source_record = [stat_result.st_size, stat_result.st_mtime_ns]
+
+        if all(
+            records.get(source_file.name) == source_record and source_file.name in names
+            for records, names in zip(previous_records, output_names)
+        ):
+            source_records[source_file.name] = source_record
+            skipped_count += 1
+            continue
+
+        output_files = [output_dir / source_file.name for output_dir in output_dirs]
+
+        try:
+            resize_image_file(source_file, output_files, sizes)
+            source_records[source_file.name] = source_record
+            resized_count += 1
+        except Exception:
+            failed_files.append(source_file)
+
+    # Outputs of images that failed to be resized are removed too, since they are of an earlier version of the image
+    removed_count = sum(
+        remove_stale_outputs(output_dir, set(source_records))
+        for output_dir in output_dirs
+    )
+
+    for output_dir in output_dirs:
+        write_output_bytes(
+            output_dir / source_records_file_name,
+            json.dumps(source_records, ensure_ascii=False).encode("utf-8"),
+        )
+
+    return resized_count, skipped_count, removed_count, failed_files
+
+
+def list_image_directories(dataset_dir: str | Path) -> list[Path]:
+    # Gives the content image directory and every font directory, relative to the dataset
+    dataset_path = Path(dataset_dir)
+    image_dirs: list[Path] = []
+
+    if (dataset_path / "ContentImage").is_dir():
+        image_dirs.append(Path("ContentImage"))
+
+    if (dataset_path / "TargetImage").is_dir():
+        image_dirs.extend(
+            Path("TargetImage") / font_path.name
+            for font_path in sorted((dataset_path / "TargetImage").iterdir())
+            if font_path.is_dir()
+        )
+
+    return image_dirs
+
+
+@metrics_stage("create image pyramid")
+@permissive_umask()
+def create_image_pyramid(
+    dataset_dir: str | Path,
+    sizes: Sequence[int] = (64, 96, 128),
+    output_dirs: Sequence[str | Path] | None = None,
+    max_workers: int | None = None,
+) -> tuple[list[Path], list[Path]]:
+    # Gives the output dataset directories (one per size) and the images that could not be resized
+    dataset_path = Path(dataset_dir)
+    sizes = list(sizes)
+
+    if output_dirs is None:
+        output_paths = [get_pyramid_dataset_path(dataset_path, size) for size in sizes]
+    else:
+        output_paths = [Path(output_dir) for output_dir in output_dirs]
+
+    if len(output_paths) != len(sizes):
+        raise ValueError("There should be one output directory for every size.")
+
+    image_dirs = list_image_directories(dataset_path)
+
+    # Output directories are created before the workers start.
+    # Output fonts whose font was removed from the dataset are removed with all their images.
+    for output_path in output_paths:
+        ensure_dir_exists_with_perms(output_path / "TargetImage")
+        for image_dir in list_image_directories(output_path):
+            if image_dir not in image_dirs:
+                shutil.rmtree(output_path / image_dir)
+        for image_dir in image_dirs:
+            ensure_dir_exists_with_perms(output_path / image_dir)
+
+    failed_files: list[Path] = []
+    skipped_count = 0
+    removed_count = 0
+
+    # Decoding, resizing and encoding are CPU bound, so directories are resized in worker processes
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        results = executor.map(
+            resize_directory_images,
+            [dataset_path / image_dir for image_dir in image_dirs],
+            [
+                [output_path / image_dir for output_path in output_paths]
+                for image_dir in image_dirs
+            ],
+            repeat(sizes),
+        )
+
+        for (
+            resized_count,
+            directory_skipped_count,
+            directory_removed_count,
+            directory_failed_files,
+        ) in tqdm(results, total=len(image_dirs), desc="Create image pyramid"):
+            count_items(resized_count)
+            skipped_count += directory_skipped_count
+            removed_count += directory_removed_count
+            failed_files.extend(directory_failed_files)
+
+    if skipped_count:
+        print(f"Skipped {skipped_count} images that were already resized")
+
+    if removed_count:
+        print(f"Removed {removed_count} resized images whose image was removed")
+
+    for output_path in output_paths:
+        write_dataset_manifest(output_path)
+
+    return output_paths, failed_files
+
+
+@record_metrics("xxx-dataset-pyramid", dataset_dir="xxx-dataset")
+def main():
+    dataset_dir = "xxx-dataset"
+    sizes = [64, 96, 128]
+
+    output_paths, failed_files = create_image_pyramid(dataset_dir, sizes=sizes)
+
+    for output_path in output_paths:
+        print(f"Dataset written to {output_path.as_posix()}")
+
+    for failed_file in failed_files:
+        print(f"Cannot resize image: {failed_file.as_posix()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+# This script keeps a manifest of every content and target image of a dataset, so that the utilities
+# do not need to walk the dataset and parse every file name again.
+# Each converter writes the manifest when it finishes. The manifest is stale when a directory of the dataset
+# has changed since then (files are added, removed or replaced), which is found from directory modification times.
+# A stale manifest is not used, and it is brought up to date by reading only the directories that have changed.
+
+# Dataset format:
+# xxx-dataset/
+# ├── ContentImage/
+# │   ├── char1.png
+# ├── TargetImage/
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png
+# │   │   ├── fontA+char1+1.png
+
+# Manifest format (numpy .npz), saved next to the dataset (e.g. xxx-dataset.manifest.npz):
+# records: one row per file: kind, font, char, sample, path, size, width, height, format, mode, digest
+#          (font, char, path, format and mode are indices into the string pools below)
+# fonts, characters, paths, formats, modes: string pools
+# directories, directory_mtimes: the directories of the dataset and their modification times
+
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .image_header import image_header_size, parse_image_header
+from .metrics import count_bytes_read, metrics_stage
+from .output_writer import is_hidden_file_name
+
+content_image_dir_name = "ContentImage"
+target_image_dir_name = "TargetImage"
+
+content_kind = 0
+target_kind = 1
+
+record_dtype = np.dtype(
+    [
+        ("kind", "u1"),
+        ("font", "<i4"),  # -1 for content images
+        ("char", "<i4"),  # -1 if the file name cannot be parsed
+        ("sample", "<i4"),
+        ("path", "<i4"),
+        ("size", "<i8"),
+        ("width", "<i4"),  # -1 if the file is not a PNG or GIF image
+        ("height", "<i4"),
+        ("format", "<i4"),
+        ("mode", "<i4"),
+        ("digest", "u1", (16,)),
+    ]
+)
+
+
+class ManifestEntry:
+    kind: int
+    font: str | None
+    char: str | None
+    sample: int
+    path: str  # Relative to the dataset directory
+    size: int
+    width: int
+    height: int
+    format: str
+    mode: str
+    digest: bytes
+
+    def __init__(
+        self,
+        kind: int,
+        font: str | None,
+        char: str | None,
+        sample: int,
+        path: str,
+        size: int,
+        width: int,
+        height: int,
+        format: str,
+        mode: str,
+        digest: bytes,
+    ):
+        self.kind = kind
+        self.font = font
+        self.char = char
+        self.sample = sample
+        self.path = path
+        self.size = size
+        self.width = width
+        self.height = height
+        self.format = format
+        self.mode = mode
+        self.digest = digest
+
+
+class DatasetManifest:
+    dataset_path: Path
+    entries: list[ManifestEntry]
+    # Directory (relative to the dataset directory) -> modification time in nanoseconds
+    directory_mtimes: dict[str, int]
+
+    def __init__(
+        self,
+        dataset_dir: str | Path,
+        entries: list[ManifestEntry],
+        directory_mtimes: dict[str, int],
+    ):
+        self.dataset_path = Path(dataset_dir)
+        self.entries = entries
+        self.directory_mtimes = directory_mtimes
+
+    def is_stale(self) -> bool:
+        return get_directory_mtimes(self.dataset_path) != self.directory_mtimes
+
+    def get_target_fonts(self) -> set[str]:
+        # Includes fonts without any target image
+        return {
+            Path(directory).name
+            for directory in self.directory_mtimes
+            if Path(directory).parent.name == target_image_dir_name
+        }
+
+    def get_content_images(self) -> list[ManifestEntry]:
+        return [entry for entry in self.entries if entry.kind == content_kind]
+
+    def get_target_images(self) -> list[ManifestEntry]:
+        return [entry for entry in self.entries if entry.kind == target_kind]
+
+    def get_path(self, entry: ManifestEntry, image_dir: str | Path) -> Path:
+        # Gives the path of the file under the ContentImage or TargetImage directory as it was passed in
+        return Path(image_dir) / Path(entry.path).relative_to(Path(entry.path).parts[0])
+
+
+def get_manifest_path(dataset_dir: str | Path) -> Path:
+    dataset_path = Path(dataset_dir).absolute()
+    return dataset_path.with_name(f"{dataset_path.name}.manifest.npz")
+
+
+def get_directory_mtimes(dataset_dir: str | Path) -> dict[str, int]:
+    # Adding, removing or replacing a file changes the modification time of its directory
+    dataset_path = Path(dataset_dir)
+    directory_mtimes: dict[str, int] = {}
+
+    for image_dir_name in [content_image_dir_name, target_image_dir_name]:
+        image_path = dataset_path / image_dir_name
+        if not image_path.is_dir():
+            continue
+
+        directory_mtimes[image_dir_name] = image_path.stat().st_mtime_ns
+
+        if image_dir_name == target_image_dir_name:
+            with os.scandir(image_path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        directory_mtimes[f"{image_dir_name}/{entry.name}"] = (
+                            entry.stat().st_mtime_ns
+                        )
+
+    return directory_mtimes
+
+
+def parse_image_name(kind: int, file_name: str) -> tuple[str | None, int]:
+    # Returns (char, sample), with char None if the name cannot be parsed
+    stem = Path(file_name).stem
+
+    if kind == content_kind:
+        return stem, 0
+
+    # Input Format: style+content[+optional-suffix]
+    target_components = stem.split("+")
+    if len(target_components) < 2:
+        return None, 0
+
+    sample = (
+        int(target_components[2])
+        if len(target_components) > 2 and target_components[2].isdigit()
+        else 0
+    )
+    return target_components[1], sample
+
+
+def read_manifest_entry(
+    dataset_path: Path, kind: int, font: str | None, file_path: Path
+) -> ManifestEntry:
+    with open(file_path, "rb") as f:
+        data = f.read()
+    count_bytes_read(len(data))
+
+    image_header = parse_image_header(data[:image_header_size])
+    image_format, width, height, mode = (
+        image_header if image_header is not None else ("", -1, -1, "")
+    )
+
+    char, sample = parse_image_name(kind, file_path.name)
+
+    return ManifestEntry(
+        kind=kind,
+        font=font,
+        char=char,
+        sample=sample,
+        path=file_path.relative_to(dataset_path).as_posix(),
+        size=len(data),
+        width=width,
+        height=height,
+        format=image_format,
+        mode=mode or "",
+        digest=hashlib.blake2b(data, digest_size=16).digest(),
+    )
+
+
+def scan_manifest_directory(dataset_path: Path, directory: str) -> list[ManifestEntry]:
+    if directory == content_image_dir_name:
+        kind, font = content_kind, None
+    else:
+        kind, font = target_kind, Path(directory).name
+
+    with os.scandir(dataset_path / directory) as entries:
+        file_paths = sorted(
+            Path(entry.path)
+            for entry in entries
+            if entry.is_file() and not is_hidden_file_name(entry.name)
+        )
+
+    return [
+        read_manifest_entry(dataset_path, kind, font, file_path)
+        for file_path in file_paths
+    ]
+
+
+def save_dataset_manifest(manifest: DatasetManifest) -> Path:
+    def create_pool(values) -> tuple[list[str], dict[str, int]]:
+        pool = sorted(set(values))
+        return pool, {value: index for index, value in enumerate(pool)}
+
+    fonts, font_indices = create_pool(
+        entry.font for entry in manifest.entries if entry.font is not None
+    )
+    characters, character_indices = create_pool(
+        entry.char for entry in manifest.entries if entry.char is not None
+    )
+    formats, format_indices = create_pool(entry.format for entry in manifest.entries)
+    modes, mode_indices = create_pool(entry.mode for entry in manifest.entries)
+
+    records = np.zeros(len(manifest.entries), dtype=record_dtype)
+    for index, entry in enumerate(manifest.entries):
+        records[index] = (
+            entry.kind,
+            font_indices[entry.font] if entry.font is not None else -1,
+            character_indices[entry.char] if entry.char is not None else -1,
+            entry.sample,
+            index,
+            entry.size,
+            entry.width,
+            entry.height,
+            format_indices[entry.format],
+            mode_indices[entry.mode],
+            np.frombuffer(entry.digest, dtype=np.uint8),
+        )
+
+    manifest_path = get_manifest_path(manifest.dataset_path)
+    temporary_path = manifest_path.with_name(f".{manifest_path.name}.tmp")
+
+    with open(temporary_path, "wb") as f:
+        np.savez(
+            f,
+            records=records,
+            fonts=np.array(fonts, dtype=str),
+            characters=np.array(characters, dtype=str),
+            paths=np.array([entry.path for entry in manifest.entries], dtype=str),
+            formats=np.array(formats, dtype=str),
+            modes=np.array(modes, dtype=str),
+            directories=np.array(list(manifest.directory_mtimes), dtype=str),
+            directory_mtimes=np.array(
+                list(manifest.directory_mtimes.values()), dtype=np.int64
+            ),
+        )
+    os.replace(temporary_path, manifest_path)
+
+    return manifest_path
+
+
+def read_dataset_manifest(dataset_dir: str | Path) -> DatasetManifest | None:
+    # Reads the manifest even if it is stale
+    manifest_path = get_manifest_path(dataset_dir)
+
+    if not manifest_path.exists():
+        return None
+
+    with np.load(manifest_path, allow_pickle=False) as data:
+        records = data["records"]
+        fonts = data["fonts"].tolist()
+        characters = data["characters"].tolist()
+        paths = data["paths"].tolist()
+        formats = data["formats"].tolist()
+        modes = data["modes"].tolist()
+        directory_mtimes = dict(
+            zip(data["directories"].tolist(), data["directory_mtimes"].tolist())
+        )
+
+    entries = [
+        ManifestEntry(
+            kind=int(record["kind"]),
+            font=fonts[record["font"]] if record["font"] >= 0 else None,
+            char=characters[record["char"]] if record["char"] >= 0 else None,
+            sample=int(record["sample"]),
+            path=paths[record["path"]],
+            size=int(record["size"]),
+            width=int(record["width"]),
+            height=int(record["height"]),
+            format=formats[record["format"]],
+            mode=modes[record["mode"]],
+            digest=record["digest"].tobytes(),
+        )
+        for record in records
+    ]
+
+    return DatasetManifest(dataset_dir, entries, directory_mtimes)
+
+
+def load_dataset_manifest(dataset_dir: str | Path) -> DatasetManifest | None:
+    # Gives None if there is no manifest or if it is stale, in which case the dataset should be scanned instead.
+    # A dataset with misnamed target images is also scanned, so that the error is reported as before.
+    manifest = read_dataset_manifest(dataset_dir)
+
+    if manifest is None or manifest.is_stale():
+        return None
+
+    if any(entry.char is None for entry in manifest.get_target_images()):
+        return None
+
+    return manifest
+
+
+def load_dataset_manifest_for(
+    content_image_dir: str | Path | None, target_image_dir: str | Path | None
+) -> DatasetManifest | None:
+    # The manifest is only used when the directories are the ContentImage and TargetImage of one dataset
+    image_dirs = {
+        content_image_dir_name: content_image_dir,
+        target_image_dir_name: target_image_dir,
+    }
+    dataset_paths = set()
+
+    for image_dir_name, image_dir in image_dirs.items():
+        if image_dir is None:
+            continue
+        image_path = Path(image_dir).absolute()
+        if image_path.name != image_dir_name:
+            return None
+        dataset_paths.add(image_path.parent)
+
+    if len(dataset_paths) != 1:
+        return None
+
+    return load_dataset_manifest(dataset_paths.pop())
+
+
+@metrics_stage("write dataset manifest")
+def write_dataset_manifest(
+    dataset_dir: str | Path, max_workers: int | None = None
+) -> DatasetManifest:
+    # Directories that have not changed since the previous manifest are not read again
+    dataset_path = Path(dataset_dir)
+
+    previous_manifest = read_dataset_manifest(dataset_path)
+    previous_entries: dict[str, list[ManifestEntry]] = {}
+    previous_directory_mtimes: dict[str, int] = {}
+
+    if previous_manifest is not None:
+        previous_directory_mtimes = previous_manifest.directory_mtimes
+        for entry in previous_manifest.entries:
+            previous_entries.setdefault(
+                str(Path(entry.path).parent.as_posix()), []
+            ).append(entry)
+
+    directory_mtimes = get_directory_mtimes(dataset_path)
+
+    # The top-level TargetImage directory holds no images, only font directories
+    image_directories = [
+        directory
+        for directory in directory_mtimes
+        if directory != target_image_dir_name
+    ]
+
+    changed_directories = [
+        directory
+        for directory in image_directories
+        if previous_directory_mtimes.get(directory) != directory_mtimes[directory]
+    ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        scanned_entries = dict(
+            zip(
+                changed_directories,
+                executor.map(
+                    lambda directory: scan_manifest_directory(dataset_path, directory),
+                    changed_directories,
+                ),
+            )
+        )
+
+    entries: list[ManifestEntry] = []
+    for directory in image_directories:
+        if directory in scanned_entries:
+            entries.extend(scanned_entries[directory])
+        else:
+            entries.extend(previous_entries.get(directory, []))
+
+    # A directory changed while it was read is read again next time
+    directory_mtimes = {
+        directory: mtime
+        for directory, mtime in directory_mtimes.items()
+        if get_directory_mtime(dataset_path / directory) == mtime
+    }
+
+    manifest = DatasetManifest(dataset_path, entries, directory_mtimes)
+    save_dataset_manifest(manifest)
+
+    return manifest
+
+
+def get_directory_mtime(directory: Path) -> int | None:
+    try:
+        return directory.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def write_dataset_manifest_for(image_dir: str | Path) -> DatasetManifest | None:
+    # Converters write to the ContentImage or TargetImage directory of a dataset.
+    # A manifest is only written for this standard layout.
+    image_path = Path(image_dir).absolute()
+
+    if image_path.name not in [content_image_dir_name, target_image_dir_name]:
+        return None
+
+    return write_dataset_manifest(image_path.parent)
+
+
+def remove_from_dataset_manifest(
+    dataset_dir: str | Path, removed_files: list[str | Path]
+) -> DatasetManifest | None:
+    # After files are removed from a dataset, its manifest is updated without reading the dataset again.
+    # The manifest is only updated if it was up to date except for the removed directories.
+    manifest = read_dataset_manifest(dataset_dir)
+    if manifest is None:
+        return None
+
+    dataset_path = Path(dataset_dir).absolute()
+    removed_paths = {
+        Path(file).absolute().relative_to(dataset_path).as_posix()
+        for file in removed_files
+    }
+    removed_directories = {Path(path).parent.as_posix() for path in removed_paths}
+
+    directory_mtimes = get_directory_mtimes(dataset_dir)
+    for directory, mtime in manifest.directory_mtimes.items():
+        if (
+            directory not in removed_directories
+            and directory_mtimes.get(directory) != mtime
+        ):
+            return None
+
+    manifest.entries = [
+        entry for entry in manifest.entries if entry.path not in removed_paths
+    ]
+    manifest.directory_mtimes = directory_mtimes
+    save_dataset_manifest(manifest)
+
+    return manifest
@@ -0,0 +1,361 @@
+# This script packs a prepared dataset into tar shards, and reads the shards back as a shuffled stream of samples
+# for training, where reading millions of small files in random order is slow on a shared file system.
+# Samples are shuffled (with a seed) before they are written, so every shard holds a mix of fonts and characters.
+# When reading, every shard is read from start to end, and samples are shuffled again through a bounded buffer.
+# Shards are divided between data loader workers by worker index, in an order that depends only on the seed
+# and the epoch, so that every sample is read by exactly one worker in every epoch.
+# Content images are small in number and shared by every font, so they are written to one tar file
+# that each worker reads into memory once.
+
+# Dataset format:
+# xxx-dataset/
+# ├── ContentImage/
+# │   ├── char1.png
+# ├── TargetImage/
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png
+
+# Output format:
+# xxx-dataset-shards/
+# ├── shards.json  <-- written last: { "sample_count": 2, "seed": 0, "shards": [{ "file": "target-00000.tar", "samples": 2 }] }
+# ├── content.tar  <-- ContentImage/char1.png, ...
+# ├── target-00000.tar  <-- TargetImage/fontA/fontA+char1.png, ...
+# ├── target-00001.tar
+
+# Usage (e.g. in the __iter__ of a torch IterableDataset, with the worker index and count from get_worker_info()):
+# dataset = ShardedFontDataset("xxx-dataset-shards", seed=0, worker_index=0, worker_count=1)
+# dataset.set_epoch(epoch)
+# for content_image, target_image, font, char in dataset:
+#     ...
+
+
+import io
+import json
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from .dataset_manifest import parse_image_name, target_kind
+from .font_dataset import FontSample, index_dataset
+from .metrics import count_bytes_read, count_items, metrics_stage, record_metrics
+from .output_writer import (
+    ensure_dir_exists_with_perms,
+    permissive_umask,
+    write_output_bytes,
+)
+
+shard_index_file_name = "shards.json"
+content_shard_file_name = "content.tar"
+
+tar_block_size = 512
+tar_zero_block = bytes(tar_block_size)
+
+
+def get_target_shard_file_name(shard_number: int) -> str:
+    return f"target-{shard_number:05d}.tar"
+
+
+def pack_tar(files: list[tuple[str, Path]]) -> bytes:
+    # Members get fixed owners, permissions and modification times, so the same files always give the same shard
+    buffer = io.BytesIO()
+
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+        for member_name, path in files:
+            with open(path, "rb") as f:
+                data = f.read()
+            count_bytes_read(len(data))
+
+            member = tarfile.TarInfo(member_name)
+            member.size = len(data)
+            member.mode = 0o644
+            tar.addfile(member, io.BytesIO(data))
+
+    return buffer.getvalue()
+
+
+def write_shard(shard_file: Path, files: list[tuple[str, Path]]) -> int:
+    write_output_bytes(shard_file, pack_tar(files))
+    return len(files)
+
+
+@metrics_stage("write dataset shards")
+@permissive_umask()
+def write_dataset_shards(
+    dataset_dir: str | Path,
+    output_dir: str | Path,
+    samples_per_shard: int = 5000,
+    seed: int = 0,
+    max_workers: int | None = None,
+) -> tuple[int, int]:
+    # Gives the numbers of samples written and of samples left out for having no content image
+    dataset_path = Path(dataset_dir)
+    output_path = Path(output_dir)
+
+    samples, content_paths = index_dataset(dataset_path)
+
+    paired_samples = [sample for sample in samples if sample.char in content_paths]
+    unpaired_count = len(samples) - len(paired_samples)
+
+    order = np.random.default_rng(seed).permutation(len(paired_samples))
+    shuffled_samples = [paired_samples[index] for index in order]
+
+    shard_samples: list[list[FontSample]] = [
+        shuffled_samples[i : i + samples_per_shard]
+        for i in range(0, len(shuffled_samples), samples_per_shard)
+    ]
+
+    ensure_dir_exists_with_perms(output_path)
+
+    # The shard index is removed first, so that an interrupted run is never read as complete
+    (output_path / shard_index_file_name).unlink(missing_ok=True)
+    for old_shard_file in output_path.glob("target-*.tar"):
+        old_shard_file.unlink()
+
+    content_files = [
+        (path.relative_to(dataset_path).as_posix(), path)
+        for _, path in sorted(content_paths.items())
+    ]
+    write_shard(output_path / content_shard_file_name, content_files)
+
+    # Shards are written by threads, since most of the time is spent reading files
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        written_counts = executor.map(
+            write_shard,
+            [
+                output_path / get_target_shard_file_name(shard_number)
+                for shard_number in range(len(shard_samples))
+            ],
+            [
+                [
+                    (sample.path.relative_to(dataset_path).as_posix(), sample.path)
+                    for sample in samples_of_shard
+                ]
+                for samples_of_shard in shard_samples
+            ],
+        )
+
+        for written_count in tqdm(
+            written_counts, total=len(shard_samples), desc="Write shards"
+        ):
+            count_items(written_count)
+
+    shard_index = {
+        "sample_count": len(shuffled_samples),
+        "seed": seed,
+        "shards": [
+            {
+                "file": get_target_shard_file_name(shard_number),
+                "samples": len(samples_of_shard),
+            }
+            for shard_number, samples_of_shard in enumerate(shard_samples)
+        ],
+    }
+    write_output_bytes(
+        output_path / shard_index_file_name,
+        json.dumps(shard_index, ensure_ascii=False, indent=2).encode("utf-8"),
+    )
+
+    return len(shuffled_samples), unpaired_count
+
+
+def read_shard_index(shard_dir: str | Path) -> dict:
+    with open(Path(shard_dir) / shard_index_file_name, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_tar_members(tar_file: str | Path) -> Iterator[tuple[str, bytes]]:
+    # The shard is read with one sequential read, and only the name, size and type of each member are parsed.
+    # (tarfile parses every field of every header, which took as long as decoding the images.)
+    # Regular files of ustar archives are given, with names from PAX or GNU long name headers.
+    with open(tar_file, "rb") as f:
+        data = f.read()
+    count_bytes_read(len(data))
+
+    offset = 0
+    long_name: str | None = None
+
+    while offset + tar_block_size <= len(data):
+        header = data[offset : offset + tar_block_size]
+        if header == tar_zero_block:
+            break
+
+        size_field = header[124:136]
+        if size_field[0] & 0x80:
+            raise ValueError(f"Member too large to read in {tar_file}")
+        size = int(size_field.split(b"\0", 1)[0].strip() or b"0", 8)
+
+        type_flag = header[156:157]
+        body_offset = offset + tar_block_size
+        body = data[body_offset : body_offset + size]
+        offset = body_offset + -(-size // tar_block_size) * tar_block_size
+
+        if type_flag == b"x":
+            long_name = parse_pax_path(body)
+        elif type_flag == b"L":
+            long_name = body.split(b"\0", 1)[0].decode("utf-8")
+        else:
+            if type_flag in (b"0", b"\0"):
+                yield long_name or parse_ustar_name(header), body
+            long_name = None
+
+
+def parse_ustar_name(header: bytes) -> str:
+    name = header[0:100].split(b"\0", 1)[0]
+    if header[257:262] == b"ustar":
+        prefix = header[345:500].split(b"\0", 1)[0]
+        if prefix:
+            name = prefix + b"/" + name
+    return name.decode("utf-8")
+
+
+def parse_pax_path(body: bytes) -> str | None:
+    # Records are "<length> <key>=<value>\n", where the length counts the whole record
+    offset = 0
+    while offset < len(body):
+        space = body.index(b" ", offset)
+        length = int(body[offset:space])
+        key, value = body[space + 1 : offset + length - 1].split(b"=", 1)
+        if key == b"path":
+            return value.decode("utf-8")
+        offset += length
+    return None
+
+
+def decode_image(data: bytes, image_mode: str | None) -> np.ndarray:
+    with Image.open(io.BytesIO(data)) as image:
+        if image_mode is not None and image.mode != image_mode:
+            return np.asarray(image.convert(image_mode))
+        return np.asarray(image)
+
+
+class ShardedFontDataset:
+    shard_path: Path
+    shard_files: list[str]
+    sample_count: int
+    seed: int
+    epoch: int
+    shuffle_buffer_size: int
+    worker_index: int
+    worker_count: int
+    image_mode: str | None
+    content_images: (
+        dict[str, bytes] | None
+    )  # Character -> encoded image, read on first use
+    decoded_content_images: dict[str, np.ndarray]
+
+    def __init__(
+        self,
+        shard_dir: str | Path,
+        seed: int = 0,
+        shuffle_buffer_size: int = 10000,
+        worker_index: int = 0,
+        worker_count: int = 1,
+        image_mode: str | None = "L",
+    ):
+        if not 0 <= worker_index < worker_count:
+            raise ValueError(
+                f"Worker index {worker_index} should be between 0 and {worker_count - 1}."
+            )
+
+        self.shard_path = Path(shard_dir)
+        self.seed = seed
+        self.epoch = 0
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        self.image_mode = image_mode
+
+        shard_index = read_shard_index(self.shard_path)
+        self.shard_files = [shard["file"] for shard in shard_index["shards"]]
+        self.sample_count = shard_index["sample_count"]
+
+        self.content_images = None
+        self.decoded_content_images = {}
+
+    def set_epoch(self, epoch: int):
+        # Every epoch reads the shards in a different order, and shuffles the samples differently
+        self.epoch = epoch
+
+    def get_worker_shard_files(self) -> list[str]:
+        # Shards are dealt to the workers in turn, after shuffling the shards in the same way in every worker
+        order = np.random.default_rng([self.seed, self.epoch]).permutation(
+            len(self.shard_files)
+        )
+        shard_files = [self.shard_files[index] for index in order]
+        return shard_files[self.worker_index :: self.worker_count]
+
+    def get_content_image(self, char: str) -> np.ndarray:
+        if self.content_images is None:
+            self.content_images = {
+                Path(member_name).stem: data
+                for member_name, data in read_tar_members(
+                    self.shard_path / content_shard_file_name
+                )
+            }
+
+        content_image = self.decoded_content_images.get(char)
+        if content_image is None:
+            content_image = decode_image(self.content_images[char], self.image_mode)
+            content_image.setflags(write=False)
+            self.decoded_content_images[char] = content_image
+
+        return content_image
+
+    def read_samples(self) -> Iterator[tuple[str, str, bytes]]:
+        # Gives (font, char, encoded target image) in the order of the shards
+        for shard_file in self.get_worker_shard_files():
+            for member_name, data in read_tar_members(self.shard_path / shard_file):
+                member_path = Path(member_name)
+                char, _ = parse_image_name(target_kind, member_path.name)
+                if char is not None:
+                    yield member_path.parent.name, char, data
+
+    def __iter__(self) -> Iterator[tuple[np.ndarray, np.ndarray, str, str]]:
+        # Encoded samples are kept in the buffer, and only decoded when they are given out
+        rng = np.random.default_rng([self.seed, self.epoch, self.worker_index])
+        buffer: list[tuple[str, str, bytes]] = []
+
+        for sample in self.read_samples():
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(sample)
+                continue
+
+            index = int(rng.integers(len(buffer)))
+            buffer[index], sample = sample, buffer[index]
+            yield self.decode_sample(sample)
+
+        for index in rng.permutation(len(buffer)):
+            yield self.decode_sample(buffer[index])
+
+    def decode_sample(
+        self, sample: tuple[str, str, bytes]
+    ) -> tuple[np.ndarray, np.ndarray, str, str]:
+        font, char, data = sample
+        target_image = decode_image(data, self.image_mode)
+        return self.get_content_image(char), target_image, font, char
+
+
+@record_metrics("xxx-dataset-shards", dataset_dir="xxx-dataset")
+def main():
+    dataset_dir = "xxx-dataset"
+    output_dir = "xxx-dataset-shards"
+    samples_per_shard = 5000
+    seed = 0
+
+    written_count, unpaired_count = write_dataset_shards(
+        dataset_dir, output_dir, samples_per_shard=samples_per_shard, seed=seed
+    )
+
+    print(f"{written_count} samples written to {output_dir}")
+
+    if unpaired_count:
+        print(f"{unpaired_count} target images without a content image were left out")
+
+
+if __name__ == "__main__":
+    main()
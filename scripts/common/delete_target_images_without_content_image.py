@@ -1,10 +1,21 @@
 # In the scenario that content images are generated from target images, but some characters failed to generate into content images.
 # This script detects and deletes target images that do not have corresponding content images.
+# Images listed in invalid_image_list (e.g. the quarantine list of validate_glyph_images.py) are treated as missing:
+# an invalid content image removes the target images of its character, and invalid target images are removed.
 
 from pathlib import Path
 
 from tqdm import tqdm
 
+from .dataset_manifest import (
+    DatasetManifest,
+    load_dataset_manifest_for,
+    remove_from_dataset_manifest,
+)
+from .file_deletion import is_excluded_file, read_excluded_files, remove_files
+from .metrics import metrics_stage, record_metrics
+from .output_writer import is_hidden_file_name
+
 
 def parse_target_image_name(target_image_name: str):
     # Input Format: style+content[+optional-suffix]
@@ -14,62 +25,163 @@ def parse_target_image_name(target_image_name: str):
     return style, content
 
 
-def find_preserved_characters(content_image_dir: str | Path) -> set[str]:
+def find_preserved_characters(
+    content_image_dir: str | Path,
+    manifest: DatasetManifest | None = None,
+    invalid_files: set[Path] | None = None,
+) -> set[str]:
+    invalid_files = invalid_files or set()
+
+    if manifest is not None:
+        return {
+            entry.char
+            for entry in manifest.get_content_images()
+            if not is_excluded_file(
+                manifest.get_path(entry, content_image_dir), invalid_files
+            )
+        }
+
     content_image_path = Path(content_image_dir)
 
     preserved_characters = set()
 
     for image_file in content_image_path.iterdir():
-        preserved_characters.add(image_file.stem)
+        if not is_hidden_file_name(image_file.name) and not is_excluded_file(
+            image_file, invalid_files
+        ):
+            preserved_characters.add(image_file.stem)
 
     return preserved_characters
 
 
-def delete_failed_characters(
-    target_image_dir: str | Path, preserved_characters: set[str]
-) -> set[str]:
+def find_failed_target_images(
+    target_image_dir: str | Path,
+    preserved_characters: set[str],
+    manifest: DatasetManifest | None = None,
+    invalid_files: set[Path] | None = None,
+) -> tuple[list[Path], set[str]]:
+    invalid_files = invalid_files or set()
     target_image_path = Path(target_image_dir)
 
-    delete_count = 0
+    removed_files: list[Path] = []
     removed_characters = set()
 
+    if manifest is not None:
+        for entry in manifest.get_target_images():
+            file = manifest.get_path(entry, target_image_dir)
+            if entry.char not in preserved_characters:
+                removed_files.append(file)
+                removed_characters.add(entry.char)
+            elif is_excluded_file(file, invalid_files):
+                removed_files.append(file)
+        return removed_files, removed_characters
+
     for font_dir in target_image_path.iterdir():
         total_files = len(list(font_dir.iterdir()))
         for target_image_file in tqdm(
             font_dir.iterdir(), total=total_files, desc="Validating target images"
         ):
-            if target_image_file.is_file():
+            if target_image_file.is_file() and not is_hidden_file_name(
+                target_image_file.name
+            ):
                 target_image_name = target_image_file.stem
                 _, char_name = parse_target_image_name(target_image_name)
 
                 if char_name not in preserved_characters:
-                    print(f"Deleting {target_image_file}")
-                    target_image_file.unlink()
-                    delete_count += 1
+                    removed_files.append(target_image_file)
                     removed_characters.add(char_name)
+                elif is_excluded_file(target_image_file, invalid_files):
+                    removed_files.append(target_image_file)
+
+    return removed_files, removed_characters
+
+
+def delete_failed_characters(
+    target_image_dir: str | Path,
+    preserved_characters: set[str],
+    dry_run: bool = False,
+    plan_file: str | Path | None = None,
+    quarantine_dir: str | Path | None = None,
+    max_workers: int | None = None,
+    manifest: DatasetManifest | None = None,
+    invalid_files: set[Path] | None = None,
+) -> set[str]:
+    removed_files, removed_characters = find_failed_target_images(
+        target_image_dir=target_image_dir,
+        preserved_characters=preserved_characters,
+        manifest=manifest,
+        invalid_files=invalid_files,
+    )
+
+    removed_files = remove_files(
+        removed_files,
+        root_dir=target_image_dir,
+        dry_run=dry_run,
+        plan_file=plan_file,
+        quarantine_dir=quarantine_dir,
+        max_workers=max_workers,
+    )
+
+    # Files that could not be removed are kept in the manifest
+    if manifest is not None and not dry_run:
+        remove_from_dataset_manifest(manifest.dataset_path, removed_files)
 
     return removed_characters
 
 
+@metrics_stage("delete target images without content image")
 def delete_target_images_without_content_image(
-    content_image_dir: str | Path, target_image_dir: str | Path
+    content_image_dir: str | Path,
+    target_image_dir: str | Path,
+    dry_run: bool = False,
+    plan_file: str | Path | None = None,
+    quarantine_dir: str | Path | None = None,
+    max_workers: int | None = None,
+    invalid_image_list: str | Path | None = None,
 ):
-    preserved_characters = find_preserved_characters(content_image_dir)
+    # The dataset manifest is used instead of scanning the dataset when it is up to date
+    manifest = load_dataset_manifest_for(content_image_dir, target_image_dir)
+
+    invalid_files = read_excluded_files(invalid_image_list)
+
+    preserved_characters = find_preserved_characters(
+        content_image_dir, manifest, invalid_files
+    )
 
     removed_characters = delete_failed_characters(
         target_image_dir=target_image_dir,
         preserved_characters=preserved_characters,
+        dry_run=dry_run,
+        plan_file=plan_file,
+        quarantine_dir=quarantine_dir,
+        max_workers=max_workers,
+        manifest=manifest,
+        invalid_files=invalid_files,
     )
 
     return preserved_characters, removed_characters
 
 
+@record_metrics("xxx-dataset-deletion", dataset_dir="xxx-dataset")
 def main():
     content_image_dir = "xxx-dataset/ContentImage"
     target_image_dir = "xxx-dataset/TargetImage"
 
+    # Set dry_run to only write the plan file, or set quarantine_dir to move files instead of deleting them
+    dry_run = False
+    plan_file = "xxx-dataset-deletion-plan.txt"
+    quarantine_dir = None
+
+    # Set to the quarantine list of validate_glyph_images.py to treat invalid images as missing
+    invalid_image_list = None
+
     preserved, removed = delete_target_images_without_content_image(
-        content_image_dir, target_image_dir
+        content_image_dir,
+        target_image_dir,
+        dry_run=dry_run,
+        plan_file=plan_file,
+        quarantine_dir=quarantine_dir,
+        invalid_image_list=invalid_image_list,
     )
 
     print(f"Removed characters: {', '.join(removed)}")
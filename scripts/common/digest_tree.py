@@ -0,0 +1,188 @@
+# This script computes a Merkle-style digest tree of a directory, such as a dataset.
+# Each file has a content digest and each directory has a digest of its entries,
+# so two trees with equal directory digests have equal contents.
+# The tree is saved next to the directory (e.g. xxx-dataset.digest-tree.json next to xxx-dataset/)
+# and reused on the next build, so that only files with a changed size or modification time are read again.
+
+# Tree format (JSON):
+# {
+#     "digest": "...",
+#     "files": {
+#         "file1.png": [size, mtime_ns, digest],
+#     },
+#     "dirs": {
+#         "fontA": { "digest": "...", "files": {...}, "dirs": {...} },
+#     },
+# }
+
+
+import filecmp
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .file_digest import hash_file
+
+DigestTree = dict
+
+
+def get_digest_tree_path(directory: str | Path) -> Path:
+    directory_path = Path(directory).absolute()
+    return directory_path.with_name(f"{directory_path.name}.digest-tree.json")
+
+
+def load_digest_tree(directory: str | Path) -> DigestTree | None:
+    tree_path = get_digest_tree_path(directory)
+
+    if not tree_path.exists():
+        return None
+
+    try:
+        with open(tree_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable digest tree {tree_path}: {e}")
+        return None
+
+
+def save_digest_tree(directory: str | Path, tree: DigestTree) -> None:
+    tree_path = get_digest_tree_path(directory)
+
+    temporary_path = tree_path.with_name(f".{tree_path.name}.tmp")
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(tree, f, ensure_ascii=False)
+    os.replace(temporary_path, tree_path)
+
+
+def scan_directory_tree(
+    directory: Path,
+    previous_tree: DigestTree | None,
+    files_to_hash: list[tuple[dict, str, Path, os.stat_result]],
+) -> DigestTree:
+    previous_files = previous_tree["files"] if previous_tree else {}
+    previous_dirs = previous_tree["dirs"] if previous_tree else {}
+
+    tree: DigestTree = {"digest": None, "files": {}, "dirs": {}}
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name in filecmp.DEFAULT_IGNORES:
+                continue
+
+            if entry.is_dir():
+                tree["dirs"][entry.name] = scan_directory_tree(
+                    Path(entry.path), previous_dirs.get(entry.name), files_to_hash
+                )
+
+            elif entry.is_file():
+                stat_result = entry.stat()
+                previous_file = previous_files.get(entry.name)
+
+                if (
+                    previous_file is not None
+                    and previous_file[0] == stat_result.st_size
+                    and previous_file[1] == stat_result.st_mtime_ns
+                ):
+                    tree["files"][entry.name] = previous_file
+                else:
+                    files_to_hash.append(
+                        (tree["files"], entry.name, Path(entry.path), stat_result)
+                    )
+
+    return tree
+
+
+def compute_directory_digests(tree: DigestTree) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+
+    for name in sorted(tree["files"]):
+        digest.update(f"f\0{name}\0{tree['files'][name][2]}\n".encode())
+
+    for name in sorted(tree["dirs"]):
+        subtree_digest = compute_directory_digests(tree["dirs"][name])
+        digest.update(f"d\0{name}\0{subtree_digest}\n".encode())
+
+    tree["digest"] = digest.hexdigest()
+
+    return tree["digest"]
+
+
+def build_digest_tree(
+    directory: str | Path,
+    previous_tree: DigestTree | None = None,
+    max_workers: int | None = None,
+) -> DigestTree:
+    files_to_hash: list[tuple[dict, str, Path, os.stat_result]] = []
+
+    tree = scan_directory_tree(Path(directory), previous_tree, files_to_hash)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = executor.map(
+            hash_file, [file_path for _, _, file_path, _ in files_to_hash]
+        )
+
+        for (files, name, _, stat_result), digest in zip(files_to_hash, digests):
+            files[name] = [stat_result.st_size, stat_result.st_mtime_ns, digest]
+
+    compute_directory_digests(tree)
+
+    return tree
+
+
+def update_digest_tree(
+    directory: str | Path, refresh: bool = True, max_workers: int | None = None
+) -> DigestTree:
+    # Without refresh, a saved tree is trusted as is and the directory is not scanned
+
+    previous_tree = load_digest_tree(directory)
+
+    if previous_tree is not None and not refresh:
+        return previous_tree
+
+    tree = build_digest_tree(directory, previous_tree, max_workers=max_workers)
+
+    if tree != previous_tree:
+        save_digest_tree(directory, tree)
+
+    return tree
+
+
+def diff_digest_trees(
+    dir1: Path,
+    dir2: Path,
+    tree1: DigestTree,
+    tree2: DigestTree,
+    outer_differences: list[Path],
+    changed_files: list[tuple[Path, Path]],
+    uncomparable_files: list[tuple[Path, Path]],
+) -> None:
+    # Subtrees with equal digests are skipped without looking at their contents
+    if tree1["digest"] == tree2["digest"]:
+        return
+
+    names1 = tree1["files"].keys() | tree1["dirs"].keys()
+    names2 = tree2["files"].keys() | tree2["dirs"].keys()
+
+    outer_differences.extend(
+        [dir1 / name for name in names1 - names2]
+        + [dir2 / name for name in names2 - names1]
+    )
+
+    for name in names1 & names2:
+        if name in tree1["dirs"] and name in tree2["dirs"]:
+            diff_digest_trees(
+                dir1 / name,
+                dir2 / name,
+                tree1["dirs"][name],
+                tree2["dirs"][name],
+                outer_differences,
+                changed_files,
+                uncomparable_files,
+            )
+        elif name in tree1["files"] and name in tree2["files"]:
+            if tree1["files"][name][2] != tree2["files"][name][2]:
+                changed_files.append((dir1 / name, dir2 / name))
+        else:
+            uncomparable_files.append((dir1 / name, dir2 / name))
@@ -0,0 +1,241 @@
+# This script removes many dataset files at once.
+# Files can be deleted in parallel, moved into a quarantine directory, or only listed in a plan file (dry run).
+# A file is never moved over a file already in quarantine (e.g. from an earlier run); it is reported as failed instead.
+
+# Quarantine format (relative paths under the root directory are preserved):
+# quarantine/
+# ├── fontA/
+# │   ├── fontA+char1.png
+# ├── fontB/
+# │   ├── fontB+char1.png
+
+
+import errno
+import os
+import shutil
+import stat
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Sequence
+
+from .metrics import count_items, metrics_stage
+
+unlink_chunk_size = 512
+
+
+def write_deletion_plan(plan_file: str | Path, files: Iterable[str | Path]) -> None:
+    plan_path = Path(plan_file)
+    plan_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(plan_path, "w", encoding="utf-8") as f:
+        for file in sorted(Path(file).as_posix() for file in files):
+            f.write(f"{file}\n")
+
+
+def read_deletion_plan(plan_file: str | Path) -> list[Path]:
+    with open(plan_file, "r", encoding="utf-8") as f:
+        return [Path(line.rstrip("\n")) for line in f if line.strip()]
+
+
+def read_excluded_files(list_file: str | Path | None) -> set[Path]:
+    # Reads a file list in the deletion plan format (e.g. a quarantine list of invalid images) as absolute paths
+    if list_file is None:
+        return set()
+    return {file.absolute() for file in read_deletion_plan(list_file)}
+
+
+def is_excluded_file(file: str | Path, excluded_files: set[Path]) -> bool:
+    return bool(excluded_files) and Path(file).absolute() in excluded_files
+
+
+def group_files_by_directory(files: Iterable[str | Path]) -> dict[Path, list[Path]]:
+    files_by_directory: dict[Path, list[Path]] = defaultdict(list)
+
+    for file in files:
+        file_path = Path(file)
+        files_by_directory[file_path.parent].append(file_path)
+
+    return files_by_directory
+
+
+def unlink_file_chunk(files: Sequence[Path]) -> list[tuple[Path, OSError]]:
+    failures: list[tuple[Path, OSError]] = []
+
+    for file in files:
+        try:
+            os.unlink(file)
+        except OSError as e:
+            failures.append((file, e))
+
+    return failures
+
+
+def unlink_files(
+    files: Sequence[str | Path], max_workers: int | None = None
+) -> list[tuple[Path, OSError]]:
+    file_paths = [Path(file) for file in files]
+
+    chunks = [
+        file_paths[i : i + unlink_chunk_size]
+        for i in range(0, len(file_paths), unlink_chunk_size)
+    ]
+
+    failures: list[tuple[Path, OSError]] = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk_failures in executor.map(unlink_file_chunk, chunks):
+            failures.extend(chunk_failures)
+
+    return failures
+
+
+def move_file_chunk(
+    files: Sequence[Path], destination_dir: Path
+) -> list[tuple[Path, OSError]]:
+    failures: list[tuple[Path, OSError]] = []
+
+    for file in files:
+        try:
+            move_file(file, destination_dir / file.name)
+        except OSError as e:
+            failures.append((file, e))
+
+    return failures
+
+
+def move_file(file: Path, destination: Path):
+    if destination.exists():
+        raise FileExistsError(
+            errno.EEXIST, "File already exists in the destination", str(destination)
+        )
+
+    try:
+        file.rename(destination)
+    except OSError as e:
+        # The quarantine directory is on another file system
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.copy2(file, destination)
+        file.unlink()
+
+
+def get_removed_files(
+    files: Sequence[Path], failures: list[tuple[Path, OSError]]
+) -> list[Path]:
+    failed_files = {file for file, _ in failures}
+    return [file for file in files if file not in failed_files]
+
+
+def quarantine_file_by_file(
+    files: list[Path], quarantine_directory: Path
+) -> tuple[list[Path], list[tuple[Path, OSError]]]:
+    quarantine_directory.mkdir(parents=True, exist_ok=True)
+    failures = move_file_chunk(files, quarantine_directory)
+    return get_removed_files(files, failures), failures
+
+
+def quarantine_directory_files(
+    directory: Path, files: list[Path], quarantine_directory: Path
+) -> tuple[list[Path], list[tuple[Path, OSError]]]:
+    # Gives the files that left the directory, and the files that could not be moved
+    removed_names = {file.name for file in files}
+    kept_names = [name for name in os.listdir(directory) if name not in removed_names]
+
+    # When most of a directory goes, one rename moves the whole directory
+    # into quarantine and only the few kept files are moved back.
+    # Files are moved one by one if the directory cannot be renamed (e.g. to another file system).
+    if len(kept_names) < len(files) and not quarantine_directory.exists():
+        directory_mode = stat.S_IMODE(directory.stat().st_mode)
+
+        quarantine_directory.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            directory.rename(quarantine_directory)
+        except OSError:
+            return quarantine_file_by_file(files, quarantine_directory)
+        directory.mkdir()
+        directory.chmod(directory_mode)
+
+        kept_files = [quarantine_directory / name for name in kept_names]
+        failures = move_file_chunk(kept_files, directory)
+
+        # Kept files that could not be moved back are left in quarantine too
+        return files + [directory / file.name for file, _ in failures], failures
+
+    return quarantine_file_by_file(files, quarantine_directory)
+
+
+def quarantine_files(
+    files: Sequence[str | Path],
+    root_dir: str | Path,
+    quarantine_dir: str | Path,
+    max_workers: int | None = None,
+) -> tuple[list[Path], list[tuple[Path, OSError]]]:
+    root_path = Path(root_dir)
+    quarantine_path = Path(quarantine_dir)
+
+    files_by_directory = group_files_by_directory(files)
+
+    removed_files: list[Path] = []
+    failures: list[tuple[Path, OSError]] = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                quarantine_directory_files,
+                directory,
+                directory_files,
+                quarantine_path / directory.relative_to(root_path),
+            )
+            for directory, directory_files in files_by_directory.items()
+        ]
+        for future in futures:
+            directory_removed_files, directory_failures = future.result()
+            removed_files.extend(directory_removed_files)
+            failures.extend(directory_failures)
+
+    return removed_files, failures
+
+
+@metrics_stage("remove files")
+def remove_files(
+    files: Sequence[str | Path],
+    root_dir: str | Path,
+    dry_run: bool = False,
+    plan_file: str | Path | None = None,
+    quarantine_dir: str | Path | None = None,
+    max_workers: int | None = None,
+) -> list[Path]:
+    # Returns the files removed (or planned to be removed on a dry run), without the files that failed
+
+    if plan_file is not None:
+        write_deletion_plan(plan_file, files)
+        print(f"Wrote deletion plan of {len(files)} files to {plan_file}")
+
+    if dry_run or not files:
+        return [Path(file) for file in files]
+
+    if quarantine_dir is not None:
+        removed_files, failures = quarantine_files(
+            files,
+            root_dir=root_dir,
+            quarantine_dir=quarantine_dir,
+            max_workers=max_workers,
+        )
+        action = f"Moved to quarantine {quarantine_dir}:"
+    else:
+        failures = unlink_files(files, max_workers=max_workers)
+        removed_files = get_removed_files([Path(file) for file in files], failures)
+        action = "Deleted:"
+
+    directory_count = len(group_files_by_directory(removed_files))
+    count_items(len(removed_files))
+
+    print(f"{action} {len(removed_files)} files in {directory_count} directories")
+
+    if failures:
+        print(f"Failed to remove {len(failures)} files, e.g.:")
+        for file, error in failures[:5]:
+            print(f"{file}: {error}")
+
+    return removed_files
@@ -0,0 +1,95 @@
+# This script computes content digests of files.
+# Digests can be cached in a sidecar file keyed by path, size and modification time,
+# so that files that have not changed since the last run are not read again.
+# Entries of files that were not looked up in a run (e.g. deleted files) are dropped when the cache is saved,
+# so the cache does not grow with files that no longer exist.
+
+# Cache format (JSON):
+# {
+#     "/absolute/path/to/file": [size, mtime_ns, digest],
+# }
+
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def hash_file(file_path: str | Path) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.file_digest(
+            f, lambda: hashlib.blake2b(digest_size=16)
+        ).hexdigest()
+
+
+class DigestCache:
+    cache_file: Path | None
+    entries: dict[str, tuple[int, int, str]]
+    seen_keys: set[str]  # Paths looked up in this run
+    modified: bool
+
+    def __init__(self, cache_file: str | Path | None = None):
+        self.cache_file = Path(cache_file) if cache_file is not None else None
+        self.entries = {}
+        self.seen_keys = set()
+        self.modified = False
+
+        if self.cache_file is not None and self.cache_file.exists():
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    self.entries = {
+                        path: (size, mtime_ns, digest)
+                        for path, (size, mtime_ns, digest) in json.load(f).items()
+                    }
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Ignoring unreadable digest cache {self.cache_file}: {e}")
+
+    def get_digest(
+        self, file_path: str | Path, stat_result: os.stat_result | None = None
+    ):
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+
+        key = os.path.abspath(file_path)
+        self.seen_keys.add(key)
+        entry = self.entries.get(key)
+
+        if (
+            entry is not None
+            and entry[0] == stat_result.st_size
+            and entry[1] == stat_result.st_mtime_ns
+        ):
+            return entry[2]
+
+        digest = hash_file(file_path)
+
+        # Dictionary assignment is atomic, so worker threads can share the cache
+        self.entries[key] = (stat_result.st_size, stat_result.st_mtime_ns, digest)
+        self.modified = True
+
+        return digest
+
+    def save(self):
+        if self.cache_file is None:
+            return
+
+        if len(self.seen_keys) < len(self.entries):
+            self.entries = {
+                key: entry
+                for key, entry in self.entries.items()
+                if key in self.seen_keys
+            }
+            self.modified = True
+
+        if not self.modified:
+            return
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+
+        temporary_file = self.cache_file.with_name(f".{self.cache_file.name}.tmp")
+        with open(temporary_file, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(temporary_file, self.cache_file)
+
+        self.modified = False
@@ -0,0 +1,197 @@
+# This script reads a prepared dataset as a library, e.g. from the data loader of a training script.
+# The dataset is indexed once (from the dataset manifest when it is up to date, otherwise by scanning it),
+# and target images can then be read by integer index or by (font, char, sample),
+# together with the content image of the same character.
+# Decoded images are kept in a bounded LRU cache, since every content image is read once for every font.
+# Each data loader worker process has its own copy of the dataset and its own cache.
+
+# Dataset format:
+# xxx-dataset/
+# ├── ContentImage/
+# │   ├── char1.png
+# ├── TargetImage/
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png    <-- sample 0
+# │   │   ├── fontA+char1+1.png  <-- sample 1
+
+# Usage:
+# dataset = FontDataset("xxx-dataset")
+# content_image, target_image = dataset[0]
+# content_image, target_image = dataset.get_pair(dataset.find_sample("fontA", "char1"))
+
+
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .dataset_manifest import (
+    content_image_dir_name,
+    content_kind,
+    load_dataset_manifest,
+    parse_image_name,
+    target_image_dir_name,
+    target_kind,
+)
+from .output_writer import is_hidden_file_name
+
+
+class FontSample:
+    font: str
+    char: str
+    sample: int
+    path: Path
+
+    def __init__(self, font: str, char: str, sample: int, path: Path):
+        self.font = font
+        self.char = char
+        self.sample = sample
+        self.path = path
+
+
+class FontDataset:
+    dataset_path: Path
+    samples: list[
+        FontSample
+    ]  # Target images, sorted by font, character and sample number
+    sample_indices: dict[tuple[str, str, int], int]  # (font, char, sample) -> index
+    content_paths: dict[str, Path]  # Character -> content image
+    fonts: list[str]
+    image_mode: (
+        str | None
+    )  # Images are converted to this mode when they are read (None to keep their mode)
+    cache: OrderedDict[Path, np.ndarray]  # Least recently used first
+    cache_size: int
+    cache_hits: int
+    cache_misses: int
+
+    def __init__(
+        self,
+        dataset_dir: str | Path,
+        image_mode: str | None = "L",
+        cache_size: int = 4096,
+    ):
+        self.dataset_path = Path(dataset_dir)
+        self.image_mode = image_mode
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache = OrderedDict()
+
+        self.samples, self.content_paths = index_dataset(self.dataset_path)
+        self.fonts = sorted({sample.font for sample in self.samples})
+        self.sample_indices = {
+            (sample.font, sample.char, sample.sample): index
+            for index, sample in enumerate(self.samples)
+        }
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __getitem__(
+        self, key: int | tuple[str, str, int]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Gives the content image and the target image of a sample
+        index = self.find_sample(*key) if isinstance(key, tuple) else int(key)
+        return self.get_pair(index)
+
+    def get_sample(self, index: int) -> FontSample:
+        return self.samples[index]
+
+    def find_sample(self, font: str, char: str, sample: int = 0) -> int:
+        # Raises KeyError if the dataset does not have the sample
+        return self.sample_indices[(font, char, sample)]
+
+    def get_content_path(self, char: str) -> Path | None:
+        return self.content_paths.get(char)
+
+    def read_target_image(self, index: int) -> np.ndarray:
+        return self.read_image(self.samples[index].path)
+
+    def read_content_image(self, char: str) -> np.ndarray:
+        # Raises KeyError if the dataset has no content image of the character
+        return self.read_image(self.content_paths[char])
+
+    def get_pair(self, index: int) -> tuple[np.ndarray, np.ndarray]:
+        sample = self.samples[index]
+        return self.read_content_image(sample.char), self.read_image(sample.path)
+
+    def read_image(self, path: Path) -> np.ndarray:
+        # Cached arrays are shared between callers, so they are read-only
+        image = self.cache.get(path)
+        if image is not None:
+            self.cache.move_to_end(path)
+            self.cache_hits += 1
+            return image
+
+        self.cache_misses += 1
+
+        with Image.open(path) as opened_image:
+            if self.image_mode is not None and opened_image.mode != self.image_mode:
+                image = np.asarray(opened_image.convert(self.image_mode))
+            else:
+                image = np.asarray(opened_image)
+        image.setflags(write=False)
+
+        if self.cache_size > 0:
+            self.cache[path] = image
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return image
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def index_dataset(dataset_path: Path) -> tuple[list[FontSample], dict[str, Path]]:
+    # Files whose names cannot be parsed are left out
+    samples: list[FontSample] = []
+    content_paths: dict[str, Path] = {}
+
+    manifest = load_dataset_manifest(dataset_path)
+
+    if manifest is not None:
+        for entry in manifest.entries:
+            if entry.char is None:
+                continue
+            path = dataset_path / entry.path
+            if entry.kind == content_kind:
+                content_paths[entry.char] = path
+            elif entry.kind == target_kind and entry.font is not None:
+                samples.append(FontSample(entry.font, entry.char, entry.sample, path))
+
+    else:
+        content_image_path = dataset_path / content_image_dir_name
+        if content_image_path.is_dir():
+            for path in list_files(content_image_path):
+                char, _ = parse_image_name(content_kind, path.name)
+                if char is not None:
+                    content_paths[char] = path
+
+        target_image_path = dataset_path / target_image_dir_name
+        if target_image_path.is_dir():
+            for font_path in sorted(target_image_path.iterdir()):
+                if not font_path.is_dir():
+                    continue
+                for path in list_files(font_path):
+                    char, sample = parse_image_name(target_kind, path.name)
+                    if char is not None:
+                        samples.append(FontSample(font_path.name, char, sample, path))
+
+    samples.sort(key=lambda sample: (sample.font, sample.char, sample.sample))
+
+    return samples, content_paths
+
+
+def list_files(directory: Path) -> list[Path]:
+    with os.scandir(directory) as entries:
+        return sorted(
+            Path(entry.path)
+            for entry in entries
+            if entry.is_file() and not is_hidden_file_name(entry.name)
+        )
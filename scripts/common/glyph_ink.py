@@ -0,0 +1,51 @@
+# This script finds the ink of glyph images with numpy, over stacked batches of images of the same size.
+# The background of an image is the median of its border pixels, so that both black-on-white and
+# white-on-black glyphs are handled, and a pixel is ink when it differs from the background by more than ink_contrast.
+
+# Images are (count, height, width) uint8 grayscale arrays.
+
+
+import numpy as np
+
+ink_contrast = 64
+
+
+def find_backgrounds(images: np.ndarray) -> np.ndarray:
+    border = np.concatenate(
+        [images[:, 0, :], images[:, -1, :], images[:, :, 0], images[:, :, -1]], axis=1
+    )
+    return np.median(border, axis=1)
+
+
+def find_ink(images: np.ndarray, contrast: int = ink_contrast) -> np.ndarray:
+    # Gives a (count, height, width) boolean mask
+    backgrounds = find_backgrounds(images)
+
+    # Comparing with per-image bounds avoids widening every pixel to a signed type
+    lower_bound = np.clip(backgrounds - contrast, 0, 255).astype(np.uint8)
+    upper_bound = np.clip(backgrounds + contrast, 0, 255).astype(np.uint8)
+
+    return (images < lower_bound[:, None, None]) | (images > upper_bound[:, None, None])
+
+
+def find_ink_bounding_boxes(ink: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Gives (count, 4) boxes as left, top, right, bottom (exclusive), and a mask of the images with any ink.
+    # Boxes of images without ink are all zero.
+    _, height, width = ink.shape
+
+    ink_rows = ink.any(axis=2)
+    ink_columns = ink.any(axis=1)
+    has_ink = ink_rows.any(axis=1)
+
+    boxes = np.stack(
+        [
+            ink_columns.argmax(axis=1),
+            ink_rows.argmax(axis=1),
+            width - ink_columns[:, ::-1].argmax(axis=1),
+            height - ink_rows[:, ::-1].argmax(axis=1),
+        ],
+        axis=1,
+    )
+    boxes[~has_ink] = 0
+
+    return boxes, has_ink
@@ -0,0 +1,43 @@
+# This script computes perceptual hashes of glyph images, so that near-identical glyphs can be found
+# without comparing their pixels.
+# A difference hash (dHash) shrinks the image to a small grayscale thumbnail and records, for every pixel,
+# whether it is brighter than its right neighbour. Re-encoding, small shifts in brightness and resizing
+# change only a few bits, so two glyphs are near-identical when their hashes differ in only a few bits.
+
+# Hashes are 64-bit integers (for the default hash size of 8), and can be stored in numpy uint64 arrays.
+
+
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+hash_size = 8
+
+
+def difference_hash(image: Image.Image, size: int = hash_size) -> int:
+    # The thumbnail has one more column than the hash, since each bit compares two neighbouring columns
+    thumbnail = image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def read_difference_hash(image_file: str | Path, size: int = hash_size) -> int | None:
+    # Gives None if the image cannot be read
+    try:
+        with Image.open(image_file) as image:
+            return difference_hash(image, size)
+    except OSError:
+        return None
+
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    return (hash_a ^ hash_b).bit_count()
+
+
+def get_hamming_distances(hashes_a: np.ndarray, hashes_b: np.ndarray) -> np.ndarray:
+    # Element-wise Hamming distances of two uint64 arrays (broadcast like any numpy operation)
+    return np.bitwise_count(np.bitwise_xor(hashes_a, hashes_b))
@@ -0,0 +1,45 @@
+# This script reads the format, size and mode of PNG and GIF images from their headers,
+# without decoding any pixels.
+
+
+import struct
+from pathlib import Path
+
+png_signature = b"\x89PNG\r\n\x1a\n"
+gif_signatures = (b"GIF87a", b"GIF89a")
+
+# The PNG signature and the IHDR chunk fit in the first 29 bytes
+image_header_size = 32
+
+png_color_type_modes = {0: "L", 2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}
+
+
+def get_png_mode(bit_depth: int, color_type: int) -> str | None:
+    if color_type == 0 and bit_depth == 1:
+        return "1"
+    if color_type == 0 and bit_depth == 16:
+        return "I;16"
+    return png_color_type_modes.get(color_type)
+
+
+def parse_image_header(header: bytes) -> tuple[str, int, int, str | None] | None:
+    # Returns (format, width, height, mode), or None if the header is not a PNG or GIF header
+
+    if (
+        header.startswith(png_signature)
+        and header[12:16] == b"IHDR"
+        and len(header) >= 26
+    ):
+        width, height, bit_depth, color_type = struct.unpack(">IIBB", header[16:26])
+        return "PNG", width, height, get_png_mode(bit_depth, color_type)
+
+    if header[:6] in gif_signatures and len(header) >= 10:
+        width, height = struct.unpack("<HH", header[6:10])
+        return "GIF", width, height, "P"
+
+    return None
+
+
+def read_image_header(file_path: str | Path) -> tuple[str, int, int, str | None] | None:
+    with open(file_path, "rb") as f:
+        return parse_image_header(f.read(image_header_size))
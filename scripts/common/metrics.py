@@ -0,0 +1,316 @@
+# This script records performance metrics of the dataset scripts, cheap enough to be left on for every run.
+# A run is split into stages (e.g. "create target images"). For every stage, the wall time, CPU time,
+# item count, bytes read and written, peak RSS and the time spent in hot sections (e.g. "encode", "write")
+# are recorded, and written at the end of the run as JSON and as a Prometheus textfile
+# (e.g. for the textfile collector of the node exporter).
+
+# Work done in the worker processes of the streaming pipeline is only included in the CPU time
+# (once the worker processes exit), not in the counters or sections.
+# Every thread has its own stack of stages. Work counted on a worker thread (e.g. of a thread pool) is added to
+# the stages of the thread that records the run, and to the stages opened on the worker thread itself.
+
+# Usage:
+# with record_metrics("casia-dataset-target-images", dataset_dir="casia-dataset"):
+#     with metrics_stage("create target images"):
+#         ...
+#         count_items(1)
+
+# Output format (next to the dataset, or in the directory set by FONT_DATASETS_METRICS_DIR):
+# casia-dataset-target-images.metrics.json
+# casia-dataset-target-images.metrics.prom
+
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where CPU time of worker processes and peak RSS are not recorded
+    resource = None
+
+metric_prefix = "font_datasets"
+
+
+class StageMetrics:
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    items: int
+    bytes_read: int
+    bytes_written: int
+    peak_rss_bytes: int | None
+    section_seconds: dict[str, float]
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.items = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss_bytes = None
+        self.section_seconds = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "items": self.items,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "section_seconds": dict(sorted(self.section_seconds.items())),
+        }
+
+
+class RunMetrics:
+    run_name: str
+    stages: dict[str, StageMetrics]
+    thread_id: int  # The thread that records the run
+    thread_stages: list[StageMetrics]  # The active stages of that thread
+
+    def __init__(self, run_name: str):
+        self.run_name = run_name
+        self.stages = {}
+        self.thread_id = threading.get_ident()
+        self.thread_stages = get_thread_stages()
+
+    def get_stage(self, name: str) -> StageMetrics:
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
+
+    def to_dict(self) -> dict:
+        return {
+            "run": self.run_name,
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+
+
+# Counters are added to every active stage, so that an outer stage includes its inner stages.
+# Counting does nothing outside of record_metrics().
+active_run: RunMetrics | None = None
+metrics_lock = threading.Lock()
+thread_state = threading.local()
+
+# Metrics are written to this directory instead of next to the dataset, if it is set
+metrics_dir_variable = "FONT_DATASETS_METRICS_DIR"
+
+
+def get_thread_stages() -> list[StageMetrics]:
+    if not hasattr(thread_state, "stages"):
+        thread_state.stages = []
+    return thread_state.stages
+
+
+def get_active_stages(run_metrics: RunMetrics) -> list[StageMetrics]:
+    # Called with metrics_lock held
+    stages = get_thread_stages()
+    if threading.get_ident() == run_metrics.thread_id:
+        return stages
+    # A worker thread works for the stages of the thread that records the run
+    return run_metrics.thread_stages + stages
+
+
+def get_cpu_seconds() -> float:
+    # CPU time of all threads of this process, and of its worker processes that have exited
+    cpu_seconds = time.process_time()
+    if resource is not None:
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_seconds += children_usage.ru_utime + children_usage.ru_stime
+    return cpu_seconds
+
+
+def get_peak_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+@contextmanager
+def metrics_stage(name: str):
+    # Outside of record_metrics(), a stage is not recorded
+    if active_run is None:
+        yield None
+        return
+
+    thread_stages = get_thread_stages()
+
+    with metrics_lock:
+        stage = active_run.get_stage(name)
+        thread_stages.append(stage)
+
+    start_wall_seconds = time.perf_counter()
+    start_cpu_seconds = get_cpu_seconds()
+
+    try:
+        yield stage
+    finally:
+        with metrics_lock:
+            stage.wall_seconds += time.perf_counter() - start_wall_seconds
+            stage.cpu_seconds += get_cpu_seconds() - start_cpu_seconds
+            stage.peak_rss_bytes = get_peak_rss_bytes()
+            thread_stages.remove(stage)
+
+
+def count_items(items: int = 1):
+    run_metrics = active_run
+    if run_metrics is None:
+        return
+    with metrics_lock:
+        for stage in get_active_stages(run_metrics):
+            stage.items += items
+
+
+def count_bytes_read(size: int):
+    run_metrics = active_run
+    if run_metrics is None:
+        return
+    with metrics_lock:
+        for stage in get_active_stages(run_metrics):
+            stage.bytes_read += size
+
+
+def count_bytes_written(size: int):
+    run_metrics = active_run
+    if run_metrics is None:
+        return
+    with metrics_lock:
+        for stage in get_active_stages(run_metrics):
+            stage.bytes_written += size
+
+
+@contextmanager
+def metrics_section(name: str):
+    # Sections are small hot spots inside a stage. Their time is summed over all threads,
+    # so the sections of a multi-threaded stage can add up to more than its wall time.
+    run_metrics = active_run
+    if run_metrics is None:
+        yield
+        return
+
+    start_seconds = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_seconds = time.perf_counter() - start_seconds
+        with metrics_lock:
+            for stage in get_active_stages(run_metrics):
+                stage.section_seconds[name] = (
+                    stage.section_seconds.get(name, 0.0) + elapsed_seconds
+                )
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus_metrics(run_metrics: RunMetrics) -> str:
+    stage_metrics = [
+        ("wall_seconds", "Wall time of the stage in seconds."),
+        ("cpu_seconds", "CPU time of the stage in seconds."),
+        ("items", "Number of items processed by the stage."),
+        ("bytes_read", "Number of bytes read by the stage."),
+        ("bytes_written", "Number of bytes written by the stage."),
+        (
+            "peak_rss_bytes",
+            "Peak resident set size of the process at the end of the stage.",
+        ),
+    ]
+
+    run_label = f'run="{escape_label_value(run_metrics.run_name)}"'
+    lines = []
+
+    for metric, description in stage_metrics:
+        metric_name = f"{metric_prefix}_stage_{metric}"
+        lines.append(f"# HELP {metric_name} {description}")
+        lines.append(f"# TYPE {metric_name} gauge")
+        for stage in run_metrics.stages.values():
+            value = getattr(stage, metric)
+            if value is not None:
+                lines.append(
+                    f'{metric_name}{{{run_label},stage="{escape_label_value(stage.name)}"}} {value}'
+                )
+
+    metric_name = f"{metric_prefix}_stage_section_seconds"
+    lines.append(
+        f"# HELP {metric_name} Time spent in a section of the stage in seconds."
+    )
+    lines.append(f"# TYPE {metric_name} gauge")
+    for stage in run_metrics.stages.values():
+        for section, seconds in sorted(stage.section_seconds.items()):
+            lines.append(
+                f'{metric_name}{{{run_label},stage="{escape_label_value(stage.name)}",'
+                f'section="{escape_label_value(section)}"}} {seconds}'
+            )
+
+    return "\n".join(lines) + "\n"
+
+
+def write_text_atomically(path: str | Path, text: str):
+    # The textfile collector may read the file at any time, so it is replaced in one step
+    output_path = Path(path)
+    temporary_path = output_path.with_name(f".{output_path.name}.tmp")
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temporary_path, output_path)
+
+
+def get_metrics_output_prefix(
+    run_name: str, dataset_dir: str | Path | None = None
+) -> Path:
+    metrics_dir = os.environ.get(metrics_dir_variable)
+    if metrics_dir:
+        return Path(metrics_dir) / run_name
+    if dataset_dir is not None:
+        return Path(dataset_dir).absolute().parent / run_name
+    return Path(run_name)
+
+
+def write_metrics(run_metrics: RunMetrics, output_prefix: str | Path):
+    Path(output_prefix).parent.mkdir(parents=True, exist_ok=True)
+    write_text_atomically(
+        f"{output_prefix}.metrics.json",
+        json.dumps(run_metrics.to_dict(), ensure_ascii=False, indent=2),
+    )
+    write_text_atomically(
+        f"{output_prefix}.metrics.prom", format_prometheus_metrics(run_metrics)
+    )
+
+
+@contextmanager
+def record_metrics(
+    run_name: str,
+    output_prefix: str | Path | None = None,
+    dataset_dir: str | Path | None = None,
+):
+    # The whole run is also recorded as a stage named "total".
+    # The metrics are written even when the run fails, so that a slow failure can be looked into.
+    # Without an output prefix, the metrics are written next to the dataset (see get_metrics_output_prefix).
+    global active_run
+
+    run_metrics = RunMetrics(run_name)
+    previous_run = active_run
+    active_run = run_metrics
+
+    try:
+        with metrics_stage("total"):
+            yield run_metrics
+    finally:
+        active_run = previous_run
+        write_metrics(
+            run_metrics,
+            (
+                output_prefix
+                if output_prefix is not None
+                else get_metrics_output_prefix(run_name, dataset_dir)
+            ),
+        )
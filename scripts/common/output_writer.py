@@ -0,0 +1,134 @@
+# This script writes the output files of all dataset scripts.
+# Every file is written to a temporary name and renamed into place, so a crash never leaves a partly written file.
+# Output files and directories are given full permissions (0o777) without a chmod per file:
+# inside permissive_umask(), files are created with their final permissions,
+# and directories are only chmod-ed the first time they are seen by this process.
+
+
+import io
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from PIL import Image
+
+from .metrics import count_bytes_read, count_bytes_written, metrics_section
+
+output_permissions = 0o777
+
+prepared_directories: set[Path] = set()
+permissive_umask_depth = 0
+previous_umask = 0
+permissive_umask_lock = threading.Lock()
+
+
+@contextmanager
+def permissive_umask():
+    # Can also be used as a decorator on the top-level function of a script
+    global permissive_umask_depth, previous_umask
+
+    with permissive_umask_lock:
+        if permissive_umask_depth == 0:
+            previous_umask = os.umask(0)
+        permissive_umask_depth += 1
+
+    try:
+        yield
+    finally:
+        with permissive_umask_lock:
+            permissive_umask_depth -= 1
+            if permissive_umask_depth == 0:
+                os.umask(previous_umask)
+
+
+def ensure_dir_exists_with_perms(path: str | Path):
+    # Create a Path object
+    base_path = Path(path)
+
+    # Create the directory if it doesn't exist
+    try:
+        base_path.mkdir()
+        created_directories = {base_path}
+    except FileExistsError:
+        created_directories = set()
+    except FileNotFoundError:
+        base_path.mkdir(parents=True, exist_ok=True)
+        created_directories = {base_path, *base_path.parents}
+
+    # Change permissions of the base directory itself and the directory tree above it,
+    # skipping directories that were already changed by this process
+    for directory in [base_path, *base_path.parents]:
+        if directory == Path("."):
+            continue
+        if directory in created_directories or directory not in prepared_directories:
+            with metrics_section("chmod"):
+                directory.chmod(output_permissions)
+            prepared_directories.add(directory)
+
+
+def is_hidden_file_name(name: str) -> bool:
+    # The temporary files of write_output_bytes() start with a dot and are left behind by a killed run,
+    # so scanners of output directories skip them (and other hidden files, e.g. .DS_Store)
+    return name.startswith(".")
+
+
+def write_output_bytes(path: str | Path, data: bytes, fsync: bool = False):
+    output_path = Path(path)
+    temporary_path = output_path.with_name(
+        f".{output_path.name}.{os.getpid()}-{threading.get_ident()}.tmp"
+    )
+
+    with metrics_section("write"):
+        fd = os.open(
+            temporary_path,
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC,
+            output_permissions,
+        )
+
+        try:
+            try:
+                if permissive_umask_depth == 0:
+                    os.fchmod(fd, output_permissions)
+
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view) :]
+
+                if fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            os.replace(temporary_path, output_path)
+
+        except BaseException:
+            temporary_path.unlink(missing_ok=True)
+            raise
+
+    count_bytes_written(len(data))
+
+
+def encode_image(img: Image.Image, format: str) -> bytes:
+    with metrics_section("encode"):
+        buffer = io.BytesIO()
+        img.save(buffer, format)
+        return buffer.getvalue()
+
+
+def save_image(
+    img: Image.Image, path: str | Path, format: str | None = None, fsync: bool = False
+):
+    if format is None:
+        format = Image.registered_extensions()[Path(path).suffix.lower()]
+
+    write_output_bytes(path, encode_image(img, format), fsync=fsync)
+
+
+def copy_file(source: str | Path, destination: str | Path, fsync: bool = False):
+    with open(source, "rb") as f:
+        data = f.read()
+
+    count_bytes_read(len(data))
+
+    write_output_bytes(destination, data, fsync=fsync)
@@ -0,0 +1,251 @@
+# This script builds a table that pairs every target image of a dataset with the content image of its character,
+# so that a trainer can load the pairs with np.load instead of listing and parsing every file name at startup.
+# Run it after the dataset is balanced (see scripts/util/balance_dataset.py), since target images
+# without a content image are left out of the table.
+# The table and the path pool are .npy files, so they can be memory-mapped (np.load(..., mmap_mode="r")).
+# The modification times of the dataset directories are saved with the table (as in the dataset manifest),
+# so that a table of a dataset that changed since (e.g. was balanced again) is known to be stale.
+
+# Dataset format:
+# xxx-dataset/
+# ├── ContentImage/
+# │   ├── char1.png
+# ├── TargetImage/
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png
+# │   │   ├── fontA+char1+1.png
+
+# Output format:
+# xxx-dataset-pairs/
+# ├── pairs.npy  <-- written last: one row per target image, sorted by font, character and sample:
+# │                  font, char, sample, target_path, content_path
+# │                  (font and char are line numbers in fonts.txt and characters.txt,
+# │                   target_path and content_path are byte offsets into paths.npy)
+# ├── paths.npy  <-- uint8: paths relative to the dataset directory, UTF-8, each followed by a NUL byte
+# ├── fonts.txt  <-- one font per line
+# ├── characters.txt  <-- one character per line
+# ├── directories.json  <-- the modification time of every dataset directory when the table was built
+
+# Usage:
+# pairs = np.load("xxx-dataset-pairs/pairs.npy", mmap_mode="r")
+# table = PairingTable("xxx-dataset-pairs", "xxx-dataset")
+# content_path, target_path = table.get_content_path(0), table.get_target_path(0)
+
+
+import io
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .dataset_manifest import get_directory_mtimes
+from .font_dataset import index_dataset
+from .metrics import count_items, metrics_stage, record_metrics
+from .output_writer import (
+    ensure_dir_exists_with_perms,
+    permissive_umask,
+    write_output_bytes,
+)
+
+pair_dtype = np.dtype(
+    [
+        ("font", "<i4"),
+        ("char", "<i4"),
+        ("sample", "<i4"),
+        ("target_path", "<i8"),
+        ("content_path", "<i8"),
+    ]
+)
+
+pairs_file_name = "pairs.npy"
+paths_file_name = "paths.npy"
+fonts_file_name = "fonts.txt"
+characters_file_name = "characters.txt"
+directories_file_name = "directories.json"
+
+# Paths are read from the pool in windows of this size, so no path may be longer
+max_path_bytes = 4096
+
+
+def get_pairing_table_path(dataset_dir: str | Path) -> Path:
+    dataset_path = Path(dataset_dir).absolute()
+    return dataset_path.with_name(f"{dataset_path.name}-pairs")
+
+
+def is_pairing_table_stale(dataset_dir: str | Path, table_dir: str | Path) -> bool:
+    # A table is stale if it is missing or incomplete, or if a file was added to or removed from the dataset since
+    table_path = Path(table_dir)
+
+    if not (table_path / pairs_file_name).exists():
+        return True
+
+    try:
+        with open(table_path / directories_file_name, "r", encoding="utf-8") as f:
+            directory_mtimes = json.load(f)
+    except (OSError, ValueError):
+        return True
+
+    return get_directory_mtimes(dataset_dir) != directory_mtimes
+
+
+def build_path_pool(paths: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    # Gives the pool and the byte offset of every path in it
+    encoded_paths = [path.encode("utf-8") for path in paths]
+
+    if any(len(encoded_path) >= max_path_bytes for encoded_path in encoded_paths):
+        raise ValueError(f"Paths should be shorter than {max_path_bytes} bytes.")
+
+    lengths = np.fromiter(
+        (len(encoded_path) + 1 for encoded_path in encoded_paths),
+        dtype=np.int64,
+        count=len(encoded_paths),
+    )
+    offsets = np.cumsum(lengths) - lengths
+
+    pool = np.frombuffer(b"".join(path + b"\0" for path in encoded_paths), np.uint8)
+
+    return pool, offsets
+
+
+def write_npy(path: Path, array: np.ndarray):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    write_output_bytes(path, buffer.getvalue())
+
+
+@metrics_stage("write pairing table")
+@permissive_umask()
+def write_pairing_table(
+    dataset_dir: str | Path, output_dir: str | Path | None = None
+) -> tuple[int, int]:
+    # Gives the numbers of pairs written and of target images left out for having no content image
+    dataset_path = Path(dataset_dir)
+    output_path = (
+        Path(output_dir)
+        if output_dir is not None
+        else get_pairing_table_path(dataset_path)
+    )
+
+    # Taken before the dataset is indexed, so that changes made while indexing make the table stale
+    directory_mtimes = get_directory_mtimes(dataset_path)
+
+    samples, content_paths = index_dataset(dataset_path)
+
+    paired_samples = [sample for sample in samples if sample.char in content_paths]
+    unpaired_count = len(samples) - len(paired_samples)
+
+    fonts = sorted({sample.font for sample in paired_samples})
+    characters = sorted({sample.char for sample in paired_samples})
+    font_ids = {font: font_id for font_id, font in enumerate(fonts)}
+    char_ids = {char: char_id for char_id, char in enumerate(characters)}
+
+    # Content paths come first in the pool, one per character
+    relative_paths = [
+        content_paths[char].relative_to(dataset_path).as_posix() for char in characters
+    ] + [sample.path.relative_to(dataset_path).as_posix() for sample in paired_samples]
+    path_pool, path_offsets = build_path_pool(relative_paths)
+
+    pairs = np.zeros(len(paired_samples), dtype=pair_dtype)
+    pairs["font"] = [font_ids[sample.font] for sample in paired_samples]
+    pairs["char"] = [char_ids[sample.char] for sample in paired_samples]
+    pairs["sample"] = [sample.sample for sample in paired_samples]
+    pairs["content_path"] = path_offsets[pairs["char"]]
+    pairs["target_path"] = path_offsets[len(characters) :]
+
+    ensure_dir_exists_with_perms(output_path)
+
+    # The table is removed first and written last, so that an interrupted run never leaves
+    # a table that refers to pools of another run
+    (output_path / pairs_file_name).unlink(missing_ok=True)
+
+    write_output_bytes(
+        output_path / fonts_file_name, "".join(f"{font}\n" for font in fonts).encode()
+    )
+    write_output_bytes(
+        output_path / characters_file_name,
+        "".join(f"{char}\n" for char in characters).encode(),
+    )
+    write_npy(output_path / paths_file_name, path_pool)
+    write_output_bytes(
+        output_path / directories_file_name,
+        json.dumps(directory_mtimes, ensure_ascii=False).encode("utf-8"),
+    )
+    write_npy(output_path / pairs_file_name, pairs)
+
+    count_items(len(pairs))
+
+    return len(pairs), unpaired_count
+
+
+def read_string_pool(pool_file: str | Path) -> list[str]:
+    # Not splitlines(), which also splits at characters such as U+2028
+    with open(pool_file, "r", encoding="utf-8", newline="\n") as f:
+        return f.read().split("\n")[:-1]
+
+
+class PairingTable:
+    dataset_path: Path
+    pairs: np.ndarray  # Memory-mapped, with the pair_dtype fields
+    paths: np.ndarray  # Memory-mapped path pool
+    fonts: list[str]
+    characters: list[str]
+
+    def __init__(
+        self, table_dir: str | Path, dataset_dir: str | Path, mmap: bool = True
+    ):
+        table_path = Path(table_dir)
+        mmap_mode = "r" if mmap else None
+
+        self.dataset_path = Path(dataset_dir)
+        self.pairs = np.load(table_path / pairs_file_name, mmap_mode=mmap_mode)
+        self.paths = np.load(table_path / paths_file_name, mmap_mode=mmap_mode)
+        self.fonts = read_string_pool(table_path / fonts_file_name)
+        self.characters = read_string_pool(table_path / characters_file_name)
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def get_path(self, offset: int) -> Path:
+        window = np.asarray(self.paths[offset : offset + max_path_bytes])
+        length = int(np.argmax(window == 0))
+        return self.dataset_path / window[:length].tobytes().decode("utf-8")
+
+    def get_relative_paths(self, offsets: np.ndarray) -> list[str]:
+        # Gives many paths at once (relative to the dataset), much faster than get_path for each of them
+        pool = np.asarray(self.paths)
+        path_starts = np.flatnonzero(pool == 0)[:-1] + 1
+        path_indices = np.searchsorted(path_starts, offsets, side="right")
+        paths = pool.tobytes().decode("utf-8").split("\0")
+        return [paths[index] for index in path_indices.tolist()]
+
+    def get_target_path(self, index: int) -> Path:
+        return self.get_path(int(self.pairs[index]["target_path"]))
+
+    def get_content_path(self, index: int) -> Path:
+        return self.get_path(int(self.pairs[index]["content_path"]))
+
+    def get_font(self, index: int) -> str:
+        return self.fonts[self.pairs[index]["font"]]
+
+    def get_char(self, index: int) -> str:
+        return self.characters[self.pairs[index]["char"]]
+
+
+@record_metrics("xxx-dataset-pairing-table", dataset_dir="xxx-dataset")
+def main():
+    dataset_dir = "xxx-dataset"
+    output_dir = "xxx-dataset-pairs"
+
+    pair_count, unpaired_count = write_pairing_table(dataset_dir, output_dir)
+
+    print(f"{pair_count} pairs written to {output_dir}")
+
+    if unpaired_count:
+        print(
+            f"{unpaired_count} target images without a content image were left out, "
+            "balance the dataset first"
+        )
+
+
+if __name__ == "__main__":
+    main()
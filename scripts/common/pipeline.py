@@ -0,0 +1,171 @@
+# This script runs the steps that prepare a dataset as stages of one pipeline in a single process.
+# Each stage declares its input and output paths. A stage is skipped when its inputs, parameters and outputs
+# have not changed since its last successful run.
+# A stage fails when it raises or returns None or False; the pipeline then stops without recording the stage,
+# and the later stages do not run.
+# A stage may change the paths of an earlier stage (e.g. deleting target images changes the output of the stage
+# that created them). The earlier stage is fingerprinted again, so that it is not run again for that change.
+# Stages share a context dictionary, so that an index built by one stage (e.g. the set of characters
+# in the target images) can be reused by the next stage instead of scanning the disk again.
+
+# State file format (JSON), saved next to the dataset (e.g. xxx-dataset.pipeline-state.json):
+# {
+#     "stage name": { "fingerprint": "...", "outputs": "..." },
+# }
+
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Sequence
+
+from .metrics import metrics_stage
+
+
+class Stage:
+    name: str
+    inputs: list[Path]
+    outputs: list[Path]
+    run: Callable[[dict[str, Any]], Any]
+    parameters: dict[str, Any]
+
+    def __init__(
+        self,
+        name: str,
+        inputs: Sequence[str | Path],
+        outputs: Sequence[str | Path],
+        run: Callable[[dict[str, Any]], Any],
+        parameters: dict[str, Any] | None = None,
+    ):
+        self.name = name
+        self.inputs = [Path(path) for path in inputs]
+        self.outputs = [Path(path) for path in outputs]
+        self.run = run
+        self.parameters = parameters or {}
+
+
+def update_path_fingerprint(digest: hashlib.blake2b, path: Path) -> None:
+    # Only names, sizes and modification times are used, so no file is read
+
+    if not path.exists():
+        digest.update(f"missing\0{path.as_posix()}\n".encode())
+        return
+
+    if path.is_file():
+        stat_result = path.stat()
+        digest.update(
+            f"file\0{path.as_posix()}\0{stat_result.st_size}\0{stat_result.st_mtime_ns}\n".encode()
+        )
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            stat_result = os.stat(os.path.join(root, file))
+            relative_path = os.path.relpath(os.path.join(root, file), path)
+            digest.update(
+                f"{relative_path}\0{stat_result.st_size}\0{stat_result.st_mtime_ns}\n".encode()
+            )
+
+
+def fingerprint_stage(stage: Stage) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+
+    digest.update(json.dumps(stage.parameters, sort_keys=True, default=str).encode())
+
+    for input_path in stage.inputs:
+        update_path_fingerprint(digest, input_path)
+
+    return digest.hexdigest()
+
+
+def fingerprint_outputs(stage: Stage) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+
+    for output_path in stage.outputs:
+        update_path_fingerprint(digest, output_path)
+
+    return digest.hexdigest()
+
+
+def record_stage(stage: Stage) -> dict[str, str]:
+    return {
+        "fingerprint": fingerprint_stage(stage),
+        "outputs": fingerprint_outputs(stage),
+    }
+
+
+def is_stage_failure(result: Any) -> bool:
+    return result is None or result is False
+
+
+def paths_overlap(path: Path, other_path: Path) -> bool:
+    return (
+        path == other_path or path in other_path.parents or other_path in path.parents
+    )
+
+
+def load_pipeline_state(state_file: str | Path) -> dict[str, dict[str, str]]:
+    if not Path(state_file).exists():
+        return {}
+
+    with open(state_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_pipeline_state(state_file: str | Path, state: dict[str, dict[str, str]]):
+    state_path = Path(state_file)
+
+    temporary_path = state_path.with_name(f".{state_path.name}.tmp")
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(temporary_path, state_path)
+
+
+def run_pipeline(
+    stages: Sequence[Stage], state_file: str | Path, force: bool = False
+) -> dict[str, Any]:
+    state = load_pipeline_state(state_file)
+    context: dict[str, Any] = {}
+
+    for index, stage in enumerate(stages):
+        is_up_to_date = not force and state.get(stage.name) == record_stage(stage)
+
+        if is_up_to_date:
+            print(f"Skipping stage (up to date): {stage.name}")
+            continue
+
+        print(f"Running stage: {stage.name}")
+
+        # Forget the previous run, so that a failed stage is not considered up to date
+        state.pop(stage.name, None)
+        save_pipeline_state(state_file, state)
+
+        with metrics_stage(stage.name):
+            context[stage.name] = stage.run(context)
+
+        if is_stage_failure(context[stage.name]):
+            print(f"Stage failed, stopping the pipeline: {stage.name}")
+            return context
+
+        # Inputs are fingerprinted again, since a stage may change its own inputs
+        state[stage.name] = record_stage(stage)
+
+        # Earlier stages were up to date before this stage changed their paths, so they are recorded again
+        for earlier_stage in stages[:index]:
+            if earlier_stage.name in state and any(
+                paths_overlap(path, output_path)
+                for path in earlier_stage.inputs + earlier_stage.outputs
+                for output_path in stage.outputs
+            ):
+                state[earlier_stage.name] = record_stage(earlier_stage)
+
+        save_pipeline_state(state_file, state)
+
+    return context
+
+
+def get_pipeline_state_path(dataset_dir: str | Path) -> Path:
+    dataset_path = Path(dataset_dir).absolute()
+    return dataset_path.with_name(f"{dataset_path.name}.pipeline-state.json")
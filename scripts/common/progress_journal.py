@@ -0,0 +1,168 @@
+# This script keeps an append-only journal of the work units completed by a converter
+# (e.g. a GNT file, a font directory or a content character), so that an interrupted run can be resumed.
+# A unit is recorded only after all of its files are written. On restart, recorded units are skipped,
+# and units that were not recorded (possibly with partly written files) are converted again from scratch.
+# The journal is kept next to the output directory (see get_journal_path) and starts with the identity of
+# the output directory, so that its records are discarded when the output is deleted or replaced.
+# Outputs that were deleted from the output directory since are found with one listing of the directory
+# (see list_output_names), not a stat call per unit.
+
+# Journal format (JSON lines):
+# {"output": [device, inode]}
+# {"unit": "001-f.gnt", "success": ["char1", "char2"], "skipped": []}
+# {"unit": "002-f.gnt", "success": ["char1"], "skipped": ["char3"]}
+
+
+import json
+import os
+from contextlib import AbstractContextManager, nullcontext
+from pathlib import Path
+from typing import Any, TextIO
+
+
+def get_journal_path(output_dir: str | Path) -> Path:
+    output_path = Path(output_dir).absolute()
+    return output_path.with_name(f"{output_path.name}.journal")
+
+
+def get_output_identity(output_dir: str | Path) -> list[int] | None:
+    try:
+        stat = os.stat(output_dir)
+    except FileNotFoundError:
+        return None
+    return [stat.st_dev, stat.st_ino]
+
+
+def list_output_names(output_dir: str | Path) -> set[str]:
+    # Gives the names in the output directory, so that completed units whose output is gone are converted again
+    try:
+        with os.scandir(output_dir) as entries:
+            return {entry.name for entry in entries}
+    except FileNotFoundError:
+        return set()
+
+
+class ProgressJournal:
+    journal_file: Path
+    records: dict[str, dict[str, Any]]
+    fsync: bool
+    file: TextIO | None
+    output_identity: (
+        list[int] | None
+    )  # None if the journal is not tied to an output directory
+    is_stale: bool  # Whether the journal file is of another output directory, and is started over
+
+    def __init__(
+        self,
+        journal_file: str | Path,
+        fsync: bool = False,
+        output_dir: str | Path | None = None,
+    ):
+        self.journal_file = Path(journal_file)
+        self.records = {}
+        self.fsync = fsync
+        self.file = None
+        self.output_identity = (
+            get_output_identity(output_dir) if output_dir is not None else None
+        )
+        self.is_stale = False
+
+        if self.journal_file.exists():
+            identity, self.records = self.read_records(self.journal_file)
+
+            if output_dir is not None and (
+                self.output_identity is None or identity != self.output_identity
+            ):
+                self.records = {}
+                self.is_stale = True
+
+    @staticmethod
+    def read_records(
+        journal_file: Path,
+    ) -> tuple[list[int] | None, dict[str, dict[str, Any]]]:
+        # Gives the identity of the output directory and the records
+        identity: list[int] | None = None
+        records: dict[str, dict[str, Any]] = {}
+
+        with open(journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                # A line without a newline was cut off by a crash, so its unit is not complete
+                if not line.endswith("\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if "output" in record:
+                    identity = record["output"]
+                else:
+                    records[record["unit"]] = record
+
+        return identity, records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def is_completed(self, unit: str) -> bool:
+        return unit in self.records
+
+    def get_record(self, unit: str) -> dict[str, Any]:
+        return self.records[unit]
+
+    def record(self, unit: str, **data: Any) -> None:
+        if self.file is None:
+            self.open_file()
+
+        record = {"unit": unit, **data}
+        self.write_line(record)
+        self.records[unit] = record
+
+    def open_file(self) -> None:
+        self.journal_file.parent.mkdir(parents=True, exist_ok=True)
+
+        if self.is_stale or not self.journal_file.exists():
+            self.file = open(self.journal_file, "w", encoding="utf-8")
+            self.is_stale = False
+            if self.output_identity is not None:
+                self.write_line({"output": self.output_identity})
+        else:
+            self.truncate_incomplete_line()
+            self.file = open(self.journal_file, "a", encoding="utf-8")
+
+    def write_line(self, line: dict[str, Any]) -> None:
+        assert self.file is not None
+        self.file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+        # Flushing is enough to survive a killed process; fsync also survives a power loss
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def truncate_incomplete_line(self) -> None:
+        if not self.journal_file.exists():
+            return
+
+        with open(self.journal_file, "rb+") as f:
+            content = f.read()
+            complete_length = content.rfind(b"\n") + 1
+            if complete_length != len(content):
+                f.truncate(complete_length)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def open_progress_journal(
+    journal_file: str | Path | None,
+    fsync: bool = False,
+    output_dir: str | Path | None = None,
+) -> AbstractContextManager[ProgressJournal | None]:
+    # Gives None instead of a journal when no journal file is used
+    if journal_file is None:
+        return nullcontext()
+    return ProgressJournal(journal_file, fsync=fsync, output_dir=output_dir)
@@ -0,0 +1,280 @@
+# This script recentres the glyphs of target images whose font is drawn off-centre
+# (e.g. the fonts of the fyp23 dataset that are "Shifted Left & Up").
+# For every font, the ink bounding box of every image is found with numpy over stacked batches,
+# and the median offset of the glyph centres from the image centre is the offset of the font.
+# Every glyph of the font is moved by the opposite of that offset, so the glyphs keep their positions
+# relative to each other (e.g. "一" stays near the middle and "丶" stays near the top).
+# Images keep their size, so that they still match the content images of the dataset, and an image
+# whose glyph is not moved is not rewritten. (A canvas size can be given to also place every image on a canvas
+# of that size, e.g. when the content images are rendered at another size.)
+# A glyph is moved less if the full offset would push its ink off the canvas.
+# Fonts are processed in parallel, one font per worker process.
+
+# Dataset format:
+# xxx-dataset/
+# ├── TargetImage/  <-- images are rewritten in place
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png
+# │   │   ├── fontA+char2.png
+# │   ├── fontB/
+# │   │   ├── fontB+char1.png
+# │   │   ├── fontB+char2.png
+
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from .dataset_manifest import write_dataset_manifest_for
+from .glyph_ink import find_ink, find_ink_bounding_boxes
+from .metrics import count_items, metrics_stage
+from .output_writer import is_hidden_file_name, permissive_umask, save_image
+
+# Modes that numpy arrays can be turned back into without losing information
+recentered_image_modes = ["L", "LA", "RGB", "RGBA"]
+
+
+class FontRecentering:
+    font: str
+    offset: tuple[
+        float, float
+    ]  # Median (x, y) offset of the glyph centres from the image centre
+    image_count: int
+    rewritten_count: int
+    clamped_count: (
+        int  # Glyphs moved less than the font offset to keep their ink on the canvas
+    )
+    failed_files: list[Path]
+
+    def __init__(
+        self,
+        font: str,
+        offset: tuple[float, float],
+        image_count: int,
+        rewritten_count: int,
+        clamped_count: int,
+        failed_files: list[Path],
+    ):
+        self.font = font
+        self.offset = offset
+        self.image_count = image_count
+        self.rewritten_count = rewritten_count
+        self.clamped_count = clamped_count
+        self.failed_files = failed_files
+
+
+class DecodedGlyph:
+    file: Path
+    format: str
+    pixels: np.ndarray  # (height, width) or (height, width, channels)
+    grayscale: np.ndarray  # (height, width)
+
+    def __init__(
+        self, file: Path, format: str, pixels: np.ndarray, grayscale: np.ndarray
+    ):
+        self.file = file
+        self.format = format
+        self.pixels = pixels
+        self.grayscale = grayscale
+
+
+def decode_glyph(file: Path) -> DecodedGlyph | None:
+    try:
+        with Image.open(file) as image:
+            format = image.format or Image.registered_extensions()[file.suffix.lower()]
+            if image.mode not in recentered_image_modes:
+                image = image.convert("RGB")
+            return DecodedGlyph(
+                file, format, np.asarray(image), np.asarray(image.convert("L"))
+            )
+    except Exception:
+        return None
+
+
+def find_glyph_boxes(glyphs: list[DecodedGlyph]) -> tuple[np.ndarray, np.ndarray]:
+    # Gives (count, 4) ink boxes (left, top, right, bottom) and a mask of the glyphs with ink,
+    # computed for each group of images of the same size at once
+    boxes = np.zeros((len(glyphs), 4), dtype=np.int64)
+    has_ink = np.zeros(len(glyphs), dtype=bool)
+
+    indices_by_shape: dict[tuple[int, ...], list[int]] = {}
+    for index, glyph in enumerate(glyphs):
+        indices_by_shape.setdefault(glyph.grayscale.shape, []).append(index)
+
+    for indices in indices_by_shape.values():
+        images = np.stack([glyphs[index].grayscale for index in indices])
+        boxes[indices], has_ink[indices] = find_ink_bounding_boxes(find_ink(images))
+
+    return boxes, has_ink
+
+
+def get_glyph_shifts(
+    boxes: np.ndarray,
+    has_ink: np.ndarray,
+    origins: np.ndarray,
+    canvas_lengths: np.ndarray,
+    axis: int,
+    min_offset: float,
+) -> tuple[float, int, np.ndarray]:
+    # For one axis (0 for x, 1 for y), gives the median offset of the font, the shift of the font
+    # and the shift of every glyph.
+    # origins are the positions of the images on their canvases before they are moved.
+    starts = boxes[:, axis] + origins
+    ends = boxes[:, axis + 2] + origins
+
+    offsets = (starts + ends) / 2 - canvas_lengths / 2
+    offset = float(np.median(offsets[has_ink])) if has_ink.any() else 0.0
+
+    shift = 0 if abs(offset) < min_offset else -round(offset)
+
+    # The shift is limited so that the ink stays on the canvas,
+    # and glyphs larger than the canvas are centred instead
+    lowest_shifts = -starts
+    highest_shifts = canvas_lengths - ends
+    fitting_shifts = np.clip(shift, lowest_shifts, highest_shifts)
+    centring_shifts = np.round((lowest_shifts + highest_shifts) / 2).astype(np.int64)
+
+    shifts = np.where(
+        lowest_shifts <= highest_shifts, fitting_shifts, centring_shifts
+    ).astype(np.int64)
+    shifts[~has_ink] = shift
+
+    return offset, shift, shifts
+
+
+def place_on_canvas(
+    pixels: np.ndarray, canvas_size: tuple[int, int], position: tuple[int, int]
+) -> np.ndarray:
+    # The canvas is filled with the background of the image (the median of its border pixels, per channel)
+    canvas_width, canvas_height = canvas_size
+    height, width = pixels.shape[:2]
+    x, y = position
+
+    border = np.concatenate([pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]])
+    background = np.median(border, axis=0).astype(pixels.dtype)
+
+    canvas = np.empty((canvas_height, canvas_width, *pixels.shape[2:]), pixels.dtype)
+    canvas[...] = background
+
+    # Only the part of the image that lands on the canvas is copied
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + width, canvas_width), min(y + height, canvas_height)
+    if left < right and top < bottom:
+        canvas[top:bottom, left:right] = pixels[
+            top - y : bottom - y, left - x : right - x
+        ]
+
+    return canvas
+
+
+def recenter_font(
+    font_path: Path,
+    canvas_size: tuple[int, int] | None,
+    min_offset: float,
+    dry_run: bool,
+) -> FontRecentering:
+    # Runs in a worker process, so that the offset model of a font is built from images decoded only once
+    glyphs: list[DecodedGlyph] = []
+    failed_files: list[Path] = []
+
+    for file in sorted(font_path.iterdir()):
+        if file.is_file() and not is_hidden_file_name(file.name):
+            glyph = decode_glyph(file)
+            if glyph is None:
+                failed_files.append(file)
+            else:
+                glyphs.append(glyph)
+
+    if not glyphs:
+        return FontRecentering(
+            font_path.name, (0.0, 0.0), len(failed_files), 0, 0, failed_files
+        )
+
+    boxes, has_ink = find_glyph_boxes(glyphs)
+
+    # Without a canvas size, every image is its own canvas
+    sizes = np.array([glyph.grayscale.shape[::-1] for glyph in glyphs])
+    canvas_sizes = (
+        sizes if canvas_size is None else np.broadcast_to(canvas_size, sizes.shape)
+    )
+    origins = (canvas_sizes - sizes) // 2
+
+    offset_x, font_shift_x, shifts_x = get_glyph_shifts(
+        boxes, has_ink, origins[:, 0], canvas_sizes[:, 0], 0, min_offset
+    )
+    offset_y, font_shift_y, shifts_y = get_glyph_shifts(
+        boxes, has_ink, origins[:, 1], canvas_sizes[:, 1], 1, min_offset
+    )
+
+    is_clamped = has_ink & ((shifts_x != font_shift_x) | (shifts_y != font_shift_y))
+
+    is_canvas_size = (sizes == canvas_sizes).all(axis=1)
+    needs_rewrite = ~is_canvas_size | (shifts_x != 0) | (shifts_y != 0)
+
+    if not dry_run:
+        for index in np.flatnonzero(needs_rewrite):
+            glyph = glyphs[index]
+            position = (
+                int(origins[index, 0] + shifts_x[index]),
+                int(origins[index, 1] + shifts_y[index]),
+            )
+            canvas = place_on_canvas(
+                glyph.pixels, tuple(canvas_sizes[index].tolist()), position
+            )
+            save_image(Image.fromarray(canvas), glyph.file, format=glyph.format)
+
+    return FontRecentering(
+        font_path.name,
+        (offset_x, offset_y),
+        image_count=len(glyphs) + len(failed_files),
+        rewritten_count=int(needs_rewrite.sum()),
+        clamped_count=int(is_clamped.sum()),
+        failed_files=failed_files,
+    )
+
+
+@metrics_stage("recenter target images")
+@permissive_umask()
+def recenter_target_images(
+    target_image_dir: str | Path,
+    canvas_size: tuple[int, int] | None = None,
+    min_offset: float = 1.0,
+    dry_run: bool = False,
+    max_workers: int | None = None,
+) -> list[FontRecentering]:
+    # Images keep their size unless canvas_size is given, so only images whose glyph is moved are rewritten.
+    # Fonts whose median offset is below min_offset (in pixels) on an axis are not moved on that axis.
+    # With dry_run, the offsets are measured but no image is rewritten.
+    font_paths = sorted(
+        font_path
+        for font_path in Path(target_image_dir).iterdir()
+        if font_path.is_dir()
+    )
+
+    recenterings: list[FontRecentering] = []
+
+    # Decoding and encoding are CPU bound, so fonts are processed in worker processes
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        results = executor.map(
+            recenter_font,
+            font_paths,
+            repeat(canvas_size),
+            repeat(min_offset),
+            repeat(dry_run),
+        )
+
+        for recentering in tqdm(results, total=len(font_paths), desc="Recenter fonts"):
+            recenterings.append(recentering)
+            count_items(recentering.image_count)
+
+    if not dry_run and any(recentering.rewritten_count for recentering in recenterings):
+        write_dataset_manifest_for(target_image_dir)
+
+    return recenterings
@@ -0,0 +1,119 @@
+# This script splits the work of a converter across several machines that share one filesystem.
+# Every work unit (e.g. a GNT file, a font directory or a content character) is assigned to a shard
+# by a stable hash of its name, so every machine computes the same assignment without coordination.
+# Each shard writes a report of its results, and the reports are merged into the result of a single-machine run.
+
+# Usage:
+# python -m scripts.casia.step_0_create_target_images --shard 0/4  (on machine 1)
+# python -m scripts.casia.step_0_create_target_images --shard 1/4  (on machine 2)
+# ...
+
+# Report format (JSON):
+# {
+#     "shard": "0/4",
+#     "success": ["char1", "char2"],
+#     "skipped": ["char3"],
+# }
+
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Callable, Iterable, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    # Input Format: index/count, e.g. 0/4
+    try:
+        shard_index, shard_count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f'Shard "{shard}" should be in the format "index/count".')
+
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f'Shard "{shard}" should have 0 <= index < count.')
+
+    return shard_index, shard_count
+
+
+def parse_shard_argument(arguments: Sequence[str]) -> tuple[int, int]:
+    # Reads "--shard index/count" from the command line arguments, defaulting to a single shard
+    if "--shard" not in arguments:
+        return 0, 1
+
+    position = list(arguments).index("--shard")
+    if position + 1 >= len(arguments):
+        raise ValueError('Argument "--shard" should be followed by "index/count".')
+
+    return parse_shard(arguments[position + 1])
+
+
+def get_shard_of(unit: str, shard_count: int) -> int:
+    # Python's hash() is randomized per process, so a fixed hash function is used instead
+    digest = hashlib.blake2b(unit.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+
+def select_shard(
+    units: Iterable[T],
+    shard_index: int,
+    shard_count: int,
+    key: Callable[[T], str] = str,
+) -> list[T]:
+    if shard_count == 1:
+        return list(units)
+
+    return [
+        unit for unit in units if get_shard_of(key(unit), shard_count) == shard_index
+    ]
+
+
+def get_shard_path(path: str | Path, shard_index: int, shard_count: int) -> Path:
+    # Gives each shard its own file, e.g. report.json -> report.shard-0-of-4.json
+    shard_path = Path(path)
+    return shard_path.with_name(
+        f"{shard_path.stem}.shard-{shard_index}-of-{shard_count}{shard_path.suffix}"
+    )
+
+
+def write_shard_report(
+    report_file: str | Path,
+    shard_index: int,
+    shard_count: int,
+    **results: set[str],
+) -> None:
+    report = {"shard": f"{shard_index}/{shard_count}"}
+    report.update({name: sorted(values) for name, values in results.items()})
+
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def merge_shard_reports(report_files: Sequence[str | Path]) -> dict[str, set[str]]:
+    # Every work unit belongs to exactly one shard, so the union of the shard results
+    # is the result of a single-machine run
+    merged_results: dict[str, set[str]] = {}
+    shard_indices: set[int] = set()
+    shard_counts: set[int] = set()
+
+    for report_file in report_files:
+        with open(report_file, "r", encoding="utf-8") as f:
+            report = json.load(f)
+
+        shard_index, shard_count = parse_shard(report.pop("shard"))
+        shard_indices.add(shard_index)
+        shard_counts.add(shard_count)
+
+        for name, values in report.items():
+            merged_results.setdefault(name, set()).update(values)
+
+    if len(shard_counts) > 1:
+        raise ValueError(f"Shard reports have different shard counts: {shard_counts}")
+
+    if shard_counts and len(shard_indices) != shard_counts.pop():
+        raise ValueError(
+            f"Shard reports are missing for some shards, found: {sorted(shard_indices)}"
+        )
+
+    return merged_results
@@ -0,0 +1,300 @@
+# This script overlaps the read, decode/encode and write steps of a converter.
+# Items flow through a chain of stages connected by bounded queues, so that reading the next sample,
+# encoding the current one and writing the previous one happen at the same time.
+# I/O stages run in threads. CPU stages can run in worker processes, driven by one thread per worker.
+# A full queue blocks the stage before it (backpressure), so at most a fixed number of items are in memory.
+
+# Usage:
+# with StreamingPipeline(
+#     [
+#         StreamingStage("encode", encode_function, workers=4, use_processes=True),
+#         StreamingStage("write", write_function, workers=2),
+#     ]
+# ) as pipeline:
+#     for result in pipeline.run(read_items()):
+#         ...
+#     print(pipeline.format_statistics())
+
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+# Marks the end of the items in a queue
+end_of_items = object()
+
+# Process-local state created by the initializer of a process stage (e.g. a loaded font)
+worker_state: dict[str, Any] = {}
+
+
+class StreamingStage:
+    name: str
+    function: Callable[[Any], Any]
+    workers: int
+    use_processes: bool
+    chunk_size: int
+    initializer: Callable[..., None] | None
+    initargs: tuple
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable[[Any], Any],
+        workers: int = 1,
+        use_processes: bool = False,
+        chunk_size: int = 16,
+        initializer: Callable[..., None] | None = None,
+        initargs: tuple = (),
+    ):
+        # A function in a process stage must be defined at module level, so that it can be pickled.
+        # Items are sent to worker processes in chunks, so that small items do not pay the IPC cost one by one.
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.use_processes = use_processes
+        self.chunk_size = chunk_size if use_processes else 1
+        self.initializer = initializer
+        self.initargs = initargs
+
+
+class StageStatistics:
+    name: str
+    items: int
+    busy_seconds: float
+    wall_seconds: float
+    lock: threading.Lock
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, items: int, busy_seconds: float):
+        with self.lock:
+            self.items += items
+            self.busy_seconds += busy_seconds
+
+    def get_throughput(self) -> float:
+        # Items per second over the time the pipeline was running
+        return self.items / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.name}: {self.items} items, {self.get_throughput():.1f} items/s, "
+            f"busy {self.busy_seconds:.2f}s of {self.wall_seconds:.2f}s"
+        )
+
+
+def get_default_encode_workers() -> int | None:
+    # With a single CPU, the encode processes only add overhead
+    cpu_count = os.process_cpu_count() or 1
+    return cpu_count if cpu_count > 1 else None
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+def apply_to_chunk(function: Callable[[Any], Any], chunk: list[Any]) -> list[Any]:
+    return [function(item) for item in chunk]
+
+
+class StreamingPipeline:
+    stages: list[StreamingStage]
+    max_queued_items: int
+    statistics: list[StageStatistics]
+    executors: list[ProcessPoolExecutor | None]
+
+    def __init__(self, stages: Sequence[StreamingStage], max_queued_items: int = 64):
+        self.stages = list(stages)
+        self.max_queued_items = max_queued_items
+        self.statistics = [StageStatistics("read")] + [
+            StageStatistics(stage.name) for stage in self.stages
+        ]
+        self.executors = [None] * len(self.stages)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_executor(self, stage_number: int) -> ProcessPoolExecutor | None:
+        # Worker processes are started once and reused by every run of the pipeline.
+        # They are spawned rather than forked, since forking a process with running threads is unsafe.
+        stage = self.stages[stage_number]
+
+        if stage.use_processes and self.executors[stage_number] is None:
+            self.executors[stage_number] = ProcessPoolExecutor(
+                max_workers=stage.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=stage.initializer,
+                initargs=stage.initargs,
+            )
+
+        return self.executors[stage_number]
+
+    def close(self):
+        for executor in self.executors:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        self.executors = [None] * len(self.stages)
+
+    def run(self, items: Iterable[Any]) -> Iterator[Any]:
+        # Results are given in the order they finish, which may differ from the order of the items.
+        # Statistics add up over all runs of the pipeline.
+        read_statistics = self.statistics[0]
+
+        queues: list[queue.Queue] = [
+            queue.Queue(maxsize=self.max_queued_items)
+            for _ in range(len(self.stages) + 1)
+        ]
+        stop_event = threading.Event()
+        errors: list[BaseException] = []
+
+        executors = [
+            self.get_executor(stage_number) for stage_number in range(len(self.stages))
+        ]
+
+        def put(output_queue: queue.Queue, item: Any):
+            # Waits for space in the queue, but gives up when the pipeline is stopped
+            while True:
+                try:
+                    output_queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    if stop_event.is_set():
+                        raise PipelineStopped()
+
+        def get(input_queue: queue.Queue) -> Any:
+            while True:
+                try:
+                    return input_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if stop_event.is_set():
+                        raise PipelineStopped()
+
+        def fail(error: BaseException):
+            errors.append(error)
+            stop_event.set()
+
+        def read_items():
+            output_queue = queues[0]
+            try:
+                iterator = iter(items)
+                while True:
+                    start_time = time.perf_counter()
+                    item = next(iterator, end_of_items)
+                    is_item = item is not end_of_items
+                    read_statistics.add(int(is_item), time.perf_counter() - start_time)
+                    if not is_item:
+                        break
+                    put(output_queue, item)
+                put(output_queue, end_of_items)
+            except PipelineStopped:
+                pass
+            except BaseException as e:
+                fail(e)
+
+        def run_stage(stage_number: int, remaining_workers: list[int]):
+            stage = self.stages[stage_number]
+            stage_statistics = self.statistics[stage_number + 1]
+            executor = executors[stage_number]
+            input_queue = queues[stage_number]
+            output_queue = queues[stage_number + 1]
+
+            try:
+                is_finished = False
+                while not is_finished:
+                    chunk = []
+                    item = get(input_queue)
+
+                    # Take more items for a chunk only if they are already waiting
+                    while item is not end_of_items:
+                        chunk.append(item)
+                        if len(chunk) >= stage.chunk_size:
+                            break
+                        try:
+                            item = input_queue.get_nowait()
+                        except queue.Empty:
+                            break
+
+                    if item is end_of_items:
+                        # Pass the end marker on to the other workers of this stage
+                        put(input_queue, end_of_items)
+                        is_finished = True
+
+                    if not chunk:
+                        continue
+
+                    start_time = time.perf_counter()
+                    if executor is None:
+                        results = apply_to_chunk(stage.function, chunk)
+                    else:
+                        results = executor.submit(
+                            apply_to_chunk, stage.function, chunk
+                        ).result()
+                    stage_statistics.add(len(chunk), time.perf_counter() - start_time)
+
+                    for result in results:
+                        put(output_queue, result)
+
+                with stage_statistics.lock:
+                    remaining_workers[0] -= 1
+                    is_last_worker = remaining_workers[0] == 0
+
+                if is_last_worker:
+                    put(output_queue, end_of_items)
+
+            except PipelineStopped:
+                pass
+            except BaseException as e:
+                fail(e)
+
+        threads = [threading.Thread(target=read_items, daemon=True)]
+        for stage_number, stage in enumerate(self.stages):
+            remaining_workers = [stage.workers]
+            threads.extend(
+                threading.Thread(
+                    target=run_stage,
+                    args=(stage_number, remaining_workers),
+                    daemon=True,
+                )
+                for _ in range(stage.workers)
+            )
+
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                try:
+                    result = get(queues[-1])
+                except PipelineStopped:
+                    break
+                if result is end_of_items:
+                    break
+                yield result
+
+        finally:
+            # Also stops the stages when the caller stops early
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+            wall_seconds = time.perf_counter() - start_time
+            for stage_statistics in self.statistics:
+                stage_statistics.wall_seconds += wall_seconds
+
+        if errors:
+            raise errors[0]
+
+    def format_statistics(self) -> str:
+        return "\n".join(str(stage_statistics) for stage_statistics in self.statistics)
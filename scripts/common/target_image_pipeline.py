@@ -0,0 +1,125 @@
+# This script builds the pipeline of a dataset whose target images are extracted from a downloaded source
+# (e.g. CASIA and zhuojg), and whose content images are rendered from a font for the characters found.
+# The dataset scripts (e.g. scripts/casia/run_pipeline.py) give their own step that creates the target images.
+
+# Stages:
+# create target images: xxx-dataset-source/ -> xxx-dataset/TargetImage/
+# create content images: xxx-dataset/TargetImage/ -> xxx-dataset/ContentImage/
+# delete target images without content image (optional): xxx-dataset/ContentImage/ -> xxx-dataset/TargetImage/
+
+
+from pathlib import Path
+from typing import Any, Callable
+
+from .create_content_images_from_target_images import (
+    create_content_images_from_target_images,
+)
+from .delete_target_images_without_content_image import (
+    delete_target_images_without_content_image,
+)
+from .pipeline import Stage, get_pipeline_state_path, run_pipeline
+
+
+def build_target_image_stages(
+    create_target_images: Callable[..., Any],
+    source_dir: str | Path,
+    dataset_dir: str | Path,
+    font_dir: str | Path,
+    image_size: tuple[int, int],
+    font_size: int,
+    delete_target_images_without_content_images: bool,
+) -> list[Stage]:
+    # create_target_images is the step_0 function of the dataset, which gives the characters it created
+    # target images of (reused by the content images stage) and the characters it skipped
+    content_image_dir = Path(dataset_dir) / "ContentImage"
+    target_image_dir = Path(dataset_dir) / "TargetImage"
+
+    def run_create_target_images(context: dict[str, Any]):
+        return create_target_images(
+            source_dir=source_dir, output_target_image_dir=target_image_dir
+        )
+
+    def run_create_content_images(context: dict[str, Any]):
+        # Reuse the characters found by the previous stage if it ran in this process
+        required_characters = None
+        if "create target images" in context:
+            required_characters, _ = context["create target images"]
+
+        return create_content_images_from_target_images(
+            output_content_image_dir=content_image_dir,
+            target_image_dir=target_image_dir,
+            font_dir=font_dir,
+            image_size=image_size,
+            font_size=font_size,
+            required_characters=required_characters,
+        )
+
+    def run_delete_target_images(context: dict[str, Any]):
+        return delete_target_images_without_content_image(
+            content_image_dir=content_image_dir,
+            target_image_dir=target_image_dir,
+        )
+
+    stages = [
+        Stage(
+            name="create target images",
+            inputs=[source_dir],
+            outputs=[target_image_dir],
+            run=run_create_target_images,
+        ),
+        Stage(
+            name="create content images",
+            inputs=[target_image_dir, font_dir],
+            outputs=[content_image_dir],
+            run=run_create_content_images,
+            parameters={"image_size": image_size, "font_size": font_size},
+        ),
+    ]
+
+    if delete_target_images_without_content_images:
+        stages.append(
+            Stage(
+                name="delete target images without content image",
+                inputs=[content_image_dir, target_image_dir],
+                outputs=[target_image_dir],
+                run=run_delete_target_images,
+            )
+        )
+
+    return stages
+
+
+def run_target_image_pipeline(
+    create_target_images: Callable[..., Any],
+    source_dir: str | Path,
+    dataset_dir: str | Path,
+    font_dir: str | Path,
+    image_size: tuple[int, int],
+    font_size: int,
+    delete_target_images_without_content_images: bool,
+):
+    stages = build_target_image_stages(
+        create_target_images=create_target_images,
+        source_dir=source_dir,
+        dataset_dir=dataset_dir,
+        font_dir=font_dir,
+        image_size=image_size,
+        font_size=font_size,
+        delete_target_images_without_content_images=delete_target_images_without_content_images,
+    )
+
+    context = run_pipeline(stages, state_file=get_pipeline_state_path(dataset_dir))
+
+    if "create content images" in context:
+        result = context["create content images"]
+
+        if not result:
+            print("Failed to create content images.")
+            return
+
+        successful, unsuccessful = result
+
+        if unsuccessful:
+            print(
+                f"Content images for some characters could not be created: {', '.join(unsuccessful)}"
+            )
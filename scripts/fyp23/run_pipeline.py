@@ -0,0 +1,73 @@
+# This script prepares the fyp23 dataset from the downloaded source with the pipeline runner.
+# It runs the same steps as step_0 and step_1, and skips the steps that are up to date.
+
+# Stages:
+# create content and target images: fyp23-dataset-source/ -> fyp23-dataset/ContentImage/, fyp23-dataset/TargetImage/
+# recenter target images: fyp23-dataset/TargetImage/ -> fyp23-dataset/TargetImage/ (in place)
+
+
+from pathlib import Path
+from typing import Any
+
+from ..common.metrics import record_metrics
+from ..common.pipeline import Stage, get_pipeline_state_path, run_pipeline
+from ..common.recenter_target_images import recenter_target_images
+from .step_0_create_content_and_target_images import create_content_and_target_images
+
+
+def build_stages(
+    source_dir: str | Path,
+    source_wordlist: str | Path,
+    output_dir: str | Path,
+    canvas_size: tuple[int, int] | None = None,
+    min_offset: float = 1.0,
+) -> list[Stage]:
+    target_image_dir = Path(output_dir) / "TargetImage"
+
+    def run_create_content_and_target_images(context: dict[str, Any]):
+        return create_content_and_target_images(
+            source_dir=source_dir,
+            source_wordlist=source_wordlist,
+            output_dir=output_dir,
+        )
+
+    def run_recenter_target_images(context: dict[str, Any]):
+        return recenter_target_images(
+            target_image_dir, canvas_size=canvas_size, min_offset=min_offset
+        )
+
+    return [
+        Stage(
+            name="create content and target images",
+            inputs=[source_dir, source_wordlist],
+            outputs=[Path(output_dir) / "ContentImage", target_image_dir],
+            run=run_create_content_and_target_images,
+        ),
+        # The images are rewritten in place, and the pipeline fingerprints them again after the stage
+        Stage(
+            name="recenter target images",
+            inputs=[target_image_dir],
+            outputs=[target_image_dir],
+            run=run_recenter_target_images,
+            parameters={"canvas_size": canvas_size, "min_offset": min_offset},
+        ),
+    ]
+
+
+@record_metrics("fyp23-dataset-pipeline", dataset_dir="fyp23-dataset")
+def main():
+    source_dir = "fyp23-dataset-source"
+
+    source_wordlist = "fyp23-dataset-source/wordlist.txt"
+
+    output_dir = "fyp23-dataset"
+
+    stages = build_stages(
+        source_dir=source_dir, source_wordlist=source_wordlist, output_dir=output_dir
+    )
+
+    run_pipeline(stages, state_file=get_pipeline_state_path(output_dir))
+
+
+if __name__ == "__main__":
+    main()
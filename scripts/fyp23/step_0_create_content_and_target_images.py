@@ -27,26 +27,17 @@
 # │   │   ├── fontB+char2.png
 
 
-import shutil
 from pathlib import Path
 
 from tqdm import tqdm
 
-
-def ensure_dir_exists_with_perms(path: str | Path):
-    # Create a Path object
-    base_path = Path(path)
-
-    # Create the directory if it doesn't exist
-    base_path.mkdir(parents=True, exist_ok=True)
-
-    # Change permissions of the base directory itself
-    base_path.chmod(0o777)
-
-    # Traverse up the directory tree and change permissions
-    for parent in base_path.parents:
-        if parent != Path("."):
-            parent.chmod(0o777)
+from ..common.dataset_manifest import write_dataset_manifest
+from ..common.metrics import count_items, metrics_stage, record_metrics
+from ..common.output_writer import (
+    copy_file,
+    ensure_dir_exists_with_perms,
+    permissive_umask,
+)
 
 
 def get_word_from_token(wordlist: str, token: str) -> str:
@@ -54,6 +45,7 @@ def get_word_from_token(wordlist: str, token: str) -> str:
     return wordlist[index]
 
 
+@metrics_stage("copy target images")
 def copy_target_images(
     source_target_dir: str | Path, output_target_image_dir: str | Path, wordlist: str
 ):
@@ -68,8 +60,7 @@ def copy_target_images(
         font_name = source_font_path.stem
 
         target_font_path = target_image_path / font_name
-        target_font_path.mkdir(parents=True, exist_ok=True)
-        target_font_path.chmod(0o777)
+        ensure_dir_exists_with_perms(target_font_path)
 
         total_files = len(list(source_font_path.iterdir()))
 
@@ -83,8 +74,8 @@ def copy_target_images(
             new_img_file = (
                 target_font_path / f"{font_name}+{word}{source_img_file.suffix}"
             )
-            shutil.copy(source_img_file, new_img_file)
-            new_img_file.chmod(0o777)
+            copy_file(source_img_file, new_img_file)
+            count_items(1)
 
     font_list = [
         source_font_path.stem for source_font_path in source_target_path.iterdir()
@@ -93,6 +84,7 @@ def copy_target_images(
     return font_list
 
 
+@metrics_stage("copy content images")
 def copy_content_images(
     source_content_dir: str | Path, output_content_image_dir: str | Path, wordlist: str
 ):
@@ -107,10 +99,11 @@ def copy_content_images(
         if source_img_file.is_file():
             word = get_word_from_token(wordlist, source_img_file.stem)
             new_img_file = content_image_path / f"{word}{source_img_file.suffix}"
-            shutil.copy(source_img_file, new_img_file)
-            new_img_file.chmod(0o777)
+            copy_file(source_img_file, new_img_file)
+            count_items(1)
 
 
+@permissive_umask()
 def create_content_and_target_images(
     source_dir: str | Path,
     source_wordlist: str | Path,
@@ -142,7 +135,12 @@ def create_content_and_target_images(
 
     print(f"Number of target fonts: {len(font_list)}")
 
+    write_dataset_manifest(output_dir)
+
+    return font_list
+
 
+@record_metrics("fyp23-dataset", dataset_dir="fyp23-dataset")
 def main():
     source_dir = "fyp23-dataset-source"
 
@@ -0,0 +1,51 @@
+# This script recentres the target images of the fyp23 dataset.
+# Many of its fonts are drawn off-centre (see the table in README.md), while the content images are centred.
+
+# Dataset format:
+# fyp23-dataset/
+# ├── ContentImage/
+# │   ├── char1.png
+# │   ├── char2.png
+# ├── TargetImage/  <-- images are rewritten in place
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png
+# │   │   ├── fontA+char2.png
+
+
+from ..common.metrics import record_metrics
+from ..common.recenter_target_images import recenter_target_images
+
+
+@record_metrics("fyp23-dataset-recentering", dataset_dir="fyp23-dataset")
+def main():
+    target_image_dir = "fyp23-dataset/TargetImage"
+
+    # The images keep their size, so that they match the content images (which are copied, not rendered)
+    canvas_size = None
+
+    # Fonts offset by less than this many pixels are considered centred
+    min_offset = 1.0
+
+    # Set dry_run to only print the offset of every font
+    dry_run = False
+
+    recenterings = recenter_target_images(
+        target_image_dir,
+        canvas_size=canvas_size,
+        min_offset=min_offset,
+        dry_run=dry_run,
+    )
+
+    for recentering in recenterings:
+        offset_x, offset_y = recentering.offset
+        print(
+            f"{recentering.font}: offset ({offset_x:+.1f}, {offset_y:+.1f}), "
+            f"{recentering.rewritten_count}/{recentering.image_count} images rewritten, "
+            f"{recentering.clamped_count} clamped"
+        )
+        for failed_file in recentering.failed_files:
+            print(f"Cannot read image: {failed_file.as_posix()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+# This script finds fonts of the neumason dataset source that are duplicates or near-duplicates of each other,
+# and recommends which of them to reject before the content and target images are created.
+# A sample of the characters shared by most fonts is hashed with a perceptual hash for every font.
+# Two fonts are near-identical when their glyphs differ by only a few bits on average,
+# and near-identical fonts are grouped into clusters. One font of every cluster is kept:
+# the content font if it is in the cluster, otherwise the font with the most characters (then the shortest name).
+
+# Dataset format:
+# neumason-dataset-source/png9169/
+# ├── 汉仪书宋二S.ttf  <-- one font is used for content images, and is never rejected
+# │   ├── char1.png
+# │   ├── char2.png
+# ├── fontA01000000100001000.ttf
+# │   ├── char1.png
+# │   ├── char2.png
+# ├── fontA01000000100001000(duplicate).ttf
+# │   ├── char1.png
+# │   ├── char2.png
+
+# Output format (JSON):
+# {
+#     "clusters": [["fontA01000000100001000.ttf", "fontA01000000100001000(duplicate).ttf"]],
+#     "rejected_font_dirs": ["fontA01000000100001000(duplicate).ttf"]
+# }
+
+
+import json
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from ..common.image_hash import get_hamming_distances, read_difference_hash
+from ..common.metrics import count_items, metrics_stage, record_metrics
+
+
+def list_font_characters(source_dir: str | Path) -> dict[str, set[str]]:
+    # Font directory name -> characters of the font
+    font_characters: dict[str, set[str]] = {}
+
+    for font_path in sorted(Path(source_dir).iterdir()):
+        if not font_path.is_dir():
+            continue
+
+        with os.scandir(font_path) as entries:
+            font_characters[font_path.name] = {
+                Path(entry.name).stem for entry in entries if entry.is_file()
+            }
+
+    return font_characters
+
+
+def select_sample_characters(
+    font_characters: dict[str, set[str]], sample_size: int
+) -> list[str]:
+    # The characters found in the most fonts are chosen, so that most pairs of fonts share most of the sample
+    character_counts = Counter(
+        character for characters in font_characters.values() for character in characters
+    )
+
+    ranked_characters = sorted(
+        character_counts,
+        key=lambda character: (-character_counts[character], character),
+    )
+
+    return ranked_characters[:sample_size]
+
+
+def hash_font_characters(
+    font_path: Path, characters: list[str], font_character_set: set[str]
+) -> list[int | None]:
+    # Gives None for the characters that the font does not have
+    return [
+        (
+            read_difference_hash(font_path / f"{character}.png")
+            if character in font_character_set
+            else None
+        )
+        for character in characters
+    ]
+
+
+@metrics_stage("hash fonts")
+def hash_fonts(
+    source_dir: str | Path,
+    font_characters: dict[str, set[str]],
+    sample_characters: list[str],
+    max_workers: int | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    # Gives a hash matrix (fonts x sample characters, uint64) and a mask of the hashes that exist.
+    # Decoding images is CPU bound, so fonts are hashed in a process pool (spawned, as in the streaming pipeline).
+    source_path = Path(source_dir)
+    font_dirs = list(font_characters)
+
+    hashes = np.zeros((len(font_dirs), len(sample_characters)), dtype=np.uint64)
+    has_hash = np.zeros((len(font_dirs), len(sample_characters)), dtype=bool)
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        font_hashes = executor.map(
+            hash_font_characters,
+            [source_path / font_dir for font_dir in font_dirs],
+            [sample_characters] * len(font_dirs),
+            [font_characters[font_dir] for font_dir in font_dirs],
+            chunksize=4,
+        )
+
+        for font_number, character_hashes in enumerate(
+            tqdm(font_hashes, total=len(font_dirs), desc="Hash fonts")
+        ):
+            for character_number, character_hash in enumerate(character_hashes):
+                if character_hash is not None:
+                    hashes[font_number, character_number] = character_hash
+                    has_hash[font_number, character_number] = True
+            count_items(1)
+
+    return hashes, has_hash
+
+
+def find_similar_font_pairs(
+    hashes: np.ndarray,
+    has_hash: np.ndarray,
+    max_distance: float,
+    min_shared_characters: int,
+) -> list[tuple[int, int]]:
+    # Two fonts are similar when their shared sample characters differ by at most max_distance bits on average.
+    # Every font is compared with all later fonts at once.
+    similar_font_pairs: list[tuple[int, int]] = []
+
+    for font_number in range(len(hashes) - 1):
+        distances = get_hamming_distances(
+            hashes[font_number], hashes[font_number + 1 :]
+        )
+        shared = has_hash[font_number] & has_hash[font_number + 1 :]
+
+        shared_counts = shared.sum(axis=1)
+        total_distances = np.where(shared, distances, 0).sum(axis=1)
+
+        is_similar = (shared_counts >= min_shared_characters) & (
+            total_distances <= max_distance * shared_counts
+        )
+
+        similar_font_pairs.extend(
+            (font_number, font_number + 1 + int(offset))
+            for offset in np.flatnonzero(is_similar)
+        )
+
+    return similar_font_pairs
+
+
+def group_into_clusters(
+    item_count: int, pairs: list[tuple[int, int]]
+) -> list[list[int]]:
+    # Union-find over the pairs, giving the clusters of more than one item
+    parents = list(range(item_count))
+
+    def find_root(item: int) -> int:
+        while parents[item] != item:
+            parents[item] = parents[parents[item]]
+            item = parents[item]
+        return item
+
+    for item_a, item_b in pairs:
+        root_a, root_b = find_root(item_a), find_root(item_b)
+        if root_a != root_b:
+            parents[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters: dict[int, list[int]] = {}
+    for item in range(item_count):
+        clusters.setdefault(find_root(item), []).append(item)
+
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+
+def recommend_rejected_fonts(
+    clusters: list[list[str]],
+    font_characters: dict[str, set[str]],
+    content_font_dir: str | None = None,
+) -> list[str]:
+    rejected_font_dirs: list[str] = []
+
+    for cluster in clusters:
+        kept_font_dir = min(
+            cluster,
+            key=lambda font_dir: (
+                font_dir != content_font_dir,
+                -len(font_characters[font_dir]),
+                len(font_dir),  # Copies usually have a suffix, e.g. "(duplicate)"
+                font_dir,
+            ),
+        )
+        rejected_font_dirs.extend(
+            font_dir for font_dir in cluster if font_dir != kept_font_dir
+        )
+
+    return sorted(rejected_font_dirs)
+
+
+@metrics_stage("find duplicate fonts")
+def find_duplicate_fonts(
+    source_dir: str | Path,
+    content_font_dir: str | None = None,
+    sample_size: int = 64,
+    max_distance: float = 2.0,
+    min_shared_characters: int = 16,
+    max_workers: int | None = None,
+) -> tuple[list[list[str]], list[str]]:
+    # Gives the clusters of near-identical fonts and the font directories recommended for rejection
+    font_characters = list_font_characters(source_dir)
+    font_dirs = list(font_characters)
+
+    sample_characters = select_sample_characters(font_characters, sample_size)
+
+    hashes, has_hash = hash_fonts(
+        source_dir, font_characters, sample_characters, max_workers=max_workers
+    )
+
+    similar_font_pairs = find_similar_font_pairs(
+        hashes,
+        has_hash,
+        max_distance=max_distance,
+        min_shared_characters=max(
+            1, min(min_shared_characters, len(sample_characters))
+        ),
+    )
+
+    clusters = [
+        [font_dirs[font_number] for font_number in cluster]
+        for cluster in group_into_clusters(len(font_dirs), similar_font_pairs)
+    ]
+
+    rejected_font_dirs = recommend_rejected_fonts(
+        clusters, font_characters, content_font_dir
+    )
+
+    return clusters, rejected_font_dirs
+
+
+@record_metrics(
+    "neumason-dataset-duplicate-fonts", dataset_dir="neumason-dataset-source"
+)
+def main():
+    source_dir = "neumason-dataset-source/png9169/"
+    content_font_dir = "汉仪书宋二S10000000000000000.ttf"
+    report_file = "neumason-dataset-duplicate-fonts.json"
+
+    clusters, rejected_font_dirs = find_duplicate_fonts(
+        source_dir=source_dir, content_font_dir=content_font_dir
+    )
+
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(
+            {"clusters": clusters, "rejected_font_dirs": rejected_font_dirs},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    for cluster in clusters:
+        print(f"Near-identical fonts: {', '.join(cluster)}")
+
+    # Add these to rejected_font_dirs in step_0_create_content_and_target_images.py
+    print(f"Recommended rejected_font_dirs: {rejected_font_dirs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# This script prepares the neumason dataset from the downloaded source with the pipeline runner.
+# It runs the same step as step_0, and skips it if it is up to date.
+
+# Stages:
+# create content and target images: neumason-dataset-source/png9169/ -> neumason-dataset/ContentImage/, neumason-dataset/TargetImage/
+
+
+from pathlib import Path
+from typing import Any
+
+from ..common.metrics import record_metrics
+from ..common.pipeline import Stage, get_pipeline_state_path, run_pipeline
+from .step_0_create_content_and_target_images import create_content_and_target_images
+
+
+def build_stages(
+    source_dir: str | Path,
+    output_dir: str | Path,
+    content_font_dir: str,
+    rejected_font_dirs: list[str],
+) -> list[Stage]:
+    def run_create_content_and_target_images(context: dict[str, Any]):
+        return create_content_and_target_images(
+            source_dir=source_dir,
+            output_dir=output_dir,
+            content_font_dir=content_font_dir,
+            rejected_font_dirs=rejected_font_dirs,
+        )
+
+    return [
+        Stage(
+            name="create content and target images",
+            inputs=[source_dir],
+            outputs=[
+                Path(output_dir) / "ContentImage",
+                Path(output_dir) / "TargetImage",
+            ],
+            run=run_create_content_and_target_images,
+            parameters={
+                "content_font_dir": content_font_dir,
+                "rejected_font_dirs": rejected_font_dirs,
+            },
+        ),
+    ]
+
+
+@record_metrics("neumason-dataset-pipeline", dataset_dir="neumason-dataset")
+def main():
+    source_dir = "neumason-dataset-source/png9169/"
+
+    output_dir = "neumason-dataset/"
+
+    # Make sure this font has all the characters you need
+    content_font_dir = "汉仪书宋二S10000000000000000.ttf"
+
+    # Remove duplicate or problematic fonts
+    # (find_duplicate_fonts.py recommends the near-identical fonts to reject)
+    rejected_font_dirs = [
+        "汉仪粗仿宋简01000000100001000.ttf",  # duplicate
+        "汉仪新蒂棉花糖黑板报00001010000000000.ttf",  # has 1 char more than any other font
+    ]
+
+    stages = build_stages(
+        source_dir=source_dir,
+        output_dir=output_dir,
+        content_font_dir=content_font_dir,
+        rejected_font_dirs=rejected_font_dirs,
+    )
+
+    run_pipeline(stages, state_file=get_pipeline_state_path(output_dir))
+
+
+if __name__ == "__main__":
+    main()
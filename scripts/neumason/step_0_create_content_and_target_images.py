@@ -26,11 +26,18 @@
 # │   │   ├── fontB+char2.png
 
 
-import shutil
 from pathlib import Path
 
 from tqdm import tqdm
 
+from ..common.dataset_manifest import write_dataset_manifest
+from ..common.metrics import count_items, metrics_stage, record_metrics
+from ..common.output_writer import (
+    copy_file,
+    ensure_dir_exists_with_perms,
+    permissive_umask,
+)
+
 
 class Font:
     font_name: str
@@ -58,22 +65,6 @@ class Font:
         return name
 
 
-def ensure_dir_exists_with_perms(path: str | Path):
-    # Create a Path object
-    base_path = Path(path)
-
-    # Create the directory if it doesn't exist
-    base_path.mkdir(parents=True, exist_ok=True)
-
-    # Change permissions of the base directory itself
-    base_path.chmod(0o777)
-
-    # Traverse up the directory tree and change permissions
-    for parent in base_path.parents:
-        if parent != Path("."):
-            parent.chmod(0o777)
-
-
 def get_font_list(
     source_dir: str | Path, content_font_dir: str, rejected_font_dirs: list[str]
 ):
@@ -97,6 +88,7 @@ def get_font_list(
     return content_font, target_fonts
 
 
+@metrics_stage("copy content images")
 def copy_content_images(output_content_image_dir: str | Path, content_font: Font):
     content_image_path = Path(output_content_image_dir)
 
@@ -108,17 +100,17 @@ def copy_content_images(output_content_image_dir: str | Path, content_font: Font
     ):
         if source_file.is_file():
             new_file = content_image_path / source_file.name
-            shutil.copy(source_file, new_file)
-            new_file.chmod(0o777)
+            copy_file(source_file, new_file)
+            count_items(1)
 
 
+@metrics_stage("copy target images")
 def copy_target_images(output_target_image_dir: str | Path, target_fonts: list[Font]):
     total_fonts = len(target_fonts)
     for target_font in tqdm(target_fonts, total=total_fonts, desc="Copy target images"):
         font_destination_path = Path(output_target_image_dir) / target_font.font_name
 
-        font_destination_path.mkdir(exist_ok=True)
-        font_destination_path.chmod(0o777)
+        ensure_dir_exists_with_perms(font_destination_path)
 
         total_files = len(list(target_font.source_path.iterdir()))
         for source_file in tqdm(
@@ -132,10 +124,11 @@ def copy_target_images(output_target_image_dir: str | Path, target_fonts: list[F
                 new_file = (
                     font_destination_path / f"{target_font.font_name}+{char_name}.png"
                 )
-                shutil.copy(source_file, new_file)
-                new_file.chmod(0o777)
+                copy_file(source_file, new_file)
+                count_items(1)
 
 
+@permissive_umask()
 def create_content_and_target_images(
     source_dir: str | Path,
     output_dir: str | Path,
@@ -164,7 +157,12 @@ def create_content_and_target_images(
         output_target_image_dir=output_target_image_dir, target_fonts=target_fonts
     )
 
+    write_dataset_manifest(output_dir)
+
+    return content_font, target_fonts
+
 
+@record_metrics("neumason-dataset", dataset_dir="neumason-dataset")
 def main():
     source_dir = "neumason-dataset-source/png9169/"
 
@@ -174,6 +172,7 @@ def main():
     content_font_dir = "汉仪书宋二S10000000000000000.ttf"
 
     # Remove duplicate or problematic fonts
+    # (find_duplicate_fonts.py recommends the near-identical fonts to reject)
     rejected_font_dirs = [
         "汉仪粗仿宋简01000000100001000.ttf",  # duplicate
         "汉仪新蒂棉花糖黑板报00001010000000000.ttf",  # has 1 char more than any other font
@@ -15,12 +15,25 @@
 # │   │   ├── fontB+char1.png
 # │   │   ├── fontB+char2.png
 
+# Images listed in invalid_image_list (e.g. the quarantine list of validate_glyph_images.py) are treated as missing,
+# so their characters are removed from every font, and the listed images themselves are removed.
 
+
+import os
 from collections import defaultdict
 from pathlib import Path
 
 from tqdm import tqdm
 
+from ..common.dataset_manifest import (
+    DatasetManifest,
+    load_dataset_manifest_for,
+    remove_from_dataset_manifest,
+)
+from ..common.file_deletion import is_excluded_file, read_excluded_files, remove_files
+from ..common.metrics import metrics_stage, record_metrics
+from ..common.output_writer import is_hidden_file_name
+
 
 def parse_target_image_name(target_image_name: str):
     # Input Format: style+content[+optional-suffix]
@@ -30,7 +43,22 @@ def parse_target_image_name(target_image_name: str):
     return style, content
 
 
-def find_content_characters(content_image_dir: str | Path) -> set[str]:
+def find_content_characters(
+    content_image_dir: str | Path,
+    manifest: DatasetManifest | None = None,
+    invalid_files: set[Path] | None = None,
+) -> set[str]:
+    invalid_files = invalid_files or set()
+
+    if manifest is not None:
+        return {
+            entry.char
+            for entry in manifest.get_content_images()
+            if not is_excluded_file(
+                manifest.get_path(entry, content_image_dir), invalid_files
+            )
+        }
+
     content_image_path = Path(content_image_dir)
     content_characters = set()
 
@@ -39,14 +67,29 @@ def find_content_characters(content_image_dir: str | Path) -> set[str]:
     for img_file in tqdm(
         content_image_path.iterdir(), total=total_files, desc="Scan content images"
     ):
-        if img_file.is_file():
+        if (
+            img_file.is_file()
+            and not is_hidden_file_name(img_file.name)
+            and not is_excluded_file(img_file, invalid_files)
+        ):
             img_name = img_file.stem
             content_characters.add(img_name)
 
     return content_characters
 
 
-def find_common_target_characters(target_image_dir: str | Path) -> set[str]:
+def find_common_target_characters(
+    target_image_dir: str | Path,
+    manifest: DatasetManifest | None = None,
+    invalid_files: set[Path] | None = None,
+) -> set[str]:
+    invalid_files = invalid_files or set()
+
+    if manifest is not None:
+        return find_common_target_characters_in_manifest(
+            manifest, target_image_dir, invalid_files
+        )
+
     target_image_path = Path(target_image_dir)
     character_to_fonts_mapping = defaultdict(set)
 
@@ -63,7 +106,11 @@ def find_common_target_characters(target_image_dir: str | Path) -> set[str]:
             for img_file in tqdm(
                 font_path.iterdir(), total=total_files, desc=f"{font_name}", leave=False
             ):
-                if img_file.is_file():
+                if (
+                    img_file.is_file()
+                    and not is_hidden_file_name(img_file.name)
+                    and not is_excluded_file(img_file, invalid_files)
+                ):
                     img_name = img_file.stem
                     _, char_name = parse_target_image_name(img_name)
 
@@ -84,49 +131,110 @@ def find_common_target_characters(target_image_dir: str | Path) -> set[str]:
     return common_target_characters
 
 
+def find_common_target_characters_in_manifest(
+    manifest: DatasetManifest,
+    target_image_dir: str | Path,
+    invalid_files: set[Path] | None = None,
+) -> set[str]:
+    invalid_files = invalid_files or set()
+    character_to_fonts_mapping = defaultdict(set)
+
+    for entry in manifest.get_target_images():
+        file = manifest.get_path(entry, target_image_dir)
+        if not is_excluded_file(file, invalid_files):
+            character_to_fonts_mapping[entry.char].add(entry.font)
+
+    all_available_fonts = manifest.get_target_fonts()
+
+    return {
+        char_name
+        for char_name, font_names in character_to_fonts_mapping.items()
+        if font_names == all_available_fonts
+    }
+
+
 def find_preserved_characters(
-    content_image_dir: str | Path, target_image_dir: str | Path
+    content_image_dir: str | Path,
+    target_image_dir: str | Path,
+    manifest: DatasetManifest | None = None,
+    invalid_files: set[Path] | None = None,
 ) -> set[str]:
-    content_characters = find_content_characters(content_image_dir)
+    content_characters = find_content_characters(
+        content_image_dir, manifest, invalid_files
+    )
 
-    common_target_characters = find_common_target_characters(target_image_dir)
+    common_target_characters = find_common_target_characters(
+        target_image_dir, manifest, invalid_files
+    )
 
     preserved_characters = common_target_characters.intersection(content_characters)
 
     return preserved_characters
 
 
-def delete_non_common_content_images(
-    content_image_dir: str | Path, preserved_characters: set[str]
-) -> set[str]:
+def find_non_common_content_images(
+    content_image_dir: str | Path,
+    preserved_characters: set[str],
+    manifest: DatasetManifest | None = None,
+    invalid_files: set[Path] | None = None,
+) -> tuple[list[Path], set[str]]:
+    # Invalid images are removed even if their character is preserved (e.g. an invalid extra sample)
+    invalid_files = invalid_files or set()
+    removed_files: list[Path] = []
     removed_characters = set()
 
+    if manifest is not None:
+        for entry in manifest.get_content_images():
+            file = manifest.get_path(entry, content_image_dir)
+            if entry.char not in preserved_characters:
+                removed_files.append(file)
+                removed_characters.add(entry.char)
+            elif is_excluded_file(file, invalid_files):
+                removed_files.append(file)
+        return removed_files, removed_characters
+
     content_image_path = Path(content_image_dir)
 
     total_files = len(list(content_image_path.iterdir()))
 
-    for img_file in (
-        progress_bar := tqdm(
-            content_image_path.iterdir(),
-            total=total_files,
-            desc="Scan for deletion in content images",
-        )
+    for img_file in tqdm(
+        content_image_path.iterdir(),
+        total=total_files,
+        desc="Scan for deletion in content images",
     ):
-        if img_file.is_file():
+        if img_file.is_file() and not is_hidden_file_name(img_file.name):
             img_name = img_file.stem
 
             if img_name not in preserved_characters:
-                progress_bar.write(f"Deleting {img_file}")
-                img_file.unlink()
+                removed_files.append(img_file)
                 removed_characters.add(img_name)
+            elif is_excluded_file(img_file, invalid_files):
+                removed_files.append(img_file)
 
-    return removed_characters
+    return removed_files, removed_characters
 
 
-def delete_non_common_target_images(
-    target_image_dir: str | Path, preserved_characters: set[str]
-) -> set[str]:
+def find_non_common_target_images(
+    target_image_dir: str | Path,
+    preserved_characters: set[str],
+    manifest: DatasetManifest | None = None,
+    invalid_files: set[Path] | None = None,
+) -> tuple[list[Path], set[str]]:
+    # Invalid images are removed even if their character is preserved (e.g. an invalid extra sample)
+    invalid_files = invalid_files or set()
+    removed_files: list[Path] = []
     removed_characters = set()
+
+    if manifest is not None:
+        for entry in manifest.get_target_images():
+            file = manifest.get_path(entry, target_image_dir)
+            if entry.char not in preserved_characters:
+                removed_files.append(file)
+                removed_characters.add(entry.char)
+            elif is_excluded_file(file, invalid_files):
+                removed_files.append(file)
+        return removed_files, removed_characters
+
     target_image_path = Path(target_image_dir)
 
     total_fonts = len(list(target_image_path.iterdir()))
@@ -140,54 +248,96 @@ def delete_non_common_target_images(
 
             total_files = len(list(font_path.iterdir()))
 
-            for img_file in (
-                progress_bar := tqdm(
-                    font_path.iterdir(),
-                    total=total_files,
-                    desc=f"{font_path.stem}",
-                    leave=False,
-                )
+            for img_file in tqdm(
+                font_path.iterdir(),
+                total=total_files,
+                desc=f"{font_path.stem}",
+                leave=False,
             ):
-                if img_file.is_file():
+                if img_file.is_file() and not is_hidden_file_name(img_file.name):
                     img_name = img_file.stem
                     _, char_name = parse_target_image_name(img_name)
 
                     if char_name not in preserved_characters:
-                        progress_bar.write(f"Deleting {img_file}")
-                        img_file.unlink()
+                        removed_files.append(img_file)
                         removed_characters.add(char_name)
+                    elif is_excluded_file(img_file, invalid_files):
+                        removed_files.append(img_file)
 
-    return removed_characters
+    return removed_files, removed_characters
 
 
+@metrics_stage("balance dataset")
 def balance_dataset(
     content_image_dir: str | Path,
     target_image_dir: str | Path,
+    dry_run: bool = False,
+    plan_file: str | Path | None = None,
+    quarantine_dir: str | Path | None = None,
+    max_workers: int | None = None,
+    invalid_image_list: str | Path | None = None,
 ):
+    # The dataset manifest is used instead of scanning the dataset when it is up to date
+    manifest = load_dataset_manifest_for(content_image_dir, target_image_dir)
+
+    invalid_files = read_excluded_files(invalid_image_list)
+
     preserved_characters = find_preserved_characters(
-        content_image_dir, target_image_dir
+        content_image_dir, target_image_dir, manifest, invalid_files
+    )
+
+    removed_content_files, removed_content_characters = find_non_common_content_images(
+        content_image_dir, preserved_characters, manifest, invalid_files
     )
 
-    removed_content_characters = delete_non_common_content_images(
-        content_image_dir, preserved_characters
+    removed_target_files, removed_target_characters = find_non_common_target_images(
+        target_image_dir, preserved_characters, manifest, invalid_files
     )
 
-    removed_target_characters = delete_non_common_target_images(
-        target_image_dir, preserved_characters
+    # Content and target images are removed together so that one plan file
+    # (and one quarantine directory) covers the whole dataset
+    dataset_dir = os.path.commonpath(
+        [Path(content_image_dir).absolute(), Path(target_image_dir).absolute()]
     )
 
+    removed_files = remove_files(
+        [file.absolute() for file in removed_content_files + removed_target_files],
+        root_dir=dataset_dir,
+        dry_run=dry_run,
+        plan_file=plan_file,
+        quarantine_dir=quarantine_dir,
+        max_workers=max_workers,
+    )
+
+    # Files that could not be removed are kept in the manifest
+    if manifest is not None and not dry_run:
+        remove_from_dataset_manifest(manifest.dataset_path, removed_files)
+
     removed_characters = removed_content_characters.union(removed_target_characters)
 
     return preserved_characters, removed_characters
 
 
+@record_metrics("xxx-dataset-balance", dataset_dir="xxx-dataset")
 def main():
     content_image_dir = "xxx-dataset/ContentImage"
     target_image_dir = "xxx-dataset/TargetImage"
 
+    # Set dry_run to only write the plan file, or set quarantine_dir to move files instead of deleting them
+    dry_run = False
+    plan_file = "xxx-dataset-balance-plan.txt"
+    quarantine_dir = None
+
+    # Set to the quarantine list of validate_glyph_images.py to treat invalid images as missing
+    invalid_image_list = None
+
     preserved, removed = balance_dataset(
         content_image_dir,
         target_image_dir,
+        dry_run=dry_run,
+        plan_file=plan_file,
+        quarantine_dir=quarantine_dir,
+        invalid_image_list=invalid_image_list,
     )
 
     print(f"Removed characters: {', '.join(removed)}")
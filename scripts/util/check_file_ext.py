@@ -1,11 +1,32 @@
 # This script scans the whole directory tree of a specified source directory
 # and checks for unique file extensions.
 # This helps identifying any missing or unsupported file types.
+# The census also sniffs the first bytes of every file to find its real type,
+# and reports files whose extension does not match their content.
 
 
+import os
+import struct
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
+from ..common.image_header import gif_signatures, png_signature
+from ..common.metrics import count_items, metrics_stage, record_metrics
 
+# A GNT sample header is 10 bytes
+file_type_header_size = 10
+
+file_type_extensions = {
+    "PNG": {"png"},
+    "GIF": {"gif"},
+    "JPEG": {"jpg", "jpeg"},
+    "GNT": {"gnt"},
+    "TTF": {"ttf", "otf", "ttc"},
+}
+
+
+@metrics_stage("extract file extensions")
 def extract_file_extensions(source_dir: str | Path):
     # Set to hold unique file extensions
     extensions = set()
@@ -21,6 +42,111 @@ def extract_file_extensions(source_dir: str | Path):
     return extensions
 
 
+def sniff_file_type(header: bytes, file_size: int) -> str:
+    if header.startswith(png_signature):
+        return "PNG"
+    if header[:6] in gif_signatures:
+        return "GIF"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if header[:4] in (b"\x00\x01\x00\x00", b"true", b"OTTO", b"ttcf"):
+        return "TTF"
+
+    # GNT files have no magic number, but the first sample size must match its bitmap size
+    if len(header) == file_type_header_size:
+        sample_size = struct.unpack("<I", header[:4])[0]
+        width, height = struct.unpack("<HH", header[6:10])
+        if width > 0 and height > 0 and sample_size == 10 + width * height <= file_size:
+            return "GNT"
+
+    return "unknown"
+
+
+def is_extension_mismatch(extension: str, file_type: str) -> bool:
+    if file_type in file_type_extensions:
+        return extension not in file_type_extensions[file_type]
+
+    # Unknown content with the extension of a known type
+    return any(extension in extensions for extensions in file_type_extensions.values())
+
+
+def census_directory(directory: Path) -> tuple[dict, list[Path]]:
+    directory_census = {
+        "type_counts": Counter(),
+        "type_bytes": Counter(),
+        "extension_counts": Counter(),
+        "mismatches": [],
+    }
+    subdirectories: list[Path] = []
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(Path(entry.path))
+                continue
+
+            if not entry.is_file():
+                continue
+
+            extension = os.path.splitext(entry.name)[1].lower().lstrip(".")
+            file_size = entry.stat().st_size
+
+            try:
+                with open(entry.path, "rb") as f:
+                    file_type = sniff_file_type(
+                        f.read(file_type_header_size), file_size
+                    )
+            except OSError:
+                file_type = "unreadable"
+
+            directory_census["type_counts"][file_type] += 1
+            directory_census["type_bytes"][file_type] += file_size
+            directory_census["extension_counts"][extension] += 1
+
+            if is_extension_mismatch(extension, file_type):
+                directory_census["mismatches"].append(
+                    (Path(entry.path), extension, file_type)
+                )
+
+    return directory_census, subdirectories
+
+
+@metrics_stage("census file types")
+def census_file_types(source_dir: str | Path, max_workers: int | None = None) -> dict:
+    census = {
+        "type_counts": Counter(),
+        "type_bytes": Counter(),
+        "extension_counts": Counter(),
+        "mismatches": [],
+    }
+
+    # Every directory is a separate task, so subtrees are walked concurrently
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(census_directory, Path(source_dir))}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                directory_census, subdirectories = future.result()
+
+                for key in ["type_counts", "type_bytes", "extension_counts"]:
+                    census[key].update(directory_census[key])
+                census["mismatches"].extend(directory_census["mismatches"])
+
+                pending.update(
+                    executor.submit(census_directory, subdirectory)
+                    for subdirectory in subdirectories
+                )
+
+    census["mismatches"].sort()
+
+    count_items(census["type_counts"].total())
+
+    return census
+
+
+@record_metrics("xxx-dataset-source-file-types", dataset_dir="xxx-dataset-source")
 def main():
     # Input directory path
     source_dir = "xxx-dataset-source/"  # Change this to your actual source directory
@@ -32,6 +158,19 @@ def main():
     for ext in sorted(extensions):
         print(ext)
 
+    census = census_file_types(source_dir)
+
+    print("File types found by content:")
+    for file_type, count in census["type_counts"].most_common():
+        print(f"{file_type}: {count} files, {census['type_bytes'][file_type]} bytes")
+
+    if census["mismatches"]:
+        print("Files whose extension does not match their content:")
+        for file_path, extension, file_type in census["mismatches"]:
+            print(
+                f"{file_path.as_posix()} (extension: {extension}, content: {file_type})"
+            )
+
 
 if __name__ == "__main__":
     main()
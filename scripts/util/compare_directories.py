@@ -1,22 +1,201 @@
 # This script is used for testing.
 # It compares two directories and reports differences, mismatched files, and uncomparable files.
+# Files are hashed in parallel. Pass a digest cache file to skip rereading files that have not changed since the last comparison.
+# Images with different bytes are compared by pixels, optionally within a per-pixel tolerance.
+# With digest trees, a digest tree is saved next to each directory and only subtrees with different digests are compared.
 
 
 import filecmp
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
 from PIL import Image
 
+from ..common.digest_tree import diff_digest_trees, update_digest_tree
+from ..common.file_digest import DigestCache
+
 image_file_extensions = {".png", ".jpg", ".jpeg"}
 
 
-def images_are_equal(img1_path: Path, img2_path: Path) -> bool:
-    img1 = Image.open(img1_path).convert("RGB")
-    img2 = Image.open(img2_path).convert("RGB")
-    arr1 = np.frombuffer(img1.tobytes(), dtype=np.uint8)
-    arr2 = np.frombuffer(img2.tobytes(), dtype=np.uint8)
-    return np.array_equal(arr1, arr2)
+# Rows compared at a time, so that a mismatch near the top of an image stops the comparison early
+rows_per_block = 32
+
+
+class ImageDifference:
+    size1: tuple[int, int]
+    size2: tuple[int, int]
+    max_difference: float | None
+    mean_difference: float | None
+    differing_pixels: int | None
+
+    def __init__(
+        self,
+        size1: tuple[int, int],
+        size2: tuple[int, int],
+        max_difference: float | None = None,
+        mean_difference: float | None = None,
+        differing_pixels: int | None = None,
+    ):
+        self.size1 = size1
+        self.size2 = size2
+        self.max_difference = max_difference
+        self.mean_difference = mean_difference
+        self.differing_pixels = differing_pixels
+
+    def __str__(self):
+        if self.size1 != self.size2:
+            return f"image sizes {self.size1} and {self.size2}"
+        return (
+            f"max difference {self.max_difference:g}, "
+            f"mean difference {self.mean_difference:.4f}, "
+            f"{self.differing_pixels} pixels differ"
+        )
+
+
+def absolute_difference(arr1: np.ndarray, arr2: np.ndarray) -> np.ndarray:
+    if np.issubdtype(arr1.dtype, np.floating):
+        return np.abs(arr1.astype(np.float64) - arr2.astype(np.float64))
+    return np.abs(arr1.astype(np.int64) - arr2.astype(np.int64))
+
+
+def arrays_are_within_tolerance(
+    arr1: np.ndarray, arr2: np.ndarray, tolerance: float
+) -> bool:
+    for start in range(0, arr1.shape[0], rows_per_block):
+        block1 = arr1[start : start + rows_per_block]
+        block2 = arr2[start : start + rows_per_block]
+
+        if tolerance == 0:
+            if not np.array_equal(block1, block2):
+                return False
+        elif np.any(absolute_difference(block1, block2) > tolerance):
+            return False
+
+    return True
+
+
+def measure_image_difference(
+    arr1: np.ndarray, arr2: np.ndarray, tolerance: float
+) -> ImageDifference:
+    difference = absolute_difference(arr1, arr2)
+
+    # A pixel differs if any of its channels differs by more than the tolerance
+    pixel_differs = difference > tolerance
+    if pixel_differs.ndim == 3:
+        pixel_differs = pixel_differs.any(axis=2)
+
+    size = (arr1.shape[1], arr1.shape[0])
+
+    return ImageDifference(
+        size1=size,
+        size2=size,
+        max_difference=difference.max().item(),
+        mean_difference=difference.mean().item(),
+        differing_pixels=int(np.count_nonzero(pixel_differs)),
+    )
+
+
+def compare_images(
+    img1_path: Path, img2_path: Path, tolerance: float = 0
+) -> ImageDifference | None:
+    # Returns None if the images are equal within the per-pixel tolerance
+
+    with Image.open(img1_path) as img1, Image.open(img2_path) as img2:
+        # Opening an image only reads its header, so this check does not decode pixels
+        if img1.size != img2.size:
+            return ImageDifference(size1=img1.size, size2=img2.size)
+
+        # Palette indices are only comparable through their colors
+        if img1.mode != img2.mode or img1.mode == "P":
+            arr1 = np.asarray(img1.convert("RGB"))
+            arr2 = np.asarray(img2.convert("RGB"))
+        else:
+            arr1 = np.asarray(img1)
+            arr2 = np.asarray(img2)
+
+    if arrays_are_within_tolerance(arr1, arr2, tolerance):
+        return None
+
+    return measure_image_difference(arr1, arr2, tolerance)
+
+
+def images_are_equal(img1_path: Path, img2_path: Path, tolerance: float = 0) -> bool:
+    return compare_images(img1_path, img2_path, tolerance) is None
+
+
+def collect_directory_differences(
+    dir1: Path,
+    dir2: Path,
+    outer_differences: list[Path],
+    uncomparable_files: list[tuple[Path, Path]],
+    common_files: list[tuple[Path, Path, os.stat_result, os.stat_result]],
+) -> None:
+    def list_entries(directory: Path) -> dict[str, os.DirEntry]:
+        with os.scandir(directory) as entries:
+            return {
+                entry.name: entry
+                for entry in entries
+                if entry.name not in filecmp.DEFAULT_IGNORES
+            }
+
+    entries1 = list_entries(dir1)
+    entries2 = list_entries(dir2)
+
+    # Files that are only in one directory
+    outer_differences.extend(
+        [dir1 / name for name in entries1 if name not in entries2]
+        + [dir2 / name for name in entries2 if name not in entries1]
+    )
+
+    for name in entries1.keys() & entries2.keys():
+        entry1 = entries1[name]
+        entry2 = entries2[name]
+
+        try:
+            if entry1.is_dir() and entry2.is_dir():
+                # Recursively compare subdirectories
+                collect_directory_differences(
+                    dir1 / name,
+                    dir2 / name,
+                    outer_differences,
+                    uncomparable_files,
+                    common_files,
+                )
+            elif entry1.is_file() and entry2.is_file():
+                common_files.append(
+                    (dir1 / name, dir2 / name, entry1.stat(), entry2.stat())
+                )
+            else:
+                uncomparable_files.append((dir1 / name, dir2 / name))
+        except OSError:
+            uncomparable_files.append((dir1 / name, dir2 / name))
+
+
+def compare_files(
+    path1: Path,
+    path2: Path,
+    stat1: os.stat_result,
+    stat2: os.stat_result,
+    digest_cache: DigestCache,
+    image_tolerance: float,
+) -> tuple[bool, ImageDifference | None]:
+    is_image_file = path1.suffix.lower() in image_file_extensions
+
+    # Files of different sizes can only be equal if they are equal images,
+    # and their digests can never match, so they are not read to be hashed
+    if stat1.st_size != stat2.st_size:
+        if not is_image_file:
+            return False, None
+    elif digest_cache.get_digest(path1, stat1) == digest_cache.get_digest(path2, stat2):
+        return True, None
+    elif not is_image_file:
+        return False, None
+
+    image_difference = compare_images(path1, path2, image_tolerance)
+
+    return image_difference is None, image_difference
 
 
 def compare_directories(
@@ -25,56 +204,134 @@ def compare_directories(
     outer_differences: list[Path],
     inner_differences: list[tuple[Path, Path]],
     uncomparable_files: list[tuple[Path, Path]],
+    max_workers: int | None = None,
+    digest_cache_file: str | Path | None = None,
+    image_tolerance: float = 0,
+    image_differences: dict[tuple[Path, Path], ImageDifference] | None = None,
+    use_digest_trees: bool = False,
+    refresh_digest_trees: bool = True,
 ) -> None:
     assert Path(dir1).exists(), f"{dir1} does not exist."
     assert Path(dir2).exists(), f"{dir2} does not exist."
     assert Path(dir1).is_dir(), f"{dir1} is not a directory."
     assert Path(dir2).is_dir(), f"{dir2} is not a directory."
 
-    dcmp = filecmp.dircmp(
-        dir1, dir2, shallow=False
-    )  # `shallow` is available since Python 3.13
+    if use_digest_trees:
+        compare_directories_by_digest_trees(
+            Path(dir1),
+            Path(dir2),
+            outer_differences,
+            inner_differences,
+            uncomparable_files,
+            max_workers=max_workers,
+            refresh_digest_trees=refresh_digest_trees,
+            image_tolerance=image_tolerance,
+            image_differences=image_differences,
+        )
+        return
 
-    # Files that are only in one directory
-    outer_differences.extend(
-        [Path(dir1) / file for file in dcmp.left_only]
-        + [Path(dir2) / file for file in dcmp.right_only]
+    common_files: list[tuple[Path, Path, os.stat_result, os.stat_result]] = []
+
+    collect_directory_differences(
+        Path(dir1), Path(dir2), outer_differences, uncomparable_files, common_files
     )
 
-    # Files that are different
-    for file in dcmp.diff_files:
-        is_image_file = Path(file).suffix.lower() in image_file_extensions
+    # Digests of unchanged files are read from the cache instead of the disk
+    digest_cache = DigestCache(digest_cache_file)
 
-        path1 = Path(dir1) / file
-        path2 = Path(dir2) / file
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                compare_files,
+                path1,
+                path2,
+                stat1,
+                stat2,
+                digest_cache,
+                image_tolerance,
+            )
+            for path1, path2, stat1, stat2 in common_files
+        ]
 
-        if not is_image_file:
-            inner_differences.append((path1, path2))
-            continue
+        # Files that are different, or that cannot be compared
+        for (path1, path2, _, _), future in zip(common_files, futures):
+            try:
+                files_are_equal, image_difference = future.result()
+            except OSError:
+                uncomparable_files.append((path1, path2))
+                continue
+
+            if not files_are_equal:
+                inner_differences.append((path1, path2))
+
+                if image_differences is not None and image_difference is not None:
+                    image_differences[(path1, path2)] = image_difference
+
+    digest_cache.save()
+
+
+def compare_directories_by_digest_trees(
+    dir1: Path,
+    dir2: Path,
+    outer_differences: list[Path],
+    inner_differences: list[tuple[Path, Path]],
+    uncomparable_files: list[tuple[Path, Path]],
+    max_workers: int | None = None,
+    refresh_digest_trees: bool = True,
+    image_tolerance: float = 0,
+    image_differences: dict[tuple[Path, Path], ImageDifference] | None = None,
+) -> None:
+    tree1 = update_digest_tree(
+        dir1, refresh=refresh_digest_trees, max_workers=max_workers
+    )
+    tree2 = update_digest_tree(
+        dir2, refresh=refresh_digest_trees, max_workers=max_workers
+    )
 
-        if not images_are_equal(path1, path2):
-            inner_differences.append((path1, path2))
+    changed_files: list[tuple[Path, Path]] = []
 
-    # Files that cannot be compared
-    uncomparable_files.extend(
-        [(Path(dir1) / file, Path(dir2) / file) for file in dcmp.funny_files]
+    diff_digest_trees(
+        dir1, dir2, tree1, tree2, outer_differences, changed_files, uncomparable_files
     )
 
-    # Recursively compare subdirectories
-    for sub_dcmp in dcmp.subdirs.values():
-        compare_directories(
-            sub_dcmp.left,
-            sub_dcmp.right,
-            outer_differences,
-            inner_differences,
-            uncomparable_files,
-        )
+    changed_images = [
+        (path1, path2)
+        for path1, path2 in changed_files
+        if path1.suffix.lower() in image_file_extensions
+    ]
+
+    inner_differences.extend(
+        (path1, path2)
+        for path1, path2 in changed_files
+        if path1.suffix.lower() not in image_file_extensions
+    )
+
+    # Images with different bytes may still have equal pixels
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(compare_images, path1, path2, image_tolerance)
+            for path1, path2 in changed_images
+        ]
+
+        for (path1, path2), future in zip(changed_images, futures):
+            try:
+                image_difference = future.result()
+            except OSError:
+                uncomparable_files.append((path1, path2))
+                continue
+
+            if image_difference is not None:
+                inner_differences.append((path1, path2))
+
+                if image_differences is not None:
+                    image_differences[(path1, path2)] = image_difference
 
 
 def create_comparison_summary(
     outer_differences: list[Path],
     inner_differences: list[tuple[Path, Path]],
     uncomparable_files: list[tuple[Path, Path]],
+    image_differences: dict[tuple[Path, Path], ImageDifference] | None = None,
 ) -> tuple[bool, str]:
     has_outer_differences = len(outer_differences) > 0
     has_inner_difference = len(inner_differences) > 0
@@ -95,7 +352,10 @@ def create_comparison_summary(
         sorted_inner_differences = sorted(inner_differences)
         output.append("Files with different content:")
         for file1, file2 in sorted_inner_differences:
-            output.append(f"{file1.as_posix()} and {file2.as_posix()}")
+            line = f"{file1.as_posix()} and {file2.as_posix()}"
+            if image_differences and (file1, file2) in image_differences:
+                line += f" ({image_differences[(file1, file2)]})"
+            output.append(line)
 
     if has_uncomparable_files:
         sorted_uncomparable_files = sorted(uncomparable_files)
@@ -106,17 +366,29 @@ def create_comparison_summary(
     return False, "\n".join(output)
 
 
-def compare_directories_and_return_summary(dir1: str | Path, dir2: str | Path):
+def compare_directories_and_return_summary(
+    dir1: str | Path,
+    dir2: str | Path,
+    max_workers: int | None = None,
+    digest_cache_file: str | Path | None = None,
+    image_tolerance: float = 0,
+    use_digest_trees: bool = False,
+):
     compare_directories(
         dir1,
         dir2,
         outer_differences := [],
         inner_differences := [],
         uncomparable_files := [],
+        max_workers=max_workers,
+        digest_cache_file=digest_cache_file,
+        image_tolerance=image_tolerance,
+        image_differences=(image_differences := {}),
+        use_digest_trees=use_digest_trees,
     )
 
     directories_are_equal, message = create_comparison_summary(
-        outer_differences, inner_differences, uncomparable_files
+        outer_differences, inner_differences, uncomparable_files, image_differences
     )
 
     return directories_are_equal, message
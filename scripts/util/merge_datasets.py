@@ -0,0 +1,335 @@
+# This script merges several prepared datasets into one dataset, e.g. to train on CASIA, zhuojg and FYP23 together.
+# Files are not copied: every image of the merged dataset is a hard link to the image of its source dataset,
+# so merging takes seconds per million images and uses no extra disk space.
+# (An image is copied instead only if it cannot be linked, e.g. when the output is on another file system.
+# The copy keeps the modification time of its source, so that it is not copied again while the source is unchanged.)
+# Font names are prefixed with the name given to their source dataset ({namespace}_{font}), so that fonts of
+# different datasets never collide.
+# The content images are the union of the content images of the sources. If more than one source has a content
+# image of a character, the one of the first source is used, so list the source with the preferred content font first.
+# Characters with target images but no content image in any source are reported.
+# Images that are already linked (or copied) from the right file are skipped, so the merge can be run again
+# after a source changes.
+# Images (and fonts) of the merged dataset that are no longer in any source are removed.
+# The manifest of the merged dataset is built from the manifests of the sources where they are up to date,
+# so that the images do not need to be read.
+
+# Dataset format (every source):
+# casia-dataset/
+# ├── ContentImage/
+# │   ├── char1.png
+# ├── TargetImage/
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png
+
+# Output format:
+# merged-dataset/
+# ├── ContentImage/
+# │   ├── char1.png  <-- from the first source with a content image of char1
+# ├── TargetImage/
+# │   ├── casia_fontA/
+# │   │   ├── casia_fontA+char1.png
+# │   ├── zhuojg_fontA/
+# │   │   ├── zhuojg_fontA+char1.png
+
+
+import errno
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from tqdm import tqdm
+
+from ..common.dataset_manifest import (
+    DatasetManifest,
+    ManifestEntry,
+    content_image_dir_name,
+    get_directory_mtime,
+    load_dataset_manifest,
+    save_dataset_manifest,
+    target_image_dir_name,
+    write_dataset_manifest,
+)
+from ..common.font_dataset import index_dataset
+from ..common.metrics import count_items, metrics_stage, record_metrics
+from ..common.output_writer import (
+    copy_file,
+    ensure_dir_exists_with_perms,
+    permissive_umask,
+)
+
+# Errors of os.link() for which the file is copied instead
+link_unsupported_errors = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP}
+
+
+class MergedDirectory:
+    output_dir: Path  # Relative to the merged dataset
+    files: list[tuple[Path, str]]  # (source file, output file name)
+    # Manifest entries of the output files, or None if a source of the directory has no up-to-date manifest
+    entries: list[ManifestEntry] | None
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self.files = []
+        self.entries = []
+
+    def add_file(
+        self,
+        source_file: Path,
+        output_name: str,
+        source_entry: ManifestEntry | None,
+        font: str | None,
+    ):
+        self.files.append((source_file, output_name))
+
+        if source_entry is None:
+            self.entries = None
+        elif self.entries is not None:
+            self.entries.append(
+                ManifestEntry(
+                    kind=source_entry.kind,
+                    font=font,
+                    char=source_entry.char,
+                    sample=source_entry.sample,
+                    path=(self.output_dir / output_name).as_posix(),
+                    size=source_entry.size,
+                    width=source_entry.width,
+                    height=source_entry.height,
+                    format=source_entry.format,
+                    mode=source_entry.mode,
+                    digest=source_entry.digest,
+                )
+            )
+
+
+def get_namespaced_font(namespace: str, font: str) -> str:
+    return f"{namespace}_{font}"
+
+
+def check_namespace(namespace: str):
+    if not namespace or any(c in namespace for c in "+/\\"):
+        raise ValueError(
+            f'Namespace "{namespace}" should not be empty or contain "+", "/" or "\\".'
+        )
+
+
+def plan_dataset_merge(
+    sources: dict[str, Path],
+) -> tuple[list[MergedDirectory], list[str]]:
+    # Gives the directories of the merged dataset, and the characters that have no content image in any source
+    content_directory = MergedDirectory(Path(content_image_dir_name))
+    target_directories: dict[str, MergedDirectory] = {}
+    font_namespaces: dict[str, str] = {}
+    target_characters: set[str] = set()
+    content_characters: set[str] = set()
+
+    for namespace, source_path in sources.items():
+        check_namespace(namespace)
+
+        samples, content_paths = index_dataset(source_path)
+
+        manifest = load_dataset_manifest(source_path)
+        source_entries = (
+            {entry.path: entry for entry in manifest.entries}
+            if manifest is not None
+            else {}
+        )
+
+        # Paths of the index are under the source dataset (Path.relative_to() is slow for every image)
+        source_prefix_length = len(str(source_path / "_")) - 1
+
+        def get_source_entry(path: Path) -> ManifestEntry | None:
+            relative_path = str(path)[source_prefix_length:].replace(os.sep, "/")
+            return source_entries.get(relative_path)
+
+        for char, path in sorted(content_paths.items()):
+            if char in content_characters:
+                continue
+            content_characters.add(char)
+            content_directory.add_file(path, path.name, get_source_entry(path), None)
+
+        for sample in samples:
+            font = get_namespaced_font(namespace, sample.font)
+
+            if font_namespaces.setdefault(font, namespace) != namespace:
+                raise ValueError(
+                    f'Font "{font}" is in both "{font_namespaces[font]}" '
+                    f'and "{namespace}".'
+                )
+
+            directory = target_directories.get(font)
+            if directory is None:
+                directory = MergedDirectory(Path(target_image_dir_name) / font)
+                target_directories[font] = directory
+
+            # Input Format: style+content[+optional-suffix]
+            output_name = f"{font}+{sample.path.name.split('+', 1)[1]}"
+            directory.add_file(
+                sample.path, output_name, get_source_entry(sample.path), font
+            )
+            target_characters.add(sample.char)
+
+    directories = [content_directory] + [
+        target_directories[font] for font in sorted(target_directories)
+    ]
+
+    return directories, sorted(target_characters - content_characters)
+
+
+def link_file(source_file: Path, output_file: Path) -> str:
+    # Gives "linked", "copied" or "skipped" (if the output file is already a link to, or a copy of, the source file)
+    source_stat = os.stat(source_file)
+
+    try:
+        output_stat = os.stat(output_file)
+        if os.path.samestat(source_stat, output_stat) or (
+            output_stat.st_size == source_stat.st_size
+            and output_stat.st_mtime_ns == source_stat.st_mtime_ns
+        ):
+            return "skipped"
+    except FileNotFoundError:
+        pass
+
+    # Linked to a temporary name and renamed into place, so that an existing file is replaced
+    temporary_file = output_file.with_name(
+        f".{output_file.name}.{os.getpid()}-{threading.get_ident()}.tmp"
+    )
+
+    try:
+        os.link(source_file, temporary_file)
+    except OSError as e:
+        if e.errno not in link_unsupported_errors:
+            raise
+        copy_file(source_file, output_file)
+        os.utime(output_file, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        return "copied"
+
+    os.replace(temporary_file, output_file)
+    return "linked"
+
+
+def link_directory_files(
+    output_dir: Path, files: list[tuple[Path, str]]
+) -> dict[str, int]:
+    # Gives the number of files of each result. Files that are not from the merge
+    # (e.g. images removed from their source since the last merge) are removed.
+    result_counts = {"linked": 0, "copied": 0, "skipped": 0, "removed": 0}
+
+    for source_file, output_name in files:
+        result_counts[link_file(source_file, output_dir / output_name)] += 1
+
+    output_names = {output_name for _, output_name in files}
+    for name in os.listdir(output_dir):
+        if name not in output_names and (output_dir / name).is_file():
+            (output_dir / name).unlink()
+            result_counts["removed"] += 1
+
+    return result_counts
+
+
+@metrics_stage("merge datasets")
+@permissive_umask()
+def merge_datasets(
+    sources: dict[str, str | Path],
+    output_dir: str | Path,
+    max_workers: int | None = None,
+) -> tuple[int, list[str]]:
+    # sources maps a namespace (the prefix of the font names) to a dataset, in order of preference for content images.
+    # Gives the number of images in the merged dataset, and the characters without a content image.
+    source_paths = {namespace: Path(path) for namespace, path in sources.items()}
+    output_path = Path(output_dir)
+
+    directories, characters_without_content = plan_dataset_merge(source_paths)
+
+    ensure_dir_exists_with_perms(output_path / target_image_dir_name)
+    for directory in directories:
+        ensure_dir_exists_with_perms(output_path / directory.output_dir)
+
+    # Fonts that are no longer in any source are removed
+    output_dirs = {directory.output_dir for directory in directories}
+    for font_path in (output_path / target_image_dir_name).iterdir():
+        if font_path.is_dir() and font_path.relative_to(output_path) not in output_dirs:
+            shutil.rmtree(font_path)
+
+    result_counts = {"linked": 0, "copied": 0, "skipped": 0, "removed": 0}
+    complete_directories: list[MergedDirectory] = []
+
+    # Linking is bound by file system operations, so directories are linked by threads
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda directory: link_directory_files(
+                output_path / directory.output_dir, directory.files
+            ),
+            directories,
+        )
+
+        for directory, directory_result_counts in tqdm(
+            zip(directories, results), total=len(directories), desc="Merge datasets"
+        ):
+            for result, count in directory_result_counts.items():
+                result_counts[result] += count
+            count_items(len(directory.files))
+
+            if directory.entries is not None:
+                complete_directories.append(directory)
+
+    if result_counts["skipped"]:
+        print(f"Skipped {result_counts['skipped']} images that were already linked")
+
+    if result_counts["copied"]:
+        print(f"Copied {result_counts['copied']} images that could not be linked")
+
+    if result_counts["removed"]:
+        print(
+            f"Removed {result_counts['removed']} images that are no longer in a source"
+        )
+
+    # Directories whose entries are known are saved to the manifest first, so that only the others are read
+    save_dataset_manifest(
+        DatasetManifest(
+            output_path,
+            [
+                entry
+                for directory in complete_directories
+                for entry in directory.entries or []
+            ],
+            {
+                directory.output_dir.as_posix(): get_directory_mtime(
+                    output_path / directory.output_dir
+                )
+                for directory in complete_directories
+            },
+        )
+    )
+    write_dataset_manifest(output_path)
+
+    image_count = sum(len(directory.files) for directory in directories)
+
+    return image_count, characters_without_content
+
+
+@record_metrics("merged-dataset", dataset_dir="merged-dataset")
+def main():
+    # In order of preference for content images
+    sources = {
+        "fyp23": "fyp23-dataset",
+        "casia": "casia-dataset",
+        "zhuojg": "zhuojg-dataset",
+    }
+    output_dir = "merged-dataset"
+
+    image_count, characters_without_content = merge_datasets(sources, output_dir)
+
+    print(f"{image_count} images merged into {output_dir}")
+
+    if characters_without_content:
+        print(
+            f"Characters without a content image ({len(characters_without_content)}): "
+            f"{' '.join(characters_without_content)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
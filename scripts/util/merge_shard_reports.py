@@ -0,0 +1,57 @@
+# This script merges the reports written by the shards of a converter run with "--shard index/count"
+# into the result a single-machine run would produce.
+
+# Input format:
+# casia-dataset-target-images.shard-0-of-4.json
+# casia-dataset-target-images.shard-1-of-4.json
+# ...
+
+# Output format:
+# casia-dataset-target-images.json
+
+
+import json
+from pathlib import Path
+
+from ..common.sharding import merge_shard_reports
+
+
+def find_shard_reports(report_file: str | Path) -> list[Path]:
+    report_path = Path(report_file)
+    return sorted(
+        report_path.parent.glob(f"{report_path.stem}.shard-*-of-*{report_path.suffix}")
+    )
+
+
+def merge_shard_reports_into_file(report_file: str | Path) -> dict[str, set[str]]:
+    shard_report_files = find_shard_reports(report_file)
+
+    assert shard_report_files, f"No shard reports found for {report_file}."
+
+    merged_results = merge_shard_reports(shard_report_files)
+
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(
+            {name: sorted(values) for name, values in merged_results.items()},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    return merged_results
+
+
+def main():
+    # e.g. casia-dataset-target-images.json or casia-dataset-content-images.json
+    report_file = "xxx-dataset-target-images.json"
+
+    merged_results = merge_shard_reports_into_file(report_file)
+
+    for name, values in merged_results.items():
+        print(
+            f"{name.capitalize()} characters ({len(values)}): {' '.join(sorted(values))}"
+        )
+
+
+if __name__ == "__main__":
+    main()
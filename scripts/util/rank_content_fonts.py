@@ -0,0 +1,374 @@
+# This script helps to choose the content font of a dataset. It reads which characters every candidate font has
+# (from the cmap tables of the font), ranks the fonts by how many characters of the dataset they have,
+# and proposes a chain of fallback fonts that has every character (or as many as the fonts have together).
+# The characters of every font are kept in a bitset of all Unicode code points, cached next to the font directory,
+# so that a font is only read again when it changes. Fonts are read in parallel, one font per task.
+# The fallback chain is found greedily: the next font is always the one with the most characters still missing.
+# Every face of a font collection (.ttc or .otc) is a candidate of its own, named file.ttc#0, file.ttc#1 and so on.
+
+# Font directory format:
+# ttf/
+# ├── SourceHanSerifTC-VF.ttf
+# ├── 汉仪书宋二S.ttf
+# ├── collection.ttc
+
+# Cache format (numpy .npz), saved next to the font directory (e.g. ttf.coverage.npz):
+# files, faces, sizes, mtimes: the font file (relative to the font directory), face, size and modification time
+# bitsets: one row per face: bit c (most significant bit first) is set if the face has code point c
+
+# Output format (JSON):
+# {
+#     "required_characters": 3,
+#     "ranking": [{ "font": "SourceHanSerifTC-VF.ttf", "characters": 2 }, { "font": "汉仪书宋二S.ttf", "characters": 1 }],
+#     "fallback_chain": [{ "font": "SourceHanSerifTC-VF.ttf", "characters": "char1char2" }],
+#     "missing_characters": "char3"
+# }
+
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from fontTools.ttLib import TTCollection, TTFont
+from tqdm import tqdm
+
+from ..common.create_content_images_from_target_images import (
+    find_required_characters,
+)
+from ..common.metrics import count_items, metrics_stage, record_metrics
+from ..common.output_writer import permissive_umask, write_output_bytes
+
+font_suffixes = {".ttf", ".otf", ".ttc", ".otc"}
+collection_suffixes = {".ttc", ".otc"}
+
+code_point_count = 0x110000
+bitset_size = code_point_count // 8
+
+
+class FontCoverage:
+    fonts: list[
+        str
+    ]  # Font file relative to the font directory, with "#face" for faces of collections
+    files: list[str]
+    faces: list[int]
+    sizes: list[int]
+    mtimes: list[int]
+    bitsets: np.ndarray  # (fonts, bitset_size) uint8
+
+    def __init__(
+        self,
+        files: list[str],
+        faces: list[int],
+        sizes: list[int],
+        mtimes: list[int],
+        bitsets: np.ndarray,
+    ):
+        self.files = files
+        self.faces = faces
+        self.sizes = sizes
+        self.mtimes = mtimes
+        self.bitsets = bitsets
+        self.fonts = [
+            (
+                f"{file}#{face}"
+                if Path(file).suffix.lower() in collection_suffixes
+                else file
+            )
+            for file, face in zip(files, faces)
+        ]
+
+    def get_coverage_matrix(self, characters: list[str]) -> np.ndarray:
+        # Gives a (fonts, characters) bool array. Characters of more than one code point are in no font.
+        code_points = np.array(
+            [ord(char) if len(char) == 1 else -1 for char in characters], dtype=np.int64
+        )
+        valid = code_points >= 0
+        code_points[~valid] = 0
+
+        bytes_of_characters = self.bitsets[:, code_points >> 3]
+        bits = (bytes_of_characters >> (7 - (code_points & 7)).astype(np.uint8)) & 1
+        return (bits == 1) & valid
+
+
+def get_coverage_cache_path(font_dir: str | Path) -> Path:
+    font_path = Path(font_dir).absolute()
+    return font_path.with_name(f"{font_path.name}.coverage.npz")
+
+
+def list_font_files(font_dir: str | Path) -> list[Path]:
+    return sorted(
+        path
+        for path in Path(font_dir).rglob("*")
+        if path.suffix.lower() in font_suffixes and path.is_file()
+    )
+
+
+def get_cmap_bitset(font: TTFont) -> np.ndarray:
+    # Only Unicode subtables count, since the characters of a dataset are looked up by code point
+    has_code_point = np.zeros(code_point_count, dtype=bool)
+
+    for subtable in font["cmap"].tables:
+        if subtable.isUnicode():
+            code_points = np.fromiter(subtable.cmap.keys(), dtype=np.int64)
+            has_code_point[code_points[code_points < code_point_count]] = True
+
+    return np.packbits(has_code_point)
+
+
+def read_font_bitsets(font_file: Path) -> list[np.ndarray] | None:
+    # Runs in a worker process. Gives one bitset per face, or None if the font cannot be read.
+    try:
+        if font_file.suffix.lower() in collection_suffixes:
+            with TTCollection(font_file, lazy=True) as collection:
+                return [get_cmap_bitset(font) for font in collection.fonts]
+
+        with TTFont(font_file, lazy=True) as font:
+            return [get_cmap_bitset(font)]
+
+    except Exception as e:
+        print(f"Cannot read font: {font_file}, error: {e}")
+        return None
+
+
+def load_coverage_cache(cache_file: Path) -> FontCoverage | None:
+    if not cache_file.exists():
+        return None
+
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            return FontCoverage(
+                data["files"].tolist(),
+                data["faces"].tolist(),
+                data["sizes"].tolist(),
+                data["mtimes"].tolist(),
+                data["bitsets"],
+            )
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable coverage cache {cache_file}: {e}")
+        return None
+
+
+def save_coverage_cache(coverage: FontCoverage, cache_file: Path):
+    # Bitsets are mostly zeros, so they are compressed
+    temporary_path = cache_file.with_name(f".{cache_file.name}.tmp")
+
+    with open(temporary_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            files=np.array(coverage.files, dtype=str),
+            faces=np.array(coverage.faces, dtype=np.int32),
+            sizes=np.array(coverage.sizes, dtype=np.int64),
+            mtimes=np.array(coverage.mtimes, dtype=np.int64),
+            bitsets=coverage.bitsets.reshape(-1, bitset_size),
+        )
+    os.replace(temporary_path, cache_file)
+
+
+@metrics_stage("scan font coverage")
+def scan_font_coverage(
+    font_dir: str | Path, max_workers: int | None = None
+) -> tuple[FontCoverage, list[Path]]:
+    # Gives the coverage of every font in the directory, and the font files that cannot be read
+    font_path = Path(font_dir)
+    cache_file = get_coverage_cache_path(font_path)
+
+    cached_bitsets: dict[tuple[str, int, int], list[np.ndarray]] = {}
+    cache = load_coverage_cache(cache_file)
+    if cache is not None:
+        for index, (file, size, mtime) in enumerate(
+            zip(cache.files, cache.sizes, cache.mtimes)
+        ):
+            cached_bitsets.setdefault((file, size, mtime), []).append(
+                cache.bitsets[index]
+            )
+
+    font_files = list_font_files(font_path)
+    font_keys = []
+    for font_file in font_files:
+        stat_result = font_file.stat()
+        font_keys.append(
+            (
+                font_file.relative_to(font_path).as_posix(),
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+            )
+        )
+
+    unread_indices = [
+        index for index, key in enumerate(font_keys) if key not in cached_bitsets
+    ]
+    font_bitsets = {key: cached_bitsets.get(key) for key in font_keys}
+
+    # Parsing the cmap tables is CPU bound, so fonts are read in worker processes
+    if unread_indices:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results = executor.map(
+                read_font_bitsets, [font_files[index] for index in unread_indices]
+            )
+
+            for index, bitsets in tqdm(
+                zip(unread_indices, results),
+                total=len(unread_indices),
+                desc="Read fonts",
+            ):
+                font_bitsets[font_keys[index]] = bitsets
+                count_items(1)
+
+    if len(unread_indices) < len(font_files):
+        print(
+            f"Read the characters of {len(font_files) - len(unread_indices)} "
+            "unchanged fonts from the cache"
+        )
+
+    files: list[str] = []
+    faces: list[int] = []
+    sizes: list[int] = []
+    mtimes: list[int] = []
+    bitsets: list[np.ndarray] = []
+    failed_files: list[Path] = []
+
+    for font_file, key in zip(font_files, font_keys):
+        face_bitsets = font_bitsets[key]
+        if face_bitsets is None:
+            failed_files.append(font_file)
+            continue
+
+        file, size, mtime = key
+        for face, bitset in enumerate(face_bitsets):
+            files.append(file)
+            faces.append(face)
+            sizes.append(size)
+            mtimes.append(mtime)
+            bitsets.append(bitset)
+
+    coverage = FontCoverage(
+        files,
+        faces,
+        sizes,
+        mtimes,
+        np.array(bitsets, dtype=np.uint8).reshape(-1, bitset_size),
+    )
+
+    # Fonts that cannot be read are not cached, so that they are tried again
+    if unread_indices or cache is None or cache.files != files:
+        save_coverage_cache(coverage, cache_file)
+
+    return coverage, failed_files
+
+
+def rank_fonts(coverage_matrix: np.ndarray) -> np.ndarray:
+    # Gives the font indices, the font with the most characters first (fonts with as many in directory order)
+    return np.argsort(-coverage_matrix.sum(axis=1), kind="stable")
+
+
+def find_fallback_chain(coverage_matrix: np.ndarray) -> tuple[list[int], np.ndarray]:
+    # Gives the font indices of the chain, and the characters (a bool mask) that no font has.
+    # The next font is the one with the most missing characters, preferring higher ranked fonts.
+    ranked_fonts = rank_fonts(coverage_matrix)
+    ranked_matrix = coverage_matrix[ranked_fonts]
+
+    missing = np.ones(coverage_matrix.shape[1], dtype=bool)
+    chain: list[int] = []
+
+    while missing.any():
+        gains = ranked_matrix[:, missing].sum(axis=1)
+        if len(gains) == 0 or gains.max() == 0:
+            break
+
+        rank = int(np.argmax(gains))
+        chain.append(int(ranked_fonts[rank]))
+        missing &= ~ranked_matrix[rank]
+
+    return chain, missing
+
+
+@metrics_stage("rank content fonts")
+@permissive_umask()
+def rank_content_fonts(
+    font_dir: str | Path,
+    characters: set[str],
+    report_file: str | Path | None = None,
+    max_workers: int | None = None,
+) -> tuple[list[tuple[str, int]], list[tuple[str, str]], str]:
+    # Gives the fonts ranked by their number of characters, the fallback chain (every font with the characters
+    # it adds), and the characters that no font has
+    # Fonts that cannot be read are reported when they are read
+    coverage, _ = scan_font_coverage(font_dir, max_workers=max_workers)
+
+    required_characters = sorted(characters)
+    coverage_matrix = coverage.get_coverage_matrix(required_characters)
+    character_counts = coverage_matrix.sum(axis=1)
+
+    ranking = [
+        (coverage.fonts[index], int(character_counts[index]))
+        for index in rank_fonts(coverage_matrix)
+    ]
+
+    chain_fonts, missing = find_fallback_chain(coverage_matrix)
+    fallback_chain: list[tuple[str, str]] = []
+    added = np.zeros(len(required_characters), dtype=bool)
+    for index in chain_fonts:
+        font_characters = coverage_matrix[index] & ~added
+        added |= font_characters
+        fallback_chain.append(
+            (
+                coverage.fonts[index],
+                "".join(np.array(required_characters)[font_characters]),
+            )
+        )
+
+    missing_characters = "".join(
+        char for char, is_missing in zip(required_characters, missing) if is_missing
+    )
+
+    if report_file is not None:
+        report = {
+            "required_characters": len(required_characters),
+            "ranking": [{"font": font, "characters": count} for font, count in ranking],
+            "fallback_chain": [
+                {"font": font, "characters": chars} for font, chars in fallback_chain
+            ],
+            "missing_characters": missing_characters,
+        }
+        write_output_bytes(
+            report_file,
+            json.dumps(report, ensure_ascii=False, indent=2).encode("utf-8"),
+        )
+
+    return ranking, fallback_chain, missing_characters
+
+
+@record_metrics("xxx-dataset-content-fonts", dataset_dir="xxx-dataset")
+def main():
+    font_dir = "ttf"
+    target_image_dir = "xxx-dataset/TargetImage"
+    report_file = "xxx-dataset-content-fonts.json"
+
+    characters = find_required_characters(target_image_dir)
+
+    ranking, fallback_chain, missing_characters = rank_content_fonts(
+        font_dir, characters, report_file=report_file
+    )
+
+    print(f"Fonts with the most of the {len(characters)} characters:")
+    for font, count in ranking[:10]:
+        print(f"  {font}: {count}")
+
+    print("Fallback chain:")
+    for font, chars in fallback_chain:
+        print(f"  {font}: {len(chars)} characters")
+
+    if missing_characters:
+        print(
+            f"Characters in no font ({len(missing_characters)}): "
+            f"{' '.join(missing_characters)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
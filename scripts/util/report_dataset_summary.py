@@ -1,4 +1,6 @@
 # This script generates a summary report of the dataset's target images.
+# The extended report reads only the PNG/GIF headers of every image (no pixels are decoded)
+# and can be written as JSON or CSV, e.g. for dashboards.
 
 # Dataset format:
 # xxx-dataset/
@@ -11,9 +13,22 @@
 # │   │   ├── fontB+char2.png
 
 
+import csv
+import json
+import os
 import statistics
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from ..common.dataset_manifest import DatasetManifest, load_dataset_manifest_for
+from ..common.image_header import read_image_header
+from ..common.metrics import count_items, metrics_stage, record_metrics
+from ..common.output_writer import is_hidden_file_name
+
+# Mode of images whose header has an unknown mode (e.g. a PNG with an invalid color type)
+unknown_mode = "unknown"
+
 
 def report_dataset_summary(target_image_dir):
     target_image_path = Path(target_image_dir)
@@ -23,27 +38,260 @@ def report_dataset_summary(target_image_dir):
     total_font_directories = len(list(target_image_path.iterdir()))
 
     for subdirectory_path in target_image_path.iterdir():
-        sub_dir_file_count = len(list(subdirectory_path.iterdir()))
+        sub_dir_file_count = sum(
+            1
+            for path in subdirectory_path.iterdir()
+            if not is_hidden_file_name(path.name)
+        )
         font_character_counts.append(sub_dir_file_count)
 
     if total_font_directories == 0:
         return "No fonts found in the dataset."
 
+    # The sample standard deviation needs at least two fonts
+    standard_deviation = (
+        statistics.stdev(font_character_counts) if total_font_directories > 1 else 0.0
+    )
+
     summary = (
         f"Total number of fonts: {total_font_directories}\n"
         f"Range of characters per font: {min(font_character_counts)}-{max(font_character_counts)}\n"
         f"Average number of characters per font: {sum(font_character_counts) / total_font_directories:.2f}\n"
-        f"Standard deviation of characters per font: {statistics.stdev(font_character_counts):.2f}\n"
+        f"Standard deviation of characters per font: {standard_deviation:.2f}\n"
         f"Total number of characters: {sum(font_character_counts)}"
     )
 
     return summary
 
 
+def is_valid_target_image_name(target_image_name: str, font_name: str) -> bool:
+    # Expected Format: style+content[+optional-suffix]
+    target_components = target_image_name.split("+")
+    return (
+        2 <= len(target_components) <= 3
+        and target_components[0] == font_name
+        and len(target_components[1]) == 1
+        and (len(target_components) == 2 or target_components[2].isdigit())
+    )
+
+
+def collect_font_statistics(font_path: Path) -> dict:
+    font_name = font_path.name
+
+    font_statistics = {
+        "image_count": 0,
+        "total_bytes": 0,
+        "format_histogram": Counter(),
+        "width_histogram": Counter(),
+        "height_histogram": Counter(),
+        "mode_histogram": Counter(),
+        "non_image_files": [],
+        "misnamed_files": [],
+    }
+
+    with os.scandir(font_path) as entries:
+        for entry in entries:
+            if not entry.is_file() or is_hidden_file_name(entry.name):
+                continue
+
+            file_path = Path(entry.path)
+            font_statistics["total_bytes"] += entry.stat().st_size
+
+            try:
+                image_header = read_image_header(file_path)
+            except OSError:
+                image_header = None
+
+            if image_header is None:
+                font_statistics["non_image_files"].append(file_path.as_posix())
+                continue
+
+            image_format, width, height, mode = image_header
+
+            font_statistics["image_count"] += 1
+            font_statistics["format_histogram"][image_format] += 1
+            font_statistics["width_histogram"][width] += 1
+            font_statistics["height_histogram"][height] += 1
+            font_statistics["mode_histogram"][mode or unknown_mode] += 1
+
+            if not is_valid_target_image_name(file_path.stem, font_name):
+                font_statistics["misnamed_files"].append(file_path.as_posix())
+
+    return font_statistics
+
+
+def collect_font_statistics_from_manifest(
+    manifest: DatasetManifest, target_image_dir: str | Path
+) -> dict[str, dict]:
+    # Gives the same statistics as collect_font_statistics() for every font, from the headers recorded in the manifest
+    font_statistics_by_name = {
+        font_name: {
+            "image_count": 0,
+            "total_bytes": 0,
+            "format_histogram": Counter(),
+            "width_histogram": Counter(),
+            "height_histogram": Counter(),
+            "mode_histogram": Counter(),
+            "non_image_files": [],
+            "misnamed_files": [],
+        }
+        for font_name in manifest.get_target_fonts()
+    }
+
+    for entry in manifest.get_target_images():
+        font_statistics = font_statistics_by_name[entry.font]
+        file_path = manifest.get_path(entry, target_image_dir)
+        font_statistics["total_bytes"] += entry.size
+
+        if not entry.format:
+            font_statistics["non_image_files"].append(file_path.as_posix())
+            continue
+
+        font_statistics["image_count"] += 1
+        font_statistics["format_histogram"][entry.format] += 1
+        font_statistics["width_histogram"][entry.width] += 1
+        font_statistics["height_histogram"][entry.height] += 1
+        font_statistics["mode_histogram"][entry.mode or unknown_mode] += 1
+
+        if not is_valid_target_image_name(file_path.stem, entry.font):
+            font_statistics["misnamed_files"].append(file_path.as_posix())
+
+    return font_statistics_by_name
+
+
+@metrics_stage("collect dataset statistics")
+def collect_dataset_statistics(
+    target_image_dir: str | Path, max_workers: int | None = None
+) -> dict:
+    target_image_path = Path(target_image_dir)
+
+    font_paths = sorted(path for path in target_image_path.iterdir() if path.is_dir())
+
+    # The dataset manifest is used instead of reading every header when it is up to date
+    manifest = load_dataset_manifest_for(None, target_image_dir)
+
+    if manifest is not None:
+        font_statistics_by_name = collect_font_statistics_from_manifest(
+            manifest, target_image_dir
+        )
+        font_statistics_list = [
+            font_statistics_by_name[font_path.name] for font_path in font_paths
+        ]
+    else:
+        # Reading headers is I/O bound, so fonts are scanned by a thread pool
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            font_statistics_list = list(
+                executor.map(collect_font_statistics, font_paths)
+            )
+
+    dataset_statistics = {
+        "font_count": len(font_paths),
+        "image_count": 0,
+        "total_bytes": 0,
+        "format_histogram": Counter(),
+        "width_histogram": Counter(),
+        "height_histogram": Counter(),
+        "mode_histogram": Counter(),
+        "fonts": {},
+        "non_image_files": [],
+        "misnamed_files": [],
+    }
+
+    for font_path, font_statistics in zip(font_paths, font_statistics_list):
+        dataset_statistics["fonts"][font_path.name] = {
+            "image_count": font_statistics["image_count"],
+            "total_bytes": font_statistics["total_bytes"],
+        }
+
+        for key in ["image_count", "total_bytes"]:
+            dataset_statistics[key] += font_statistics[key]
+
+        for key in [
+            "format_histogram",
+            "width_histogram",
+            "height_histogram",
+            "mode_histogram",
+        ]:
+            dataset_statistics[key].update(font_statistics[key])
+
+        for key in ["non_image_files", "misnamed_files"]:
+            dataset_statistics[key].extend(font_statistics[key])
+
+    count_items(dataset_statistics["image_count"])
+
+    # Histogram keys are strings so that the statistics are the same after a JSON round trip
+    for key in [
+        "format_histogram",
+        "width_histogram",
+        "height_histogram",
+        "mode_histogram",
+    ]:
+        dataset_statistics[key] = {
+            str(value): count
+            for value, count in sorted(dataset_statistics[key].items())
+        }
+
+    return dataset_statistics
+
+
+def write_dataset_statistics_json(dataset_statistics: dict, output_file: str | Path):
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(dataset_statistics, f, ensure_ascii=False, indent=2)
+
+
+def write_dataset_statistics_csv(dataset_statistics: dict, output_file: str | Path):
+    # One metric per row: metric, key, value
+    rows: list[tuple[str, str, int | str]] = [
+        ("font_count", "", dataset_statistics["font_count"]),
+        ("image_count", "", dataset_statistics["image_count"]),
+        ("total_bytes", "", dataset_statistics["total_bytes"]),
+    ]
+
+    for key in [
+        "format_histogram",
+        "width_histogram",
+        "height_histogram",
+        "mode_histogram",
+    ]:
+        rows.extend(
+            (key, value, count) for value, count in dataset_statistics[key].items()
+        )
+
+    for font_name, font_statistics in dataset_statistics["fonts"].items():
+        rows.append(("font_image_count", font_name, font_statistics["image_count"]))
+        rows.append(("font_total_bytes", font_name, font_statistics["total_bytes"]))
+
+    rows.extend(
+        ("non_image_file", file, 1) for file in dataset_statistics["non_image_files"]
+    )
+    rows.extend(
+        ("misnamed_file", file, 1) for file in dataset_statistics["misnamed_files"]
+    )
+
+    with open(output_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["metric", "key", "value"])
+        writer.writerows(rows)
+
+
+@record_metrics("xxx-dataset-statistics", dataset_dir="xxx-dataset")
 def main():
     target_image_dir = "xxx-dataset/TargetImage"
+    statistics_file = (
+        "xxx-dataset-statistics.json"  # Use a .csv file name for CSV output
+    )
+
     print(report_dataset_summary(target_image_dir))
 
+    dataset_statistics = collect_dataset_statistics(target_image_dir)
+
+    if Path(statistics_file).suffix == ".csv":
+        write_dataset_statistics_csv(dataset_statistics, statistics_file)
+    else:
+        write_dataset_statistics_json(dataset_statistics, statistics_file)
+
+    print(f"Dataset statistics written to {statistics_file}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,229 @@
+# This script divides a dataset into train, validation and test splits without copying any file,
+# for evaluating a model on fonts or characters that it has not seen in training.
+# A split is made by font (val and test have unseen fonts), by character (val and test have unseen characters),
+# or by both (val and test have unseen fonts and unseen characters; pairs of a seen font and an unseen character,
+# or of an unseen font and a seen character, are left out of every split).
+# Splits are stratified: fonts are ordered by their number of images and characters by their number of fonts,
+# and dealt out to the splits in proportion along that order, so that every split gets large and small fonts
+# and common and rare characters. The order of fonts (or characters) of the same size is given by the seed.
+# The splits are made from the pairing table of the dataset (see scripts/common/pairing_table.py),
+# which is written first if it does not exist or the dataset changed since it was written.
+
+# Dataset format:
+# xxx-dataset/
+# ├── ContentImage/
+# │   ├── char1.png
+# ├── TargetImage/
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png
+
+# Output format:
+# xxx-dataset-font-split/
+# ├── train.txt  <-- one target image per line, relative to the dataset directory (e.g. TargetImage/fontA/fontA+char1.png)
+# ├── train.npy  <-- the rows of the pairing table (xxx-dataset-pairs/pairs.npy) of the same target images
+# ├── val.txt
+# ├── val.npy
+# ├── test.txt
+# ├── test.npy
+# ├── splits.json  <-- written last: mode, seed, fractions, and the number of images, fonts and characters of every split
+
+
+import json
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+from ..common.metrics import count_items, metrics_stage, record_metrics
+from ..common.output_writer import (
+    ensure_dir_exists_with_perms,
+    permissive_umask,
+    write_output_bytes,
+)
+from ..common.pairing_table import (
+    PairingTable,
+    get_pairing_table_path,
+    is_pairing_table_stale,
+    write_npy,
+    write_pairing_table,
+)
+
+split_names = ["train", "val", "test"]
+split_modes = ["font", "char", "both"]
+
+split_index_file_name = "splits.json"
+
+# Split id of pairs that are left out of every split (only by the "both" mode)
+no_split = -1
+
+
+def get_split_path(dataset_dir: str | Path, mode: str) -> Path:
+    dataset_path = Path(dataset_dir).absolute()
+    return dataset_path.with_name(f"{dataset_path.name}-{mode}-split")
+
+
+def get_split_sizes(item_count: int, fractions: Sequence[float]) -> np.ndarray:
+    # Largest remainder rounding, so that the sizes add up to the number of items
+    exact_sizes = np.asarray(fractions, dtype=np.float64) * item_count
+    sizes = np.floor(exact_sizes).astype(np.int64)
+    remainders = exact_sizes - sizes
+    for index in np.argsort(-remainders, kind="stable")[: item_count - sizes.sum()]:
+        sizes[index] += 1
+    return sizes
+
+
+def assign_splits(
+    item_sizes: np.ndarray, fractions: Sequence[float], rng: np.random.Generator
+) -> np.ndarray:
+    # Gives the split id of every item. Items are ordered by size (ties in random order), and every split
+    # takes its share of the items at evenly spaced places along that order, starting at a random place.
+    item_count = len(item_sizes)
+    order = np.lexsort((rng.random(item_count), item_sizes))
+
+    split_sizes = get_split_sizes(item_count, fractions)
+    slot_splits = np.repeat(np.arange(len(split_sizes)), split_sizes)
+    slot_places = np.concatenate(
+        [(np.arange(size) + rng.random()) / size for size in split_sizes if size > 0]
+        or [np.zeros(0)]
+    )
+
+    splits = np.empty(item_count, dtype=np.int8)
+    splits[order] = slot_splits[np.argsort(slot_places, kind="stable")]
+    return splits
+
+
+def check_split_options(mode: str, fractions: Sequence[float]):
+    if mode not in split_modes:
+        raise ValueError(f"Mode should be one of {', '.join(split_modes)}, not {mode}.")
+
+    if len(fractions) != len(split_names) or any(f < 0 for f in fractions):
+        raise ValueError(
+            f"There should be {len(split_names)} fractions (train, val and test), "
+            "none of them negative."
+        )
+
+    if not np.isclose(sum(fractions), 1.0):
+        raise ValueError(f"Fractions should add up to 1, not {sum(fractions)}.")
+
+
+@metrics_stage("split dataset")
+@permissive_umask()
+def split_dataset(
+    dataset_dir: str | Path,
+    output_dir: str | Path | None = None,
+    mode: str = "font",
+    fractions: Sequence[float] = (0.8, 0.1, 0.1),
+    seed: int = 0,
+    table_dir: str | Path | None = None,
+) -> tuple[dict[str, int], int]:
+    # Gives the number of images of every split, and the number of images left out of every split
+    check_split_options(mode, fractions)
+
+    dataset_path = Path(dataset_dir)
+    output_path = (
+        Path(output_dir)
+        if output_dir is not None
+        else get_split_path(dataset_path, mode)
+    )
+    table_path = (
+        Path(table_dir)
+        if table_dir is not None
+        else get_pairing_table_path(dataset_path)
+    )
+
+    if is_pairing_table_stale(dataset_path, table_path):
+        write_pairing_table(dataset_path, table_path)
+
+    table = PairingTable(table_path, dataset_path)
+    font_ids = np.asarray(table.pairs["font"])
+    char_ids = np.asarray(table.pairs["char"])
+
+    # Fonts and characters are split with separate random streams, so that changing one does not change the other
+    font_splits = assign_splits(
+        np.bincount(font_ids, minlength=len(table.fonts)),
+        fractions,
+        np.random.default_rng([seed, 0]),
+    )
+    char_splits = assign_splits(
+        np.bincount(char_ids, minlength=len(table.characters)),
+        fractions,
+        np.random.default_rng([seed, 1]),
+    )
+
+    if mode == "font":
+        pair_splits = font_splits[font_ids]
+    elif mode == "char":
+        pair_splits = char_splits[char_ids]
+    else:
+        pair_splits = font_splits[font_ids]
+        pair_splits[pair_splits != char_splits[char_ids]] = no_split
+
+    ensure_dir_exists_with_perms(output_path)
+
+    # The split index is removed first, so that an interrupted run is never read as complete
+    (output_path / split_index_file_name).unlink(missing_ok=True)
+
+    split_index = {
+        "mode": mode,
+        "seed": seed,
+        "fractions": dict(zip(split_names, fractions)),
+        "splits": {},
+    }
+
+    for split_id, split_name in enumerate(split_names):
+        rows = np.flatnonzero(pair_splits == split_id)
+
+        write_npy(output_path / f"{split_name}.npy", rows)
+
+        target_paths = table.get_relative_paths(table.pairs["target_path"][rows])
+        write_output_bytes(
+            output_path / f"{split_name}.txt",
+            "".join(f"{path}\n" for path in target_paths).encode("utf-8"),
+        )
+
+        split_index["splits"][split_name] = {
+            "images": len(rows),
+            "fonts": len(np.unique(font_ids[rows])),
+            "characters": len(np.unique(char_ids[rows])),
+        }
+        count_items(len(rows))
+
+    write_output_bytes(
+        output_path / split_index_file_name,
+        json.dumps(split_index, ensure_ascii=False, indent=2).encode("utf-8"),
+    )
+
+    split_sizes = {
+        split_name: split["images"]
+        for split_name, split in split_index["splits"].items()
+    }
+    left_out_count = int(np.count_nonzero(pair_splits == no_split))
+
+    return split_sizes, left_out_count
+
+
+@record_metrics("xxx-dataset-split", dataset_dir="xxx-dataset")
+def main():
+    dataset_dir = "xxx-dataset"
+
+    # "font" for unseen fonts, "char" for unseen characters, or "both"
+    mode = "font"
+    fractions = (0.8, 0.1, 0.1)
+    seed = 0
+
+    split_sizes, left_out_count = split_dataset(
+        dataset_dir, mode=mode, fractions=fractions, seed=seed
+    )
+
+    for split_name, image_count in split_sizes.items():
+        print(f"{split_name}: {image_count} images")
+
+    if left_out_count:
+        print(
+            f"{left_out_count} images of a seen font and an unseen character "
+            "(or of an unseen font and a seen character) were left out"
+        )
+
+
+if __name__ == "__main__":
+    main()
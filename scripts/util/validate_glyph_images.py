@@ -0,0 +1,285 @@
+# This script finds glyph images that are blank, corrupt or unlike the other images of their font,
+# e.g. near-empty CASIA bitmaps, zhuojg GIFs that failed to decode, or content images rendered
+# for a glyph without outlines.
+# Images are decoded in worker processes, and the metrics of every image are computed with numpy
+# over stacked batches of images of the same size:
+# - ink ratio: the fraction of pixels that differ from the background (see common/glyph_ink.py)
+# - bounding box: the width and height of the ink, as fractions of the image size
+# - entropy: the Shannon entropy of the grayscale histogram, in bits (estimated from a grid of at most
+#   entropy_sample_pixels pixels, since counting every pixel would take most of the time)
+# An image is flagged as "corrupt" if it cannot be decoded, "blank" if it has almost no ink,
+# and "outlier" if one of its metrics is far from the median of its font (robust z-score).
+
+# Corrupt and blank files are written to a quarantine list (one path per line, like a deletion plan),
+# which the balance and deletion scripts accept as invalid_image_list to treat those images as missing.
+# Outliers are only reported, since an unusual glyph may still be valid, and can be added after review.
+
+# Dataset format:
+# xxx-dataset/
+# ├── ContentImage/  <-- checked as one font named "ContentImage"
+# │   ├── char1.png
+# ├── TargetImage/
+# │   ├── fontA/
+# │   │   ├── fontA+char1.png
+# │   │   ├── fontA+char2.png
+
+# Report format (CSV):
+# path,font,reason,ink_ratio,bbox_width,bbox_height,entropy
+
+
+import csv
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from ..common.file_deletion import write_deletion_plan
+from ..common.glyph_ink import find_ink, find_ink_bounding_boxes
+from ..common.metrics import count_items, metrics_stage, record_metrics
+from ..common.output_writer import is_hidden_file_name
+
+metric_names = ["ink_ratio", "bbox_width", "bbox_height", "entropy"]
+
+entropy_sample_pixels = 4096
+
+# Files are decoded in chunks, so that small images do not pay the IPC cost one by one
+validation_chunk_size = 256
+
+
+class GlyphIssue:
+    path: Path
+    font: str
+    reason: str  # "corrupt", "blank" or "outlier"
+    metrics: np.ndarray  # ink_ratio, bbox_width, bbox_height, entropy (NaN if corrupt)
+
+    def __init__(self, path: Path, font: str, reason: str, metrics: np.ndarray):
+        self.path = path
+        self.font = font
+        self.reason = reason
+        self.metrics = metrics
+
+
+def compute_glyph_metrics(images: np.ndarray) -> np.ndarray:
+    # images: (count, height, width) uint8 grayscale images of the same size
+    # Gives (count, 4) metrics in the order of metric_names
+    count, height, width = images.shape
+
+    ink = find_ink(images)
+    ink_ratio = np.count_nonzero(ink.reshape(count, -1), axis=1) / (height * width)
+
+    # Boxes of images without ink are all zero, so their width and height are zero
+    boxes, _ = find_ink_bounding_boxes(ink)
+    bbox_width = (boxes[:, 2] - boxes[:, 0]) / width
+    bbox_height = (boxes[:, 3] - boxes[:, 1]) / height
+
+    # One histogram per image, from a single bincount over all images
+    step = max(1, int(np.sqrt(height * width / entropy_sample_pixels)))
+    sampled_pixels = images[:, ::step, ::step].reshape(count, -1)
+    offsets = (np.arange(count, dtype=np.int64) * 256)[:, None]
+    histograms = np.bincount(
+        (sampled_pixels + offsets).ravel(), minlength=count * 256
+    ).reshape(count, 256)
+    probabilities = histograms / sampled_pixels.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropy = -np.where(
+            probabilities > 0, probabilities * np.log2(probabilities), 0.0
+        ).sum(axis=1)
+
+    return np.stack([ink_ratio, bbox_width, bbox_height, entropy], axis=1)
+
+
+def decode_glyph_image(file: Path) -> np.ndarray | None:
+    try:
+        with Image.open(file) as image:
+            return np.asarray(image.convert("L"))
+    except Exception:
+        return None
+
+
+def measure_glyph_files(files: list[Path]) -> np.ndarray:
+    # Runs in a worker process. Gives (len(files), 4) metrics, with NaN for files that cannot be decoded.
+    metrics = np.full((len(files), len(metric_names)), np.nan)
+
+    images_by_shape: dict[tuple[int, ...], list[tuple[int, np.ndarray]]] = {}
+    for index, file in enumerate(files):
+        image = decode_glyph_image(file)
+        if image is not None and image.size > 0:
+            images_by_shape.setdefault(image.shape, []).append((index, image))
+
+    for shaped_images in images_by_shape.values():
+        indices = [index for index, _ in shaped_images]
+        metrics[indices] = compute_glyph_metrics(
+            np.stack([image for _, image in shaped_images])
+        )
+
+    return metrics
+
+
+def find_outliers(
+    metrics: np.ndarray, max_z_score: float, min_font_size: int
+) -> np.ndarray:
+    # Robust z-score against the median and the median absolute deviation of the font.
+    # Gives a boolean mask of the images with any metric beyond the maximum.
+    valid = ~np.isnan(metrics).any(axis=1)
+    outliers = np.zeros(len(metrics), dtype=bool)
+
+    if valid.sum() < min_font_size:
+        return outliers
+
+    median = np.median(metrics[valid], axis=0)
+    deviation = 1.4826 * np.median(np.abs(metrics[valid] - median), axis=0)
+
+    # A metric that hardly varies in the font cannot give meaningful z-scores
+    deviation = np.maximum(deviation, 1e-3)
+
+    z_scores = np.abs(metrics[valid] - median) / deviation
+    outliers[valid] = (z_scores > max_z_score).any(axis=1)
+
+    return outliers
+
+
+def list_glyph_fonts(
+    content_image_dir: str | Path | None, target_image_dir: str | Path | None
+) -> dict[str, list[Path]]:
+    # Font name -> image files, with the content images as one font
+    font_files: dict[str, list[Path]] = {}
+
+    if content_image_dir is not None:
+        font_files[Path(content_image_dir).name] = sorted(
+            file
+            for file in Path(content_image_dir).iterdir()
+            if file.is_file() and not is_hidden_file_name(file.name)
+        )
+
+    if target_image_dir is not None:
+        for font_path in sorted(Path(target_image_dir).iterdir()):
+            if font_path.is_dir():
+                font_files[font_path.name] = sorted(
+                    file
+                    for file in font_path.iterdir()
+                    if file.is_file() and not is_hidden_file_name(file.name)
+                )
+
+    return font_files
+
+
+@metrics_stage("validate glyph images")
+def validate_glyph_images(
+    content_image_dir: str | Path | None,
+    target_image_dir: str | Path | None,
+    min_ink_ratio: float = 0.002,
+    max_z_score: float = 6.0,
+    min_font_size: int = 30,
+    max_workers: int | None = None,
+) -> list[GlyphIssue]:
+    font_files = list_glyph_fonts(content_image_dir, target_image_dir)
+
+    chunks = [
+        (font_name, files[i : i + validation_chunk_size])
+        for font_name, files in font_files.items()
+        for i in range(0, len(files), validation_chunk_size)
+    ]
+
+    font_metrics: dict[str, list[np.ndarray]] = {
+        font_name: [] for font_name in font_files
+    }
+
+    # Decoding is CPU bound, so chunks are measured in worker processes
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        chunk_metrics = executor.map(
+            measure_glyph_files, [files for _, files in chunks]
+        )
+
+        for (font_name, files), metrics in tqdm(
+            zip(chunks, chunk_metrics), total=len(chunks), desc="Validate glyph images"
+        ):
+            font_metrics[font_name].append(metrics)
+            count_items(len(files))
+
+    issues: list[GlyphIssue] = []
+
+    for font_name, files in font_files.items():
+        if not files:
+            continue
+
+        metrics = np.concatenate(font_metrics[font_name])
+
+        is_corrupt = np.isnan(metrics).any(axis=1)
+        is_blank = ~is_corrupt & (np.nan_to_num(metrics[:, 0]) < min_ink_ratio)
+        is_outlier = ~is_blank & find_outliers(metrics, max_z_score, min_font_size)
+
+        for reason, mask in [
+            ("corrupt", is_corrupt),
+            ("blank", is_blank),
+            ("outlier", is_outlier),
+        ]:
+            issues.extend(
+                GlyphIssue(files[index], font_name, reason, metrics[index])
+                for index in np.flatnonzero(mask)
+            )
+
+    return sorted(issues, key=lambda issue: issue.path.as_posix())
+
+
+def write_glyph_issue_report(issues: list[GlyphIssue], output_file: str | Path):
+    with open(output_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["path", "font", "reason", *metric_names])
+        for issue in issues:
+            writer.writerow(
+                [
+                    issue.path.as_posix(),
+                    issue.font,
+                    issue.reason,
+                    *(
+                        "" if np.isnan(value) else f"{value:.4f}"
+                        for value in issue.metrics
+                    ),
+                ]
+            )
+
+
+@record_metrics("xxx-dataset-validation", dataset_dir="xxx-dataset")
+def main():
+    content_image_dir = "xxx-dataset/ContentImage"
+    target_image_dir = "xxx-dataset/TargetImage"
+    quarantine_list_file = "xxx-dataset-invalid-images.txt"
+    report_file = "xxx-dataset-invalid-images.csv"
+
+    # Add "outlier" after reviewing the report
+    quarantined_reasons = {"corrupt", "blank"}
+
+    issues = validate_glyph_images(content_image_dir, target_image_dir)
+
+    quarantined_files = [
+        issue.path for issue in issues if issue.reason in quarantined_reasons
+    ]
+    write_deletion_plan(quarantine_list_file, quarantined_files)
+    write_glyph_issue_report(issues, report_file)
+
+    issue_counts: dict[str, dict[str, int]] = {}
+    for issue in issues:
+        font_counts = issue_counts.setdefault(issue.font, {})
+        font_counts[issue.reason] = font_counts.get(issue.reason, 0) + 1
+
+    for font_name, font_counts in sorted(issue_counts.items()):
+        print(
+            f"{font_name}: "
+            + ", ".join(
+                f"{count} {reason}" for reason, count in sorted(font_counts.items())
+            )
+        )
+
+    print(
+        f"Quarantine list of {len(quarantined_files)} images written to {quarantine_list_file}"
+    )
+    print(f"Report of {len(issues)} flagged images written to {report_file}")
+
+
+if __name__ == "__main__":
+    main()
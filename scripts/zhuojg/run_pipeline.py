@@ -0,0 +1,40 @@
+# This script prepares the zhuojg dataset from the downloaded source with the pipeline runner.
+# It runs the same steps as step_0 and step_1 in one process, and skips steps that are up to date.
+# Unlike step_1, deleting target images without content images is not interactive; set it in main().
+# The stages are shared with the other datasets, see scripts/common/target_image_pipeline.py.
+
+# Stages:
+# create target images: zhuojg-dataset-source/chinese-calligraphy-dataset-with-calligrapher/ -> zhuojg-dataset/TargetImage/
+# create content images: zhuojg-dataset/TargetImage/ -> zhuojg-dataset/ContentImage/
+# delete target images without content image (optional): zhuojg-dataset/ContentImage/ -> zhuojg-dataset/TargetImage/
+
+
+from ..common.metrics import record_metrics
+from ..common.target_image_pipeline import run_target_image_pipeline
+from .step_0_create_target_images import create_target_images
+
+
+@record_metrics("zhuojg-dataset-pipeline", dataset_dir="zhuojg-dataset")
+def main():
+    source_dir = "zhuojg-dataset-source/chinese-calligraphy-dataset-with-calligrapher/"
+    dataset_dir = "zhuojg-dataset"
+    font_dir = "ttf/SourceHanSerifTC-VF.ttf"
+    image_size = (128, 128)
+    font_size = 100
+
+    # Warning: Deleting target images is irreversible
+    delete_target_images_without_content_images = False
+
+    run_target_image_pipeline(
+        create_target_images=create_target_images,
+        source_dir=source_dir,
+        dataset_dir=dataset_dir,
+        font_dir=font_dir,
+        image_size=image_size,
+        font_size=font_size,
+        delete_target_images_without_content_images=delete_target_images_without_content_images,
+    )
+
+
+if __name__ == "__main__":
+    main()
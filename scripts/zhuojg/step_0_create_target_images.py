@@ -1,4 +1,8 @@
 # This script processes the zhuojg dataset
+# Optionally, samples of a character that are near-identical to an earlier sample (e.g. the same scan twice)
+# are dropped before they are encoded, by comparing their perceptual hashes.
+# Samples are numbered in the order of their file names, and samples left in a font by an earlier run
+# (e.g. one without deduplication) are removed.
 
 # Dataset format:
 # zhuojg-dataset-source/chinese-calligraphy-dataset-with-calligrapher/
@@ -30,92 +34,360 @@
 # │   ├── font2+char2.png
 # │   ├── font2+char2+1.png
 
+import io
+import os
+import sys
+from contextlib import nullcontext
 from pathlib import Path
 
 from PIL import Image
 from tqdm import tqdm
 
+from ..common.dataset_manifest import write_dataset_manifest_for
+from ..common.image_hash import difference_hash, hamming_distance
+from ..common.metrics import (
+    count_bytes_read,
+    count_items,
+    metrics_section,
+    metrics_stage,
+    record_metrics,
+)
+from ..common.output_writer import (
+    encode_image,
+    ensure_dir_exists_with_perms,
+    is_hidden_file_name,
+    permissive_umask,
+    write_output_bytes,
+)
+from ..common.progress_journal import (
+    get_journal_path,
+    list_output_names,
+    open_progress_journal,
+)
+from ..common.sharding import (
+    get_shard_path,
+    parse_shard_argument,
+    select_shard,
+    write_shard_report,
+)
+from ..common.streaming_pipeline import (
+    StreamingPipeline,
+    StreamingStage,
+    get_default_encode_workers,
+)
+
+
+class ImageConversion:
+    # One source image on its way through the streaming pipeline
+    char_name: str
+    source_image_file: Path
+    new_image_path: Path
+    data: bytes | None
+    error: str | None
+
+    def __init__(self, char_name: str, source_image_file: Path, new_image_path: Path):
+        self.char_name = char_name
+        self.source_image_file = source_image_file
+        self.new_image_path = new_image_path
+        self.data = None
+        self.error = None
+
+
+class CharacterConversion:
+    # All source images of one character, so that near-duplicate samples can be dropped before encoding.
+    # The remaining images are numbered again without gaps.
+    char_name: str
+    conversions: list[ImageConversion]
+    duplicate_max_distance: int
+    dropped_samples: int
+
+    def __init__(
+        self,
+        char_name: str,
+        conversions: list[ImageConversion],
+        duplicate_max_distance: int,
+    ):
+        self.char_name = char_name
+        self.conversions = conversions
+        self.duplicate_max_distance = duplicate_max_distance
+        self.dropped_samples = 0
+
+
+def get_new_image_name(font_name: str, char_name: str, sample_number: int) -> str:
+    if sample_number == 0:
+        return f"{font_name}+{char_name}.png"
+    return f"{font_name}+{char_name}+{sample_number}.png"
+
 
-def ensure_dir_exists_with_perms(path: str | Path):
-    # Create a Path object
-    base_path = Path(path)
+def load_source_image(conversion: ImageConversion) -> ImageConversion:
+    try:
+        conversion.data = conversion.source_image_file.read_bytes()
+        count_bytes_read(len(conversion.data))
+    except Exception as e:
+        conversion.error = type(e).__name__
+    return conversion
 
-    # Create the directory if it doesn't exist
-    base_path.mkdir(parents=True, exist_ok=True)
 
-    # Change permissions of the base directory itself
-    base_path.chmod(0o777)
+def convert_source_image(conversion: ImageConversion) -> ImageConversion:
+    # Runs in a worker process of the streaming pipeline
+    if conversion.error is not None or conversion.data is None:
+        return conversion
+
+    try:
+        with (
+            metrics_section("convert"),
+            Image.open(io.BytesIO(conversion.data)) as img,
+        ):
+            conversion.data = encode_image(img.convert("RGB"), "PNG")
+    except Exception as e:
+        conversion.data = None
+        conversion.error = type(e).__name__
+    return conversion
+
+
+def write_converted_image(conversion: ImageConversion) -> ImageConversion:
+    if conversion.error is not None or conversion.data is None:
+        return conversion
+
+    try:
+        write_output_bytes(conversion.new_image_path, conversion.data)
+    except Exception as e:
+        conversion.error = type(e).__name__
+
+    # The written data is not needed anymore
+    conversion.data = None
+    return conversion
+
+
+def load_character_images(character: CharacterConversion) -> CharacterConversion:
+    for conversion in character.conversions:
+        load_source_image(conversion)
+    return character
+
+
+def convert_character_images(character: CharacterConversion) -> CharacterConversion:
+    # Runs in a worker process of the streaming pipeline.
+    # A sample is dropped when its hash is within the maximum distance of a sample kept before it.
+    kept_conversions: list[ImageConversion] = []
+    kept_hashes: list[int] = []
+
+    for conversion in character.conversions:
+        if conversion.error is not None or conversion.data is None:
+            kept_conversions.append(conversion)
+            continue
+
+        try:
+            with (
+                metrics_section("convert"),
+                Image.open(io.BytesIO(conversion.data)) as img,
+            ):
+                rgb_image = img.convert("RGB")
+                image_hash = difference_hash(rgb_image)
+
+                if any(
+                    hamming_distance(image_hash, kept_hash)
+                    <= character.duplicate_max_distance
+                    for kept_hash in kept_hashes
+                ):
+                    character.dropped_samples += 1
+                    continue
+
+                conversion.data = encode_image(rgb_image, "PNG")
+                kept_hashes.append(image_hash)
+        except Exception as e:
+            conversion.data = None
+            conversion.error = type(e).__name__
+
+        kept_conversions.append(conversion)
+
+    for sample_number, conversion in enumerate(kept_conversions):
+        font_path = conversion.new_image_path.parent
+        conversion.new_image_path = font_path / get_new_image_name(
+            font_path.name, character.char_name, sample_number
+        )
 
-    # Traverse up the directory tree and change permissions
-    for parent in base_path.parents:
-        if parent != Path("."):
-            parent.chmod(0o777)
+    character.conversions = kept_conversions
+    return character
+
+
+def write_character_images(character: CharacterConversion) -> CharacterConversion:
+    for conversion in character.conversions:
+        write_converted_image(conversion)
+    return character
+
+
+def create_streaming_pipeline(
+    encode_workers: int, io_workers: int = 2, deduplicate: bool = False
+):
+    # With deduplication, the items are the characters (CharacterConversion) instead of the images
+    if deduplicate:
+        load_function = load_character_images
+        convert_function = convert_character_images
+        write_function = write_character_images
+    else:
+        load_function = load_source_image
+        convert_function = convert_source_image
+        write_function = write_converted_image
+
+    return StreamingPipeline(
+        [
+            StreamingStage("load", load_function, workers=io_workers),
+            StreamingStage(
+                "convert",
+                convert_function,
+                workers=encode_workers,
+                use_processes=True,
+            ),
+            StreamingStage("write", write_function, workers=io_workers),
+        ]
+    )
 
 
 def generate_target_images_from_source_font_path(
     source_font_path: Path,
     output_target_font_path: Path,
+    pipeline: StreamingPipeline | None = None,
+    duplicate_max_distance: int | None = None,
+    dropped_duplicate_counts: dict[str, int] | None = None,
 ):
+    # With a maximum distance, near-duplicate samples of a character are dropped,
+    # and the number of dropped samples of the font is added to dropped_duplicate_counts
     success_characters: set[str] = set()
     skipped_characters: set[str] = set()
 
     source_char_paths = [
         source_char_path
-        for source_char_path in source_font_path.iterdir()
+        for source_char_path in sorted(source_font_path.iterdir())
         if source_char_path.is_dir()
     ]
 
     font_name = source_font_path.name
 
-    for source_char_path in (
-        progress_bar := tqdm(
-            source_char_paths,
-            total=len(source_char_paths),
-            desc=f"{font_name}",
-            leave=False,
-        )
-    ):
-        char_name = source_char_path.name
+    characters: list[CharacterConversion] = []
 
-        source_image_files = list(source_char_path.iterdir())
+    for source_char_path in source_char_paths:
+        char_name = source_char_path.name
 
-        new_image_names = [
-            (
-                f"{font_name}+{char_name}.png"
-                if i == 0
-                else f"{font_name}+{char_name}+{i}.png"
+        # Sorted, so that the same samples are numbered (and kept as the earlier of two duplicates) on every system
+        source_image_files = sorted(source_char_path.iterdir())
+
+        characters.append(
+            CharacterConversion(
+                char_name,
+                [
+                    ImageConversion(
+                        char_name,
+                        source_image_file,
+                        output_target_font_path
+                        / get_new_image_name(font_name, char_name, sample_number),
+                    )
+                    for sample_number, source_image_file in enumerate(
+                        source_image_files
+                    )
+                ],
+                duplicate_max_distance if duplicate_max_distance is not None else -1,
             )
-            for i in range(len(source_image_files))
-        ]
+        )
 
-        new_image_paths = [
-            output_target_font_path / new_image_name
-            for new_image_name in new_image_names
+    total_images = sum(len(character.conversions) for character in characters)
+
+    progress_bar = tqdm(total=total_images, desc=f"{font_name}", leave=False)
+
+    if duplicate_max_distance is None:
+        conversions = [
+            conversion
+            for character in characters
+            for conversion in character.conversions
         ]
 
-        # Convert and save images
-        for source_image_file, new_image_path in zip(
-            source_image_files, new_image_paths
-        ):
-            try:
-                with Image.open(source_image_file) as img:
-                    img.convert("RGB").save(new_image_path, "PNG")
+        if pipeline is None:
+            results = map(convert_and_save_image, conversions)
+        else:
+            # Reading, converting and writing the images of the font overlap
+            results = pipeline.run(conversions)
+
+    else:
+        if pipeline is None:
+            character_results = map(convert_and_save_character, characters)
+        else:
+            character_results = pipeline.run(characters)
+
+        def flatten_character_results(progress_bar: tqdm):
+            # Dropped samples are counted as done, so that the progress bar reaches the total
+            dropped_samples = 0
+            for character in character_results:
+                dropped_samples += character.dropped_samples
+                progress_bar.update(character.dropped_samples)
+                yield from character.conversions
+
+            if dropped_duplicate_counts is not None:
+                dropped_duplicate_counts[font_name] = (
+                    dropped_duplicate_counts.get(font_name, 0) + dropped_samples
+                )
 
-                new_image_path.chmod(0o777)
+        results = flatten_character_results(progress_bar)
 
-                success_characters.add(char_name)
+    # Names of the samples of this run, so that samples numbered by an earlier run can be removed
+    sample_names: set[str] = set()
 
-            except Exception as e:
-                progress_bar.write(
-                    f'Exception "{type(e).__name__}" occurred on image {source_image_file} -> {new_image_path}'
-                )
+    for conversion in results:
+        progress_bar.update(1)
+        count_items(1)
+
+        if conversion.error is None:
+            success_characters.add(conversion.char_name)
+            sample_names.add(conversion.new_image_path.name)
+        else:
+            progress_bar.write(
+                f'Exception "{conversion.error}" occurred on image {conversion.source_image_file} -> {conversion.new_image_path}'
+            )
+
+            skipped_characters.add(conversion.char_name)
 
-                skipped_characters.add(char_name)
+    progress_bar.close()
+
+    remove_stale_samples(output_target_font_path, sample_names)
 
     return success_characters, skipped_characters
 
 
-def create_target_images(source_dir: str | Path, output_target_image_dir: str | Path):
+def remove_stale_samples(output_target_font_path: Path, sample_names: set[str]):
+    # Samples left by an earlier run (e.g. one that kept more samples before deduplication) are removed,
+    # so that the font only has the samples of this run
+    for name in os.listdir(output_target_font_path):
+        if name not in sample_names and not is_hidden_file_name(name):
+            (output_target_font_path / name).unlink()
+
+
+def convert_and_save_image(conversion: ImageConversion) -> ImageConversion:
+    # The steps of the streaming pipeline, one after another
+    return write_converted_image(convert_source_image(load_source_image(conversion)))
+
+
+def convert_and_save_character(character: CharacterConversion) -> CharacterConversion:
+    return write_character_images(
+        convert_character_images(load_character_images(character))
+    )
+
+
+@metrics_stage("create target images")
+@permissive_umask()
+def create_target_images(
+    source_dir: str | Path,
+    output_target_image_dir: str | Path,
+    journal_file: str | Path | None = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    encode_workers: int | None = None,
+    duplicate_max_distance: int | None = None,
+    dropped_duplicate_counts: dict[str, int] | None = None,
+):
+    # With a journal file, a rerun resumes from the font directories completed by the previous run
+    # With several shards, only the font directories assigned to this shard are converted
+    # With encode workers, images are converted in that many processes while the next images are read
+    # With a maximum distance, samples of a character whose perceptual hashes differ by at most that many bits
+    # from an earlier sample are dropped, and the number dropped per font is added to dropped_duplicate_counts
+
     ensure_dir_exists_with_perms(output_target_image_dir)
 
     source_path = Path(source_dir)
@@ -124,28 +396,85 @@ def create_target_images(source_dir: str | Path, output_target_image_dir: str |
     success_characters: set[str] = set()
     skipped_characters: set[str] = set()
 
-    total_fonts = len(list(source_path.iterdir()))
+    source_font_paths = select_shard(
+        source_path.iterdir(),
+        shard_index,
+        shard_count,
+        key=lambda source_font_path: source_font_path.name,
+    )
+
+    total_fonts = len(source_font_paths)
 
-    # Iterate through each font directory
-    for source_font_path in tqdm(
-        source_path.iterdir(), total=total_fonts, desc="Create target images"
-    ):
+    # One listing of the output directory instead of a stat call per font directory
+    output_font_names = list_output_names(output_target_image_path)
 
-        if source_font_path.is_dir():
+    with (
+        open_progress_journal(
+            journal_file, output_dir=output_target_image_dir
+        ) as journal,
+        (
+            create_streaming_pipeline(
+                encode_workers, deduplicate=duplicate_max_distance is not None
+            )
+            if encode_workers
+            else nullcontext()
+        ) as pipeline,
+    ):
+        # Iterate through each font directory
+        for source_font_path in tqdm(
+            source_font_paths, total=total_fonts, desc="Create target images"
+        ):
             font_name = source_font_path.name
 
-            # Create a subdirectory for the font in the target directory
-            output_target_font_path = output_target_image_path / font_name
-            output_target_font_path.mkdir(parents=True, exist_ok=True)
-            output_target_font_path.chmod(0o777)
+            # Font directories completed by an interrupted run are skipped, unless their output is gone
+            if (
+                journal is not None
+                and journal.is_completed(font_name)
+                and font_name in output_font_names
+            ):
+                record = journal.get_record(font_name)
+                success_characters.update(record["success"])
+                skipped_characters.update(record["skipped"])
+                if dropped_duplicate_counts is not None and "dropped" in record:
+                    dropped_duplicate_counts[font_name] = record["dropped"]
+                continue
+
+            if source_font_path.is_dir():
+                # Create a subdirectory for the font in the target directory
+                output_target_font_path = output_target_image_path / font_name
+                ensure_dir_exists_with_perms(output_target_font_path)
+
+                font_dropped_counts: dict[str, int] = {}
+
+                success, skipped = generate_target_images_from_source_font_path(
+                    source_font_path=source_font_path,
+                    output_target_font_path=output_target_font_path,
+                    pipeline=pipeline,
+                    duplicate_max_distance=duplicate_max_distance,
+                    dropped_duplicate_counts=font_dropped_counts,
+                )
 
-            success, skipped = generate_target_images_from_source_font_path(
-                source_font_path=source_font_path,
-                output_target_font_path=output_target_font_path,
-            )
+                if journal is not None:
+                    journal_data = {
+                        "success": sorted(success),
+                        "skipped": sorted(skipped),
+                    }
+                    if font_name in font_dropped_counts:
+                        journal_data["dropped"] = font_dropped_counts[font_name]
+                    journal.record(font_name, **journal_data)
 
-            success_characters.update(success)
-            skipped_characters.update(skipped)
+                if dropped_duplicate_counts is not None:
+                    dropped_duplicate_counts.update(font_dropped_counts)
+
+                success_characters.update(success)
+                skipped_characters.update(skipped)
+
+        if pipeline is not None:
+            print(pipeline.format_statistics())
+
+    # A shard only sees part of the dataset, so the manifest is written by an unsharded run
+    if shard_count == 1:
+        write_dataset_manifest_for(output_target_image_dir)
 
     return success_characters, skipped_characters
 
@@ -156,10 +485,48 @@ def main():
     output_target_image_dir = (
         "zhuojg-dataset/TargetImage/"  # Change this to your desired output directory
     )
+    # zhuojg-dataset/TargetImage.journal, delete this file to start over
+    journal_file = get_journal_path(output_target_image_dir)
+    report_file = "zhuojg-dataset-target-images.json"
+    metrics_name = "zhuojg-dataset-target-images"
+
+    # Set to drop samples of a character that are near-identical to an earlier sample (e.g. 2 bits of 64)
+    duplicate_max_distance = None
+
+    # Run with "--shard index/count" to convert a part of the dataset on each machine
+    shard_index, shard_count = parse_shard_argument(sys.argv[1:])
+
+    if shard_count > 1:
+        journal_file = get_shard_path(journal_file, shard_index, shard_count)
+        metrics_name = get_shard_path(metrics_name, shard_index, shard_count).name
+
+    dropped_duplicate_counts: dict[str, int] = {}
+
+    with record_metrics(metrics_name, dataset_dir="zhuojg-dataset"):
+        success, skipped = create_target_images(
+            source_dir=source_dir,
+            output_target_image_dir=output_target_image_dir,
+            journal_file=journal_file,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            encode_workers=get_default_encode_workers(),
+            duplicate_max_distance=duplicate_max_distance,
+            dropped_duplicate_counts=dropped_duplicate_counts,
+        )
 
-    create_target_images(
-        source_dir=source_dir, output_target_image_dir=output_target_image_dir
-    )
+    for font_name, dropped in sorted(dropped_duplicate_counts.items()):
+        print(f"{font_name}: dropped {dropped} near-duplicate samples")
+
+    if shard_count > 1:
+        shard_report_file = get_shard_path(report_file, shard_index, shard_count)
+        write_shard_report(
+            shard_report_file,
+            shard_index,
+            shard_count,
+            success=success,
+            skipped=skipped,
+        )
+        print(f"Shard report written to {shard_report_file}")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,15 @@
+import sys
+
 from ..common.create_content_images_from_target_images import (
     create_content_images_from_target_images,
 )
 from ..common.delete_target_images_without_content_image import (
     delete_target_images_without_content_image,
 )
+from ..common.metrics import record_metrics
+from ..common.progress_journal import get_journal_path
+from ..common.sharding import get_shard_path, parse_shard_argument, write_shard_report
+from ..common.streaming_pipeline import get_default_encode_workers
 
 
 def main():
@@ -12,14 +18,30 @@ def main():
     font_dir = "ttf/SourceHanSerifTC-VF.ttf"
     image_size = (128, 128)
     font_size = 100
+    # zhuojg-dataset/ContentImage.journal, delete this file to start over
+    journal_file = get_journal_path(content_image_dir)
+    report_file = "zhuojg-dataset-content-images.json"
+    metrics_name = "zhuojg-dataset-content-images"
+
+    # Run with "--shard index/count" to render a part of the characters on each machine
+    shard_index, shard_count = parse_shard_argument(sys.argv[1:])
 
-    result = create_content_images_from_target_images(
-        output_content_image_dir=content_image_dir,
-        target_image_dir=target_image_dir,
-        font_dir=font_dir,
-        image_size=image_size,
-        font_size=font_size,
-    )
+    if shard_count > 1:
+        journal_file = get_shard_path(journal_file, shard_index, shard_count)
+        metrics_name = get_shard_path(metrics_name, shard_index, shard_count).name
+
+    with record_metrics(metrics_name, dataset_dir="zhuojg-dataset"):
+        result = create_content_images_from_target_images(
+            output_content_image_dir=content_image_dir,
+            target_image_dir=target_image_dir,
+            font_dir=font_dir,
+            image_size=image_size,
+            font_size=font_size,
+            journal_file=journal_file,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            encode_workers=get_default_encode_workers(),
+        )
 
     if not result:
         print("Failed to create content images.")
@@ -27,6 +49,19 @@ def main():
 
     successful, unsuccessful = result
 
+    if shard_count > 1:
+        # Target images are only deleted after all shards are merged (see scripts/util/merge_shard_reports.py)
+        shard_report_file = get_shard_path(report_file, shard_index, shard_count)
+        write_shard_report(
+            shard_report_file,
+            shard_index,
+            shard_count,
+            successful=successful,
+            unsuccessful=unsuccessful,
+        )
+        print(f"Shard report written to {shard_report_file}")
+        return
+
     if unsuccessful:
         print(
             f"Content images for some characters could not be created: {', '.join(unsuccessful)}"
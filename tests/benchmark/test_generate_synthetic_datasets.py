@@ -0,0 +1,103 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from scripts.benchmark.generate_synthetic_datasets import (
+    generate_synthetic_datasets,
+    get_gb2312_characters,
+    neumason_content_font_dir,
+)
+from scripts.casia.step_0_create_target_images import (
+    create_target_images as create_casia_target_images,
+)
+from scripts.fyp23.step_0_create_content_and_target_images import (
+    create_content_and_target_images as create_fyp23_images,
+)
+from scripts.neumason.step_0_create_content_and_target_images import (
+    create_content_and_target_images as create_neumason_images,
+)
+from scripts.util.compare_directories import compare_directories_and_return_summary
+from scripts.zhuojg.step_0_create_target_images import (
+    create_target_images as create_zhuojg_target_images,
+)
+
+test_output_path = Path("test_outputs") / "synthetic_datasets"
+
+
+@pytest.fixture
+def output_path():
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    yield test_output_path
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+
+def count_files(directory: Path) -> int:
+    return sum(1 for path in directory.rglob("*") if path.is_file())
+
+
+def test_synthetic_datasets_are_converted(output_path: Path):
+    fonts = 2
+    characters_per_font = 5
+
+    source_dirs = generate_synthetic_datasets(
+        output_path / "source",
+        fonts=fonts,
+        characters_per_font=characters_per_font,
+        images_per_character=2,
+    )
+
+    characters = set(get_gb2312_characters(characters_per_font))
+
+    success, skipped = create_casia_target_images(
+        source_dirs["casia"], output_path / "casia" / "TargetImage"
+    )
+    assert success == characters
+    assert skipped == set()
+    assert count_files(output_path / "casia") == fonts * characters_per_font
+
+    success, skipped = create_zhuojg_target_images(
+        source_dirs["zhuojg"], output_path / "zhuojg" / "TargetImage"
+    )
+    assert success == characters
+    assert skipped == set()
+    assert count_files(output_path / "zhuojg") == fonts * characters_per_font * 2
+
+    create_fyp23_images(
+        source_dirs["fyp23"],
+        source_dirs["fyp23"] / "wordlist.txt",
+        output_path / "fyp23",
+    )
+    assert {
+        path.stem for path in (output_path / "fyp23" / "ContentImage").iterdir()
+    } == (characters)
+    assert (
+        count_files(output_path / "fyp23" / "TargetImage")
+        == fonts * characters_per_font
+    )
+
+    create_neumason_images(
+        source_dirs["neumason"], output_path / "neumason", neumason_content_font_dir, []
+    )
+    assert len(list((output_path / "neumason" / "TargetImage").iterdir())) == fonts
+    assert (
+        count_files(output_path / "neumason" / "TargetImage")
+        == fonts * characters_per_font
+    )
+
+
+def test_synthetic_datasets_are_reproducible(output_path: Path):
+    for name in ["first", "second"]:
+        generate_synthetic_datasets(
+            output_path / name, fonts=1, characters_per_font=3, images_per_character=1
+        )
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        output_path / "first", output_path / "second"
+    )
+
+    assert directories_are_equal, message
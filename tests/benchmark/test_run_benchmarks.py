@@ -0,0 +1,60 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from scripts.benchmark.generate_synthetic_datasets import generate_synthetic_datasets
+from scripts.benchmark.run_benchmarks import (
+    build_benchmarks,
+    compare_with_baseline,
+    run_benchmarks,
+)
+
+test_output_path = Path("test_outputs") / "benchmarks"
+
+
+@pytest.fixture
+def output_path():
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    yield test_output_path
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+
+def test_every_benchmark_processes_items(output_path: Path):
+    source_dirs = generate_synthetic_datasets(
+        output_path / "source", fonts=2, characters_per_font=3, images_per_character=1
+    )
+
+    benchmarks = build_benchmarks(source_dirs, font_file=output_path / "missing.ttf")
+    # Every repeat starts from a prepared work directory
+    results = run_benchmarks(benchmarks, work_dir=output_path / "output", repeats=2)
+
+    assert list(results) == [benchmark.name for benchmark in benchmarks]
+
+    for name, result in results.items():
+        assert result["items"] > 0, name
+        assert result["items_per_second"] > 0, name
+
+    assert results["casia target images"]["items"] == 6
+    assert results["casia target images"]["bytes_written"] > 0
+
+
+def test_regressions_are_found_beyond_tolerance():
+    baseline = {
+        "fast": {"items_per_second": 100.0},
+        "slow": {"items_per_second": 100.0},
+    }
+    results = {
+        "fast": {"items_per_second": 85.0},
+        "slow": {"items_per_second": 70.0},
+        "new": {"items_per_second": 1.0},
+    }
+
+    regressions = compare_with_baseline(results, baseline, tolerance=0.2)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("slow:")
@@ -1,9 +1,13 @@
 import shutil
+import struct
 from pathlib import Path
 
+import numpy as np
 import pytest
+from PIL import Image
 
 from scripts.casia.step_0_create_target_images import create_target_images
+from scripts.common.progress_journal import get_journal_path
 from scripts.util.compare_directories import compare_directories_and_return_summary
 
 test_reference_path = Path("tests") / "casia" / "create_target_images_test_data"
@@ -114,3 +118,153 @@ def test_create_target_images_with_chinese_characters(output_target_image_dir):
     )
 
     assert directories_are_equal, message
+
+
+@pytest.mark.parametrize("dataset_name", ["source_with_chinese_characters_resumed"])
+def test_create_target_images_resumes_from_journal(output_target_image_dir):
+    source_dir = test_reference_path / "source_with_chinese_characters"
+    journal_file = get_journal_path(output_target_image_dir)
+
+    if journal_file.exists():
+        journal_file.unlink()
+
+    create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        journal_file=journal_file,
+    )
+
+    # A completed GNT file is converted again if its font directory is gone
+    shutil.rmtree(output_target_image_dir / "style_003")
+
+    success, skipped = create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        journal_file=journal_file,
+    )
+
+    assert success == {"扼", "遏"}
+    assert skipped == set()
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        output_target_image_dir,
+        test_reference_path / "source_with_chinese_characters_result",
+    )
+    assert directories_are_equal, message
+
+    journal_file.unlink()
+
+
+@pytest.mark.parametrize("dataset_name", ["source_with_chinese_characters_restarted"])
+def test_create_target_images_starts_over_when_output_is_deleted(
+    output_target_image_dir,
+):
+    source_dir = test_reference_path / "source_with_chinese_characters"
+    journal_file = get_journal_path(output_target_image_dir)
+
+    if journal_file.exists():
+        journal_file.unlink()
+
+    create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        journal_file=journal_file,
+    )
+
+    shutil.rmtree(output_target_image_dir)
+
+    create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        journal_file=journal_file,
+    )
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        output_target_image_dir,
+        test_reference_path / "source_with_chinese_characters_result",
+    )
+    assert directories_are_equal, message
+
+    journal_file.unlink()
+
+
+@pytest.mark.parametrize("dataset_name", ["source_with_sharded_gnt_files"])
+def test_sharded_target_images_match_single_shard(output_target_image_dir):
+    source_dir = test_reference_path / "source_with_chinese_characters"
+
+    success_characters: set[str] = set()
+    skipped_characters: set[str] = set()
+
+    for shard_index in range(3):
+        success, skipped = create_target_images(
+            source_dir=source_dir,
+            output_target_image_dir=output_target_image_dir,
+            shard_index=shard_index,
+            shard_count=3,
+        )
+        success_characters.update(success)
+        skipped_characters.update(skipped)
+
+    assert success_characters == {"扼", "遏"}
+    assert skipped_characters == set()
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        output_target_image_dir,
+        test_reference_path / "source_with_chinese_characters_result",
+    )
+
+    assert directories_are_equal, message
+
+
+@pytest.mark.parametrize("dataset_name", ["source_with_streaming_pipeline"])
+def test_streaming_target_images_match_lockstep(output_target_image_dir):
+    source_dir = test_reference_path / "source_with_chinese_characters"
+
+    success, skipped = create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        encode_workers=2,
+    )
+
+    assert success == {"扼", "遏"}
+    assert skipped == set()
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        output_target_image_dir,
+        test_reference_path / "source_with_chinese_characters_result",
+    )
+
+    assert directories_are_equal, message
+
+
+def write_gnt_file(gnt_file: Path, glyphs: list[tuple[str, int]]):
+    # One 4x4 glyph of the given fill for every (character, fill)
+    with open(gnt_file, "wb") as f:
+        for character, fill in glyphs:
+            tag_code = character.encode("gb2312")
+            f.write(struct.pack("<I", 10 + 16) + tag_code + struct.pack("<HH", 4, 4))
+            f.write(bytes([fill]) * 16)
+
+
+@pytest.mark.parametrize("dataset_name", ["source_with_duplicate_characters"])
+def test_streaming_writes_last_glyph_of_duplicate_characters(output_target_image_dir):
+    source_dir = test_output_path / "source_with_duplicate_characters_source"
+    source_dir.mkdir(parents=True, exist_ok=True)
+
+    # The last glyph of a character in a GNT file is written, as without the streaming pipeline
+    glyphs = [("扼", fill) for fill in range(0, 200, 10)] + [("遏", 0), ("扼", 255)]
+    write_gnt_file(source_dir / "001-f.gnt", glyphs)
+
+    success, skipped = create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        encode_workers=2,
+    )
+
+    assert success == {"扼", "遏"}
+    assert skipped == set()
+
+    with Image.open(output_target_image_dir / "style_001" / "style_001+扼.png") as img:
+        assert np.all(np.asarray(img) == 255)
+
+    shutil.rmtree(source_dir)
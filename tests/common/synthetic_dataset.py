@@ -0,0 +1,41 @@
+import shutil
+from pathlib import Path
+from typing import Callable, Sequence
+
+from PIL import Image
+
+from scripts.common.dataset_manifest import get_manifest_path
+
+# An int fill gives a grayscale image, and a tuple fill gives an RGB image
+Fill = int | tuple[int, int, int]
+
+
+def create_synthetic_dataset(
+    dataset_path: Path,
+    content_chars: Sequence[str],
+    fonts: dict[str, Sequence[str]],
+    content_fill: Callable[[str], Fill] = lambda char: 255,
+    target_fill: Callable[[str, str], Fill] = lambda font_name, name: 0,
+):
+    # Writes an 8x8 image of every content character, and of every name (e.g. "char1" or "char1+1") of every font.
+    # An earlier dataset at the same path and its manifest are removed first.
+    if dataset_path.exists():
+        shutil.rmtree(dataset_path)
+    get_manifest_path(dataset_path).unlink(missing_ok=True)
+
+    (dataset_path / "ContentImage").mkdir(parents=True)
+    for char in content_chars:
+        save_image(content_fill(char), dataset_path / "ContentImage" / f"{char}.png")
+
+    for font_name, names in fonts.items():
+        font_path = dataset_path / "TargetImage" / font_name
+        font_path.mkdir(parents=True)
+        for name in names:
+            save_image(
+                target_fill(font_name, name), font_path / f"{font_name}+{name}.png"
+            )
+
+
+def save_image(fill: Fill, image_path: Path):
+    mode = "L" if isinstance(fill, int) else "RGB"
+    Image.new(mode, (8, 8), fill).save(image_path)
@@ -0,0 +1,155 @@
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from scripts.common.create_image_pyramid import create_image_pyramid
+from scripts.common.dataset_manifest import get_manifest_path, load_dataset_manifest
+
+test_output_path = Path("test_outputs")
+
+
+@pytest.fixture
+def dataset_path():
+    root_path = test_output_path / "create_image_pyramid"
+    if root_path.exists():
+        shutil.rmtree(root_path)
+
+    dataset_path = root_path / "xxx-dataset"
+    (dataset_path / "ContentImage").mkdir(parents=True)
+    Image.new("L", (128, 128), 255).save(dataset_path / "ContentImage" / "char1.png")
+
+    for font_name in ["fontA", "fontB"]:
+        font_path = dataset_path / "TargetImage" / font_name
+        font_path.mkdir(parents=True)
+        Image.new("RGB", (128, 128), "white").save(font_path / f"{font_name}+char1.png")
+
+    # A palette image, and a file that is not an image
+    fontB_path = dataset_path / "TargetImage" / "fontB"
+    Image.new("P", (100, 100)).save(fontB_path / "fontB+char2.png")
+    (fontB_path / "fontB+char3.png").write_bytes(b"broken")
+
+    yield dataset_path
+
+    shutil.rmtree(root_path)
+
+
+def test_creates_one_dataset_per_size(dataset_path: Path):
+    output_paths, failed_files = create_image_pyramid(
+        dataset_path, sizes=[64, 96, 128], max_workers=1
+    )
+
+    assert [path.name for path in output_paths] == [
+        "xxx-dataset-64px",
+        "xxx-dataset-96px",
+        "xxx-dataset-128px",
+    ]
+    assert failed_files == [dataset_path / "TargetImage" / "fontB" / "fontB+char3.png"]
+
+    for output_path, size in zip(output_paths, [64, 96, 128]):
+        for image_path in [
+            Path("ContentImage") / "char1.png",
+            Path("TargetImage") / "fontA" / "fontA+char1.png",
+            Path("TargetImage") / "fontB" / "fontB+char2.png",
+        ]:
+            with Image.open(output_path / image_path) as image:
+                assert image.size == (size, size)
+
+        # Every resized dataset has its own manifest
+        manifest = load_dataset_manifest(output_path)
+        assert manifest is not None
+        assert len(manifest.get_target_images()) == 3
+
+    # Images that already have the size are copied as they are
+    source_image_path = dataset_path / "TargetImage" / "fontA" / "fontA+char1.png"
+    copied_image_path = output_paths[2] / "TargetImage" / "fontA" / "fontA+char1.png"
+    assert copied_image_path.read_bytes() == source_image_path.read_bytes()
+
+
+def test_resized_images_are_not_resized_again(dataset_path: Path):
+    output_paths, _ = create_image_pyramid(dataset_path, sizes=[64], max_workers=1)
+
+    output_image_path = output_paths[0] / "ContentImage" / "char1.png"
+    modified_time = output_image_path.stat().st_mtime_ns
+
+    create_image_pyramid(dataset_path, sizes=[64], max_workers=1)
+
+    assert output_image_path.stat().st_mtime_ns == modified_time
+
+
+def test_output_directories_must_match_sizes(dataset_path: Path):
+    with pytest.raises(ValueError):
+        create_image_pyramid(
+            dataset_path, sizes=[64, 96], output_dirs=[dataset_path.parent / "a"]
+        )
+
+
+def test_non_square_images_are_padded_instead_of_stretched(dataset_path: Path):
+    # A black glyph that fills a 128x64 image on a white background
+    font_path = dataset_path / "TargetImage" / "fontA"
+    image = Image.new("L", (128, 64), 255)
+    image.paste(0, (0, 8, 128, 56))
+    image.save(font_path / "fontA+char2.png")
+
+    output_paths, _ = create_image_pyramid(dataset_path, sizes=[64], max_workers=1)
+
+    with Image.open(
+        output_paths[0] / "TargetImage" / "fontA" / "fontA+char2.png"
+    ) as image:
+        assert image.size == (64, 64)
+        pixels = np.asarray(image)
+
+    # Scaled by half and centered: 16 rows of padding and 4 rows of margin above and below 24 rows of glyph
+    assert np.all(pixels[:16] == 255) and np.all(pixels[-16:] == 255)
+    assert np.all(pixels[22:42] <= 1)
+
+
+def test_removed_images_are_removed_from_resized_datasets(dataset_path: Path):
+    output_paths, _ = create_image_pyramid(dataset_path, sizes=[64], max_workers=1)
+    output_path = output_paths[0]
+
+    (dataset_path / "TargetImage" / "fontB" / "fontB+char2.png").unlink()
+    shutil.rmtree(dataset_path / "TargetImage" / "fontA")
+
+    create_image_pyramid(dataset_path, sizes=[64], max_workers=1)
+
+    assert not (output_path / "TargetImage" / "fontB" / "fontB+char2.png").exists()
+    assert (output_path / "TargetImage" / "fontB" / "fontB+char1.png").exists()
+    assert not (output_path / "TargetImage" / "fontA").exists()
+
+    manifest = load_dataset_manifest(output_path)
+    assert manifest is not None
+    assert len(manifest.get_target_images()) == 1
+
+
+def test_replaced_images_are_resized_again_even_if_older(dataset_path: Path):
+    output_paths, _ = create_image_pyramid(dataset_path, sizes=[64], max_workers=1)
+    output_image_path = output_paths[0] / "ContentImage" / "char1.png"
+
+    # Replaced by a black image that keeps the modification time of an older file (as with shutil.copy2)
+    source_image_path = dataset_path / "ContentImage" / "char1.png"
+    Image.new("L", (96, 96), 0).save(source_image_path)
+    older_time_ns = output_image_path.stat().st_mtime_ns - 10**9
+    os.utime(source_image_path, ns=(older_time_ns, older_time_ns))
+
+    create_image_pyramid(dataset_path, sizes=[64], max_workers=1)
+
+    with Image.open(output_image_path) as image:
+        assert image.getextrema() == (0, 0)
+
+
+def test_images_that_fail_to_resize_lose_their_earlier_outputs(dataset_path: Path):
+    output_paths, _ = create_image_pyramid(dataset_path, sizes=[64], max_workers=1)
+    output_image_path = output_paths[0] / "TargetImage" / "fontA" / "fontA+char1.png"
+    assert output_image_path.exists()
+
+    source_image_path = dataset_path / "TargetImage" / "fontA" / "fontA+char1.png"
+    source_image_path.write_bytes(b"broken")
+
+    _, failed_files = create_image_pyramid(dataset_path, sizes=[64], max_workers=1)
+
+    assert source_image_path in failed_files
+    assert not output_image_path.exists()
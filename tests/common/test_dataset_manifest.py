@@ -0,0 +1,238 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from scripts.common.create_content_images_from_target_images import (
+    find_required_characters,
+)
+from scripts.common.dataset_manifest import (
+    get_manifest_path,
+    load_dataset_manifest,
+    read_dataset_manifest,
+    write_dataset_manifest,
+    write_dataset_manifest_for,
+)
+from scripts.util.balance_dataset import balance_dataset
+from scripts.util.compare_directories import compare_directories_and_return_summary
+from scripts.util.report_dataset_summary import collect_dataset_statistics
+
+balance_dataset_test_reference_path = (
+    Path("tests") / "util" / "balance_dataset_test_data"
+)
+
+test_output_path = Path("test_outputs")
+
+
+def remove_dataset(dataset_path: Path):
+    if dataset_path.exists():
+        shutil.rmtree(dataset_path)
+    get_manifest_path(dataset_path).unlink(missing_ok=True)
+
+
+def touch_later(path: Path):
+    # Directory modification times may not change within the timestamp resolution of the file system
+    stat_result = path.stat()
+    os.utime(
+        path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000_000)
+    )
+
+
+@pytest.fixture
+def image_dataset_path():
+    dataset_path = test_output_path / "dataset_manifest" / "xxx-dataset"
+    remove_dataset(dataset_path)
+
+    (dataset_path / "ContentImage").mkdir(parents=True)
+    Image.new("L", (64, 64), 255).save(dataset_path / "ContentImage" / "一.png")
+    Image.new("L", (64, 64), 255).save(dataset_path / "ContentImage" / "二.png")
+
+    for font_name in ["fontA", "fontB"]:
+        font_path = dataset_path / "TargetImage" / font_name
+        font_path.mkdir(parents=True)
+        Image.new("L", (128, 96), 0).save(font_path / f"{font_name}+一.png")
+        Image.new("RGB", (128, 128), 0).save(font_path / f"{font_name}+一+1.png")
+
+    (dataset_path / "TargetImage" / "fontB" / "fontB+三.txt").write_text("not an image")
+    (dataset_path / "TargetImage" / "fontC").mkdir()
+
+    yield dataset_path
+
+    shutil.rmtree(test_output_path / "dataset_manifest")
+
+
+@pytest.fixture
+def balance_dataset_paths(dataset_name: str):
+    # Two copies of the same dataset, balanced with and without a manifest
+    scanned_dataset_path = (
+        test_output_path / "dataset_manifest" / "scanned" / dataset_name
+    )
+    manifest_dataset_path = (
+        test_output_path / "dataset_manifest" / "manifest" / dataset_name
+    )
+
+    for dataset_path in [scanned_dataset_path, manifest_dataset_path]:
+        remove_dataset(dataset_path)
+        shutil.copytree(
+            balance_dataset_test_reference_path / dataset_name, dataset_path
+        )
+
+    yield scanned_dataset_path, manifest_dataset_path
+
+    shutil.rmtree(test_output_path / "dataset_manifest")
+
+
+def test_manifest_lists_every_image(image_dataset_path: Path):
+    write_dataset_manifest(image_dataset_path)
+
+    manifest = load_dataset_manifest(image_dataset_path)
+    assert manifest is not None
+
+    content_entries = {entry.path: entry for entry in manifest.get_content_images()}
+    assert set(content_entries) == {"ContentImage/一.png", "ContentImage/二.png"}
+    assert content_entries["ContentImage/一.png"].char == "一"
+    assert content_entries["ContentImage/一.png"].font is None
+
+    target_entries = {entry.path: entry for entry in manifest.get_target_images()}
+    assert set(target_entries) == {
+        "TargetImage/fontA/fontA+一.png",
+        "TargetImage/fontA/fontA+一+1.png",
+        "TargetImage/fontB/fontB+一.png",
+        "TargetImage/fontB/fontB+一+1.png",
+        "TargetImage/fontB/fontB+三.txt",
+    }
+
+    entry = target_entries["TargetImage/fontA/fontA+一.png"]
+    assert (entry.font, entry.char, entry.sample) == ("fontA", "一", 0)
+    assert (entry.format, entry.width, entry.height, entry.mode) == (
+        "PNG",
+        128,
+        96,
+        "L",
+    )
+    assert entry.size == (image_dataset_path / entry.path).stat().st_size
+    assert len(entry.digest) == 16
+
+    entry = target_entries["TargetImage/fontB/fontB+一+1.png"]
+    assert (entry.sample, entry.mode) == (1, "RGB")
+
+    entry = target_entries["TargetImage/fontB/fontB+三.txt"]
+    assert (entry.format, entry.width, entry.height) == ("", -1, -1)
+
+    assert manifest.get_target_fonts() == {"fontA", "fontB", "fontC"}
+
+
+def test_temporary_files_of_a_killed_run_are_skipped(image_dataset_path: Path):
+    # Left behind by write_output_bytes() when a converter is killed before renaming them into place
+    content_image_path = image_dataset_path / "ContentImage"
+    target_image_path = image_dataset_path / "TargetImage"
+    (content_image_path / ".三.png.4242-140000.tmp").write_bytes(b"\x89PNG")
+    (target_image_path / "fontA" / ".fontA+二.png.4242-140000.tmp").write_bytes(b"")
+
+    assert find_required_characters(target_image_path) == {"一", "三"}
+
+    _, removed_characters = balance_dataset(
+        content_image_path, target_image_path, dry_run=True
+    )
+    assert removed_characters <= {"一", "二", "三"}
+
+    manifest = write_dataset_manifest(image_dataset_path)
+    assert not any("/." in entry.path for entry in manifest.entries)
+
+
+def test_changed_manifest_is_stale_until_written_again(image_dataset_path: Path):
+    write_dataset_manifest(image_dataset_path)
+
+    new_image_path = image_dataset_path / "TargetImage" / "fontC" / "fontC+一.png"
+    Image.new("L", (128, 128), 0).save(new_image_path)
+    touch_later(new_image_path.parent)
+
+    assert load_dataset_manifest(image_dataset_path) is None
+
+    manifest = write_dataset_manifest(image_dataset_path)
+
+    assert "TargetImage/fontC/fontC+一.png" in {
+        entry.path for entry in manifest.get_target_images()
+    }
+    assert load_dataset_manifest(image_dataset_path) is not None
+
+
+def test_unchanged_directories_are_not_read_again(image_dataset_path: Path):
+    write_dataset_manifest(image_dataset_path)
+
+    # A file replaced without changing the modification time of its directory is not noticed,
+    # which shows that the previous entries of the directory are reused
+    image_path = image_dataset_path / "TargetImage" / "fontA" / "fontA+一.png"
+    directory_stat = image_path.parent.stat()
+    image_path.write_bytes(b"changed")
+    os.utime(
+        image_path.parent, ns=(directory_stat.st_atime_ns, directory_stat.st_mtime_ns)
+    )
+
+    manifest = write_dataset_manifest(image_dataset_path)
+
+    entry = next(
+        entry
+        for entry in manifest.entries
+        if entry.path == "TargetImage/fontA/fontA+一.png"
+    )
+    assert entry.format == "PNG"
+
+
+def test_manifest_is_only_written_for_dataset_directories(image_dataset_path: Path):
+    assert write_dataset_manifest_for(image_dataset_path / "TargetImage") is not None
+    assert get_manifest_path(image_dataset_path).exists()
+
+    assert (
+        write_dataset_manifest_for(image_dataset_path / "TargetImage" / "fontA") is None
+    )
+
+
+def test_statistics_from_manifest_equal_statistics_from_scan(image_dataset_path: Path):
+    target_image_dir = image_dataset_path / "TargetImage"
+
+    scanned_statistics = collect_dataset_statistics(target_image_dir)
+
+    write_dataset_manifest(image_dataset_path)
+    manifest_statistics = collect_dataset_statistics(target_image_dir)
+
+    assert manifest_statistics == scanned_statistics
+
+
+@pytest.mark.parametrize(
+    "dataset_name",
+    [
+        "dataset_with_no_missing_images",
+        "dataset_with_missing_target_images",
+        "dataset_with_missing_content_images",
+    ],
+)
+def test_balance_with_manifest_equals_balance_with_scan(balance_dataset_paths):
+    scanned_dataset_path, manifest_dataset_path = balance_dataset_paths
+
+    scanned_result = balance_dataset(
+        scanned_dataset_path / "ContentImage", scanned_dataset_path / "TargetImage"
+    )
+
+    write_dataset_manifest(manifest_dataset_path)
+    manifest_result = balance_dataset(
+        manifest_dataset_path / "ContentImage", manifest_dataset_path / "TargetImage"
+    )
+
+    assert manifest_result == scanned_result
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        manifest_dataset_path, scanned_dataset_path
+    )
+    assert directories_are_equal, message
+
+    # The manifest is updated with the removed files, so it can be used again
+    manifest = read_dataset_manifest(manifest_dataset_path)
+    assert manifest is not None
+    assert {entry.path for entry in manifest.entries} == {
+        path.relative_to(manifest_dataset_path).as_posix()
+        for path in manifest_dataset_path.rglob("*")
+        if path.is_file()
+    }
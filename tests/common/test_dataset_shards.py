@@ -0,0 +1,135 @@
+import io
+import shutil
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from scripts.common.dataset_shards import (
+    ShardedFontDataset,
+    read_shard_index,
+    read_tar_members,
+    write_dataset_shards,
+)
+from tests.common.synthetic_dataset import create_synthetic_dataset
+
+test_output_path = Path("test_outputs")
+
+characters = ["一", "二", "三", "四", "五", "六"]
+
+
+@pytest.fixture
+def shard_path():
+    root_path = test_output_path / "dataset_shards"
+    if root_path.exists():
+        shutil.rmtree(root_path)
+
+    dataset_path = root_path / "xxx-dataset"
+
+    # A target image without a content image (fontA+七) is left out
+    create_synthetic_dataset(
+        dataset_path,
+        characters,
+        {
+            "fontA": characters + ["七"],
+            "fontB": characters,
+            "fontC": characters,
+        },
+        content_fill=characters.index,
+        target_fill=get_target_value,
+    )
+
+    shard_path = root_path / "xxx-dataset-shards"
+    written_count, unpaired_count = write_dataset_shards(
+        dataset_path, shard_path, samples_per_shard=4, seed=1
+    )
+    assert (written_count, unpaired_count) == (18, 1)
+
+    yield shard_path
+
+    shutil.rmtree(root_path)
+
+
+def get_target_value(font: str, char: str) -> int:
+    if char not in characters:
+        return 0
+    return 100 + 10 * "ABC".index(font[-1]) + characters.index(char)
+
+
+def read_epoch(dataset: ShardedFontDataset) -> list[tuple[str, str]]:
+    samples = []
+    for content_image, target_image, font, char in dataset:
+        # Every target image is given with the content image of its character
+        assert content_image[0, 0] == characters.index(char)
+        assert target_image[0, 0] == get_target_value(font, char)
+        samples.append((font, char))
+    return samples
+
+
+def test_writes_shards(shard_path: Path):
+    shard_index = read_shard_index(shard_path)
+
+    assert shard_index["sample_count"] == 18
+    assert [shard["samples"] for shard in shard_index["shards"]] == [4, 4, 4, 4, 2]
+    assert all((shard_path / shard["file"]).exists() for shard in shard_index["shards"])
+
+
+def test_every_sample_is_read_once_per_epoch(shard_path: Path):
+    dataset = ShardedFontDataset(shard_path, seed=0, shuffle_buffer_size=3)
+
+    samples = read_epoch(dataset)
+
+    assert len(samples) == 18
+    assert set(samples) == {
+        (font, char) for font in ["fontA", "fontB", "fontC"] for char in characters
+    }
+
+
+def test_workers_read_different_shards(shard_path: Path):
+    worker_samples = [
+        read_epoch(ShardedFontDataset(shard_path, worker_index=index, worker_count=2))
+        for index in range(2)
+    ]
+
+    assert len(worker_samples[0]) + len(worker_samples[1]) == 18
+    assert not set(worker_samples[0]) & set(worker_samples[1])
+
+
+def test_order_depends_only_on_seed_and_epoch(shard_path: Path):
+    def read_order(seed: int, epoch: int) -> list[tuple[str, str]]:
+        dataset = ShardedFontDataset(shard_path, seed=seed, shuffle_buffer_size=5)
+        dataset.set_epoch(epoch)
+        return read_epoch(dataset)
+
+    assert read_order(0, 0) == read_order(0, 0)
+    assert read_order(0, 0) != read_order(0, 1)
+    assert read_order(0, 0) != read_order(1, 0)
+
+
+def test_worker_index_must_be_below_worker_count(shard_path: Path):
+    with pytest.raises(ValueError):
+        ShardedFontDataset(shard_path, worker_index=2, worker_count=2)
+
+
+@pytest.mark.parametrize(
+    "tar_format", [tarfile.USTAR_FORMAT, tarfile.GNU_FORMAT, tarfile.PAX_FORMAT]
+)
+def test_reads_tar_files_written_by_tarfile(tar_format):
+    tar_path = test_output_path / "dataset_shards_tar" / "shard.tar"
+    tar_path.parent.mkdir(parents=True, exist_ok=True)
+
+    long_name = "TargetImage/" + "a" * 120 + "/fontA+char1.png"
+    members = [("TargetImage/fontA/fontA+char1.png", b"image"), (long_name, b"")]
+
+    with tarfile.open(tar_path, mode="w", format=tar_format) as tar:
+        directory = tarfile.TarInfo("TargetImage")
+        directory.type = tarfile.DIRTYPE
+        tar.addfile(directory)
+        for name, data in members:
+            member = tarfile.TarInfo(name)
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+
+    assert list(read_tar_members(tar_path)) == members
+
+    shutil.rmtree(tar_path.parent)
@@ -1,8 +1,14 @@
+import os
 import shutil
 from pathlib import Path
 
 import pytest
 
+from scripts.common.dataset_manifest import (
+    get_manifest_path,
+    read_dataset_manifest,
+    write_dataset_manifest,
+)
 from scripts.common.delete_target_images_without_content_image import (
     delete_target_images_without_content_image,
 )
@@ -123,3 +129,36 @@ def test_deletes_target_images_without_content_images(test_dataset_path: Path):
 
     assert directories_are_equal, message
     assert directories_are_equal, message
+
+
+@pytest.mark.parametrize("dataset_name", ["dataset_with_missing_content_images"])
+def test_files_that_fail_to_delete_stay_in_manifest(
+    test_dataset_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    write_dataset_manifest(test_dataset_path)
+
+    failed_file = test_dataset_path / "TargetImage" / "fontB" / "fontB+char2.txt"
+    unlink = os.unlink
+
+    def failing_unlink(path):
+        if Path(path) == failed_file:
+            raise PermissionError(f"Cannot delete {path}")
+        unlink(path)
+
+    monkeypatch.setattr(os, "unlink", failing_unlink)
+
+    delete_target_images_without_content_image(
+        test_dataset_path / "ContentImage", test_dataset_path / "TargetImage"
+    )
+
+    assert failed_file.exists()
+
+    manifest = read_dataset_manifest(test_dataset_path)
+    assert manifest is not None
+    assert {entry.path for entry in manifest.entries} == {
+        path.relative_to(test_dataset_path).as_posix()
+        for path in test_dataset_path.rglob("*")
+        if path.is_file()
+    }
+
+    get_manifest_path(test_dataset_path).unlink()
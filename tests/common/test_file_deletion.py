@@ -0,0 +1,169 @@
+import errno
+import shutil
+from pathlib import Path
+
+import pytest
+
+from scripts.common.file_deletion import read_deletion_plan, remove_files
+
+test_output_path = Path("test_outputs")
+
+
+@pytest.fixture
+def dataset_path():
+    # fontA loses most of its files, fontB loses only one file
+    dataset_path = test_output_path / "file_deletion_dataset"
+
+    if dataset_path.exists():
+        shutil.rmtree(dataset_path)
+
+    for font_name, chars in [("fontA", "abcd"), ("fontB", "abcd")]:
+        font_path = dataset_path / font_name
+        font_path.mkdir(parents=True)
+        for char in chars:
+            (font_path / f"{font_name}+{char}.txt").write_text(char)
+
+    yield dataset_path
+
+    if dataset_path.exists():
+        shutil.rmtree(dataset_path)
+
+
+def files_to_remove(dataset_path: Path):
+    return [
+        dataset_path / "fontA" / "fontA+a.txt",
+        dataset_path / "fontA" / "fontA+b.txt",
+        dataset_path / "fontA" / "fontA+c.txt",
+        dataset_path / "fontB" / "fontB+a.txt",
+    ]
+
+
+def remaining_files(path: Path):
+    return sorted(
+        file.relative_to(path).as_posix() for file in path.rglob("*") if file.is_file()
+    )
+
+
+def test_dry_run_only_writes_plan(dataset_path: Path):
+    plan_file = dataset_path.parent / "file_deletion_plan.txt"
+    files = files_to_remove(dataset_path)
+
+    removed_files = remove_files(
+        files, root_dir=dataset_path, dry_run=True, plan_file=plan_file
+    )
+
+    assert len(removed_files) == 4
+    assert len(remaining_files(dataset_path)) == 8
+    assert read_deletion_plan(plan_file) == sorted(files)
+
+    plan_file.unlink()
+
+
+def test_deletes_files(dataset_path: Path):
+    removed_files = remove_files(files_to_remove(dataset_path), root_dir=dataset_path)
+
+    assert len(removed_files) == 4
+    assert remaining_files(dataset_path) == [
+        "fontA/fontA+d.txt",
+        "fontB/fontB+b.txt",
+        "fontB/fontB+c.txt",
+        "fontB/fontB+d.txt",
+    ]
+
+
+def test_moves_files_to_quarantine(dataset_path: Path):
+    quarantine_path = test_output_path / "file_deletion_quarantine"
+
+    if quarantine_path.exists():
+        shutil.rmtree(quarantine_path)
+
+    removed_files = remove_files(
+        files_to_remove(dataset_path),
+        root_dir=dataset_path,
+        quarantine_dir=quarantine_path,
+    )
+
+    assert len(removed_files) == 4
+    assert remaining_files(dataset_path) == [
+        "fontA/fontA+d.txt",
+        "fontB/fontB+b.txt",
+        "fontB/fontB+c.txt",
+        "fontB/fontB+d.txt",
+    ]
+    assert remaining_files(quarantine_path) == [
+        "fontA/fontA+a.txt",
+        "fontA/fontA+b.txt",
+        "fontA/fontA+c.txt",
+        "fontB/fontB+a.txt",
+    ]
+
+    shutil.rmtree(quarantine_path)
+
+
+def test_files_that_fail_to_delete_are_not_returned(dataset_path: Path):
+    files = files_to_remove(dataset_path)
+    files[0].unlink()
+
+    removed_files = remove_files(files, root_dir=dataset_path)
+
+    assert removed_files == files[1:]
+
+
+@pytest.fixture
+def quarantine_path():
+    quarantine_path = test_output_path / "file_deletion_quarantine"
+
+    if quarantine_path.exists():
+        shutil.rmtree(quarantine_path)
+
+    yield quarantine_path
+
+    if quarantine_path.exists():
+        shutil.rmtree(quarantine_path)
+
+
+def test_quarantined_files_are_not_replaced(dataset_path: Path, quarantine_path: Path):
+    files = files_to_remove(dataset_path)
+    remove_files(files, root_dir=dataset_path, quarantine_dir=quarantine_path)
+
+    # Files of the same names are quarantined again, e.g. after the dataset is converted again
+    for file in files:
+        file.write_text("new")
+
+    removed_files = remove_files(
+        files, root_dir=dataset_path, quarantine_dir=quarantine_path
+    )
+
+    assert removed_files == []
+    assert all(file.read_text() == "new" for file in files)
+    assert (quarantine_path / "fontA" / "fontA+a.txt").read_text() == "a"
+    assert (quarantine_path / "fontB" / "fontB+a.txt").read_text() == "a"
+
+
+def test_quarantine_on_another_file_system_moves_files(
+    dataset_path: Path, quarantine_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    def rename_across_file_systems(self, target):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(Path, "rename", rename_across_file_systems)
+
+    removed_files = remove_files(
+        files_to_remove(dataset_path),
+        root_dir=dataset_path,
+        quarantine_dir=quarantine_path,
+    )
+
+    assert removed_files == files_to_remove(dataset_path)
+    assert remaining_files(dataset_path) == [
+        "fontA/fontA+d.txt",
+        "fontB/fontB+b.txt",
+        "fontB/fontB+c.txt",
+        "fontB/fontB+d.txt",
+    ]
+    assert remaining_files(quarantine_path) == [
+        "fontA/fontA+a.txt",
+        "fontA/fontA+b.txt",
+        "fontA/fontA+c.txt",
+        "fontB/fontB+a.txt",
+    ]
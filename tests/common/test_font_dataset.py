@@ -0,0 +1,108 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from scripts.common.dataset_manifest import write_dataset_manifest
+from scripts.common.font_dataset import FontDataset
+from tests.common.synthetic_dataset import create_synthetic_dataset
+
+test_output_path = Path("test_outputs")
+
+
+@pytest.fixture
+def dataset_path():
+    dataset_path = test_output_path / "font_dataset" / "xxx-dataset"
+    fonts = ["fontB", "fontA"]
+    characters = ["一", "二", "三"]
+
+    def get_target_fill(font_name: str, name: str):
+        # Samples are RGB, except the second sample of "一"
+        if name == "一+1":
+            return 200
+        return (100 + 10 * fonts.index(font_name) + characters.index(name),) * 3
+
+    create_synthetic_dataset(
+        dataset_path,
+        ["一", "二"],
+        {font_name: characters + ["一+1"] for font_name in fonts},
+        content_fill=characters.index,
+        target_fill=get_target_fill,
+    )
+
+    yield dataset_path
+
+    shutil.rmtree(test_output_path / "font_dataset")
+
+
+@pytest.mark.parametrize("use_manifest", [False, True])
+def test_indexes_dataset(dataset_path: Path, use_manifest):
+    if use_manifest:
+        write_dataset_manifest(dataset_path)
+    else:
+        (dataset_path / "TargetImage" / "fontA" / "notes.txt").write_text(
+            "not a sample"
+        )
+
+    dataset = FontDataset(dataset_path)
+
+    assert len(dataset) == 8
+    assert dataset.fonts == ["fontA", "fontB"]
+    samples = [dataset.get_sample(index) for index in range(4)]
+    assert [(sample.font, sample.char, sample.sample) for sample in samples] == [
+        ("fontA", "一", 0),
+        ("fontA", "一", 1),
+        ("fontA", "三", 0),
+        ("fontA", "二", 0),
+    ]
+    assert set(dataset.content_paths) == {"一", "二"}
+
+
+def test_reads_content_and_target_pairs(dataset_path: Path):
+    dataset = FontDataset(dataset_path)
+
+    index = dataset.find_sample("fontB", "二")
+    content_image, target_image = dataset.get_pair(index)
+    assert content_image.shape == (8, 8) and content_image[0, 0] == 1
+    assert target_image.shape == (8, 8) and target_image[0, 0] == 101
+
+    content_image, target_image = dataset[("fontA", "一", 1)]
+    assert content_image[0, 0] == 0 and target_image[0, 0] == 200
+
+    # Indices from numpy samplers are accepted
+    _, target_image = dataset[np.int64(index)]
+    assert target_image[0, 0] == 101
+
+    # There is no content image of "三", and no sample 2 of "一"
+    with pytest.raises(KeyError):
+        dataset[("fontA", "三", 0)]
+    with pytest.raises(KeyError):
+        dataset.find_sample("fontA", "一", 2)
+
+
+def test_cache_keeps_recently_used_images(dataset_path: Path):
+    dataset = FontDataset(dataset_path, cache_size=2)
+
+    dataset.read_content_image("一")
+    dataset.read_content_image("一")
+    assert (dataset.cache_hits, dataset.cache_misses) == (1, 1)
+
+    dataset.read_content_image("二")
+    dataset.read_content_image("一")
+    dataset.read_target_image(0)  # Evicts "二", the least recently used image
+    assert (dataset.cache_hits, dataset.cache_misses) == (2, 3)
+
+    dataset.read_content_image("一")
+    dataset.read_content_image("二")
+    assert (dataset.cache_hits, dataset.cache_misses) == (3, 4)
+
+    with pytest.raises(ValueError):
+        dataset.read_content_image("一")[0, 0] = 255
+
+
+def test_images_keep_their_mode_without_image_mode(dataset_path: Path):
+    dataset = FontDataset(dataset_path, image_mode=None)
+
+    target_image = dataset.read_target_image(dataset.find_sample("fontA", "二"))
+    assert target_image.shape == (8, 8, 3)
@@ -0,0 +1,50 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from scripts.common.image_hash import (
+    difference_hash,
+    get_hamming_distances,
+    hamming_distance,
+)
+
+
+def draw_glyph(lines: list[tuple[int, int, int, int]], size: int = 128) -> Image.Image:
+    image = Image.new("L", (size, size), 255)
+    draw = ImageDraw.Draw(image)
+    for line in lines:
+        draw.line(line, fill=0, width=size // 12)
+    return image
+
+
+def test_reencoded_glyphs_have_near_identical_hashes():
+    glyph = draw_glyph([(20, 20, 100, 100), (20, 100, 100, 20)])
+
+    buffer = io.BytesIO()
+    glyph.resize((96, 96)).save(buffer, "JPEG", quality=70)
+    reencoded_glyph = Image.open(buffer)
+
+    assert (
+        hamming_distance(difference_hash(glyph), difference_hash(reencoded_glyph)) <= 4
+    )
+
+
+def test_different_glyphs_have_distant_hashes():
+    glyph_a = draw_glyph([(20, 20, 100, 100), (20, 100, 100, 20)])
+    glyph_b = draw_glyph([(64, 10, 64, 118), (10, 40, 118, 40), (10, 90, 118, 90)])
+
+    assert hamming_distance(difference_hash(glyph_a), difference_hash(glyph_b)) > 10
+
+
+def test_hamming_distances_of_arrays_equal_hamming_distance():
+    hashes_a = [0, 0xFFFF_FFFF_FFFF_FFFF, 0x0F0F]
+    hashes_b = [1, 0, 0xF0F0]
+
+    distances = get_hamming_distances(
+        np.array(hashes_a, dtype=np.uint64), np.array(hashes_b, dtype=np.uint64)
+    )
+
+    assert distances.tolist() == [
+        hamming_distance(hash_a, hash_b) for hash_a, hash_b in zip(hashes_a, hashes_b)
+    ]
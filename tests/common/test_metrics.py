@@ -0,0 +1,134 @@
+import json
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from scripts.common.metrics import (
+    count_items,
+    metrics_dir_variable,
+    metrics_section,
+    metrics_stage,
+    record_metrics,
+)
+from scripts.common.output_writer import save_image
+
+test_output_path = Path("test_outputs") / "metrics"
+
+
+@pytest.fixture
+def output_path():
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    test_output_path.mkdir(parents=True)
+
+    yield test_output_path
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+
+def test_stages_record_counters_and_sections(output_path: Path):
+    image = Image.new("RGB", (16, 16), "white")
+
+    with record_metrics("test-run", output_prefix=output_path / "test-run") as run:
+        with metrics_stage("outer"):
+            count_items(2)
+
+            with metrics_stage("inner"):
+                save_image(image, output_path / "image.png")
+                count_items(1)
+
+    stages = run.stages
+
+    assert list(stages) == ["total", "outer", "inner"]
+
+    # An outer stage includes the counters of its inner stages
+    assert stages["outer"].items == 3
+    assert stages["inner"].items == 1
+
+    image_size = (output_path / "image.png").stat().st_size
+    assert stages["inner"].bytes_written == image_size
+    assert stages["outer"].bytes_written == image_size
+
+    assert set(stages["inner"].section_seconds) == {"encode", "write"}
+    assert stages["inner"].wall_seconds <= stages["outer"].wall_seconds
+    assert stages["inner"].peak_rss_bytes is None or stages["inner"].peak_rss_bytes > 0
+
+
+def test_metrics_are_written_as_json_and_prometheus_textfile(output_path: Path):
+    with record_metrics("test-run", output_prefix=output_path / "test-run"):
+        with metrics_stage('stage "A"'):
+            count_items(5)
+
+    with open(output_path / "test-run.metrics.json", "r", encoding="utf-8") as f:
+        metrics = json.load(f)
+
+    assert metrics["run"] == "test-run"
+    assert metrics["stages"]['stage "A"']["items"] == 5
+
+    prometheus_metrics = (output_path / "test-run.metrics.prom").read_text(
+        encoding="utf-8"
+    )
+
+    assert "# TYPE font_datasets_stage_items gauge" in prometheus_metrics
+    assert (
+        'font_datasets_stage_items{run="test-run",stage="stage \\"A\\""} 5'
+        in prometheus_metrics
+    )
+
+
+def test_nothing_is_recorded_outside_of_a_run():
+    with metrics_stage("stage") as stage:
+        with metrics_section("section"):
+            count_items(1)
+
+    assert stage is None
+
+
+def test_stages_of_worker_threads_only_count_their_own_work(output_path: Path):
+    worker_stage_entered = threading.Event()
+    main_items_counted = threading.Event()
+
+    def work():
+        # Counted in the stage of the worker thread and in the stages of the run thread
+        with metrics_stage("worker"):
+            worker_stage_entered.set()
+            main_items_counted.wait()
+            count_items(1)
+
+    with record_metrics("test-run", output_prefix=output_path / "test-run") as run:
+        with metrics_stage("main"):
+            worker = threading.Thread(target=work)
+            worker.start()
+            worker_stage_entered.wait()
+
+            # Not counted in the stage that the worker thread has open
+            count_items(10)
+            main_items_counted.set()
+            worker.join()
+
+    assert run.stages["worker"].items == 1
+    assert run.stages["main"].items == 11
+    assert run.stages["total"].items == 11
+
+
+def test_metrics_are_written_next_to_the_dataset(output_path: Path, monkeypatch):
+    monkeypatch.delenv(metrics_dir_variable, raising=False)
+
+    with record_metrics("test-run", dataset_dir=output_path / "xxx-dataset"):
+        pass
+
+    assert (output_path / "test-run.metrics.json").exists()
+    assert (output_path / "test-run.metrics.prom").exists()
+
+    metrics_dir = output_path / "metrics"
+    monkeypatch.setenv(metrics_dir_variable, str(metrics_dir))
+
+    with record_metrics("test-run", dataset_dir=output_path / "xxx-dataset"):
+        pass
+
+    assert (metrics_dir / "test-run.metrics.json").exists()
@@ -0,0 +1,80 @@
+import shutil
+import stat
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from scripts.common.output_writer import (
+    copy_file,
+    ensure_dir_exists_with_perms,
+    permissive_umask,
+    save_image,
+    write_output_bytes,
+)
+
+test_output_path = Path("test_outputs") / "output_writer"
+
+
+@pytest.fixture
+def output_path():
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    ensure_dir_exists_with_perms(test_output_path / "fontA")
+
+    yield test_output_path / "fontA"
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+
+def get_permissions(path: Path):
+    return stat.S_IMODE(path.stat().st_mode)
+
+
+def test_directories_are_created_with_full_permissions(output_path: Path):
+    assert output_path.is_dir()
+    assert get_permissions(output_path) == 0o777
+    assert get_permissions(output_path.parent) == 0o777
+
+    # A directory that is deleted and created again gets its permissions again
+    shutil.rmtree(output_path)
+    ensure_dir_exists_with_perms(output_path)
+    assert get_permissions(output_path) == 0o777
+
+
+@pytest.mark.parametrize("use_permissive_umask", [True, False])
+def test_files_are_written_with_full_permissions(
+    output_path: Path, use_permissive_umask: bool
+):
+    image_file = output_path / "fontA+書.png"
+    copied_file = output_path / "fontA+書+1.png"
+
+    if use_permissive_umask:
+        with permissive_umask():
+            save_image(Image.new("L", (8, 8), 255), image_file)
+            copy_file(image_file, copied_file)
+    else:
+        save_image(Image.new("L", (8, 8), 255), image_file)
+        copy_file(image_file, copied_file)
+
+    assert get_permissions(image_file) == 0o777
+    assert get_permissions(copied_file) == 0o777
+    assert copied_file.read_bytes() == image_file.read_bytes()
+    assert sorted(file.name for file in output_path.iterdir()) == [
+        "fontA+書+1.png",
+        "fontA+書.png",
+    ]
+
+
+def test_failed_write_leaves_no_file(output_path: Path, monkeypatch):
+    def failing_write(fd, data):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr("os.write", failing_write)
+
+    with pytest.raises(OSError):
+        write_output_bytes(output_path / "file.txt", b"data")
+
+    assert list(output_path.iterdir()) == []
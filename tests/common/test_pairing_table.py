@@ -0,0 +1,101 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from scripts.common import pairing_table
+from scripts.common.pairing_table import (
+    PairingTable,
+    get_pairing_table_path,
+    write_pairing_table,
+)
+from tests.common.synthetic_dataset import create_synthetic_dataset
+
+test_output_path = Path("test_outputs")
+
+
+@pytest.fixture
+def dataset_path():
+    root_path = test_output_path / "pairing_table"
+    if root_path.exists():
+        shutil.rmtree(root_path)
+
+    dataset_path = root_path / "xxx-dataset"
+    names = ["一", "二", "二+1", " ", "三"]
+    create_synthetic_dataset(
+        dataset_path, ["一", "二", " "], {"fontB": names, "fontA": names}
+    )
+
+    yield dataset_path
+
+    shutil.rmtree(root_path)
+
+
+def test_pairs_target_images_with_content_images(dataset_path: Path):
+    pair_count, unpaired_count = write_pairing_table(dataset_path)
+    assert (pair_count, unpaired_count) == (8, 2)
+
+    table_path = get_pairing_table_path(dataset_path)
+    table = PairingTable(table_path, dataset_path)
+
+    assert len(table) == 8
+    assert table.fonts == ["fontA", "fontB"]
+    assert table.characters == [" ", "一", "二"]
+
+    rows = [
+        (table.get_font(i), table.get_char(i), int(table.pairs[i]["sample"]))
+        for i in range(4)
+    ]
+    assert rows == [
+        ("fontA", " ", 0),
+        ("fontA", "一", 0),
+        ("fontA", "二", 0),
+        ("fontA", "二", 1),
+    ]
+
+    target_path = dataset_path / "TargetImage" / "fontA" / "fontA+二+1.png"
+    assert table.get_target_path(3) == target_path
+    assert table.get_content_path(3) == dataset_path / "ContentImage" / "二.png"
+    for index in range(len(table)):
+        assert table.get_target_path(index).exists()
+        assert table.get_content_path(index).exists()
+
+    relative_paths = table.get_relative_paths(table.pairs["target_path"][::-1])
+    assert [dataset_path / path for path in relative_paths] == [
+        table.get_target_path(index) for index in reversed(range(len(table)))
+    ]
+
+
+def test_table_can_be_memory_mapped(dataset_path: Path):
+    write_pairing_table(dataset_path)
+
+    pairs = np.load(get_pairing_table_path(dataset_path) / "pairs.npy", mmap_mode="r")
+
+    assert isinstance(pairs, np.memmap)
+    assert pairs.dtype.names == (
+        "font",
+        "char",
+        "sample",
+        "target_path",
+        "content_path",
+    )
+    assert len(pairs) == 8
+
+
+def test_interrupted_run_leaves_no_table(
+    dataset_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    write_pairing_table(dataset_path)
+    table_path = get_pairing_table_path(dataset_path)
+
+    def interrupted_write(path, data):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(pairing_table, "write_output_bytes", interrupted_write)
+
+    with pytest.raises(KeyboardInterrupt):
+        write_pairing_table(dataset_path)
+
+    # The table of the previous run would refer to pools that are being replaced
+    assert not (table_path / "pairs.npy").exists()
@@ -0,0 +1,142 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from scripts.common.pipeline import Stage, run_pipeline
+
+test_output_path = Path("test_outputs") / "pipeline"
+
+
+@pytest.fixture
+def pipeline_path():
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    (test_output_path / "source").mkdir(parents=True)
+    (test_output_path / "source" / "input.txt").write_text("a")
+
+    yield test_output_path
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+
+def build_stages(pipeline_path: Path, runs: list[str]) -> list[Stage]:
+    def run_copy(context):
+        runs.append("copy")
+        text = (pipeline_path / "source" / "input.txt").read_text()
+        (pipeline_path / "copy.txt").write_text(text)
+        return text
+
+    def run_repeat(context):
+        runs.append("repeat")
+        text = context.get("copy") or (pipeline_path / "copy.txt").read_text()
+        (pipeline_path / "repeat.txt").write_text(text * 2)
+        return text * 2
+
+    return [
+        Stage(
+            name="copy",
+            inputs=[pipeline_path / "source"],
+            outputs=[pipeline_path / "copy.txt"],
+            run=run_copy,
+        ),
+        Stage(
+            name="repeat",
+            inputs=[pipeline_path / "copy.txt"],
+            outputs=[pipeline_path / "repeat.txt"],
+            run=run_repeat,
+        ),
+    ]
+
+
+def test_skips_stages_that_are_up_to_date(pipeline_path: Path):
+    state_file = pipeline_path / "state.json"
+    runs: list[str] = []
+
+    context = run_pipeline(build_stages(pipeline_path, runs), state_file)
+    assert runs == ["copy", "repeat"]
+    assert context["copy"] == "a"
+
+    runs.clear()
+    context = run_pipeline(build_stages(pipeline_path, runs), state_file)
+    assert runs == []
+    assert context == {}
+
+
+def test_reruns_stages_with_changed_inputs_or_missing_outputs(pipeline_path: Path):
+    state_file = pipeline_path / "state.json"
+    runs: list[str] = []
+
+    run_pipeline(build_stages(pipeline_path, runs), state_file)
+
+    runs.clear()
+    (pipeline_path / "source" / "input.txt").write_text("bb")
+    run_pipeline(build_stages(pipeline_path, runs), state_file)
+    assert runs == ["copy", "repeat"]
+    assert (pipeline_path / "repeat.txt").read_text() == "bbbb"
+
+    runs.clear()
+    (pipeline_path / "repeat.txt").unlink()
+    run_pipeline(build_stages(pipeline_path, runs), state_file)
+    assert runs == ["repeat"]
+
+
+def test_failed_stage_stops_the_pipeline(pipeline_path: Path):
+    state_file = pipeline_path / "state.json"
+    runs: list[str] = []
+
+    stages = build_stages(pipeline_path, runs)
+    stages[0].run = lambda context: runs.append("copy") or False
+
+    # The failed stage created its output, but is not recorded, and the next stage does not run
+    (pipeline_path / "copy.txt").write_text("")
+    context = run_pipeline(stages, state_file)
+    assert runs == ["copy"]
+    assert context == {"copy": False}
+
+    runs.clear()
+    run_pipeline(build_stages(pipeline_path, runs), state_file)
+    assert runs == ["copy", "repeat"]
+
+
+def test_reruns_stages_with_changed_outputs(pipeline_path: Path):
+    state_file = pipeline_path / "state.json"
+    runs: list[str] = []
+
+    run_pipeline(build_stages(pipeline_path, runs), state_file)
+
+    runs.clear()
+    (pipeline_path / "repeat.txt").write_text("changed")
+    run_pipeline(build_stages(pipeline_path, runs), state_file)
+    assert runs == ["repeat"]
+    assert (pipeline_path / "repeat.txt").read_text() == "aa"
+
+
+def test_changes_by_later_stages_do_not_rerun_earlier_stages(pipeline_path: Path):
+    state_file = pipeline_path / "state.json"
+    runs: list[str] = []
+
+    def run_trim(context):
+        runs.append("trim")
+        (pipeline_path / "copy.txt").write_text("")
+        return True
+
+    def build_trimming_stages() -> list[Stage]:
+        # The last stage changes the output of the first stage, which is the input of the second stage
+        return build_stages(pipeline_path, runs) + [
+            Stage(
+                name="trim",
+                inputs=[pipeline_path / "repeat.txt"],
+                outputs=[pipeline_path / "copy.txt"],
+                run=run_trim,
+            )
+        ]
+
+    run_pipeline(build_trimming_stages(), state_file)
+    assert runs == ["copy", "repeat", "trim"]
+
+    runs.clear()
+    run_pipeline(build_trimming_stages(), state_file)
+    assert runs == []
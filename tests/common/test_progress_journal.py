@@ -0,0 +1,89 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from scripts.common.progress_journal import ProgressJournal, list_output_names
+
+test_output_path = Path("test_outputs") / "progress_journal"
+
+
+@pytest.fixture
+def journal_file():
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    yield test_output_path / "test.journal"
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+
+def test_records_are_read_back(journal_file: Path):
+    with ProgressJournal(journal_file) as journal:
+        journal.record("001-f.gnt", success=["扼"], skipped=[])
+        journal.record("002-f.gnt", success=[], skipped=["!"])
+
+    journal = ProgressJournal(journal_file)
+
+    assert journal.is_completed("001-f.gnt")
+    assert journal.is_completed("002-f.gnt")
+    assert journal.get_record("002-f.gnt")["skipped"] == ["!"]
+
+
+def test_incomplete_record_is_ignored_and_truncated(journal_file: Path):
+    with ProgressJournal(journal_file) as journal:
+        journal.record("001-f.gnt", success=["扼"], skipped=[])
+
+    # Simulate a crash in the middle of writing a record
+    with open(journal_file, "a", encoding="utf-8") as f:
+        f.write('{"unit": "002-f.gnt", "succ')
+
+    with ProgressJournal(journal_file) as journal:
+        assert journal.is_completed("001-f.gnt")
+        assert not journal.is_completed("002-f.gnt")
+
+        journal.record("002-f.gnt", success=[], skipped=["!"])
+
+    journal = ProgressJournal(journal_file)
+
+    assert journal.is_completed("002-f.gnt")
+
+
+def test_records_are_discarded_when_output_is_replaced(journal_file: Path):
+    output_dir = test_output_path / "output"
+    output_dir.mkdir(parents=True)
+
+    with ProgressJournal(journal_file, output_dir=output_dir) as journal:
+        journal.record("001-f.gnt", success=["扼"], skipped=[])
+
+    assert ProgressJournal(journal_file, output_dir=output_dir).is_completed(
+        "001-f.gnt"
+    )
+
+    # Moved aside rather than deleted, so that the new directory cannot reuse its inode
+    output_dir.rename(test_output_path / "old-output")
+    assert not ProgressJournal(journal_file, output_dir=output_dir).is_completed(
+        "001-f.gnt"
+    )
+
+    output_dir.mkdir()
+    with ProgressJournal(journal_file, output_dir=output_dir) as journal:
+        assert not journal.is_completed("001-f.gnt")
+        journal.record("002-f.gnt", success=[], skipped=["!"])
+
+    journal = ProgressJournal(journal_file, output_dir=output_dir)
+
+    assert not journal.is_completed("001-f.gnt")
+    assert journal.is_completed("002-f.gnt")
+
+
+def test_output_names_are_listed_once(journal_file: Path):
+    output_path = journal_file.with_name("output")
+
+    assert list_output_names(output_path) == set()
+
+    (output_path / "style_001").mkdir(parents=True)
+    (output_path / "一.png").write_bytes(b"")
+
+    assert list_output_names(output_path) == {"style_001", "一.png"}
@@ -0,0 +1,170 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from scripts.common.dataset_manifest import get_manifest_path
+from scripts.common.glyph_ink import find_ink, find_ink_bounding_boxes
+from scripts.common.recenter_target_images import recenter_target_images
+
+test_output_path = Path("test_outputs")
+
+fyp23_result_path = (
+    Path("tests")
+    / "fyp23"
+    / "create_content_and_target_images_test_data"
+    / "source_with_chinese_characters_result"
+)
+
+
+def save_glyph(path: Path, center: tuple[int, int], size: int = 128):
+    image = Image.new("L", (size, size), 255)
+    x, y = center
+    ImageDraw.Draw(image).rectangle((x - 10, y - 10, x + 9, y + 9), fill=0)
+    image.save(path)
+
+
+def get_glyph_center(path: Path) -> tuple[float, float]:
+    with Image.open(path) as image:
+        assert image.size == (128, 128)
+        pixels = np.asarray(image.convert("L"))[None]
+
+    boxes, has_ink = find_ink_bounding_boxes(find_ink(pixels))
+    assert has_ink[0]
+    left, top, right, bottom = boxes[0]
+    return (left + right) / 2, (top + bottom) / 2
+
+
+@pytest.fixture
+def target_image_path():
+    target_image_path = test_output_path / "recenter_target_images" / "TargetImage"
+    if target_image_path.exists():
+        shutil.rmtree(target_image_path)
+
+    # fontA is shifted left and up, and its glyphs are in slightly different places
+    fontA_path = target_image_path / "fontA"
+    fontA_path.mkdir(parents=True)
+    for number, (x, y) in enumerate([(44, 50), (48, 54), (52, 58), (46, 52), (50, 56)]):
+        save_glyph(fontA_path / f"fontA+char{number}.png", (x, y))
+
+    # fontB is centred
+    fontB_path = target_image_path / "fontB"
+    fontB_path.mkdir(parents=True)
+    for number in range(5):
+        save_glyph(fontB_path / f"fontB+char{number}.png", (64, 64))
+
+    yield target_image_path
+
+    shutil.rmtree(test_output_path / "recenter_target_images")
+    get_manifest_path(target_image_path.parent).unlink(missing_ok=True)
+
+
+@pytest.fixture
+def fyp23_dataset_path():
+    dataset_path = test_output_path / "recenter_fyp23_dataset"
+    if dataset_path.exists():
+        shutil.rmtree(dataset_path)
+
+    shutil.copytree(fyp23_result_path, dataset_path)
+
+    yield dataset_path
+
+    shutil.rmtree(dataset_path)
+    get_manifest_path(dataset_path).unlink(missing_ok=True)
+
+
+def test_recenters_shifted_font(target_image_path: Path):
+    recenterings = recenter_target_images(target_image_path, max_workers=1)
+
+    recentering = next(r for r in recenterings if r.font == "fontA")
+    assert recentering.offset == (-16.0, -10.0)
+    assert recentering.rewritten_count == 5
+    assert recentering.clamped_count == 0
+
+    # Glyphs keep their positions relative to each other
+    assert get_glyph_center(target_image_path / "fontA" / "fontA+char1.png") == (64, 64)
+    assert get_glyph_center(target_image_path / "fontA" / "fontA+char0.png") == (60, 60)
+    assert get_glyph_center(target_image_path / "fontA" / "fontA+char2.png") == (68, 68)
+
+
+def test_centred_font_is_not_rewritten(target_image_path: Path):
+    image_path = target_image_path / "fontB" / "fontB+char0.png"
+    modified_time = image_path.stat().st_mtime_ns
+
+    recenterings = recenter_target_images(target_image_path, max_workers=1)
+
+    recentering = next(r for r in recenterings if r.font == "fontB")
+    assert recentering.offset == (0.0, 0.0)
+    assert recentering.rewritten_count == 0
+    assert image_path.stat().st_mtime_ns == modified_time
+
+
+def test_dry_run_does_not_rewrite_images(target_image_path: Path):
+    image_path = target_image_path / "fontA" / "fontA+char0.png"
+    modified_time = image_path.stat().st_mtime_ns
+
+    recenterings = recenter_target_images(
+        target_image_path, dry_run=True, max_workers=1
+    )
+
+    assert next(r for r in recenterings if r.font == "fontA").rewritten_count == 5
+    assert image_path.stat().st_mtime_ns == modified_time
+
+
+def test_images_keep_their_size_without_canvas_size(target_image_path: Path):
+    # Offset from the centre of its own image like the other glyphs of fontA
+    save_glyph(target_image_path / "fontA" / "fontA+char5.png", (32, 38), size=96)
+
+    recenter_target_images(target_image_path, max_workers=1)
+
+    with Image.open(target_image_path / "fontA" / "fontA+char5.png") as image:
+        assert image.size == (96, 96)
+        pixels = np.asarray(image.convert("L"))[None]
+
+    boxes, _ = find_ink_bounding_boxes(find_ink(pixels))
+    left, top, right, bottom = boxes[0]
+    assert ((left + right) / 2, (top + bottom) / 2) == (48, 48)
+
+
+def test_target_images_still_match_content_images(fyp23_dataset_path: Path):
+    # The content images of fyp23 are copied from the source, not rendered at 128x128
+    target_files = sorted((fyp23_dataset_path / "TargetImage").rglob("*.png"))
+    modified_times = [file.stat().st_mtime_ns for file in target_files]
+
+    recenterings = recenter_target_images(
+        fyp23_dataset_path / "TargetImage", max_workers=1
+    )
+
+    assert all(r.rewritten_count == 0 for r in recenterings if r.offset == (0.0, 0.0))
+    assert [file.stat().st_mtime_ns for file in target_files] == modified_times
+
+    content_sizes = set()
+    for file in (fyp23_dataset_path / "ContentImage").iterdir():
+        with Image.open(file) as image:
+            content_sizes.add(image.size)
+    for file in target_files:
+        with Image.open(file) as image:
+            assert {image.size} == content_sizes
+
+
+def test_glyphs_are_kept_on_canvas_and_resized_to_canvas(target_image_path: Path):
+    # A glyph far to the right would be pushed off the canvas by the offset of fontA
+    save_glyph(target_image_path / "fontA" / "fontA+char5.png", (112, 54))
+
+    # A smaller image is placed in the middle of the canvas
+    save_glyph(target_image_path / "fontA" / "fontA+char6.png", (32, 38), size=96)
+
+    recenterings = recenter_target_images(
+        target_image_path, canvas_size=(128, 128), max_workers=1
+    )
+
+    recentering = next(r for r in recenterings if r.font == "fontA")
+    assert recentering.clamped_count == 1
+
+    center_x, _ = get_glyph_center(target_image_path / "fontA" / "fontA+char5.png")
+    assert center_x == 118
+
+    center = get_glyph_center(target_image_path / "fontA" / "fontA+char6.png")
+    assert center == (64, 64)
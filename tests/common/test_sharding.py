@@ -0,0 +1,63 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from scripts.common.sharding import (
+    get_shard_path,
+    merge_shard_reports,
+    parse_shard,
+    select_shard,
+    write_shard_report,
+)
+
+test_output_path = Path("test_outputs") / "sharding"
+
+
+def test_parse_shard():
+    assert parse_shard("0/1") == (0, 1)
+    assert parse_shard("3/4") == (3, 4)
+
+    for shard in ["4/4", "-1/4", "0/0", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+
+def test_shards_partition_units():
+    units = [f"{i:03d}-f.gnt" for i in range(100)]
+
+    shards = [select_shard(units, shard_index, 4) for shard_index in range(4)]
+
+    assert sorted(unit for shard in shards for unit in shard) == units
+    assert all(shard for shard in shards)
+
+    # The assignment does not depend on the order of the units
+    assert select_shard(reversed(units), 1, 4) == list(reversed(shards[1]))
+
+
+def test_merged_shard_reports_match_single_shard_result():
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    test_output_path.mkdir(parents=True)
+
+    report_file = test_output_path / "report.json"
+
+    write_shard_report(
+        get_shard_path(report_file, 0, 2), 0, 2, success={"扼"}, skipped={"!"}
+    )
+
+    with pytest.raises(ValueError):
+        merge_shard_reports([get_shard_path(report_file, 0, 2)])
+
+    write_shard_report(
+        get_shard_path(report_file, 1, 2), 1, 2, success={"遏"}, skipped=set()
+    )
+
+    merged_results = merge_shard_reports(
+        [get_shard_path(report_file, 0, 2), get_shard_path(report_file, 1, 2)]
+    )
+
+    assert merged_results == {"success": {"扼", "遏"}, "skipped": {"!"}}
+
+    shutil.rmtree(test_output_path)
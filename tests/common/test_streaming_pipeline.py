@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from scripts.common.streaming_pipeline import StreamingPipeline, StreamingStage
+
+
+def test_streaming_pipeline_gives_every_result():
+    with StreamingPipeline(
+        [
+            StreamingStage("negate", lambda item: -item, workers=3),
+            StreamingStage("abs", abs, workers=2, use_processes=True),
+        ],
+        max_queued_items=4,
+    ) as pipeline:
+        results = list(pipeline.run(range(100)))
+
+        # The worker processes are reused by the next run
+        assert sorted(pipeline.run(range(10))) == list(range(10))
+
+    assert sorted(results) == list(range(100))
+    assert [stage.name for stage in pipeline.statistics] == ["read", "negate", "abs"]
+    assert all(stage.items == 110 for stage in pipeline.statistics)
+
+
+def test_streaming_pipeline_keeps_memory_bounded():
+    lock = threading.Lock()
+    read_count = 0
+
+    def read_items():
+        nonlocal read_count
+        for item in range(1000):
+            with lock:
+                read_count += 1
+            yield item
+
+    max_queued_items = 4
+    workers = 2
+
+    pipeline = StreamingPipeline(
+        [StreamingStage("identity", lambda item: item, workers=workers)],
+        max_queued_items=max_queued_items,
+    )
+
+    for consumed_count, _ in enumerate(pipeline.run(read_items()), start=1):
+        with lock:
+            # Items are only read ahead while there is space in the queues
+            assert read_count - consumed_count <= 2 * max_queued_items + workers + 1
+
+
+def test_streaming_pipeline_raises_stage_errors():
+    def fail_on_five(item: int) -> int:
+        if item == 5:
+            raise ValueError("Five")
+        return item
+
+    pipeline = StreamingPipeline(
+        [StreamingStage("check", fail_on_five, workers=2)], max_queued_items=2
+    )
+
+    with pytest.raises(ValueError, match="Five"):
+        list(pipeline.run(range(1000)))
+
+
+def test_streaming_pipeline_stops_when_caller_stops():
+    pipeline = StreamingPipeline(
+        [StreamingStage("identity", lambda item: item, workers=2)], max_queued_items=2
+    )
+
+    results = pipeline.run(iter(range(1_000_000)))
+    next(results)
+    results.close()
+
+    assert pipeline.statistics[0].items < 1_000_000
@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pytest
 
+from scripts.common.dataset_manifest import get_manifest_path
 from scripts.neumason.step_0_create_content_and_target_images import (
     create_content_and_target_images,
 )
@@ -56,6 +57,9 @@ def output_dir(dataset_name: str):
     if target_image_dir.exists():
         shutil.rmtree(target_image_dir)
 
+    # The converter also writes a manifest next to the dataset
+    get_manifest_path(target_image_dir).unlink(missing_ok=True)
+
 
 @pytest.mark.parametrize(
     "dataset_name", ["empty_source", "source_with_chinese_characters"]
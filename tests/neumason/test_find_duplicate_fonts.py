@@ -0,0 +1,90 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+
+from scripts.neumason.find_duplicate_fonts import (
+    find_duplicate_fonts,
+    group_into_clusters,
+)
+
+test_output_path = Path("test_outputs")
+
+
+def draw_glyph(rng: np.random.Generator) -> Image.Image:
+    image = Image.new("L", (128, 128), 255)
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        draw.line(
+            [
+                tuple(int(value) for value in rng.integers(10, 118, size=2))
+                for _ in range(2)
+            ],
+            fill=0,
+            width=10,
+        )
+    return image
+
+
+@pytest.fixture
+def source_dir():
+    # fontA and its duplicates (one slightly blurred, one with fewer characters), and two different fonts
+    source_path = test_output_path / "find_duplicate_fonts_source"
+
+    if source_path.exists():
+        shutil.rmtree(source_path)
+
+    characters = [chr(0x4E00 + number) for number in range(40)]
+
+    font_glyphs = {}
+    for font_number, font_dir in enumerate(["content.ttf", "fontA.ttf", "fontB.ttf"]):
+        rng = np.random.default_rng(font_number)
+        font_glyphs[font_dir] = {character: draw_glyph(rng) for character in characters}
+
+    font_glyphs["fontA(duplicate).ttf"] = {
+        character: glyph.filter(ImageFilter.GaussianBlur(1))
+        for character, glyph in font_glyphs["fontA.ttf"].items()
+    }
+    font_glyphs["fontA(partial).ttf"] = {
+        character: glyph
+        for character, glyph in list(font_glyphs["fontA.ttf"].items())[:30]
+    }
+
+    for font_dir, glyphs in font_glyphs.items():
+        font_path = source_path / font_dir
+        font_path.mkdir(parents=True)
+        for character, glyph in glyphs.items():
+            glyph.save(font_path / f"{character}.png")
+
+    yield source_path
+
+    shutil.rmtree(source_path)
+
+
+def test_near_identical_fonts_are_clustered(source_dir: Path):
+    clusters, rejected_font_dirs = find_duplicate_fonts(
+        source_dir, content_font_dir="content.ttf", sample_size=32, max_workers=1
+    )
+
+    assert [sorted(cluster) for cluster in clusters] == [
+        ["fontA(duplicate).ttf", "fontA(partial).ttf", "fontA.ttf"]
+    ]
+    assert rejected_font_dirs == ["fontA(duplicate).ttf", "fontA(partial).ttf"]
+
+
+def test_content_font_is_never_rejected(source_dir: Path):
+    shutil.copytree(source_dir / "fontB.ttf", source_dir / "fontB(copy).ttf")
+
+    clusters, rejected_font_dirs = find_duplicate_fonts(
+        source_dir, content_font_dir="fontB(copy).ttf", max_workers=1
+    )
+
+    assert ["fontB(copy).ttf", "fontB.ttf"] in [sorted(cluster) for cluster in clusters]
+    assert "fontB.ttf" in rejected_font_dirs
+    assert "fontB(copy).ttf" not in rejected_font_dirs
+
+
+def test_pairs_are_grouped_transitively():
+    assert group_into_clusters(6, [(0, 3), (3, 5), (1, 2)]) == [[0, 3, 5], [1, 2]]
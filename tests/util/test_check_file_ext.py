@@ -3,7 +3,7 @@ from pathlib import Path
 
 import pytest
 
-from scripts.util.check_file_ext import extract_file_extensions
+from scripts.util.check_file_ext import census_file_types, extract_file_extensions
 
 test_reference_path = Path("tests") / "util" / "check_file_ext_test_data"
 
@@ -40,3 +40,33 @@ def test_check_file_extensions(dataset_name: str, expected_result: set[str]):
     assert (
         result == expected_result
     ), f"Expected {expected_result} but got {result} for dataset {dataset_name}"
+
+
+def test_census_file_types_by_content():
+    census_path = Path("test_outputs") / "check_file_ext_census"
+
+    if census_path.exists():
+        shutil.rmtree(census_path)
+
+    shutil.copytree(
+        test_reference_path / "dataset_with_multiple_image_formats", census_path
+    )
+    shutil.copy(
+        Path("tests")
+        / "casia"
+        / "create_target_images_test_data"
+        / "source_with_chinese_characters"
+        / "003-f.gnt",
+        census_path / "003-f.gnt",
+    )
+    shutil.copy(census_path / "char1" / "ddeeff.png", census_path / "renamed.gif")
+
+    census = census_file_types(census_path)
+
+    assert census["type_counts"] == {"GIF": 2, "PNG": 2, "JPEG": 1, "GNT": 1}
+    assert (
+        census["type_bytes"]["PNG"] == 2 * (census_path / "renamed.gif").stat().st_size
+    )
+    assert census["mismatches"] == [(census_path / "renamed.gif", "gif", "PNG")]
+
+    shutil.rmtree(census_path)
@@ -1,7 +1,14 @@
+import json
 import shutil
 from pathlib import Path
 
-from scripts.util.compare_directories import compare_directories_and_return_summary
+import numpy as np
+from PIL import Image
+
+from scripts.util.compare_directories import (
+    compare_directories_and_return_summary,
+    compare_images,
+)
 
 test_reference_path = Path("tests") / "util" / "compare_directories_test_data"
 
@@ -107,6 +114,68 @@ def test_all_problems_message():
     )
 
 
+def test_digest_tree_comparison_matches_full_comparison():
+    test_output_path = Path("test_outputs") / "compare_directories_with_digest_trees"
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    shutil.copytree(
+        test_reference_path / "directories_with_all_problems", test_output_path
+    )
+
+    dir1 = test_output_path / "dir1"
+    dir2 = test_output_path / "dir2"
+
+    expected_result = compare_directories_and_return_summary(dir1, dir2)
+
+    for _ in range(2):
+        result = compare_directories_and_return_summary(
+            dir1, dir2, use_digest_trees=True
+        )
+        assert result == expected_result
+
+    assert (test_output_path / "dir1.digest-tree.json").exists()
+    assert (test_output_path / "dir2.digest-tree.json").exists()
+
+    shutil.rmtree(test_output_path)
+
+
+def test_image_comparison_with_tolerance():
+    test_output_path = Path("test_outputs") / "compare_images_with_tolerance"
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    test_output_path.mkdir(parents=True)
+
+    pixels = np.full((16, 16), 200, dtype=np.uint8)
+    changed_pixels = pixels.copy()
+    changed_pixels[0, :4] = 203
+
+    Image.fromarray(pixels).save(test_output_path / "image1.png")
+    Image.fromarray(changed_pixels).save(test_output_path / "image2.png")
+    Image.fromarray(pixels[:8]).save(test_output_path / "image3.png")
+
+    image1 = test_output_path / "image1.png"
+    image2 = test_output_path / "image2.png"
+    image3 = test_output_path / "image3.png"
+
+    assert compare_images(image1, image2, tolerance=3) is None
+
+    difference = compare_images(image1, image2)
+    assert difference is not None
+    assert difference.max_difference == 3
+    assert difference.differing_pixels == 4
+    assert difference.mean_difference == 3 * 4 / (16 * 16)
+
+    size_difference = compare_images(image1, image3)
+    assert size_difference is not None
+    assert str(size_difference) == "image sizes (16, 16) and (16, 8)"
+
+    shutil.rmtree(test_output_path)
+
+
 # I do not know how to create uncomparable files (funny files) to write the following tests.
 # https://docs.python.org/3.13/library/filecmp.html#filecmp.dircmp.funny_files
 
@@ -127,3 +196,75 @@ def test_all_problems_message():
 #         "tests/util/directories_with_uncomparable_files/dir1/file1.txt and "
 #         "tests/util/directories_with_uncomparable_files/dir2/file1.txt\n"
 #     )
+
+
+def test_digest_cache_detects_changed_files():
+    test_output_path = Path("test_outputs") / "compare_directories_with_digest_cache"
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    dir1 = test_output_path / "dir1"
+    dir2 = test_output_path / "dir2"
+    shutil.copytree(test_reference_path / "directories_with_same_files" / "dir1", dir1)
+    shutil.copytree(test_reference_path / "directories_with_same_files" / "dir2", dir2)
+
+    digest_cache_file = test_output_path / "digest_cache.json"
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        dir1, dir2, digest_cache_file=digest_cache_file
+    )
+    assert directories_are_equal, message
+    assert digest_cache_file.exists()
+
+    changed_file = next(file for file in dir2.rglob("*") if file.is_file())
+    changed_file.write_bytes(changed_file.read_bytes() + b"changed")
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        dir1, dir2, digest_cache_file=digest_cache_file
+    )
+    assert not directories_are_equal
+
+    shutil.rmtree(test_output_path)
+
+
+def test_digest_cache_only_keeps_files_of_the_last_run():
+    test_output_path = Path("test_outputs") / "compare_directories_with_pruned_cache"
+
+    if test_output_path.exists():
+        shutil.rmtree(test_output_path)
+
+    dir1 = test_output_path / "dir1"
+    dir2 = test_output_path / "dir2"
+    dir1.mkdir(parents=True)
+    dir2.mkdir(parents=True)
+
+    for dir in [dir1, dir2]:
+        (dir / "kept.txt").write_text("kept")
+        (dir / "deleted.txt").write_text("deleted")
+
+    # The same pixels, encoded to files of different sizes, are compared without being hashed
+    pixels = np.arange(64, dtype=np.uint8).reshape(8, 8)
+    Image.fromarray(pixels).save(dir1 / "image.png", compress_level=0)
+    Image.fromarray(pixels).save(dir2 / "image.png", compress_level=9)
+
+    digest_cache_file = test_output_path / "digest_cache.json"
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        dir1, dir2, digest_cache_file=digest_cache_file
+    )
+    assert directories_are_equal, message
+
+    (dir1 / "deleted.txt").unlink()
+    (dir2 / "deleted.txt").unlink()
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        dir1, dir2, digest_cache_file=digest_cache_file
+    )
+    assert directories_are_equal, message
+
+    with open(digest_cache_file, "r", encoding="utf-8") as f:
+        cached_paths = {Path(path).name for path in json.load(f)}
+    assert cached_paths == {"kept.txt"}
+
+    shutil.rmtree(test_output_path)
@@ -0,0 +1,223 @@
+import errno
+import shutil
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from scripts.common.dataset_manifest import (
+    get_manifest_path,
+    load_dataset_manifest,
+    write_dataset_manifest,
+)
+from scripts.util import merge_datasets as merge_datasets_module
+from scripts.util.merge_datasets import merge_datasets
+from tests.common.synthetic_dataset import create_synthetic_dataset
+
+test_output_path = Path("test_outputs")
+
+
+@pytest.fixture
+def root_path():
+    root_path = test_output_path / "merge_datasets"
+    if root_path.exists():
+        shutil.rmtree(root_path)
+
+    # Both datasets have a font named fontA, and a content image of char1
+    create_synthetic_dataset(
+        root_path / "first-dataset",
+        ["char1", "char2"],
+        {"fontA": ["char1", "char2"]},
+        content_fill=lambda char: 0,
+    )
+    create_synthetic_dataset(
+        root_path / "second-dataset",
+        ["char1"],
+        {"fontA": ["char1", "char3"], "fontB": ["char1", "char1+1"]},
+        target_fill=lambda font_name, name: 255,
+    )
+    write_dataset_manifest(root_path / "first-dataset")
+
+    yield root_path
+
+    shutil.rmtree(root_path)
+    for name in ["first-dataset", "second-dataset", "merged-dataset"]:
+        get_manifest_path(root_path / name).unlink(missing_ok=True)
+
+
+def merge(root_path: Path) -> tuple[int, list[str]]:
+    return merge_datasets(
+        {
+            "first": root_path / "first-dataset",
+            "second": root_path / "second-dataset",
+        },
+        root_path / "merged-dataset",
+        max_workers=1,
+    )
+
+
+def list_dataset_files(dataset_path: Path) -> list[str]:
+    return sorted(
+        path.relative_to(dataset_path).as_posix()
+        for path in dataset_path.rglob("*")
+        if path.is_file()
+    )
+
+
+def test_merges_datasets_with_namespaced_fonts(root_path: Path):
+    image_count, characters_without_content = merge(root_path)
+
+    assert image_count == 8
+    assert characters_without_content == ["char3"]
+
+    merged_path = root_path / "merged-dataset"
+    assert list_dataset_files(merged_path) == [
+        "ContentImage/char1.png",
+        "ContentImage/char2.png",
+        "TargetImage/first_fontA/first_fontA+char1.png",
+        "TargetImage/first_fontA/first_fontA+char2.png",
+        "TargetImage/second_fontA/second_fontA+char1.png",
+        "TargetImage/second_fontA/second_fontA+char3.png",
+        "TargetImage/second_fontB/second_fontB+char1+1.png",
+        "TargetImage/second_fontB/second_fontB+char1.png",
+    ]
+
+    # Images are hard links, and content images come from the first dataset that has them
+    source_file = root_path / "first-dataset" / "ContentImage" / "char1.png"
+    assert (merged_path / "ContentImage" / "char1.png").samefile(source_file)
+
+    source_file = root_path / "second-dataset" / "TargetImage" / "fontB"
+    merged_file = merged_path / "TargetImage" / "second_fontB"
+    assert (merged_file / "second_fontB+char1+1.png").samefile(
+        source_file / "fontB+char1+1.png"
+    )
+
+
+def test_manifest_matches_merged_dataset(root_path: Path):
+    merge(root_path)
+
+    merged_path = root_path / "merged-dataset"
+    manifest = load_dataset_manifest(merged_path)
+    assert manifest is not None
+
+    entries = {entry.path: entry for entry in manifest.entries}
+    assert sorted(entries) == list_dataset_files(merged_path)
+
+    entry = entries["TargetImage/second_fontB/second_fontB+char1+1.png"]
+    assert (entry.font, entry.char, entry.sample) == ("second_fontB", "char1", 1)
+
+    # Entries taken from the manifest of a source are the same as entries read from the images
+    get_manifest_path(merged_path).unlink()
+    scanned_entries = {
+        entry.path: entry for entry in write_dataset_manifest(merged_path).entries
+    }
+    for path, entry in entries.items():
+        assert vars(entry) == vars(scanned_entries[path])
+
+
+def test_merging_again_replaces_changed_images(root_path: Path):
+    merge(root_path)
+
+    source_path = root_path / "second-dataset" / "TargetImage" / "fontA"
+    source_file = source_path / "fontA+char1.png"
+    source_file.unlink()
+    Image.new("L", (16, 16), 0).save(source_file)
+
+    merge(root_path)
+
+    merged_path = root_path / "merged-dataset" / "TargetImage" / "second_fontA"
+    assert (merged_path / "second_fontA+char1.png").samefile(source_file)
+
+    manifest = load_dataset_manifest(root_path / "merged-dataset")
+    assert manifest is not None
+    entry = next(
+        entry
+        for entry in manifest.entries
+        if entry.path == "TargetImage/second_fontA/second_fontA+char1.png"
+    )
+    assert (entry.width, entry.height) == (16, 16)
+
+
+def test_copied_images_are_not_copied_again(root_path: Path, monkeypatch):
+    # As if the merged dataset were on another file system
+    def link(source, destination):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    copied_files: list[Path] = []
+
+    def copy_file(source, destination):
+        copied_files.append(Path(destination))
+        shutil.copyfile(source, destination)
+
+    monkeypatch.setattr(merge_datasets_module.os, "link", link)
+    monkeypatch.setattr(merge_datasets_module, "copy_file", copy_file)
+
+    image_count, _ = merge(root_path)
+    assert len(copied_files) == image_count
+
+    copied_files.clear()
+    merge(root_path)
+    assert copied_files == []
+
+    # A changed source image is copied again
+    source_file = (
+        root_path / "second-dataset" / "TargetImage" / "fontA" / "fontA+char1.png"
+    )
+    Image.new("L", (16, 16), 0).save(source_file)
+
+    merge(root_path)
+    assert copied_files == [
+        root_path
+        / "merged-dataset"
+        / "TargetImage"
+        / "second_fontA"
+        / "second_fontA+char1.png"
+    ]
+
+
+def test_merging_again_removes_images_removed_from_sources(root_path: Path):
+    merge(root_path)
+
+    source_path = root_path / "second-dataset" / "TargetImage"
+    (source_path / "fontA" / "fontA+char3.png").unlink()
+    shutil.rmtree(source_path / "fontB")
+
+    image_count, _ = merge(root_path)
+
+    merged_path = root_path / "merged-dataset"
+    assert image_count == 5
+    assert list_dataset_files(merged_path) == [
+        "ContentImage/char1.png",
+        "ContentImage/char2.png",
+        "TargetImage/first_fontA/first_fontA+char1.png",
+        "TargetImage/first_fontA/first_fontA+char2.png",
+        "TargetImage/second_fontA/second_fontA+char1.png",
+    ]
+    assert not (merged_path / "TargetImage" / "second_fontB").exists()
+
+    manifest = load_dataset_manifest(merged_path)
+    assert manifest is not None
+    assert sorted(entry.path for entry in manifest.entries) == list_dataset_files(
+        merged_path
+    )
+
+
+def test_colliding_font_names_results_in_value_error(root_path: Path):
+    # "a" + "b_fontA" and "a_b" + "fontA" are both named a_b_fontA
+    create_synthetic_dataset(root_path / "third-dataset", [], {"b_fontA": ["char1"]})
+
+    with pytest.raises(ValueError):
+        merge_datasets(
+            {
+                "a_b": root_path / "first-dataset",
+                "a": root_path / "third-dataset",
+            },
+            root_path / "merged-dataset",
+        )
+
+
+def test_invalid_namespace_results_in_value_error(root_path: Path):
+    with pytest.raises(ValueError):
+        merge_datasets(
+            {"a+b": root_path / "first-dataset"}, root_path / "merged-dataset"
+        )
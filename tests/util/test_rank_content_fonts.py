@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTCollection, TTFont
+
+from scripts.util.rank_content_fonts import (
+    get_coverage_cache_path,
+    rank_content_fonts,
+    scan_font_coverage,
+)
+
+test_output_path = Path("test_outputs")
+
+
+def build_font(characters: str) -> TTFont:
+    glyph_names = [".notdef"] + [f"uni{ord(char):04X}" for char in characters]
+
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(glyph_names)
+    builder.setupCharacterMap({ord(char): f"uni{ord(char):04X}" for char in characters})
+    builder.setupGlyf({name: TTGlyphPen(None).glyph() for name in glyph_names})
+    builder.setupHorizontalMetrics({name: (1000, 0) for name in glyph_names})
+    builder.setupHorizontalHeader(ascent=880, descent=-120)
+    builder.setupNameTable({"familyName": "Test", "styleName": "Regular"})
+    builder.setupOS2()
+    builder.setupPost()
+    return builder.font
+
+
+@pytest.fixture
+def font_path():
+    font_path = test_output_path / "rank_content_fonts" / "ttf"
+    if font_path.parent.exists():
+        shutil.rmtree(font_path.parent)
+    font_path.mkdir(parents=True)
+
+    build_font("一二三").save(font_path / "fontA.ttf")
+    build_font("三四").save(font_path / "fontB.otf")
+    build_font("四").save(font_path / "fontC.ttf")
+
+    # A collection of two faces, and a file that is not a font
+    collection = TTCollection()
+    collection.fonts = [build_font("一"), build_font("𠀀")]
+    collection.save(font_path / "collection.ttc")
+    (font_path / "broken.ttf").write_bytes(b"broken")
+
+    yield font_path
+
+    shutil.rmtree(font_path.parent)
+
+
+def test_ranks_fonts_and_finds_fallback_chain(font_path: Path):
+    report_file = font_path.parent / "report.json"
+
+    ranking, fallback_chain, missing_characters = rank_content_fonts(
+        font_path, set("一二三四五𠀀"), report_file=report_file, max_workers=1
+    )
+
+    assert ranking == [
+        ("fontA.ttf", 3),
+        ("fontB.otf", 2),
+        ("collection.ttc#0", 1),
+        ("collection.ttc#1", 1),
+        ("fontC.ttf", 1),
+    ]
+    assert fallback_chain == [
+        ("fontA.ttf", "一三二"),
+        ("fontB.otf", "四"),
+        ("collection.ttc#1", "𠀀"),
+    ]
+    assert missing_characters == "五"
+
+    with open(report_file, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["required_characters"] == 6
+    assert report["fallback_chain"][1] == {"font": "fontB.otf", "characters": "四"}
+    assert report["missing_characters"] == "五"
+
+
+def test_unreadable_fonts_are_reported(font_path: Path):
+    coverage, failed_files = scan_font_coverage(font_path, max_workers=1)
+
+    assert failed_files == [font_path / "broken.ttf"]
+    assert "broken.ttf" not in coverage.fonts
+    assert coverage.get_coverage_matrix(["一", "ab"]).tolist() == [
+        [True, False],
+        [False, False],
+        [True, False],
+        [False, False],
+        [False, False],
+    ]
+
+
+def test_unchanged_fonts_are_read_from_cache(font_path: Path):
+    scan_font_coverage(font_path, max_workers=1)
+    assert get_coverage_cache_path(font_path).exists()
+
+    # A font replaced without changing its size or modification time is not read again
+    font_file = font_path / "fontC.ttf"
+    stat_result = font_file.stat()
+    font_file.write_bytes(b"\0" * stat_result.st_size)
+    os.utime(font_file, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+
+    coverage, failed_files = scan_font_coverage(font_path, max_workers=1)
+    assert failed_files == [font_path / "broken.ttf"]
+    assert coverage.get_coverage_matrix(["四"])[coverage.fonts.index("fontC.ttf")]
+
+    # A changed font is read again
+    os.utime(font_file, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1))
+
+    coverage, failed_files = scan_font_coverage(font_path, max_workers=1)
+    assert failed_files == [font_path / "broken.ttf", font_file]
+    assert "fontC.ttf" not in coverage.fonts
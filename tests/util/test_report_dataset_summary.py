@@ -1,11 +1,25 @@
+import csv
+import json
 import shutil
+import struct
+import zlib
 from pathlib import Path
 
 import pytest
-from scripts.util.report_dataset_summary import report_dataset_summary
+from PIL import Image
+
+from scripts.common.dataset_manifest import get_manifest_path, write_dataset_manifest
+from scripts.util.report_dataset_summary import (
+    collect_dataset_statistics,
+    report_dataset_summary,
+    write_dataset_statistics_csv,
+    write_dataset_statistics_json,
+)
 
 test_reference_path = Path("tests") / "util" / "report_dataset_summary_test_data"
 
+test_output_path = Path("test_outputs")
+
 
 @pytest.fixture(scope="session", autouse=True)
 def create_empty_dataset():
@@ -65,3 +79,153 @@ def test_summarize_dataset_with_two_to_three_chars():
         "Total number of characters: 5"
     )
     assert report_dataset_summary(target_image_dir) == expected_summary
+
+
+def test_summarize_dataset_with_one_font():
+    target_image_dir = test_output_path / "dataset_with_one_font"
+
+    if target_image_dir.exists():
+        shutil.rmtree(target_image_dir)
+
+    shutil.copytree(
+        test_reference_path / "dataset_with_two_to_three_chars" / "fontA",
+        target_image_dir / "fontA",
+    )
+
+    expected_summary = (
+        "Total number of fonts: 1\n"
+        "Range of characters per font: 2-2\n"
+        "Average number of characters per font: 2.00\n"
+        "Standard deviation of characters per font: 0.00\n"
+        "Total number of characters: 2"
+    )
+    assert report_dataset_summary(target_image_dir) == expected_summary
+
+    shutil.rmtree(target_image_dir)
+
+
+def test_collect_dataset_statistics_from_image_headers():
+    target_image_dir = test_output_path / "dataset_with_images"
+
+    if target_image_dir.exists():
+        shutil.rmtree(target_image_dir)
+
+    font_path = target_image_dir / "fontA"
+    font_path.mkdir(parents=True)
+
+    Image.new("L", (128, 128), 255).save(font_path / "fontA+書.png")
+    Image.new("RGB", (128, 96), "white").save(font_path / "fontA+法+1.png")
+    Image.new("P", (64, 64)).save(font_path / "fontB+法.gif")
+    (font_path / "fontA+字.txt").write_text("not an image")
+
+    dataset_statistics = collect_dataset_statistics(target_image_dir)
+
+    assert dataset_statistics["font_count"] == 1
+    assert dataset_statistics["image_count"] == 3
+    assert dataset_statistics["format_histogram"] == {"GIF": 1, "PNG": 2}
+    assert dataset_statistics["width_histogram"] == {"64": 1, "128": 2}
+    assert dataset_statistics["height_histogram"] == {"64": 1, "96": 1, "128": 1}
+    assert dataset_statistics["mode_histogram"] == {"L": 1, "P": 1, "RGB": 1}
+    assert dataset_statistics["non_image_files"] == [
+        (font_path / "fontA+字.txt").as_posix()
+    ]
+    assert dataset_statistics["misnamed_files"] == [
+        (font_path / "fontB+法.gif").as_posix()
+    ]
+    assert dataset_statistics["fonts"]["fontA"]["image_count"] == 3
+
+    write_dataset_statistics_json(
+        dataset_statistics, test_output_path / "dataset_statistics.json"
+    )
+    write_dataset_statistics_csv(
+        dataset_statistics, test_output_path / "dataset_statistics.csv"
+    )
+
+    (test_output_path / "dataset_statistics.json").unlink()
+    (test_output_path / "dataset_statistics.csv").unlink()
+    shutil.rmtree(target_image_dir)
+
+
+def write_png_header(png_file: Path, width: int, height: int, color_type: int):
+    # A PNG signature and IHDR chunk, enough for the header to be read
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    chunk = b"IHDR" + ihdr
+    png_file.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + struct.pack(">I", len(ihdr))
+        + chunk
+        + struct.pack(">I", zlib.crc32(chunk))
+    )
+
+
+@pytest.mark.parametrize("use_manifest", [False, True])
+def test_images_of_unknown_mode_are_counted_as_unknown(use_manifest: bool):
+    dataset_path = test_output_path / "dataset_with_unknown_mode"
+    target_image_dir = dataset_path / "TargetImage"
+
+    if dataset_path.exists():
+        shutil.rmtree(dataset_path)
+
+    font_path = target_image_dir / "fontA"
+    font_path.mkdir(parents=True)
+
+    Image.new("L", (128, 128), 255).save(font_path / "fontA+書.png")
+    write_png_header(font_path / "fontA+法.png", 128, 128, color_type=5)
+
+    if use_manifest:
+        write_dataset_manifest(dataset_path)
+
+    dataset_statistics = collect_dataset_statistics(target_image_dir)
+
+    assert dataset_statistics["image_count"] == 2
+    assert dataset_statistics["mode_histogram"] == {"L": 1, "unknown": 1}
+
+    json_file = test_output_path / "dataset_statistics_unknown_mode.json"
+    csv_file = test_output_path / "dataset_statistics_unknown_mode.csv"
+    write_dataset_statistics_json(dataset_statistics, json_file)
+    write_dataset_statistics_csv(dataset_statistics, csv_file)
+
+    with open(json_file, "r", encoding="utf-8") as f:
+        assert json.load(f)["mode_histogram"] == {"L": 1, "unknown": 1}
+
+    with open(csv_file, "r", encoding="utf-8", newline="") as f:
+        mode_rows = [row for row in csv.reader(f) if row[0] == "mode_histogram"]
+    assert mode_rows == [
+        ["mode_histogram", "L", "1"],
+        ["mode_histogram", "unknown", "1"],
+    ]
+
+    json_file.unlink()
+    csv_file.unlink()
+    shutil.rmtree(dataset_path)
+    get_manifest_path(dataset_path).unlink(missing_ok=True)
+
+
+@pytest.mark.parametrize("use_manifest", [False, True])
+def test_truncated_images_are_counted_as_non_image_files(use_manifest: bool):
+    dataset_path = test_output_path / "dataset_with_truncated_image"
+    target_image_dir = dataset_path / "TargetImage"
+
+    if dataset_path.exists():
+        shutil.rmtree(dataset_path)
+
+    font_path = target_image_dir / "fontA"
+    font_path.mkdir(parents=True)
+
+    Image.new("L", (128, 128), 255).save(font_path / "fontA+書.png")
+
+    # The PNG signature and IHDR tag, cut off before the end of the image size
+    write_png_header(font_path / "fontA+法.png", 128, 128, color_type=0)
+    truncated_file = font_path / "fontA+法.png"
+    truncated_file.write_bytes(truncated_file.read_bytes()[:20])
+
+    if use_manifest:
+        write_dataset_manifest(dataset_path)
+
+    dataset_statistics = collect_dataset_statistics(target_image_dir)
+
+    assert dataset_statistics["image_count"] == 1
+    assert dataset_statistics["non_image_files"] == [truncated_file.as_posix()]
+
+    shutil.rmtree(dataset_path)
+    get_manifest_path(dataset_path).unlink(missing_ok=True)
@@ -0,0 +1,165 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from scripts.common.pairing_table import PairingTable, get_pairing_table_path
+from scripts.util.split_dataset import split_dataset
+from tests.common.synthetic_dataset import create_synthetic_dataset
+
+test_output_path = Path("test_outputs")
+
+fractions = (0.6, 0.2, 0.2)
+
+
+@pytest.fixture
+def dataset_path():
+    root_path = test_output_path / "split_dataset"
+    if root_path.exists():
+        shutil.rmtree(root_path)
+
+    dataset_path = root_path / "xxx-dataset"
+    characters = [f"char{number}" for number in range(10)]
+
+    # Five small fonts with two characters, and five large fonts with ten characters
+    create_synthetic_dataset(
+        dataset_path,
+        characters,
+        {
+            f"font{font_number}": characters[: 2 if font_number < 5 else 10]
+            for font_number in range(10)
+        },
+    )
+
+    yield dataset_path
+
+    shutil.rmtree(root_path)
+
+
+def read_split(dataset_path: Path, output_path: Path, split_name: str) -> list[Path]:
+    # Gives the target images of a split, checking that the list file and the table rows agree
+    table = PairingTable(get_pairing_table_path(dataset_path), dataset_path)
+    rows = np.load(output_path / f"{split_name}.npy")
+
+    target_paths = [table.get_target_path(row) for row in rows]
+    listed_paths = [
+        dataset_path / line
+        for line in (output_path / f"{split_name}.txt").read_text("utf-8").splitlines()
+    ]
+    assert listed_paths == target_paths
+
+    return target_paths
+
+
+def get_fonts(paths: list[Path]) -> set[str]:
+    return {path.parent.name for path in paths}
+
+
+def get_characters(paths: list[Path]) -> set[str]:
+    return {path.stem.split("+")[1] for path in paths}
+
+
+def test_font_split_has_unseen_fonts(dataset_path: Path):
+    output_path = dataset_path.with_name("font-split")
+    split_sizes, left_out_count = split_dataset(
+        dataset_path, output_path, mode="font", fractions=fractions
+    )
+
+    splits = {
+        name: read_split(dataset_path, output_path, name)
+        for name in ["train", "val", "test"]
+    }
+
+    assert left_out_count == 0
+    assert sum(split_sizes.values()) == 60
+    assert {name: len(paths) for name, paths in splits.items()} == split_sizes
+
+    train_fonts, val_fonts, test_fonts = (get_fonts(splits[name]) for name in splits)
+    assert (len(train_fonts), len(val_fonts), len(test_fonts)) == (6, 2, 2)
+    assert not train_fonts & val_fonts
+    assert not train_fonts & test_fonts
+    assert not val_fonts & test_fonts
+
+    # Stratified: val and test each have one small and one large font
+    assert split_sizes["val"] == 12
+    assert split_sizes["test"] == 12
+
+    with open(output_path / "splits.json", "r", encoding="utf-8") as f:
+        split_index = json.load(f)
+    assert split_index["mode"] == "font"
+    assert split_index["splits"]["val"] == {"images": 12, "fonts": 2, "characters": 10}
+
+
+def test_char_split_has_unseen_characters(dataset_path: Path):
+    output_path = dataset_path.with_name("char-split")
+    split_sizes, _ = split_dataset(
+        dataset_path, output_path, mode="char", fractions=fractions
+    )
+
+    assert sum(split_sizes.values()) == 60
+
+    characters = [
+        get_characters(read_split(dataset_path, output_path, name))
+        for name in ["train", "val", "test"]
+    ]
+    assert [len(chars) for chars in characters] == [6, 2, 2]
+    assert not characters[0] & characters[1]
+    assert not characters[0] & characters[2]
+    assert not characters[1] & characters[2]
+
+
+def test_both_split_has_unseen_fonts_and_characters(dataset_path: Path):
+    output_path = dataset_path.with_name("both-split")
+    split_sizes, left_out_count = split_dataset(
+        dataset_path, output_path, mode="both", fractions=fractions
+    )
+
+    assert sum(split_sizes.values()) + left_out_count == 60
+
+    train = read_split(dataset_path, output_path, "train")
+    for name in ["val", "test"]:
+        paths = read_split(dataset_path, output_path, name)
+        assert not get_fonts(train) & get_fonts(paths)
+        assert not get_characters(train) & get_characters(paths)
+
+
+def test_splits_depend_only_on_seed(dataset_path: Path):
+    def get_val_fonts(seed: int, output_name: str) -> set[str]:
+        output_path = dataset_path.with_name(output_name)
+        split_dataset(dataset_path, output_path, fractions=fractions, seed=seed)
+        return get_fonts(read_split(dataset_path, output_path, "val"))
+
+    val_fonts = get_val_fonts(0, "split-a")
+    assert get_val_fonts(0, "split-b") == val_fonts
+    assert any(get_val_fonts(seed, "split-c") != val_fonts for seed in range(1, 10))
+
+
+def test_stale_pairing_table_is_rebuilt(dataset_path: Path):
+    output_path = dataset_path.with_name("font-split")
+    split_sizes, _ = split_dataset(dataset_path, output_path, fractions=fractions)
+    assert sum(split_sizes.values()) == 60
+
+    # As if the dataset were balanced again, after the pairing table was written
+    shutil.rmtree(dataset_path / "TargetImage" / "font9")
+    (dataset_path / "TargetImage" / "font0" / "font0+char1.png").unlink()
+
+    split_sizes, _ = split_dataset(dataset_path, output_path, fractions=fractions)
+    assert sum(split_sizes.values()) == 49
+
+    for name in ["train", "val", "test"]:
+        assert all(
+            path.exists() for path in read_split(dataset_path, output_path, name)
+        )
+
+
+def test_invalid_options_result_in_value_error(dataset_path: Path):
+    with pytest.raises(ValueError):
+        split_dataset(dataset_path, mode="style")
+
+    with pytest.raises(ValueError):
+        split_dataset(dataset_path, fractions=(0.8, 0.1))
+
+    with pytest.raises(ValueError):
+        split_dataset(dataset_path, fractions=(0.8, 0.1, 0.2))
@@ -0,0 +1,140 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from scripts.common.dataset_manifest import get_manifest_path, write_dataset_manifest
+from scripts.common.delete_target_images_without_content_image import (
+    delete_target_images_without_content_image,
+)
+from scripts.common.file_deletion import write_deletion_plan
+from scripts.util.balance_dataset import balance_dataset
+from scripts.util.validate_glyph_images import (
+    compute_glyph_metrics,
+    validate_glyph_images,
+)
+
+test_output_path = Path("test_outputs")
+
+glyph_count = 40
+
+
+def save_glyph(path: Path, number: int):
+    # Similar glyphs of slightly different sizes, like the characters of one font
+    image = Image.new("L", (64, 64), 255)
+    draw = ImageDraw.Draw(image)
+    margin = 12 + number % 5
+    draw.rectangle((margin, margin, 63 - margin, 63 - margin), outline=0, width=4)
+    draw.line((margin, 32, 63 - margin, 32), fill=0, width=4)
+    image.save(path)
+
+
+@pytest.fixture
+def dataset_path():
+    dataset_path = test_output_path / "validate_glyph_images" / "xxx-dataset"
+    if dataset_path.exists():
+        shutil.rmtree(dataset_path)
+    get_manifest_path(dataset_path).unlink(missing_ok=True)
+
+    content_path = dataset_path / "ContentImage"
+    content_path.mkdir(parents=True)
+    for number in range(glyph_count):
+        save_glyph(content_path / f"char{number}.png", number)
+
+    for font_name in ["fontA", "fontB"]:
+        font_path = dataset_path / "TargetImage" / font_name
+        font_path.mkdir(parents=True)
+        for number in range(glyph_count):
+            save_glyph(font_path / f"{font_name}+char{number}.png", number)
+
+    # fontA has a blank glyph, a corrupt file and a glyph unlike the others
+    fontA_path = dataset_path / "TargetImage" / "fontA"
+    Image.new("L", (64, 64), 255).save(fontA_path / "fontA+char1.png")
+    (fontA_path / "fontA+char2.png").write_bytes(b"not an image")
+    outlier_image = Image.new("L", (64, 64), 255)
+    ImageDraw.Draw(outlier_image).rectangle((30, 30, 33, 33), fill=0)
+    outlier_image.save(fontA_path / "fontA+char3.png")
+
+    yield dataset_path
+
+    shutil.rmtree(test_output_path / "validate_glyph_images")
+
+
+def test_computes_glyph_metrics():
+    images = np.full((2, 100, 100), 255, dtype=np.uint8)
+    images[0, 10:30, 20:70] = 0
+
+    metrics = compute_glyph_metrics(images)
+
+    ink_ratio, bbox_width, bbox_height, entropy = metrics[0]
+    assert ink_ratio == pytest.approx(0.1)
+    assert bbox_width == pytest.approx(0.5)
+    assert bbox_height == pytest.approx(0.2)
+    assert entropy > 0
+
+    assert metrics[1].tolist() == [0.0, 0.0, 0.0, 0.0]
+
+
+def test_finds_blank_corrupt_and_outlier_glyphs(dataset_path: Path):
+    issues = validate_glyph_images(
+        dataset_path / "ContentImage", dataset_path / "TargetImage", max_workers=1
+    )
+
+    assert {(issue.path.name, issue.font, issue.reason) for issue in issues} == {
+        ("fontA+char1.png", "fontA", "blank"),
+        ("fontA+char2.png", "fontA", "corrupt"),
+        ("fontA+char3.png", "fontA", "outlier"),
+    }
+
+
+@pytest.mark.parametrize("use_manifest", [False, True])
+def test_balance_treats_invalid_images_as_missing(dataset_path: Path, use_manifest):
+    content_image_path = dataset_path / "ContentImage"
+    target_image_path = dataset_path / "TargetImage"
+
+    issues = validate_glyph_images(content_image_path, target_image_path, max_workers=1)
+    invalid_image_list = dataset_path.parent / "invalid-images.txt"
+    write_deletion_plan(invalid_image_list, [issue.path for issue in issues])
+
+    if use_manifest:
+        write_dataset_manifest(dataset_path)
+
+    preserved, removed = balance_dataset(
+        content_image_path, target_image_path, invalid_image_list=invalid_image_list
+    )
+
+    assert removed == {"char1", "char2", "char3"}
+    assert "char1" not in preserved and "char0" in preserved
+    assert not (content_image_path / "char1.png").exists()
+    assert not (target_image_path / "fontA" / "fontA+char2.png").exists()
+    assert not (target_image_path / "fontB" / "fontB+char3.png").exists()
+    assert (target_image_path / "fontB" / "fontB+char0.png").exists()
+
+
+def test_deletion_removes_only_invalid_target_images(dataset_path: Path):
+    content_image_path = dataset_path / "ContentImage"
+    target_image_path = dataset_path / "TargetImage"
+
+    invalid_image_list = dataset_path.parent / "invalid-images.txt"
+    write_deletion_plan(
+        invalid_image_list,
+        [
+            content_image_path / "char5.png",
+            target_image_path / "fontA" / "fontA+char1.png",
+        ],
+    )
+
+    preserved, removed = delete_target_images_without_content_image(
+        content_image_path, target_image_path, invalid_image_list=invalid_image_list
+    )
+
+    assert removed == {"char5"}
+    assert "char1" in preserved
+    assert not (target_image_path / "fontA" / "fontA+char1.png").exists()
+    assert (target_image_path / "fontB" / "fontB+char1.png").exists()
+    assert not (target_image_path / "fontB" / "fontB+char5.png").exists()
+
+    # The content image itself is left for the balance script
+    assert (content_image_path / "char5.png").exists()
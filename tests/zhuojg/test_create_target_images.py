@@ -2,6 +2,7 @@ import shutil
 from pathlib import Path
 
 import pytest
+from PIL import Image, ImageDraw
 
 from scripts.util.compare_directories import compare_directories_and_return_summary
 from scripts.zhuojg.step_0_create_target_images import create_target_images
@@ -82,3 +83,125 @@ def test_create_target_images_of_source_with_gifs(output_target_image_dir):
     )
 
     assert directories_are_equal, message
+
+
+@pytest.mark.parametrize("dataset_name", ["source_with_gifs_streaming"])
+def test_create_target_images_with_streaming_pipeline(output_target_image_dir):
+    source_dir = test_reference_path / "source_with_gifs"
+
+    success, skipped = create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        encode_workers=2,
+    )
+
+    assert success == {"書", "法"}
+    assert skipped == set()
+
+    directories_are_equal, message = compare_directories_and_return_summary(
+        output_target_image_dir,
+        test_reference_path / "source_with_gifs_result",
+    )
+
+    assert directories_are_equal, message
+
+
+@pytest.mark.parametrize("dataset_name", ["source_with_gifs_deduplicated"])
+@pytest.mark.parametrize("encode_workers", [None, 2])
+def test_identical_samples_are_dropped(output_target_image_dir, encode_workers):
+    # Both samples of every character in the test data are the same blank image
+    source_dir = test_reference_path / "source_with_gifs"
+    dropped_duplicate_counts: dict[str, int] = {}
+
+    success, skipped = create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        encode_workers=encode_workers,
+        duplicate_max_distance=0,
+        dropped_duplicate_counts=dropped_duplicate_counts,
+    )
+
+    assert success == {"書", "法"}
+    assert skipped == set()
+    assert dropped_duplicate_counts == {"fontA": 2, "fontB": 2}
+
+    expected_result_path = test_reference_path / "source_with_gifs_result"
+    output_files = sorted(
+        path.relative_to(output_target_image_dir).as_posix()
+        for path in output_target_image_dir.rglob("*.png")
+    )
+    assert output_files == [
+        "fontA/fontA+書.png",
+        "fontA/fontA+法.png",
+        "fontB/fontB+書.png",
+        "fontB/fontB+法.png",
+    ]
+    for output_file in output_files:
+        assert (output_target_image_dir / output_file).read_bytes() == (
+            expected_result_path / output_file
+        ).read_bytes()
+
+
+@pytest.mark.parametrize("dataset_name", ["source_with_gifs_deduplicated_again"])
+def test_samples_of_an_earlier_run_are_removed(output_target_image_dir):
+    source_dir = test_reference_path / "source_with_gifs"
+
+    # The first run keeps both samples of every character, the second run drops the second sample
+    create_target_images(
+        source_dir=source_dir, output_target_image_dir=output_target_image_dir
+    )
+    create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        duplicate_max_distance=0,
+    )
+
+    output_files = sorted(
+        path.relative_to(output_target_image_dir).as_posix()
+        for path in output_target_image_dir.rglob("*.png")
+    )
+    assert output_files == [
+        "fontA/fontA+書.png",
+        "fontA/fontA+法.png",
+        "fontB/fontB+書.png",
+        "fontB/fontB+法.png",
+    ]
+
+
+@pytest.mark.parametrize("dataset_name", ["source_with_near_duplicates"])
+def test_remaining_samples_are_numbered_without_gaps(output_target_image_dir):
+    source_dir = test_output_path / "source_with_near_duplicates_source"
+    if source_dir.exists():
+        shutil.rmtree(source_dir)
+
+    char_path = source_dir / "fontA" / "一"
+    char_path.mkdir(parents=True)
+
+    glyph = Image.new("L", (80, 80), 255)
+    ImageDraw.Draw(glyph).line([(10, 40), (70, 40)], fill=0, width=8)
+    other_glyph = Image.new("L", (80, 80), 255)
+    ImageDraw.Draw(other_glyph).line([(40, 10), (40, 70)], fill=0, width=8)
+
+    glyph.save(char_path / "a.gif")
+    glyph.point(lambda value: max(value - 8, 0)).save(char_path / "b.gif")
+    other_glyph.save(char_path / "c.gif")
+
+    dropped_duplicate_counts: dict[str, int] = {}
+
+    success, skipped = create_target_images(
+        source_dir=source_dir,
+        output_target_image_dir=output_target_image_dir,
+        duplicate_max_distance=2,
+        dropped_duplicate_counts=dropped_duplicate_counts,
+    )
+
+    shutil.rmtree(source_dir)
+
+    assert success == {"一"}
+    assert dropped_duplicate_counts == {"fontA": 1}
+    assert sorted(
+        path.name for path in (output_target_image_dir / "fontA").iterdir()
+    ) == [
+        "fontA+一+1.png",
+        "fontA+一.png",
+    ]